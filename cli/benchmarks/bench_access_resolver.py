@@ -0,0 +1,101 @@
+"""Compare the set and bitset based access resolvers on a synthetic
+*ssh auth dir* snapshot.
+
+Usage: `python benchmarks/bench_access_resolver.py [--users N] ...`
+"""
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from nsf_ssh_auth_dir.policy_repo import SshAuthDirRepoDefaultPolicy
+from nsf_ssh_auth_dir.repo_access import SshAccessResolver
+from nsf_ssh_auth_dir.repo_access_bitset import SshAccessBitsetResolver
+from nsf_ssh_auth_dir.repo_snapshot import SshAuthDirSnapshot
+from nsf_ssh_auth_dir.types_auth import SshRawAuth, SshRawAuthDeviceUser
+from nsf_ssh_auth_dir.types_groups import SshRawGroup, SshRawGroups
+from nsf_ssh_auth_dir.types_users import SshRawUser, SshRawUsers
+
+_T = TypeVar("_T")
+
+
+def mk_snapshot(
+        n_users: int,
+        n_device_users: int,
+        n_states: int,
+        n_groups: int,
+        group_size: int,
+        grants: Tuple[int, int],
+        seed: int = 0
+) -> SshAuthDirSnapshot:
+    rnd = random.Random(seed)
+    users_names = [f"user-{i}" for i in range(n_users)]
+    raw_users = SshRawUsers.mk_empty()
+    for u_name in users_names:
+        raw_users.ssh_users[u_name] = SshRawUser.mk_new(u_name)
+
+    groups_names = [f"group-{i}" for i in range(n_groups)]
+    raw_groups = SshRawGroups({}, {
+        g_name: SshRawGroup(
+            {}, g_name, set(rnd.sample(users_names, group_size)))
+        for g_name in groups_names})
+
+    n_du_groups, n_du_users = grants
+    raw_auths: Dict[Optional[str], SshRawAuth] = {}
+    for state_name in [None] + [f"state-{i}" for i in range(n_states)]:
+        raw_auth = SshRawAuth.mk_empty()
+        for du_name in [""] + [f"du-{i}" for i in range(n_device_users)]:
+            raw_auth.device_users[du_name] = SshRawAuthDeviceUser(
+                {}, du_name,
+                set(rnd.sample(groups_names, n_du_groups)),
+                set(rnd.sample(users_names, n_du_users)))
+        raw_auths[state_name] = raw_auth
+
+    return SshAuthDirSnapshot(
+        Path("/nonexistent"), SshAuthDirRepoDefaultPolicy(),
+        raw_users, raw_groups, raw_auths)
+
+
+def timed(label: str, fn: Callable[[], _T]) -> Tuple[_T, float]:
+    start = time.perf_counter()
+    out = fn()
+    duration = time.perf_counter() - start
+    print(f"{label:<32} {duration:8.3f}s")
+    return out, duration
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--device-users", type=int, default=500)
+    parser.add_argument("--states", type=int, default=20)
+    parser.add_argument("--groups", type=int, default=1000)
+    parser.add_argument("--group-size", type=int, default=50)
+    parser.add_argument(
+        "--grants", type=int, nargs=2, default=(2, 5),
+        metavar=("GROUPS", "USERS"),
+        help="Granted groups and users per device user and state.")
+    args = parser.parse_args()
+
+    snapshot, _ = timed("build snapshot", lambda: mk_snapshot(
+        args.users, args.device_users, args.states, args.groups,
+        args.group_size, tuple(args.grants)))
+
+    sets, t_sets = timed(
+        "sets: resolve", lambda: SshAccessResolver().resolve(snapshot))
+    bits, t_bits = timed(
+        "bitsets: resolve",
+        lambda: SshAccessBitsetResolver().resolve(snapshot))
+    names, t_names = timed(
+        "bitsets: resolve_users_names",
+        lambda: SshAccessBitsetResolver().resolve_users_names(snapshot))
+
+    assert sets == bits
+    assert sum(len(v) for v in names.values()) == len(sets)
+    print(f"entries: {len(sets)}, speedup: resolve x{t_sets / t_bits:.1f}, "
+          f"users names x{t_sets / t_names:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Compare the text lines and bytes based authorized keys compile and
+dump paths on a synthetic *ssh auth dir*.
+
+Usage: `python benchmarks/bench_compile_output.py [--users N] ...`
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple, TypeVar
+
+from nsf_ssh_auth_dir.file_pubkey import load_ssh_pubkey
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_access_bitset import SshAccessBitsetResolver
+from nsf_ssh_auth_dir.repo_compile import (dump_compiled_authorized_keys,
+                                           get_authorized_keys_basename)
+
+_T = TypeVar("_T")
+
+
+def _ssh_string(value: bytes) -> bytes:
+    return len(value).to_bytes(4, "big") + value
+
+
+def _mk_pubkey_line(rnd: random.Random, i: int) -> str:
+    if i % 4:
+        blob = _ssh_string(b"ssh-ed25519") + _ssh_string(rnd.randbytes(32))
+        key_type = "ssh-ed25519"
+    else:
+        blob = _ssh_string(b"ssh-rsa") + _ssh_string(b"\x01\x00\x01") \
+            + _ssh_string(b"\x00" + rnd.randbytes(512))
+        key_type = "ssh-rsa"
+    return f"{key_type} {base64.b64encode(blob).decode()} user-{i}@host\n"
+
+
+def mk_dir(dir: Path, n_users: int, n_device_users: int) -> None:
+    rnd = random.Random(0)
+    users = [f"user-{i}" for i in range(n_users)]
+    pubkeys_dir = dir.joinpath("public-keys")
+    pubkeys_dir.mkdir(parents=True)
+    for i, u in enumerate(users):
+        pubkeys_dir.joinpath(f"{u}.pub").write_text(_mk_pubkey_line(rnd, i))
+
+    dir.joinpath("users.json").write_text(json.dumps(
+        {"ssh-users": {u: {} for u in users}}))
+    # Each device user is granted about half of the users.
+    dir.joinpath("authorized-always.json").write_text(json.dumps(
+        {"device-users": {
+            f"du-{i}": {"ssh-users": rnd.sample(users, n_users // 2)}
+            for i in range(n_device_users)}}))
+
+
+def resolve(dir: Path) -> Tuple[Dict[str, List[str]], Dict[str, Path]]:
+    """Users of each device user and their pubkey file, common to both
+        paths.
+    """
+    snapshot = mk_ssh_auth_dir_repo(dir).load_snapshot()
+    du_users = {
+        du_name: sorted(users) for du_name, users in
+        SshAccessBitsetResolver().resolve_users_names(snapshot).items()}
+    filenames = {
+        u: snapshot.get_user(u).pubkeys.selected_filename
+        for u in snapshot.users_names}
+    return du_users, filenames
+
+
+def load_text_lines(filenames: Dict[str, Path]) -> Dict[str, str]:
+    """The former path: pubkeys decoded to lines, then joined."""
+    out = {}
+    for u, fn in filenames.items():
+        with open(fn) as f:
+            out[u] = "".join(io.StringIO(f.read(), newline=None))
+    return out
+
+
+def dump_text_lines(
+        out_dir: Path,
+        du_users: Dict[str, List[str]],
+        pubkeys: Dict[str, str]
+) -> None:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for du_name, users in sorted(du_users.items()):
+        out_dir.joinpath(get_authorized_keys_basename(du_name)).write_text(
+            "".join(pubkeys[u] for u in users))
+
+
+def load_bytes(filenames: Dict[str, Path]) -> Dict[str, bytes]:
+    return {u: load_ssh_pubkey(fn).content for u, fn in filenames.items()}
+
+
+def dump_bytes(
+        out_dir: Path,
+        du_users: Dict[str, List[str]],
+        pubkeys: Dict[str, bytes]
+) -> None:
+    dump_compiled_authorized_keys(out_dir, {
+        du_name: [pubkeys[u] for u in users]
+        for du_name, users in du_users.items()})
+
+
+def timed(label: str, fn: Callable[[], _T]) -> Tuple[_T, float]:
+    start = time.perf_counter()
+    out = fn()
+    duration = time.perf_counter() - start
+    print(f"{label:<24} {duration:8.3f}s")
+    return out, duration
+
+
+def _read_outputs(out_dir: Path) -> List[Tuple[str, bytes]]:
+    return sorted((fn.name, fn.read_bytes()) for fn in out_dir.iterdir())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--device-users", type=int, default=100)
+    args = parser.parse_args()
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="bench-compile-"))
+    try:
+        dir = tmp_dir.joinpath("device-ssh")
+        timed("build dir", lambda: mk_dir(
+            dir, args.users, args.device_users))
+
+        (du_users, filenames), _ = timed("resolve", lambda: resolve(dir))
+        text_pubkeys, t_text_load = timed(
+            "text lines: load", lambda: load_text_lines(filenames))
+        _, t_text_dump = timed("text lines: dump", lambda: dump_text_lines(
+            tmp_dir.joinpath("out-text"), du_users, text_pubkeys))
+        pubkeys, t_load = timed("bytes: load", lambda: load_bytes(filenames))
+        _, t_dump = timed("bytes: dump", lambda: dump_bytes(
+            tmp_dir.joinpath("out-bytes"), du_users, pubkeys))
+
+        assert _read_outputs(tmp_dir.joinpath("out-text")) \
+            == _read_outputs(tmp_dir.joinpath("out-bytes"))
+        mb = sum(
+            len(pubkeys[u]) for users in du_users.values()
+            for u in users) / 1e6
+        print(f"output: {mb:.1f} MB, dump: text lines "
+              f"{mb / t_text_dump:.0f} MB/s, bytes {mb / t_dump:.0f} MB/s, "
+              f"load: x{t_text_load / t_load:.1f}")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare loading a synthetic *ssh auth dir* with and without the
+persistent parse cache.
+
+Usage: `python benchmarks/bench_parse_cache.py [--users N] ...`
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+from nsf_ssh_auth_dir.file_parse_cache import SshAuthDirParseCache
+from nsf_ssh_auth_dir.policy_repo import SshAuthDirRepoDefaultPolicy
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+
+_T = TypeVar("_T")
+
+
+def mk_dir(dir: Path, n_users: int, n_groups: int) -> None:
+    rnd = random.Random(0)
+    users = [f"user-{i}" for i in range(n_users)]
+    dir.mkdir(parents=True)
+    dir.joinpath("users.json").write_text(json.dumps({"ssh-users": {
+        u: {"pubkey-file-template": f"{u}.rsa.pub"} if i % 8 else {}
+        for i, u in enumerate(users)}}))
+    dir.joinpath("groups.json").write_text(json.dumps({"ssh-groups": {
+        f"group-{i}": {"members": rnd.sample(users, min(100, n_users))}
+        for i in range(n_groups)}}))
+    # Past the window within which files are not cached.
+    for fn in dir.iterdir():
+        os.utime(fn, (1, 1))
+
+
+def load(dir: Path, cache: Optional[SshAuthDirParseCache]) -> List[str]:
+    """What `user ls` with groups needs: every user parsed."""
+    repo = mk_ssh_auth_dir_repo(
+        dir, policy=SshAuthDirRepoDefaultPolicy(parse_cache=cache))
+    raw_users = repo.users.load_raw()
+    repo.groups.load_raw()
+    return [raw_users.ssh_users[n].name for n in raw_users.ssh_users]
+
+
+def timed(label: str, fn: Callable[[], _T]) -> Tuple[_T, float]:
+    start = time.perf_counter()
+    out = fn()
+    duration = time.perf_counter() - start
+    print(f"{label:<24} {duration:8.3f}s")
+    return out, duration
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--groups", type=int, default=1000)
+    args = parser.parse_args()
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="bench-parse-cache-"))
+    try:
+        dir = tmp_dir.joinpath("device-ssh")
+        timed("build dir", lambda: mk_dir(dir, args.users, args.groups))
+        cache = SshAuthDirParseCache(tmp_dir.joinpath("cache"))
+
+        expected, t_uncached = timed("no cache", lambda: load(dir, None))
+        _, t_cold = timed("cold cache", lambda: load(dir, cache))
+        actual, t_warm = timed("warm cache", lambda: load(dir, cache))
+
+        assert expected == actual
+        assert 2 == cache.hits
+        print(f"users: {args.users}, cache: {cache.stats().size / 1e6:.1f} MB, "
+              f"warm: x{t_uncached / t_warm:.1f}, "
+              f"cold overhead: x{t_cold / t_uncached:.2f}")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Compare per user pubkey lookups with and without the shared lookup
+plan on a synthetic *ssh auth dir*.
+
+Usage: `python benchmarks/bench_pubkey_lookup.py [--users N] ...`
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple, TypeVar
+
+from nsf_ssh_auth_dir._io_stats import (IoStats, disable_io_stats,
+                                        enable_io_stats)
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_user_pubkeys import get_pubkey_lookup_plan
+from nsf_ssh_auth_dir.repo_users import SshUser
+
+_T = TypeVar("_T")
+
+
+def mk_dir(dir: Path, n_users: int) -> None:
+    """Two search dirs and templates, half of the users' keys being
+        found at the last candidate.
+    """
+    users = [f"user-{i}" for i in range(n_users)]
+    for rdir in ("public-keys-override", "public-keys"):
+        dir.joinpath(rdir).mkdir(parents=True)
+    pubkeys_dir = dir.joinpath("public-keys")
+    for i, u in enumerate(users):
+        suffix = ".rsa.pub" if i % 2 else ".pub"
+        pubkeys_dir.joinpath(f"{u}{suffix}").write_text(f"{u}\n")
+
+    dir.joinpath("users.json").write_text(json.dumps({
+        "ssh-user-defaults": {
+            "pubkey-file-template": [
+                "${ssh-user.name}.rsa.pub", "${ssh-user.name}.pub"],
+            "pubkey-file-search-path": [
+                "./public-keys-override", "./public-keys"],
+        },
+        "ssh-users": {u: {} for u in users},
+    }))
+
+
+def lookup(dir: Path, with_plan: bool) -> Tuple[List[Path], IoStats]:
+    repo = mk_ssh_auth_dir_repo(dir)
+    raw_users = repo.users.load_raw()
+    defaults = raw_users.ssh_user_defaults
+    stats = enable_io_stats()
+    try:
+        plan = get_pubkey_lookup_plan(
+            repo.dir, defaults, repo.policy.pubkey) if with_plan else None
+        out = [
+            SshUser(
+                repo.dir, raw, defaults, repo.policy.pubkey,
+                lookup_plan=plan).pubkeys.selected_filename
+            for raw in raw_users.ssh_users.values()]
+    finally:
+        disable_io_stats()
+    return out, stats
+
+
+def timed(label: str, fn: Callable[[], _T]) -> Tuple[_T, float]:
+    start = time.perf_counter()
+    out = fn()
+    duration = time.perf_counter() - start
+    print(f"{label:<24} {duration:8.3f}s")
+    return out, duration
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50000)
+    args = parser.parse_args()
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="bench-pubkey-lookup-"))
+    try:
+        dir = tmp_dir.joinpath("device-ssh")
+        timed("build dir", lambda: mk_dir(dir, args.users))
+
+        (expected, stats), t_former = timed(
+            "per user lookup", lambda: lookup(dir, False))
+        print(f"  stat calls: {stats.stat_calls}")
+        (actual, stats), t_plan = timed(
+            "shared lookup plan", lambda: lookup(dir, True))
+        print(f"  stat calls: {stats.stat_calls}")
+
+        assert expected == actual
+        print(f"users: {args.users}, "
+              f"per user: {t_former / args.users * 1e6:.1f}us -> "
+              f"{t_plan / args.users * 1e6:.1f}us, x{t_former / t_plan:.1f}")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Compare the former per field validation of parsed files with the
+compiled schema validators on synthetic users, groups and auth content.
+
+Usage: `python benchmarks/bench_schema_validation.py [--users N] ...`
+"""
+import argparse
+import random
+import time
+from typing import Any, Callable, Dict, Tuple, TypeVar
+
+from nsf_ssh_auth_dir.file_auth import _SSH_AUTH_VALIDATOR
+from nsf_ssh_auth_dir.file_groups import _SSH_GROUPS_VALIDATOR
+from nsf_ssh_auth_dir.file_users import (parse_ssh_users,
+                                         validate_plain_ssh_users)
+
+_T = TypeVar("_T")
+
+
+def _get_field(content: Dict[str, Any], field_name: str,
+               expected_types: Tuple[type, ...]) -> Any:
+    """The former `get_field_of_expected_type`."""
+    field_value = content.get(field_name, None)
+    if not isinstance(expected_types, tuple):
+        expected_types = (expected_types,)
+    if not isinstance(field_value, expected_types):
+        raise ValueError(field_name)
+    return field_value
+
+
+def _get_opt_field(content: Dict[str, Any], field_name: str,
+                   expected_types: Tuple[type, ...]) -> Any:
+    return _get_field(
+        content, field_name, expected_types + (type(None),))
+
+
+def _get_opt_list_field(content: Dict[str, Any], field_name: str,
+                        expected_types: Tuple[type, ...]) -> Any:
+    opt_list = _get_field(content, field_name, (list, type(None)))
+    if opt_list is None:
+        return opt_list
+    for x in opt_list:
+        if not isinstance(x, expected_types):
+            raise ValueError(field_name)
+    return opt_list
+
+
+def former_validate_users(plain: Dict[str, Any]) -> None:
+    for u_plain in plain["ssh-users"].values():
+        for field in (
+                "pubkey-file-template", "pubkey-file-search-path",
+                "pubkey-file"):
+            _get_opt_field(u_plain, field, (str,))
+
+
+def former_validate_groups(plain: Dict[str, Any]) -> None:
+    for g_plain in plain["ssh-groups"].values():
+        _get_opt_list_field(g_plain, "members", (str,))
+
+
+def former_validate_auth(plain: Dict[str, Any]) -> None:
+    for du_plain in plain["device-users"].values():
+        _get_opt_list_field(du_plain, "ssh-groups", (str,))
+        _get_opt_list_field(du_plain, "ssh-users", (str,))
+
+
+def mk_contents(
+        n_users: int, n_groups: int, n_device_users: int
+) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    rnd = random.Random(0)
+    users = [f"user-{i}" for i in range(n_users)]
+    groups = [f"group-{i}" for i in range(n_groups)]
+    users_plain = {"ssh-users": {
+        u: {"pubkey-file-template": f"{u}.rsa.pub"} if i % 8 else {}
+        for i, u in enumerate(users)}}
+    groups_plain = {"ssh-groups": {
+        g: {"members": rnd.sample(users, min(50, n_users))} for g in groups}}
+    auth_plain = {"device-users": {
+        f"du-{i}": {
+            "ssh-groups": rnd.sample(groups, min(20, n_groups)),
+            "ssh-users": rnd.sample(users, min(500, n_users))}
+        for i in range(n_device_users)}}
+    return users_plain, groups_plain, auth_plain
+
+
+def timed(label: str, fn: Callable[[], _T],
+          repeat: int = 5) -> Tuple[_T, float]:
+    """Best of `repeat` runs."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        durations.append(time.perf_counter() - start)
+    duration = min(durations)
+    print(f"{label:<24} {duration:8.3f}s")
+    return out, duration
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--groups", type=int, default=10000)
+    parser.add_argument("--device-users", type=int, default=200)
+    args = parser.parse_args()
+
+    users, groups, auth = mk_contents(
+        args.users, args.groups, args.device_users)
+    for label, content, former, compiled in [
+            ("users", users, former_validate_users,
+             validate_plain_ssh_users),
+            ("groups", groups, former_validate_groups,
+             _SSH_GROUPS_VALIDATOR.iter_errors),
+            ("auth", auth, former_validate_auth,
+             _SSH_AUTH_VALIDATOR.iter_errors)]:
+        _, t_former = timed(
+            f"{label}: per field", lambda: former(content))  # noqa: B023
+        _, t_compiled = timed(
+            f"{label}: compiled", lambda: compiled(content))  # noqa: B023
+        print(f"  x{t_former / t_compiled:.1f}")
+
+    # What loading users with every user accessed costs overall.
+    def access_all() -> None:
+        users_d = parse_ssh_users(users).ssh_users
+        for name in users_d:
+            users_d[name]
+    timed("users: parse all", access_all)
+
+
+if __name__ == "__main__":
+    main()
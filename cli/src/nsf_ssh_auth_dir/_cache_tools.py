@@ -0,0 +1,47 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Optional
+
+
+def get_cache_dir() -> Path:
+    """The per user cache dir of this tool (XDG base dir spec)."""
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME")
+    if xdg_cache_home:
+        base = Path(xdg_cache_home)
+    else:
+        base = Path.home().joinpath(".cache")
+    return base.joinpath("nsf-ssh-auth-dir")
+
+
+def get_dir_cache_filename(dir: Path, stem: str, suffix: str) -> Path:
+    """A cache file dedicated to `dir` (e.g.: an *ssh auth dir*)."""
+    dir_key = hashlib.sha256(str(dir.resolve()).encode()).hexdigest()[:16]
+    return get_cache_dir().joinpath(f"{stem}-{dir_key}{suffix}")
+
+
+def load_json_cache_file(filename: Path) -> Optional[Any]:
+    """Return `None` when missing or unreadable. Caches are never an error."""
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def dump_json_cache_file(filename: Path, content: Any) -> None:
+    """Atomically replace `filename` so that concurrent readers never
+        see a partial cache file. Failures are silently ignored.
+    """
+    tmp_filename = filename.with_name(f".{filename.name}.{os.getpid()}.tmp")
+    try:
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_filename, "w") as f:
+            json.dump(content, f)
+        os.replace(tmp_filename, filename)
+    except OSError:
+        try:
+            tmp_filename.unlink()
+        except OSError:
+            pass
@@ -1,9 +1,15 @@
 from pathlib import Path
-from typing import Dict, Any, Iterator, Tuple, Callable, Union
+from typing import Dict, Any, Iterator, Callable, Union
 
 import json
 import yaml
 
+from ._file_txn_tools import get_file_txn, read_file_bytes, write_file_bytes
+from ._io_stats import record_dump, record_parse, record_read, timed_phase
+from .types_observer import (NOOP_OBSERVER, SshAuthDirFileDumpEvent,
+                             SshAuthDirFileLoadEvent, SshAuthDirFileParseEvent,
+                             SshAuthDirRepoObserver, get_observer_clock)
+
 
 class FileContentError(Exception):
     pass
@@ -20,140 +26,147 @@ class FileContentFormatError(FileContentError):
 FileContentPlainT = Dict[str, Any]
 
 
+def _read_file_bytes(
+        filename: Path, observer: SshAuthDirRepoObserver) -> bytes:
+    start = get_observer_clock() if observer.enabled else 0.0
+    with timed_phase("read"):
+        try:
+            content = read_file_bytes(filename)
+        except FileNotFoundError as e:
+            raise FileContentAccessError(str(e))
+
+    record_read(filename, len(content))
+    if observer.enabled:
+        observer.on_event(SshAuthDirFileLoadEvent(
+            get_observer_clock() - start, filename, len(content)))
+    return content
+
+
 def _load_content_from_json_file(
-        filename: Path) -> FileContentPlainT:
+        filename: Path, observer: SshAuthDirRepoObserver) -> FileContentPlainT:
+    content = _read_file_bytes(filename, observer)
 
-    try:
-        with open(filename) as f:
+    start = get_observer_clock() if observer.enabled else 0.0
+    with timed_phase("parse"):
+        try:
             # We want to preserve key order. Json already does that.
-            out = json.load(f)
-    except FileNotFoundError as e:
-        raise FileContentAccessError(str(e))
-    except json.decoder.JSONDecodeError as e:
-        raise FileContentFormatError(f"Not a valid json file: {str(e)}") from e
+            out = json.loads(content)
+        except json.decoder.JSONDecodeError as e:
+            raise FileContentFormatError(
+                f"Not a valid json file: {str(e)}") from e
+    record_parse(filename)
+    if observer.enabled:
+        observer.on_event(SshAuthDirFileParseEvent(
+            get_observer_clock() - start, filename))
 
     assert out is not None
     return out
 
 
 def _load_content_from_yaml_file(
-        filename: Path) -> FileContentPlainT:
-    try:
-        with open(filename) as f:
-            # We want to preserve key order.
-            # Yaml already does that on load.
-            out = yaml.safe_load(f)
-    except FileNotFoundError as e:
-        raise FileContentAccessError(str(e))
+        filename: Path, observer: SshAuthDirRepoObserver) -> FileContentPlainT:
+    content = _read_file_bytes(filename, observer)
+
+    start = get_observer_clock() if observer.enabled else 0.0
+    with timed_phase("parse"):
+        # We want to preserve key order.
+        # Yaml already does that on load.
+        out = yaml.safe_load(content)
+    record_parse(filename)
+    if observer.enabled:
+        observer.on_event(SshAuthDirFileParseEvent(
+            get_observer_clock() - start, filename))
 
     assert out is not None
     return out
 
 
 def load_content_from_file(
-        filename: Path) -> FileContentPlainT:
+        filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
+) -> FileContentPlainT:
     if ".yaml" == filename.suffix:
-        return _load_content_from_yaml_file(filename)
+        return _load_content_from_yaml_file(filename, observer)
 
     assert ".json" == filename.suffix
-    return _load_content_from_json_file(filename)
-
-
-def get_field_of_expected_type(
-        content: FileContentPlainT,
-        field_name: str,
-        expected_types: Union[type, Tuple[type, ...]],
-        exception_cls: Callable[[str], Exception]) -> Any:
-    field_value = content.get(field_name, None)
+    return _load_content_from_json_file(filename, observer)
 
-    if not isinstance(expected_types, tuple):
-        expected_types = (expected_types,)
 
-    if not isinstance(field_value, expected_types):
-        expected_types_str = ", ".join(t.__name__ for t in expected_types)
-        raise exception_cls(
-            f"'{field_name}' field not in expected "
-            f"type set {{{expected_types_str}}} "
-            "but instead was "
-            f"found to be of type '{type(field_value).__name__}'."
-        )
-
-    assert isinstance(field_value, expected_types)
-    return field_value
-
-
-def get_opt_field_of_expected_type(
-        content: FileContentPlainT,
-        field_name: str,
-        expected_types: Union[type, Tuple[type, ...]],
-        exception_cls: Callable[[str], Exception]) -> Any:
-
-    if not isinstance(expected_types, tuple):
-        expected_types = (expected_types,)
-
-    return get_field_of_expected_type(
-        content, field_name, expected_types + (type(None),), exception_cls)
-
-
-def get_opt_list_field_of_expected_type(
-        content: FileContentPlainT,
-        field_name: str,
-        expected_types: Union[type, Tuple[type, ...]],
-        exception_cls: Callable[[str], Exception]) -> Any:
-    if not isinstance(expected_types, tuple):
-        expected_types = (expected_types,)
-
-    opt_list = get_field_of_expected_type(
-        content, field_name, (list, type(None)), exception_cls)
-
-    if opt_list is None:
-        return opt_list
-
-    for idx, x in enumerate(opt_list):
-        if not isinstance(x, expected_types):
-            expected_types_str = ", ".join(t.__name__ for t in expected_types)
-            raise exception_cls(
-                f"'{field_name}' list field at index {idx} not in expected "
-                f"type set {{{expected_types_str}}} but instead was "
-                f"found to be of type '{type(x).__name__}'."
-            )
-
-    return opt_list
-
-
-def _dump_content_to_yaml_file(
-        content: FileContentPlainT,
-        out_filename: Path
-) -> None:
-    with open(out_filename, 'w') as of:
-        # We want to preserve key order, thus the `sort_keys=False`.
-        yaml.safe_dump(content, of, sort_keys=False)
-
-
-def _dump_content_to_json_file(
-        content: FileContentPlainT,
-        out_filename: Path
-) -> None:
-    with open(out_filename, 'w') as of:
-        # We want to preserve key order, thus the `sort_keys=False`.
-        json.dump(
-            content,
-            of,
-            sort_keys=False,
-            indent=2,
-            separators=(',', ': ')
-        )
+def parse_content_from_bytes(
+        content: bytes, suffix: str) -> FileContentPlainT:
+    """Same as `load_content_from_file` but for in memory content
+        (e.g.: a blob read from git).
+    """
+    try:
+        if ".yaml" == suffix:
+            out = yaml.safe_load(content)
+        else:
+            assert ".json" == suffix
+            out = json.loads(content)
+    except (ValueError, yaml.YAMLError) as e:
+        raise FileContentFormatError(
+            f"Not a valid '{suffix}' content: {str(e)}") from e
+
+    if not isinstance(out, dict):
+        raise FileContentFormatError(
+            f"Expected top level object but got '{type(out).__name__}'.")
+    return out
 
 
 def dump_content_to_file(
         content: FileContentPlainT,
-        out_filename: Path
+        out_filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
 ) -> None:
-    if ".yaml" == out_filename.suffix:
-        return _dump_content_to_yaml_file(content, out_filename)
+    start = get_observer_clock() if observer.enabled else 0.0
+    with timed_phase("dump"):
+        out_bytes = format_content_as_bytes(content, out_filename.suffix)
+        write_file_bytes(out_filename, out_bytes)
+
+    nbytes = len(out_bytes)
+    record_dump(out_filename)
+    if observer.enabled:
+        observer.on_event(SshAuthDirFileDumpEvent(
+            get_observer_clock() - start, out_filename, nbytes))
+
+
+def format_content_as_bytes(
+        content: FileContentPlainT, suffix: str) -> bytes:
+    """Same output as `dump_content_to_file` but in memory."""
+    if ".yaml" == suffix:
+        return yaml.safe_dump(content, sort_keys=False).encode()
+
+    assert ".json" == suffix
+    return json.dumps(
+        content,
+        sort_keys=False,
+        indent=2,
+        separators=(',', ': ')
+    ).encode()
+
+
+def dump_content_to_file_if_changed(
+        content: FileContentPlainT,
+        out_filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
+) -> bool:
+    """Same as `dump_content_to_file` but leave the file untouched
+        (mtime included) when it already holds this exact content.
+
+    Return whether the file was written.
+    """
+    out_bytes = format_content_as_bytes(content, out_filename.suffix)
+    try:
+        # Cheap size check first, most changes alter the size.
+        if (get_file_txn() is not None
+                or out_filename.stat().st_size == len(out_bytes)) \
+                and read_file_bytes(out_filename) == out_bytes:
+            return False
+    except FileNotFoundError:
+        pass
 
-    assert ".json" == out_filename.suffix
-    return _dump_content_to_json_file(content, out_filename)
+    dump_content_to_file(content, out_filename, observer)
+    return True
 
 
 def dump_content_as_yaml_lines(
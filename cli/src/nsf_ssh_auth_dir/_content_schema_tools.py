@@ -0,0 +1,199 @@
+"""Declarative schemas of files' plain content, compiled once into
+validator functions.
+
+A schema is compiled into the source of a single python function
+specialized for it (nested lists and objects becoming nested loops)
+which checks a whole (sub) document in one traversal. It collects all
+errors, each along with its json path (e.g.:
+`$['ssh-users']['my-user']['pubkey-file']`), instead of stopping at the
+first one.
+
+As with our file formats, a missing object field is the same as a
+`null` one and unknown fields are ignored.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+# A path is a linked list of `(parent path, key)`, `None` being the root,
+# only built and formatted on errors.
+JsonPathT = Optional[Tuple[Any, Union[str, int]]]
+_ErrorsT = List[Tuple[JsonPathT, str]]
+_ValidatorFnT = Callable[[Any, JsonPathT, _ErrorsT], None]
+
+_NONE_TYPE = type(None)
+
+
+class Schema:
+    pass
+
+
+class OfType(Schema):
+    def __init__(self, *types: type) -> None:
+        self.types = types
+
+
+class Opt(Schema):
+    """`null` (or missing) or `schema`."""
+    def __init__(self, schema: Schema) -> None:
+        self.schema = schema
+
+
+class ListOf(Schema):
+    def __init__(self, items: Schema) -> None:
+        self.items = items
+
+
+class MapOf(Schema):
+    """An object of arbitrary keys (e.g.: entity names) to `values`."""
+    def __init__(self, values: Schema) -> None:
+        self.values = values
+
+
+class Object(Schema):
+    def __init__(self, fields: Dict[str, Schema]) -> None:
+        self.fields = fields
+
+
+def format_json_path(path: JsonPathT) -> str:
+    keys: List[Union[str, int]] = []
+    while path is not None:
+        path, key = path
+        keys.append(key)
+    return "$" + "".join(
+        f"[{k}]" if isinstance(k, int) else f"['{k}']"
+        for k in reversed(keys))
+
+
+def _mk_type_error(types: Tuple[type, ...], value: Any) -> str:
+    types_str = ", ".join(t.__name__ for t in types)
+    return (
+        f"not in expected type set {{{types_str}}} but instead was "
+        f"found to be of type '{type(value).__name__}'.")
+
+
+def _get_scalar_types(schema: Schema) -> Optional[Tuple[type, ...]]:
+    """The types accepted by `schema` when it only checks `value`'s type."""
+    if isinstance(schema, OfType):
+        return schema.types
+    if isinstance(schema, Opt) and isinstance(schema.schema, OfType):
+        return schema.schema.types + (_NONE_TYPE,)
+    return None
+
+
+class _Compiler:
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        # Type tuples, bound as globals of the generated function.
+        self.consts: Dict[str, Tuple[type, ...]] = {}
+        self._n_vars = 0
+
+    def _var(self, prefix: str) -> str:
+        self._n_vars += 1
+        return f"{prefix}{self._n_vars}"
+
+    def _const(self, types: Tuple[type, ...]) -> str:
+        name = f"T{len(self.consts)}"
+        self.consts[name] = types
+        return name
+
+    def _emit(self, indent: int, line: str) -> None:
+        self.lines.append("    " * indent + line)
+
+    def _emit_type_check(
+            self, types: Tuple[type, ...], var: str, path: str,
+            indent: int) -> None:
+        t = self._const(types)
+        self._emit(indent, f"if not isinstance({var}, {t}):")
+        self._emit(
+            indent + 1, f"errors.append(({path}, type_error({t}, {var})))")
+
+    def emit(self, schema: Schema, var: str, path: str, indent: int) -> None:
+        """Emit the checks of `var` against `schema`, `path` being the
+            expression of `var`'s path.
+        """
+        scalar_types = _get_scalar_types(schema)
+        if scalar_types is not None:
+            self._emit_type_check(scalar_types, var, path, indent)
+        elif isinstance(schema, Opt):
+            self._emit(indent, f"if {var} is not None:")
+            self.emit(schema.schema, var, path, indent + 1)
+        elif isinstance(schema, ListOf):
+            self._emit_type_check((list,), var, path, indent)
+            i, x = self._var("i"), self._var("x")
+            self._emit(indent, "else:")
+            items_types = _get_scalar_types(schema.items)
+            if items_types is None:
+                self._emit(indent + 1, f"for {i}, {x} in enumerate({var}):")
+                self.emit(schema.items, x, f"({path}, {i})", indent + 2)
+                return
+            # Scalar lists (e.g.: of names) being the bulk of our files,
+            # items' indexes are only tracked once an error is found.
+            t = self._const(items_types)
+            self._emit(indent + 1, f"for {x} in {var}:")
+            self._emit(indent + 2, f"if not isinstance({x}, {t}):")
+            self._emit(indent + 3, f"for {i}, {x} in enumerate({var}):")
+            self._emit_type_check(
+                items_types, x, f"({path}, {i})", indent + 4)
+            self._emit(indent + 3, "break")
+        elif isinstance(schema, MapOf):
+            self._emit_type_check((dict,), var, path, indent)
+            k, x = self._var("k"), self._var("x")
+            self._emit(indent, "else:")
+            self._emit(indent + 1, f"for {k}, {x} in {var}.items():")
+            self.emit(schema.values, x, f"({path}, {k})", indent + 2)
+        else:
+            assert isinstance(schema, Object)
+            self._emit_type_check((dict,), var, path, indent)
+            self._emit(indent, "else:")
+            get = self._var("get")
+            self._emit(indent + 1, f"{get} = {var}.get")
+            for key, field_schema in schema.fields.items():
+                f = self._var("f")
+                self._emit(indent + 1, f"{f} = {get}({key!r})")
+                self.emit(field_schema, f, f"({path}, {key!r})", indent + 1)
+
+
+def _compile(schema: Schema) -> _ValidatorFnT:
+    compiler = _Compiler()
+    compiler.emit(schema, "value", "path", 1)
+    source = "\n".join(
+        ["def validate(value, path, errors):"] + compiler.lines)
+    namespace: Dict[str, Any] = {
+        "type_error": _mk_type_error, **compiler.consts}
+    exec(compile(source, "<schema validator>", "exec"), namespace)
+    return namespace["validate"]
+
+
+class SchemaValidator:
+    """A schema compiled once, to be kept (e.g.: at module level) and
+        used for any number of documents.
+    """
+    def __init__(self, schema: Schema) -> None:
+        self._validate = _compile(schema)
+
+    def iter_errors(
+            self, value: Any, path: JsonPathT = None) -> List[str]:
+        """As `<json path>: <message>`, in document order."""
+        errors: _ErrorsT = []
+        self._validate(value, path, errors)
+        return [f"{format_json_path(p)}: {msg}" for p, msg in errors]
+
+    def check(
+            self,
+            value: Any,
+            exception_cls: Callable[[str], Exception],
+            path: JsonPathT = None
+    ) -> None:
+        """Raise `exception_cls` listing all errors, if any.
+
+        `path` is `value`'s path within its document.
+        """
+        errors: _ErrorsT = []
+        self._validate(value, path, errors)
+        if not errors:
+            return
+
+        lines = [f"{format_json_path(p)}: {msg}" for p, msg in errors]
+        if 1 == len(lines):
+            raise exception_cls(lines[0])
+        raise exception_cls(
+            f"{len(lines)} errors:\n" + "\n".join(f"  {ln}" for ln in lines))
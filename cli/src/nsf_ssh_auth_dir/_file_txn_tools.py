@@ -0,0 +1,180 @@
+"""Per thread deferral of file writes (see `repo_journal`).
+
+While a `FileTxn` is active, writes and removals through these helpers
+are only recorded. Reads and dir listings through these helpers see the
+recorded changes. Without a transaction, each helper costs a single
+thread local lookup on top of the plain file operation.
+"""
+import os
+import threading
+from contextlib import AbstractContextManager, ExitStack
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from ._io_stats import record_write
+
+
+class FileTxn:
+    def __init__(self) -> None:
+        # `None` for removed files. In recording order.
+        self.changes: Dict[Path, Optional[bytes]] = {}
+        # Removed files whose dir should be removed too when left empty.
+        self.rm_empty_parents: Set[Path] = set()
+        # The file locks held until the end, recorded in the journal so
+        # that recovery takes them too.
+        self.lock_filenames: Set[Path] = set()
+        self._held = ExitStack()
+        self._on_commit: List[Callable[[], None]] = []
+
+    def on_commit(self, fn: Callable[[], None]) -> None:
+        """Call `fn` once this transaction's changes are durable."""
+        self._on_commit.append(fn)
+
+    def run_on_commit(self) -> None:
+        on_commit, self._on_commit = self._on_commit, []
+        for fn in on_commit:
+            fn()
+
+    def hold(self, cm: AbstractContextManager) -> None:
+        """Keep `cm` entered (e.g.: a file lock) until this transaction
+            ends.
+        """
+        self._held.enter_context(cm)
+
+    def hold_lock(self, cm: AbstractContextManager, filename: Path) -> None:
+        """Same as `hold` for the file lock at `filename`."""
+        self.hold(cm)
+        self.lock_filenames.add(filename)
+
+    def release(self) -> None:
+        self._held.close()
+
+    def write_bytes(self, filename: Path, content: bytes) -> None:
+        # Moves the file to the end, as last changed.
+        self.rm_empty_parents.discard(filename)
+        self.changes.pop(filename, None)
+        self.changes[filename] = content
+
+    def unlink(self, filename: Path) -> None:
+        self.changes.pop(filename, None)
+        self.changes[filename] = None
+
+    def overlay_dir_listing(
+            self, dir: Path, filenames: Iterable[Path], suffix: str
+    ) -> List[Path]:
+        out = {fn: None for fn in filenames}
+        for fn, content in self.changes.items():
+            if fn.parent != dir or fn.suffix != suffix:
+                continue
+            if content is None:
+                out.pop(fn, None)
+            else:
+                out[fn] = None
+        return list(out)
+
+
+_LOCAL = threading.local()
+# Bumped on each actual file write or removal (e.g.: so that dir listings
+# can be cached until then).
+_WRITE_GENERATION = 0
+
+
+def get_write_generation() -> int:
+    return _WRITE_GENERATION
+
+
+def bump_write_generation() -> None:
+    global _WRITE_GENERATION
+    _WRITE_GENERATION += 1
+
+
+def get_file_txn() -> Optional[FileTxn]:
+    return getattr(_LOCAL, "txn", None)
+
+
+def set_file_txn(txn: Optional[FileTxn]) -> None:
+    _LOCAL.txn = txn
+
+
+def read_file_bytes(filename: Path) -> bytes:
+    """Raises:
+        FileNotFoundError: Including when removed by the transaction.
+    """
+    txn = get_file_txn()
+    if txn is not None and filename in txn.changes:
+        content = txn.changes[filename]
+        if content is None:
+            raise FileNotFoundError(f"No such file: '{filename}'")
+        return content
+
+    # Unbuffered, a single read into a buffer sized from `fstat`.
+    with open(filename, "rb", buffering=0) as f:
+        return f.read()
+
+
+def file_exists(filename: Path) -> bool:
+    txn = get_file_txn()
+    if txn is not None and filename in txn.changes:
+        return txn.changes[filename] is not None
+    return filename.exists()
+
+
+def write_file_bytes(filename: Path, content: bytes) -> None:
+    txn = get_file_txn()
+    if txn is not None:
+        txn.write_bytes(filename, content)
+    else:
+        with open(filename, "wb") as f:
+            f.write(content)
+        bump_write_generation()
+    record_write(filename, len(content))
+
+
+def unlink_file(filename: Path, rm_empty_parent: bool = False) -> None:
+    """Raises:
+        FileNotFoundError: When not there to begin with.
+    """
+    txn = get_file_txn()
+    if txn is not None:
+        if not file_exists(filename):
+            raise FileNotFoundError(f"No such file: '{filename}'")
+        txn.unlink(filename)
+        if rm_empty_parent:
+            txn.rm_empty_parents.add(filename)
+        return
+
+    filename.unlink()
+    bump_write_generation()
+    if rm_empty_parent:
+        try:
+            filename.parent.rmdir()
+        except OSError:
+            pass
+
+
+def fsync_paths(filenames: Iterable[Path]) -> None:
+    """Make the content of `filenames` and their dir entries durable.
+
+    Removed files only have their dir synced.
+    """
+    dirs = set()
+    for fn in filenames:
+        dirs.add(fn.parent)
+        try:
+            fd = os.open(fn, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    for dir in sorted(dirs):
+        try:
+            fd = os.open(dir, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
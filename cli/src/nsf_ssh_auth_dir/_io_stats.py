@@ -0,0 +1,174 @@
+"""Process wide, opt-in file io counters.
+
+Disabled by default in which case each instrumentation point costs a
+single global lookup. See the cli's `--stats` option.
+"""
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+
+class IoStats:
+    def __init__(self) -> None:
+        self.start_time = time.perf_counter()
+        self.files_opened = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        # Both `stat` and `access` like syscalls.
+        self.stat_calls = 0
+        self.parses: Dict[str, int] = {}
+        self.dumps: Dict[str, int] = {}
+        self.phase_times: Dict[str, float] = {}
+        self.phase_calls: Dict[str, int] = {}
+        # Only counts lock acquisitions which had to wait.
+        self.lock_waits = 0
+        self.lock_wait_time = 0.0
+        self.lock_timeouts = 0
+        # Optimistic mutations retried (see `repo_mutation`).
+        self.conflicts = 0
+
+    @property
+    def wall_time(self) -> float:
+        return time.perf_counter() - self.start_time
+
+
+_STATS: Optional[IoStats] = None
+
+
+def enable_io_stats() -> IoStats:
+    global _STATS
+    _STATS = IoStats()
+    return _STATS
+
+
+def disable_io_stats() -> None:
+    global _STATS
+    _STATS = None
+
+
+def get_io_stats() -> Optional[IoStats]:
+    return _STATS
+
+
+def record_read(filename: Path, nbytes: int) -> None:
+    stats = _STATS
+    if stats is None:
+        return
+    stats.files_opened += 1
+    stats.bytes_read += nbytes
+
+
+def record_write(filename: Path, nbytes: int) -> None:
+    stats = _STATS
+    if stats is None:
+        return
+    stats.files_opened += 1
+    stats.bytes_written += nbytes
+
+
+def record_parse(filename: Path) -> None:
+    stats = _STATS
+    if stats is None:
+        return
+    key = str(filename)
+    stats.parses[key] = stats.parses.get(key, 0) + 1
+
+
+def record_dump(filename: Path) -> None:
+    stats = _STATS
+    if stats is None:
+        return
+    key = str(filename)
+    stats.dumps[key] = stats.dumps.get(key, 0) + 1
+
+
+def record_stat_call(count: int = 1) -> None:
+    stats = _STATS
+    if stats is None:
+        return
+    stats.stat_calls += count
+
+
+def record_lock_wait(seconds: float, timed_out: bool = False) -> None:
+    stats = _STATS
+    if stats is None:
+        return
+    stats.lock_waits += 1
+    stats.lock_wait_time += seconds
+    if timed_out:
+        stats.lock_timeouts += 1
+
+
+def record_conflict() -> None:
+    stats = _STATS
+    if stats is None:
+        return
+    stats.conflicts += 1
+
+
+class _TimedPhase:
+    __slots__ = ("_stats", "_name", "_start")
+
+    def __init__(self, stats: IoStats, name: str) -> None:
+        self._stats = stats
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *args) -> None:
+        elapsed = time.perf_counter() - self._start
+        stats = self._stats
+        stats.phase_times[self._name] = (
+            stats.phase_times.get(self._name, 0.0) + elapsed)
+        stats.phase_calls[self._name] = (
+            stats.phase_calls.get(self._name, 0) + 1)
+
+
+class _NoopPhase:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+_NOOP_PHASE = _NoopPhase()
+
+
+def timed_phase(name: str):
+    """Accumulate the wall time spent in the `with` block under `name`."""
+    stats = _STATS
+    if stats is None:
+        return _NOOP_PHASE
+    return _TimedPhase(stats, name)
+
+
+def _fmt_filename(filename: str) -> str:
+    try:
+        return str(Path(filename).relative_to(Path.cwd()))
+    except ValueError:
+        return filename
+
+
+def format_io_stats_lines(stats: IoStats) -> Iterator[str]:
+    yield f"wall time: {stats.wall_time:.6f}s"
+    yield (
+        f"files opened: {stats.files_opened} "
+        f"(bytes read: {stats.bytes_read}, "
+        f"bytes written: {stats.bytes_written})")
+    yield f"stat / access calls: {stats.stat_calls}"
+    for title, counts in [("parses", stats.parses), ("dumps", stats.dumps)]:
+        yield f"{title}: {sum(counts.values())}"
+        for fn, count in sorted(counts.items()):
+            yield f"  {_fmt_filename(fn)}: {count}"
+    yield (
+        f"lock waits: {stats.lock_waits} "
+        f"({stats.lock_wait_time:.6f}s, timeouts: {stats.lock_timeouts})")
+    yield f"optimistic write conflicts: {stats.conflicts}"
+    for name, t in sorted(stats.phase_times.items()):
+        calls = stats.phase_calls[name]
+        yield f"phase '{name}': {t:.6f}s ({calls} calls)"
@@ -0,0 +1,87 @@
+from typing import (Any, Callable, Dict, Generic, Iterator, MutableMapping,
+                    Optional, Tuple, Type, TypeVar)
+
+_V = TypeVar("_V")
+
+_PlainEntryT = Dict[str, Any]
+
+
+class LazyParsedDict(MutableMapping[str, _V], Generic[_V]):
+    """A name to parsed entry mapping whose entries are only parsed (and
+        validated) on first access.
+
+    Key order is preserved. Listing, counting or testing for names never
+    parses anything.
+    """
+    def __init__(
+            self,
+            plain_entries: Dict[str, _PlainEntryT],
+            parse_fn: Callable[[str, _PlainEntryT], _V]
+    ) -> None:
+        # Values are either plain (unparsed) or parsed entries.
+        self._entries: Dict[str, Any] = dict(plain_entries)
+        self._unparsed = set(self._entries.keys())
+        self._parse_fn = parse_fn
+        self._error_map: Optional[
+            Tuple[Type[Exception], Callable[[Exception], Exception]]] = None
+        self.parsed = 0
+
+    def map_parse_errors(
+            self,
+            error_cls: Type[Exception],
+            map_fn: Callable[[Exception], Exception]
+    ) -> None:
+        """Raise `map_fn(e)` instead of parse errors of type `error_cls`.
+
+        Parse errors occur on access, often far from the load site whose
+        error types callers expect.
+        """
+        self._error_map = (error_cls, map_fn)
+
+    def _parse(self, name: str, plain: _PlainEntryT) -> _V:
+        if self._error_map is None:
+            return self._parse_fn(name, plain)
+
+        error_cls, map_fn = self._error_map
+        try:
+            return self._parse_fn(name, plain)
+        except error_cls as e:
+            raise map_fn(e) from e
+
+    def __getitem__(self, name: str) -> _V:
+        value = self._entries[name]
+        if name in self._unparsed:
+            value = self._parse(name, value)
+            self._entries[name] = value
+            self._unparsed.discard(name)
+            self.parsed += 1
+        return value
+
+    def __setitem__(self, name: str, value: _V) -> None:
+        self._entries[name] = value
+        self._unparsed.discard(name)
+
+    def __delitem__(self, name: str) -> None:
+        del self._entries[name]
+        self._unparsed.discard(name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._entries
+
+    def get_unparsed(self, name: str) -> Optional[_PlainEntryT]:
+        """The plain entry as loaded when never accessed, `None` otherwise.
+        """
+        if name in self._unparsed:
+            return self._entries[name]
+        return None
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}("
+            f"{len(self._entries)} entries, {len(self._unparsed)} unparsed)")
@@ -3,7 +3,8 @@ from typing import Any, Optional, List
 from pathlib import Path
 from nsf_ssh_auth_dir.click.error import CliUsageError
 from nsf_ssh_auth_dir.types_pubkey import SshPubKey
-from nsf_ssh_auth_dir.file_pubkey import load_user_home_ssh_pubkey
+from nsf_ssh_auth_dir.file_pubkey import (load_user_home_ssh_pubkey,
+                                          validate_ssh_pubkey_lines)
 
 
 def cli_ssh_user_id_argument() -> Any:
@@ -60,31 +61,12 @@ def cli_ssh_pubkey_argument() -> Any:
     )
 
 
-def _is_valid_ssh_pubkey_lines(pk_lines: List[str]) -> bool:
-    if not pk_lines:
-        return False
-
-    ln0_split = pk_lines[0].split(maxsplit=1)
-    if not ln0_split:
-        return False
-
-    if not 2 <= len(ln0_split):
-        return False
-
-    # TODO: Use `ssh-keygen` instead or once summary checks were performed.
-    # See <https://stackoverflow.com/questions/16336169/sanity-check-ssh-public-key>
-
-    key_type = ln0_split[0]
-
-    # return key_type in ["ssh-rsa"]
-    return key_type.startswith("ssh-")
-
-
 def _mk_valid_ssh_pubkey_from_lines(pk_lines: List[str]) -> SshPubKey:
-    if not _is_valid_ssh_pubkey_lines(pk_lines):
+    error = validate_ssh_pubkey_lines(pk_lines)
+    if error is not None:
         raise CliUsageError(
             "No valid ssh key provided trough stdin or via "
-            "the \"SSH_PUBKEY\" argument.")
+            f"the \"SSH_PUBKEY\" argument: {error}.")
 
     return SshPubKey(pk_lines)
 
@@ -0,0 +1,177 @@
+"""Machine readable output of listing / query commands.
+
+Records are written as soon as they are produced so that a consumer
+can start processing the output before the command completes and so
+that no full in memory list ever gets built.
+"""
+import json
+from abc import ABC, abstractmethod
+from typing import (Any, Callable, Dict, Generic, Iterable, List, Optional,
+                    Type, TypeVar)
+
+import click
+
+from nsf_ssh_auth_dir.click.error import CliUsageError
+
+_T = TypeVar("_T")
+
+OutputRecordT = Dict[str, Any]
+
+OUTPUT_FORMATS = ["text", "json", "ndjson", "tsv"]
+
+
+class OutputField(Generic[_T]):
+    def __init__(
+            self,
+            name: str,
+            get_value: Callable[[_T], Any]
+    ) -> None:
+        self.name = name
+        self.get_value = get_value
+
+
+class OutputFieldSet(Generic[_T]):
+    def __init__(
+            self,
+            fields: Iterable[OutputField[_T]],
+            default: Iterable[str] = ("name",)
+    ) -> None:
+        self._fields = {f.name: f for f in fields}
+        self._default = list(default)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._fields.keys())
+
+    def select(self, fields_str: Optional[str]) -> List[OutputField[_T]]:
+        """Return the fields selected through the `--fields` option.
+
+        Raises:
+            CliUsageError: When an unknown field is requested.
+        """
+        if fields_str is None:
+            names = self._default
+        else:
+            names = [n.strip() for n in fields_str.split(",") if n.strip()]
+
+        unknown = [n for n in names if n not in self._fields]
+        if unknown or not names:
+            unknown_str = ", ".join(f"'{n}'" for n in unknown)
+            avail_str = ", ".join(self.names)
+            raise CliUsageError(
+                f"Invalid '--fields' value: unknown field(s) {{{unknown_str}}}. "
+                f"Available fields are: {{{avail_str}}}.")
+
+        return [self._fields[n] for n in names]
+
+    def iter_records(
+            self,
+            fields: List[OutputField[_T]],
+            items: Iterable[_T]
+    ) -> Iterable[OutputRecordT]:
+        # Only the selected fields are ever computed which is important
+        # as some (e.g.: pubkey fingerprints) perform file io.
+        for item in items:
+            yield {f.name: f.get_value(item) for f in fields}
+
+
+def _format_tsv_cell(value: Any) -> str:
+    if value is None:
+        return ""
+
+    if isinstance(value, bool):
+        return "true" if value else "false"
+
+    if isinstance(value, (list, tuple)):
+        return ",".join(_format_tsv_cell(v) for v in value)
+
+    if isinstance(value, dict):
+        return ";".join(
+            f"{k}={_format_tsv_cell(v)}"
+            for k, v in value.items() if v is not None)
+
+    # Make sure the cell cannot break the tabular structure.
+    return str(value).replace("\t", " ").replace("\n", " ")
+
+
+def _dump_json_record(record: OutputRecordT) -> str:
+    return json.dumps(record, sort_keys=False)
+
+
+class RecordsWriter(ABC):
+    def __init__(self, field_names: List[str]) -> None:
+        self._field_names = field_names
+
+    def begin(self) -> None:
+        pass
+
+    @abstractmethod
+    def write(self, record: OutputRecordT) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+class TextRecordsWriter(RecordsWriter):
+    def write(self, record: OutputRecordT) -> None:
+        click.echo(" ".join(
+            _format_tsv_cell(record[n]) for n in self._field_names))
+
+
+class TsvRecordsWriter(RecordsWriter):
+    def begin(self) -> None:
+        click.echo("\t".join(self._field_names))
+
+    def write(self, record: OutputRecordT) -> None:
+        click.echo("\t".join(
+            _format_tsv_cell(record[n]) for n in self._field_names))
+
+
+class NdJsonRecordsWriter(RecordsWriter):
+    def write(self, record: OutputRecordT) -> None:
+        click.echo(_dump_json_record(record))
+
+
+class JsonRecordsWriter(RecordsWriter):
+    def __init__(self, field_names: List[str]) -> None:
+        super().__init__(field_names)
+        self._count = 0
+
+    def begin(self) -> None:
+        click.echo("[", nl=False)
+
+    def write(self, record: OutputRecordT) -> None:
+        sep = "\n  " if 0 == self._count else ",\n  "
+        click.echo(f"{sep}{_dump_json_record(record)}", nl=False)
+        self._count += 1
+
+    def end(self) -> None:
+        click.echo("\n]" if self._count else "]")
+
+
+def mk_records_writer(
+        output_format: str, field_names: List[str]) -> RecordsWriter:
+    writers_d: Dict[str, Type[RecordsWriter]] = {
+        "text": TextRecordsWriter,
+        "json": JsonRecordsWriter,
+        "ndjson": NdJsonRecordsWriter,
+        "tsv": TsvRecordsWriter,
+    }
+    assert output_format in writers_d
+    return writers_d[output_format](field_names)
+
+
+def echo_records(
+        output_format: str,
+        fields: List[OutputField[_T]],
+        field_set: OutputFieldSet[_T],
+        items: Iterable[_T]
+) -> None:
+    writer = mk_records_writer(output_format, [f.name for f in fields])
+    writer.begin()
+    try:
+        for record in field_set.iter_records(fields, items):
+            writer.write(record)
+    finally:
+        writer.end()
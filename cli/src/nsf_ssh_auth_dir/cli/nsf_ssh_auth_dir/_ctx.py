@@ -8,7 +8,9 @@ from nsf_ssh_auth_dir.click.ctx_dict import (
     init_ctx_dict_instance,
     mk_ctx_dict_pass_decorator,
 )
+from nsf_ssh_auth_dir.click.error import CliError
 from nsf_ssh_auth_dir.repo import SshAuthDirRepo, mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.types_base_errors import SshAuthDirRepoError
 
 from .._ctx import CliCtxDbBase, get_cli_ctx_db_base, mk_cli_db_obj_d
 from .._ctx_default_user import CliCtxDbWDefaultUser
@@ -104,7 +106,10 @@ def init_cli_ctx(
 
     if isinstance(repo, Path):
         assert repo.is_absolute()
-        repo = mk_ssh_auth_dir_repo(repo)
+        try:
+            repo = mk_ssh_auth_dir_repo(repo)
+        except SshAuthDirRepoError as e:
+            raise CliError(str(e)) from e
 
     init_ctx = CliCtx(ctx_db, repo, user_id)
     return init_ctx_dict_instance(ctx, CliCtx.KEY, init_ctx)
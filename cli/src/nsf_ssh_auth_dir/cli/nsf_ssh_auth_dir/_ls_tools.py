@@ -0,0 +1,111 @@
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from nsf_ssh_auth_dir.click.error import CliError
+from nsf_ssh_auth_dir.file_pubkey import get_ssh_pubkey_fingerprint
+from nsf_ssh_auth_dir.repo import SshAuthDirRepo
+from nsf_ssh_auth_dir.repo_snapshot import SshAuthDirSnapshot, SshAuthEntry
+from nsf_ssh_auth_dir.repo_user_pubkeys import SshUserPubkeysRepoAccessError
+from nsf_ssh_auth_dir.types_base_errors import SshAuthDirRepoError
+
+from ..formatting import OutputField, OutputFieldSet
+
+
+class SnapshotItemUI(NamedTuple):
+    snapshot: SshAuthDirSnapshot
+    name: str
+
+
+def iter_snapshot_items(
+        snapshot: SshAuthDirSnapshot,
+        names: Iterable[str]) -> Iterator[SnapshotItemUI]:
+    for name in names:
+        yield SnapshotItemUI(snapshot, name)
+
+
+def _format_auth_entry(entry: SshAuthEntry) -> Dict[str, Optional[str]]:
+    return {
+        "state": entry.state_name,
+        "device-user": entry.device_user_name,
+        "via-group": entry.via_group_name,
+    }
+
+
+# Pubkey related fields are `null` for dangling group members.
+def _get_user_pubkey_selected(item: SnapshotItemUI) -> Optional[str]:
+    try:
+        return str(
+            item.snapshot.get_user(item.name).pubkeys.selected_filename)
+    except (KeyError, SshUserPubkeysRepoAccessError):
+        return None
+
+
+def _get_user_pubkey_default(item: SnapshotItemUI) -> Optional[str]:
+    try:
+        return str(
+            item.snapshot.get_user(item.name).pubkeys.default_filename)
+    except (KeyError, SshUserPubkeysRepoAccessError):
+        return None
+
+
+def _get_user_pubkey_fingerprint(item: SnapshotItemUI) -> Optional[str]:
+    try:
+        pubkey = item.snapshot.get_user(item.name).pubkeys.selected
+    except (KeyError, SshUserPubkeysRepoAccessError):
+        return None
+
+    return get_ssh_pubkey_fingerprint(pubkey)
+
+
+def _get_user_authorizations(item: SnapshotItemUI) -> List[Any]:
+    return [
+        _format_auth_entry(e)
+        for e in item.snapshot.get_user_auth_entries(item.name)
+    ]
+
+
+def _get_group_authorizations(item: SnapshotItemUI) -> List[Any]:
+    return [
+        _format_auth_entry(e)
+        for e in item.snapshot.get_group_auth_entries(item.name)
+    ]
+
+
+USER_FIELDS: OutputFieldSet[SnapshotItemUI] = OutputFieldSet([
+    OutputField("name", lambda x: x.name),
+    OutputField("groups", lambda x: x.snapshot.get_user_groups_names(x.name)),
+    OutputField("pubkey-selected", _get_user_pubkey_selected),
+    OutputField("pubkey-default", _get_user_pubkey_default),
+    OutputField("pubkey-fingerprint", _get_user_pubkey_fingerprint),
+    OutputField("authorizations", _get_user_authorizations),
+])
+
+
+GROUP_FIELDS: OutputFieldSet[SnapshotItemUI] = OutputFieldSet([
+    OutputField("name", lambda x: x.name),
+    OutputField("members", lambda x: x.snapshot.get_group_members_names(x.name)),
+    OutputField("authorizations", _get_group_authorizations),
+])
+
+# The fields whose values depend on the groups, auth files.
+_W_GROUPS_FIELD_NAMES = {"groups", "members", "authorizations"}
+_W_AUTH_FIELD_NAMES = {"authorizations"}
+
+
+def load_ls_snapshot(
+        repo: SshAuthDirRepo,
+        fields: List[OutputField[SnapshotItemUI]],
+        with_groups: bool = False
+) -> SshAuthDirSnapshot:
+    """Only load the files `fields` need (e.g.: only the users file
+        for user names).
+
+    Raises:
+        CliError: When any of these files cannot be loaded.
+    """
+    names = {f.name for f in fields}
+    with_auth = bool(names & _W_AUTH_FIELD_NAMES)
+    with_groups = with_groups or bool(names & _W_GROUPS_FIELD_NAMES)
+    try:
+        return repo.load_snapshot(with_groups, with_auth)
+    except SshAuthDirRepoError as e:
+        raise CliError(str(e)) from e
@@ -0,0 +1,96 @@
+from typing import Iterable, Optional, Tuple
+
+import click
+
+from nsf_ssh_auth_dir.cli.formatting import (OutputField, OutputFieldSet,
+                                             echo_records)
+from nsf_ssh_auth_dir.cli.options import (cli_access_diff_side_on_option,
+                                          cli_output_fields_option,
+                                          cli_output_format_option)
+from nsf_ssh_auth_dir.click.error import CliError
+from nsf_ssh_auth_dir.repo_access import (SshAccessEntry, SshAccessResolver,
+                                          diff_ssh_access)
+from nsf_ssh_auth_dir.repo_diff import format_device_user_name
+from nsf_ssh_auth_dir.repo_git import SshAuthDirGitError, SshAuthDirGitRepo
+
+from ._ctx import CliCtx, pass_cli_ctx
+
+
+def _describe(change: str, e: SshAccessEntry) -> str:
+    state_str = "always" if e.state is None else f"on state '{e.state}'"
+    return (
+        f"{change}: user '{e.ssh_user}' to "
+        f"{format_device_user_name(e.device_user)} {state_str}")
+
+
+_ACCESS_CHANGE_DEFAULT_FIELDS = ("description",)
+
+ACCESS_CHANGE_FIELDS: OutputFieldSet[Tuple[str, SshAccessEntry]] = \
+    OutputFieldSet([
+        OutputField("change", lambda x: x[0]),
+        OutputField("ssh-user", lambda x: x[1].ssh_user),
+        OutputField("device-user", lambda x: x[1].device_user),
+        OutputField("state", lambda x: x[1].state),
+        OutputField("description", lambda x: _describe(*x)),
+    ], default=_ACCESS_CHANGE_DEFAULT_FIELDS)
+
+
+@click.command(name="access-diff")
+@click.argument("rev_a", type=str, required=False, default=None)
+@click.argument("rev_b", type=str, required=False, default=None)
+@cli_access_diff_side_on_option("a")
+@cli_access_diff_side_on_option("b")
+@cli_output_format_option()
+@cli_output_fields_option(
+    ACCESS_CHANGE_FIELDS.names, _ACCESS_CHANGE_DEFAULT_FIELDS)
+@pass_cli_ctx
+def access_diff(
+        ctx: CliCtx,
+        rev_a: Optional[str],
+        rev_b: Optional[str],
+        device_state_ons_a: Tuple[str, ...],
+        device_state_ons_b: Tuple[str, ...],
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
+    """Show the effective access granted / revoked from side A to B.
+
+    Access is expressed as (*ssh user*, *device user*, state) triples
+    once groups, the all *device users* set and states are applied.
+
+    Each side is a git revision (REV_A, REV_B) plus a set of active
+    device states (`--on-a`, `--on-b`). Without any `--on-*` option,
+    REV_A defaults to `HEAD`. Otherwise, it defaults to the work tree
+    so that 2 sets of states can be compared. REV_B always defaults to
+    the work tree.
+    """
+    fields = ACCESS_CHANGE_FIELDS.select(output_fields)
+
+    if rev_a is None and not device_state_ons_a and not device_state_ons_b:
+        rev_a = "HEAD"
+
+    try:
+        git_repo = SshAuthDirGitRepo(ctx.repo)
+        snapshot_a = git_repo.load_snapshot(rev_a)
+        snapshot_b = (
+            snapshot_a if rev_a == rev_b
+            else git_repo.load_snapshot(rev_b))
+    except SshAuthDirGitError as e:
+        raise CliError(str(e)) from e
+
+    def opt_states(states: Tuple[str, ...]) -> Optional[Iterable[str]]:
+        return states if states else None
+
+    # Shared so that unchanged *device users* are only resolved once.
+    resolver = SshAccessResolver()
+    access_a = resolver.resolve(snapshot_a, opt_states(device_state_ons_a))
+    access_b = resolver.resolve(snapshot_b, opt_states(device_state_ons_b))
+    diff = diff_ssh_access(access_a, access_b)
+
+    def iter_changes() -> Iterable[Tuple[str, SshAccessEntry]]:
+        for e in diff.revoked:
+            yield ("revoked", e)
+        for e in diff.granted:
+            yield ("granted", e)
+
+    echo_records(output_format, fields, ACCESS_CHANGE_FIELDS, iter_changes())
@@ -0,0 +1,25 @@
+import click
+
+from nsf_ssh_auth_dir.file_parse_cache import SshAuthDirParseCache
+
+
+@click.group()
+def cache() -> None:
+    """Inspect or clear the parse cache (see `--parse-cache`)."""
+    pass
+
+
+@cache.command(name="stats")
+def cache_stats() -> None:
+    """Print the parse cache's location, number of entries and size."""
+    stats = SshAuthDirParseCache().stats()
+    click.echo(f"dir: '{stats.dir}'")
+    click.echo(f"entries: {stats.entries}")
+    click.echo(f"size: {stats.size} bytes")
+
+
+@cache.command(name="clear")
+def cache_clear() -> None:
+    """Remove all of the parse cache's entries."""
+    removed = SshAuthDirParseCache().clear()
+    click.echo(f"Removed {removed} entries.", err=True)
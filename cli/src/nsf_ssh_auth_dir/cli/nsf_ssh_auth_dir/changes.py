@@ -0,0 +1,25 @@
+import json
+
+import click
+
+from nsf_ssh_auth_dir.repo_change_feed import iter_ssh_auth_dir_changes
+
+from ._ctx import CliCtx, pass_cli_ctx
+
+
+@click.command()
+@click.option(
+    "--since", "since",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Only print the changes whose sequence number is greater.")
+@pass_cli_ctx
+def changes(ctx: CliCtx, since: int) -> None:
+    """Print the recorded changes of the current *ssh auth dir*.
+
+    One json record per line, oldest first. Changes are only recorded
+    by commands run with `--change-feed`.
+    """
+    for record in iter_ssh_auth_dir_changes(ctx.repo.dir, since):
+        click.echo(json.dumps(record))
@@ -4,11 +4,28 @@ import click
 from typing import Optional
 
 from nsf_ssh_auth_dir.cli.log import setup_verbose
+from nsf_ssh_auth_dir.click.error import CliError
+from nsf_ssh_auth_dir.cli.profile import setup_io_stats, setup_profile
+from nsf_ssh_auth_dir.file_parse_cache import SshAuthDirParseCache
+from nsf_ssh_auth_dir.policy_lock import (DEFAULT_LOCK_TIMEOUT,
+                                          SshAuthDirLockDefaultPolicy)
+from nsf_ssh_auth_dir.policy_repo import SshAuthDirRepoDefaultPolicy
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_change_feed import SshAuthDirChangeFeedObserver
+from nsf_ssh_auth_dir.types_base_errors import SshAuthDirRepoError
 
 from ._ctx import (CliCtx, CliCtxDbInterface, init_cli_ctx,
                    mk_cli_context_settings, pass_cli_ctx)
+from .access import access_diff
+from .cache import cache
+from .changes import changes
+from .compile import compile_cmd, compile_many
+from .export import export_resolved
+from .fleet import fleet
 from .git import git
 from .group import group
+from .hash import hash_cmd
+from .layout import layout
 from .user import user
 
 
@@ -43,13 +60,90 @@ class CliCtxDb(CliCtxDbInterface):
         "Effectively sets the root ssh auth directory."
     )
 )
+@click.option(
+    "--profile", "profile_out_str",
+    default=None,
+    type=click.Path(dir_okay=False, writable=True),
+    help=(
+        "Run the command under `cProfile` and write the resulting "
+        "stats to this file (see the `pstats` python module)."
+    )
+)
+@click.option(
+    "--stats", "print_stats",
+    is_flag=True,
+    default=False,
+    help=(
+        "Print file io, parse / dump and per phase timing counters "
+        "to *stderr* once the command completes."
+    )
+)
+@click.option(
+    "--lock-timeout", "lock_timeout",
+    type=float,
+    default=DEFAULT_LOCK_TIMEOUT,
+    show_default=True,
+    envvar="NSF_SSH_AUTH_DIR_LOCK_TIMEOUT",
+    help=(
+        "Seconds to wait for another process' lock on a file before "
+        "giving up. A negative value waits forever. See `--stats` "
+        "for lock waits."
+    )
+)
+@click.option(
+    "--optimistic-writes", "optimistic_writes",
+    is_flag=True,
+    default=False,
+    envvar="NSF_SSH_AUTH_DIR_OPTIMISTIC_WRITES",
+    help=(
+        "Instead of locking a file while editing it, check it did not "
+        "change before writing and redo the edit when it did. Best when "
+        "concurrent writers rarely edit the same file."
+    )
+)
+@click.option(
+    "--change-feed", "change_feed",
+    is_flag=True,
+    default=False,
+    envvar="NSF_SSH_AUTH_DIR_CHANGE_FEED",
+    help=(
+        "Append a record of each change made by this command to the "
+        "*ssh auth dir*'s change feed (see the `changes` command)."
+    )
+)
+@click.option(
+    "--parse-cache", "parse_cache",
+    is_flag=True,
+    default=False,
+    envvar="NSF_SSH_AUTH_DIR_PARSE_CACHE",
+    help=(
+        "Reuse the parsed content of unchanged files from previous runs, "
+        "cached under `$XDG_CACHE_HOME/nsf-ssh-auth-dir/parse` (see "
+        "the `cache` command). Speeds up commands on large files."
+    )
+)
 @click.pass_context
-def cli(ctx: click.Context, user_id: Optional[str], cwd_str: Optional[str]) -> None:
+def cli(
+        ctx: click.Context,
+        user_id: Optional[str],
+        cwd_str: Optional[str],
+        profile_out_str: Optional[str],
+        print_stats: bool,
+        lock_timeout: float,
+        optimistic_writes: bool,
+        change_feed: bool,
+        parse_cache: bool
+) -> None:
     """Ssh authorization tool for nixos-secure-factory.
 
     All commands operate on the current *ssh auth dir* which
     by default correspond to the *current working directory*.
     """
+    if print_stats:
+        setup_io_stats(ctx)
+
+    if profile_out_str is not None:
+        setup_profile(ctx, Path(profile_out_str))
 
     if cwd_str is None:
         cwd = Path.cwd()
@@ -58,11 +152,22 @@ def cli(ctx: click.Context, user_id: Optional[str], cwd_str: Optional[str]) -> N
         if not cwd.is_absolute():
             cwd = Path.cwd().joinpath(cwd)
 
-    init_cli_ctx(
-        ctx,
-        repo=cwd,
-        user_id=user_id
-    )
+    lock_policy = SshAuthDirLockDefaultPolicy(
+        timeout=None if lock_timeout < 0 else lock_timeout,
+        optimistic=optimistic_writes)
+    observer = SshAuthDirChangeFeedObserver(cwd) if change_feed else None
+    try:
+        repo = mk_ssh_auth_dir_repo(
+            cwd, policy=SshAuthDirRepoDefaultPolicy(
+                lock_policy,
+                SshAuthDirParseCache() if parse_cache else None),
+            observer=observer)
+    except SshAuthDirRepoError as e:
+        # A journal left by an interrupted transaction failing to
+        # recover (e.g.: invalid or its files' locks timing out).
+        raise CliError(str(e)) from e
+
+    init_cli_ctx(ctx, repo=repo, user_id=user_id)
     setup_verbose(1)
 
 
@@ -79,6 +184,15 @@ def info(ctx: CliCtx) -> None:
 cli.add_command(user)
 cli.add_command(group)
 cli.add_command(git)
+cli.add_command(access_diff)
+cli.add_command(hash_cmd)
+cli.add_command(compile_cmd)
+cli.add_command(compile_many)
+cli.add_command(export_resolved)
+cli.add_command(fleet)
+cli.add_command(layout)
+cli.add_command(changes)
+cli.add_command(cache)
 
 
 def run_cli() -> None:
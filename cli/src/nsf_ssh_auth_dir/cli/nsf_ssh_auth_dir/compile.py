@@ -0,0 +1,180 @@
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+import click
+
+from nsf_ssh_auth_dir.cli.formatting import (OutputField, OutputFieldSet,
+                                             echo_records)
+from nsf_ssh_auth_dir.cli.options import (cli_compile_on_option,
+                                          cli_output_fields_option,
+                                          cli_output_format_option)
+from nsf_ssh_auth_dir.click.error import CliError
+from nsf_ssh_auth_dir.repo_compile import (SshAuthDirCompileError,
+                                           SshAuthDirCompileResult,
+                                           compile_many_ssh_auth_dirs,
+                                           compile_ssh_auth_dir_parts,
+                                           dump_compiled_authorized_keys,
+                                           iter_ssh_auth_dirs,
+                                           join_compiled_parts)
+from nsf_ssh_auth_dir.repo_diff import format_device_user_name
+
+from ._ctx import CliCtx, pass_cli_ctx
+
+
+def _count_keys(content: str) -> int:
+    return sum(
+        1 for ln in content.splitlines()
+        if ln.strip() and not ln.lstrip().startswith("#"))
+
+
+_COMPILED_DEFAULT_FIELDS = ("device-user", "keys")
+
+COMPILED_FIELDS: OutputFieldSet[Tuple[str, str]] = OutputFieldSet([
+    OutputField("device-user", lambda x: format_device_user_name(x[0])),
+    OutputField("keys", lambda x: _count_keys(x[1])),
+    OutputField("content", lambda x: x[1]),
+], default=_COMPILED_DEFAULT_FIELDS)
+
+
+def _opt_states(states: Tuple[str, ...]) -> Optional[Tuple[str, ...]]:
+    return states if states else None
+
+
+@click.command(name="compile")
+@cli_compile_on_option()
+@click.option(
+    "--out-dir", "out_dir_str",
+    default=None,
+    type=click.Path(file_okay=False, writable=True),
+    help=(
+        "Write one `<device-user>.authorized_keys` file per "
+        "*device user* to this dir."))
+@cli_output_format_option()
+@cli_output_fields_option(COMPILED_FIELDS.names, _COMPILED_DEFAULT_FIELDS)
+@pass_cli_ctx
+def compile_cmd(
+        ctx: CliCtx,
+        device_state_ons: Tuple[str, ...],
+        out_dir_str: Optional[str],
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
+    """Compile the authorized keys of each *device user*.
+
+    When no `--on` state is specified, all states are considered active.
+    `[ALL]` stands for any *device user* not explicitly mentioned.
+    """
+    fields = COMPILED_FIELDS.select(output_fields)
+
+    try:
+        parts = compile_ssh_auth_dir_parts(
+            ctx.repo, _opt_states(device_state_ons))
+    except SshAuthDirCompileError as e:
+        raise CliError(str(e)) from e
+
+    if out_dir_str is not None:
+        dump_compiled_authorized_keys(Path(out_dir_str), parts)
+
+    compiled = join_compiled_parts(parts)
+
+    echo_records(
+        output_format, fields, COMPILED_FIELDS, sorted(compiled.items()))
+
+
+def _fmt_status(r: SshAuthDirCompileResult) -> str:
+    return "failed" if r.error is not None else "ok"
+
+
+_COMPILE_MANY_DEFAULT_FIELDS = ("dir", "status", "device-users", "error")
+_COMPILE_MANY_FIELD_NAMES = [
+    "dir", "status", "device-users", "duration", "error"]
+
+
+def _mk_compile_many_fields(
+        root: Path) -> OutputFieldSet[SshAuthDirCompileResult]:
+    def rel_dir(r: SshAuthDirCompileResult) -> str:
+        try:
+            return r.dir.relative_to(root).as_posix()
+        except ValueError:
+            return str(r.dir)
+
+    return OutputFieldSet([
+        OutputField("dir", rel_dir),
+        OutputField("status", _fmt_status),
+        OutputField(
+            "device-users",
+            lambda r: None if r.authorized_keys is None
+            else len(r.authorized_keys)),
+        OutputField("duration", lambda r: round(r.duration, 6)),
+        OutputField("error", lambda r: r.error),
+    ], default=_COMPILE_MANY_DEFAULT_FIELDS)
+
+
+@click.command(name="compile-many")
+@click.argument(
+    "root_str",
+    metavar="ROOT",
+    type=click.Path(exists=True, file_okay=False))
+@cli_compile_on_option()
+@click.option(
+    "--jobs", "-j", "jobs",
+    type=int,
+    default=None,
+    help="The number of worker processes. Defaults to the number of cpus.")
+@click.option(
+    "--out-dir", "out_dir_str",
+    default=None,
+    type=click.Path(file_okay=False, writable=True),
+    help=(
+        "Write the compiled authorized keys of each *ssh auth dir* "
+        "to the same relative path under this dir."))
+@cli_output_format_option()
+@cli_output_fields_option(
+    _COMPILE_MANY_FIELD_NAMES, _COMPILE_MANY_DEFAULT_FIELDS)
+def compile_many(
+        root_str: str,
+        device_state_ons: Tuple[str, ...],
+        jobs: Optional[int],
+        out_dir_str: Optional[str],
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
+    """Compile every *ssh auth dir* found under ROOT.
+
+    *Ssh auth dirs* are compiled in parallel on a process pool. Results
+    are always listed in path order whatever the number of jobs and
+    failures do not prevent other dirs from being compiled. The
+    per dir `duration` field is available through `--fields`.
+    """
+    root = Path(root_str).absolute()
+    field_set = _mk_compile_many_fields(root)
+    fields = field_set.select(output_fields)
+    out_dir = None if out_dir_str is None else Path(out_dir_str)
+
+    dirs = list(iter_ssh_auth_dirs(root))
+    failed: Dict[Path, str] = {}
+    start = time.perf_counter()
+
+    def iter_results() -> Iterator[SshAuthDirCompileResult]:
+        for r in compile_many_ssh_auth_dirs(
+                dirs, _opt_states(device_state_ons), jobs):
+            if r.error is not None:
+                failed[r.dir] = r.error
+            elif out_dir is not None:
+                assert r.authorized_keys is not None
+                dump_compiled_authorized_keys(
+                    out_dir.joinpath(r.dir.relative_to(root)),
+                    r.authorized_keys)
+            yield r
+
+    echo_records(output_format, fields, field_set, iter_results())
+
+    duration = time.perf_counter() - start
+    click.echo(
+        f"Compiled {len(dirs) - len(failed)} of {len(dirs)} "
+        f"*ssh auth dirs* in {duration:.3f}s.", err=True)
+
+    if failed:
+        raise CliError(
+            f"Failed to compile {len(failed)} *ssh auth dir(s)*.")
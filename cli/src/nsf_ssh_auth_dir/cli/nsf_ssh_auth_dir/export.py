@@ -0,0 +1,56 @@
+from pathlib import Path
+from typing import Optional
+
+import click
+
+from nsf_ssh_auth_dir.click.error import CliError
+from nsf_ssh_auth_dir.repo_export import (SshAuthDirExportError,
+                                          dump_resolved_snapshot,
+                                          dumps_resolved_snapshot,
+                                          export_resolved_ssh_auth_dir)
+from nsf_ssh_auth_dir.repo_hash import SshAuthDirFileHashCache
+
+from ._ctx import CliCtx, pass_cli_ctx
+
+
+@click.command(name="export-resolved")
+@click.option(
+    "--out", "out_str",
+    default=None,
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the snapshot to this file instead of *stdout*.")
+@click.option(
+    "--no-cache", "no_cache",
+    is_flag=True,
+    default=False,
+    help="Neither use nor update the persistent per file digests cache.")
+@pass_cli_ctx
+def export_resolved(
+        ctx: CliCtx,
+        out_str: Optional[str],
+        no_cache: bool
+) -> None:
+    """Export a pre-resolved json snapshot of the current *ssh auth dir*.
+
+    The snapshot holds users along with their pubkey's content, groups,
+    *device users* for each state with groups expanded and the source
+    files of each. It records the dir's content digest (see the `hash`
+    command) so that the nix lib's `loadAuthDirResolved` only uses it
+    while up to date.
+    """
+    if no_cache:
+        cache = SshAuthDirFileHashCache()
+    else:
+        cache = SshAuthDirFileHashCache.mk_persistent_for(ctx.repo.dir)
+
+    try:
+        plain = export_resolved_ssh_auth_dir(ctx.repo, cache)
+    except SshAuthDirExportError as e:
+        raise CliError(str(e)) from e
+    cache.save()
+
+    if out_str is None:
+        click.echo(dumps_resolved_snapshot(plain), nl=False)
+        return
+
+    dump_resolved_snapshot(plain, Path(out_str))
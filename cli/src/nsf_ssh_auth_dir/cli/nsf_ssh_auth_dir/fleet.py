@@ -0,0 +1,97 @@
+from pathlib import Path
+from typing import Any, Optional
+
+import click
+
+from nsf_ssh_auth_dir.cli.formatting import (OutputField, OutputFieldSet,
+                                             echo_records)
+from nsf_ssh_auth_dir.cli.options import (cli_output_fields_option,
+                                          cli_output_format_option)
+from nsf_ssh_auth_dir.repo_diff import format_device_user_name
+from nsf_ssh_auth_dir.repo_fleet import (SshFleetIndex, SshFleetIndexEntry,
+                                         SshFleetIndexUpdateStats)
+
+from ._ctx import CliCtx, pass_cli_ctx
+
+_FLEET_ENTRY_DEFAULT_FIELDS = ("dir", "device-user", "state", "via-group")
+
+FLEET_ENTRY_FIELDS: OutputFieldSet[SshFleetIndexEntry] = OutputFieldSet([
+    OutputField("dir", lambda x: x.dir),
+    OutputField("state", lambda x: x.state),
+    OutputField("device-user", lambda x: format_device_user_name(x.device_user)),
+    OutputField("via-group", lambda x: x.via_group),
+], default=_FLEET_ENTRY_DEFAULT_FIELDS)
+
+
+def cli_fleet_root_option() -> Any:
+    return click.option(
+        "--root", "root_str",
+        default=None,
+        type=click.Path(exists=True, file_okay=False),
+        help=(
+            "The dir under which *ssh auth dirs* are indexed. Defaults to "
+            "the current *ssh auth dir*."),
+        envvar='NSF_CLI_SSH_FLEET_ROOT',
+    )
+
+
+def _mk_index(ctx: CliCtx, root_str: Optional[str]) -> SshFleetIndex:
+    root = ctx.repo.dir if root_str is None else Path(root_str)
+    return SshFleetIndex(root)
+
+
+def _update_index(index: SshFleetIndex) -> SshFleetIndexUpdateStats:
+    stats = index.update()
+    index.save()
+    for rel_dir, error in sorted(stats.failed.items()):
+        click.echo(f"WARNING: Failed to index '{rel_dir}': {error}", err=True)
+    return stats
+
+
+@click.group()
+def fleet() -> None:
+    """Query authorizations across many *ssh auth dirs*."""
+    pass
+
+
+@fleet.command(name="update")
+@cli_fleet_root_option()
+@pass_cli_ctx
+def fleet_update(ctx: CliCtx, root_str: Optional[str]) -> None:
+    """Reindex the *ssh auth dirs* whose content changed."""
+    stats = _update_index(_mk_index(ctx, root_str))
+    click.echo(
+        f"reindexed: {stats.reindexed}, unchanged: {stats.reused}, "
+        f"removed: {stats.removed}, failed: {len(stats.failed)}")
+
+
+@fleet.command(name="who")
+@click.argument("username", type=str)
+@cli_fleet_root_option()
+@click.option(
+    "--no-update", "no_update",
+    is_flag=True,
+    default=False,
+    help=(
+        "Answer from the index as last updated, without checking "
+        "for changes."))
+@cli_output_format_option()
+@cli_output_fields_option(
+    FLEET_ENTRY_FIELDS.names, _FLEET_ENTRY_DEFAULT_FIELDS)
+@pass_cli_ctx
+def fleet_who(
+        ctx: CliCtx,
+        username: str,
+        root_str: Optional[str],
+        no_update: bool,
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
+    """List where USERNAME is authorized, directly or through a group."""
+    fields = FLEET_ENTRY_FIELDS.select(output_fields)
+    index = _mk_index(ctx, root_str)
+    if not no_update:
+        _update_index(index)
+
+    echo_records(
+        output_format, fields, FLEET_ENTRY_FIELDS, index.who(username))
@@ -1,5 +1,44 @@
+from typing import Optional
+
 import click
-import logging
+
+from nsf_ssh_auth_dir.cli.formatting import (OutputField, OutputFieldSet,
+                                             echo_records)
+from nsf_ssh_auth_dir.cli.options import (cli_output_fields_option,
+                                          cli_output_format_option)
+from nsf_ssh_auth_dir.click.error import CliError
+from nsf_ssh_auth_dir.repo_diff import SshAuthDirChange
+from nsf_ssh_auth_dir.repo_git import SshAuthDirGitError, SshAuthDirGitRepo
+
+from ._ctx import CliCtx, pass_cli_ctx
+
+_CHANGE_DEFAULT_FIELDS = ("description",)
+
+CHANGE_FIELDS: OutputFieldSet[SshAuthDirChange] = OutputFieldSet([
+    OutputField("op", lambda x: x.op),
+    OutputField("entity", lambda x: x.entity),
+    OutputField("name", lambda x: x.name),
+    OutputField("target", lambda x: x.target),
+    OutputField("state", lambda x: x.state),
+    OutputField("description", lambda x: x.description),
+], default=_CHANGE_DEFAULT_FIELDS)
+
+
+def _echo_changes(
+        ctx: CliCtx,
+        a_rev: Optional[str],
+        b_rev: Optional[str],
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
+    fields = CHANGE_FIELDS.select(output_fields)
+    try:
+        git_repo = SshAuthDirGitRepo(ctx.repo)
+        echo_records(
+            output_format, fields, CHANGE_FIELDS,
+            git_repo.iter_changes(a_rev, b_rev))
+    except SshAuthDirGitError as e:
+        raise CliError(str(e)) from e
 
 
 @click.group()
@@ -9,12 +48,37 @@ def git() -> None:
 
 
 @git.command()
-def status() -> None:
-    """Run `git` status for the current *ssh auth dir*."""
-    logging.info("git status: UNIMPLEMENTED")
+@cli_output_format_option()
+@cli_output_fields_option(CHANGE_FIELDS.names, _CHANGE_DEFAULT_FIELDS)
+@pass_cli_ctx
+def status(
+        ctx: CliCtx,
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
+    """Show the semantic changes of the work tree since `HEAD`.
+
+    Changes are reported in terms of users, groups and authorizations
+    (e.g.: "user 'a' added to group 'b'") instead of lines.
+    """
+    _echo_changes(ctx, "HEAD", None, output_format, output_fields)
 
 
 @git.command()
-def diff() -> None:
-    """Run `git` diff for the current *ssh auth dir*."""
-    logging.info("git diff: UNIMPLEMENTED")
+@click.argument("rev_a", type=str, default="HEAD")
+@click.argument("rev_b", type=str, required=False, default=None)
+@cli_output_format_option()
+@cli_output_fields_option(CHANGE_FIELDS.names, _CHANGE_DEFAULT_FIELDS)
+@pass_cli_ctx
+def diff(
+        ctx: CliCtx,
+        rev_a: str,
+        rev_b: Optional[str],
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
+    """Show the semantic changes from REV_A to REV_B.
+
+    REV_A defaults to `HEAD` and REV_B to the work tree.
+    """
+    _echo_changes(ctx, rev_a, rev_b, output_format, output_fields)
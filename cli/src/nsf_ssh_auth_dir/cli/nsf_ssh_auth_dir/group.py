@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 import click
 
@@ -10,8 +10,11 @@ from nsf_ssh_auth_dir.cli.options import (
     cli_device_user_from_option,
     cli_device_user_to_all_flag,
     cli_device_user_to_option,
-    cli_force_flag
+    cli_force_flag,
+    cli_output_fields_option,
+    cli_output_format_option,
 )
+from nsf_ssh_auth_dir.cli.formatting import echo_records
 from nsf_ssh_auth_dir.click.error import CliError, echo_warning
 from nsf_ssh_auth_dir.repo_auth_device_users import (
     SshAuthRepoGroupAlreadyAuthorizedError,
@@ -28,6 +31,7 @@ from ._auth_tools import (
     select_auth_device_users_where,
 )
 from ._ctx import CliCtx, pass_cli_ctx
+from ._ls_tools import GROUP_FIELDS, iter_snapshot_items, load_ls_snapshot
 from .group_member import member
 
 
@@ -38,15 +42,29 @@ def group() -> None:
 
 
 @group.command()
+@cli_output_format_option()
+@cli_output_fields_option(GROUP_FIELDS.names)
 @pass_cli_ctx
-def ls(ctx: CliCtx) -> None:
+def ls(
+        ctx: CliCtx,
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
     """List existing *ssh group*."""
+    fields = GROUP_FIELDS.select(output_fields)
+
     try:
-        for g_name in ctx.repo.groups.names:
-            click.echo(g_name)
+        # Make sure a missing groups file is still reported as an error.
+        ctx.repo.groups.load_raw()
     except SshGroupsRepoAccessError as e:
         raise CliError(str(e)) from e
 
+    snapshot = load_ls_snapshot(ctx.repo, fields, with_groups=True)
+
+    echo_records(
+        output_format, fields, GROUP_FIELDS,
+        iter_snapshot_items(snapshot, snapshot.groups_names))
+
 
 @group.command()
 @cli_ssh_group_id_argument()
@@ -8,7 +8,12 @@ from nsf_ssh_auth_dir.cli.arguments import (
     cli_ssh_group_member_id_argument,
     ensure_ssh_user_id_or_fallback_or_fail,
 )
-from nsf_ssh_auth_dir.cli.options import cli_force_flag
+from nsf_ssh_auth_dir.cli.formatting import echo_records
+from nsf_ssh_auth_dir.cli.options import (
+    cli_force_flag,
+    cli_output_fields_option,
+    cli_output_format_option,
+)
 from nsf_ssh_auth_dir.repo_groups import (
     SshGroupsRepoAccessError,
     SshGroupsRepoDuplicateError,
@@ -16,6 +21,7 @@ from nsf_ssh_auth_dir.repo_groups import (
 from nsf_ssh_auth_dir.click.error import CliError
 
 from ._ctx import CliCtx, pass_cli_ctx
+from ._ls_tools import USER_FIELDS, iter_snapshot_items, load_ls_snapshot
 
 
 @click.group()
@@ -26,15 +32,31 @@ def member() -> None:
 
 @member.command()
 @cli_ssh_group_id_argument()
+@cli_output_format_option()
+@cli_output_fields_option(USER_FIELDS.names)
 @pass_cli_ctx
-def ls(ctx: CliCtx, ssh_group_id: str) -> None:
+def ls(
+        ctx: CliCtx,
+        ssh_group_id: str,
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
     """List members for specified *ssh group*."""
+    fields = USER_FIELDS.select(output_fields)
+
     try:
-        for m_name in ctx.repo.groups[ssh_group_id].members_names:
-            click.echo(m_name)
+        # Make sure a missing groups file / group is still reported as an error.
+        ctx.repo.groups[ssh_group_id]
     except SshGroupsRepoAccessError as e:
         raise CliError(str(e)) from e
 
+    snapshot = load_ls_snapshot(ctx.repo, fields, with_groups=True)
+
+    echo_records(
+        output_format, fields, USER_FIELDS,
+        iter_snapshot_items(
+            snapshot, snapshot.get_group_members_names(ssh_group_id)))
+
 
 @member.command()
 @cli_ssh_group_id_argument()
@@ -0,0 +1,65 @@
+from typing import Optional
+
+import click
+
+from nsf_ssh_auth_dir.cli.formatting import (OutputField, OutputFieldSet,
+                                             echo_records)
+from nsf_ssh_auth_dir.cli.options import (cli_output_fields_option,
+                                          cli_output_format_option)
+from nsf_ssh_auth_dir.repo_hash import (SshAuthDirFileHashCache,
+                                        SshAuthDirHashEntry,
+                                        compute_ssh_auth_dir_hash)
+
+from ._ctx import CliCtx, pass_cli_ctx
+
+_HASH_ENTRY_DEFAULT_FIELDS = ("digest", "kind", "path")
+
+HASH_ENTRY_FIELDS: OutputFieldSet[SshAuthDirHashEntry] = OutputFieldSet([
+    OutputField("kind", lambda x: x.kind),
+    OutputField("path", lambda x: x.path),
+    OutputField("digest", lambda x: x.digest),
+], default=_HASH_ENTRY_DEFAULT_FIELDS)
+
+
+@click.command(name="hash")
+@click.option(
+    "--files", "list_files",
+    is_flag=True,
+    default=False,
+    help="List the digest of each of the hashed files instead.")
+@click.option(
+    "--no-cache", "no_cache",
+    is_flag=True,
+    default=False,
+    help="Neither use nor update the persistent per file digests cache.")
+@cli_output_format_option()
+@cli_output_fields_option(HASH_ENTRY_FIELDS.names, _HASH_ENTRY_DEFAULT_FIELDS)
+@pass_cli_ctx
+def hash_cmd(
+        ctx: CliCtx,
+        list_files: bool,
+        no_cache: bool,
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
+    """Print the content digest of the current *ssh auth dir*.
+
+    The digest changes whenever any of the users, groups or auth files
+    or any public key file referenced by users changes.
+    """
+    fields = HASH_ENTRY_FIELDS.select(output_fields)
+
+    if no_cache:
+        cache = SshAuthDirFileHashCache()
+    else:
+        cache = SshAuthDirFileHashCache.mk_persistent_for(ctx.repo.dir)
+
+    dir_hash = compute_ssh_auth_dir_hash(ctx.repo, cache)
+    cache.save()
+
+    if list_files:
+        echo_records(
+            output_format, fields, HASH_ENTRY_FIELDS, dir_hash.entries)
+        return
+
+    click.echo(dir_hash.digest)
@@ -0,0 +1,49 @@
+import click
+
+from nsf_ssh_auth_dir.click.error import CliError
+from nsf_ssh_auth_dir.repo_layout import (LAYOUT_NAME_ENTITY_DIRS,
+                                          LAYOUT_NAME_SINGLE_FILES,
+                                          SshAuthDirLayoutError,
+                                          convert_ssh_auth_dir_layout,
+                                          get_ssh_auth_dir_layout_name,
+                                          mk_ssh_auth_dir_layout_from_name)
+
+from ._ctx import CliCtx, pass_cli_ctx
+
+
+@click.group()
+def layout() -> None:
+    """Inspect or convert the file layout of the *ssh auth dir*."""
+    pass
+
+
+@layout.command(name="show")
+@pass_cli_ctx
+def layout_show(ctx: CliCtx) -> None:
+    """Print the current layout's name."""
+    click.echo(get_ssh_auth_dir_layout_name(ctx.repo.layout))
+
+
+@layout.command(name="convert")
+@click.argument(
+    "to_name",
+    metavar="LAYOUT",
+    type=click.Choice([LAYOUT_NAME_SINGLE_FILES, LAYOUT_NAME_ENTITY_DIRS]))
+@pass_cli_ctx
+def layout_convert(ctx: CliCtx, to_name: str) -> None:
+    """Rewrite the *ssh auth dir* to LAYOUT.
+
+    With `entity-dirs`, each user, group and *device user* authorization
+    lives in its own file (e.g.: `users.d/my-user.json`) so that editing
+    one only rewrites this small file.
+    """
+    from_name = get_ssh_auth_dir_layout_name(ctx.repo.layout)
+    if from_name == to_name:
+        click.echo(f"Already in the '{to_name}' layout.", err=True)
+        return
+
+    try:
+        convert_ssh_auth_dir_layout(
+            ctx.repo, mk_ssh_auth_dir_layout_from_name(to_name))
+    except SshAuthDirLayoutError as e:
+        raise CliError(str(e)) from e
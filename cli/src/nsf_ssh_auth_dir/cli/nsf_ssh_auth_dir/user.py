@@ -1,4 +1,5 @@
-from typing import List, Optional
+from pathlib import Path
+from typing import List, Optional, Tuple
 
 import click
 
@@ -16,26 +17,36 @@ from nsf_ssh_auth_dir.cli.options import (
     cli_device_user_to_all_flag,
     cli_device_user_to_option,
     cli_user_groups_option,
-    cli_force_flag
+    cli_force_flag,
+    cli_output_fields_option,
+    cli_output_format_option,
 )
+from nsf_ssh_auth_dir.cli.formatting import (OutputField, OutputFieldSet,
+                                             echo_records)
 from nsf_ssh_auth_dir.click.error import CliError, echo_warning
 from nsf_ssh_auth_dir.repo_auth_device_users import (
     SshAuthRepoInvalidUserError,
     SshAuthRepoKeyAccessError,
     SshAuthRepoUserAlreadyAuthorizedError,
 )
+from nsf_ssh_auth_dir.repo_import import (SshUserImportResult,
+                                          SshUsersImportError,
+                                          import_ssh_users,
+                                          iter_import_candidates)
 from nsf_ssh_auth_dir.repo_users import (
     SshUsersRepoDuplicateError,
     SshUsersRepoFileAccessError,
     SshUsersRepoKeyAccessError,
     SshUsersRepoAccessError
 )
+from nsf_ssh_auth_dir.types_base_errors import SshAuthDirRepoError
 
 from ._auth_tools import (
     deauthorize_user_from_all_auth_device_users,
     select_auth_device_users_where,
 )
 from ._ctx import CliCtx, pass_cli_ctx
+from ._ls_tools import USER_FIELDS, iter_snapshot_items, load_ls_snapshot
 from ._group_tools import add_user_to_groups, rm_user_from_all_groups
 from .user_pubkey import pubkey
 
@@ -47,16 +58,21 @@ def user() -> None:
 
 
 @user.command()
+@cli_output_format_option()
+@cli_output_fields_option(USER_FIELDS.names)
 @pass_cli_ctx
-def ls(ctx: CliCtx) -> None:
+def ls(
+        ctx: CliCtx,
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
     """List existing *ssh user*."""
-    repo = ctx.repo
+    fields = USER_FIELDS.select(output_fields)
 
-    try:
-        for uname in repo.users.names:
-            click.echo(uname)
-    except SshUsersRepoFileAccessError as e:
-        raise CliError(str(e)) from e
+    snapshot = load_ls_snapshot(ctx.repo, fields)
+    echo_records(
+        output_format, fields, USER_FIELDS,
+        iter_snapshot_items(snapshot, snapshot.users_names))
 
 
 @user.command()
@@ -130,19 +146,22 @@ def rm(
 
     # Ensure the user exists before proceeding.
     try:
-        ctx.repo.users.rm(user_id)
+        ctx.repo.users[user_id]
     except SshUsersRepoAccessError as e:
         if not force:
             raise CliError(str(e)) from e
 
-    deauthorize_user_from_all_auth_device_users(
-        ctx.repo, user_id, force=True)
-    rm_user_from_all_groups(ctx.repo, user_id, force=True)
+    # Either the user is gone from every file or from none.
+    with ctx.repo.transaction():
+        deauthorize_user_from_all_auth_device_users(
+            ctx.repo, user_id, force=True)
+        rm_user_from_all_groups(ctx.repo, user_id, force=True)
 
-    try:
-        ctx.repo.users.rm(user_id, force=force)
-    except (SshUsersRepoFileAccessError, SshUsersRepoKeyAccessError) as e:
-        raise CliError(str(e)) from e
+        try:
+            ctx.repo.users.rm(user_id, force=force)
+        except (SshUsersRepoFileAccessError,
+                SshUsersRepoKeyAccessError) as e:
+            raise CliError(str(e)) from e
 
 
 @user.command()
@@ -230,4 +249,68 @@ def deauthorize(
             raise CliError(str(e)) from e
 
 
+_IMPORT_DEFAULT_FIELDS = ("status", "name", "source")
+
+IMPORT_RESULT_FIELDS: OutputFieldSet[SshUserImportResult] = OutputFieldSet([
+    OutputField("status", lambda x: x.status),
+    OutputField("name", lambda x: x.candidate.name),
+    OutputField("fingerprint", lambda x: x.candidate.fingerprint),
+    OutputField("source", lambda x: x.candidate.source),
+], default=_IMPORT_DEFAULT_FIELDS)
+
+
+@user.command(name="import")
+@click.argument(
+    "sources",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, readable=True))
+@click.option(
+    "--name-template", "name_template",
+    type=str,
+    default=None,
+    help=(
+        "How to derive user names from `{stem}` (the file's basename "
+        "minus the `.pub` suffix), `{comment}` or `{comment_user}` (the "
+        "key comment's part before any '@'). Defaults to `{stem}` "
+        "for `*.pub` files and `{comment_user}` for `authorized_keys`."))
+@click.option(
+    "--dry-run", "dry_run",
+    is_flag=True,
+    default=False,
+    help="Only report what would be imported.")
+@cli_output_format_option()
+@cli_output_fields_option(
+    IMPORT_RESULT_FIELDS.names, _IMPORT_DEFAULT_FIELDS)
+@pass_cli_ctx
+def import_cmd(
+        ctx: CliCtx,
+        sources: Tuple[str, ...],
+        name_template: Optional[str],
+        dry_run: bool,
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
+    """Bulk import *ssh users* from existing pubkeys.
+
+    SOURCES: Dirs are scanned for `*.pub` files (one user per file).
+    Other files are parsed as `authorized_keys` (one user per key).
+
+    Pubkeys already known (by fingerprint) and users whose name is
+    already taken are skipped.
+    """
+    fields = IMPORT_RESULT_FIELDS.select(output_fields)
+
+    try:
+        results = import_ssh_users(
+            ctx.repo,
+            iter_import_candidates(
+                (Path(s) for s in sources), name_template),
+            dry_run=dry_run)
+    except (SshUsersImportError, SshAuthDirRepoError) as e:
+        raise CliError(str(e)) from e
+
+    echo_records(output_format, fields, IMPORT_RESULT_FIELDS, results)
+
+
 user.add_command(pubkey)
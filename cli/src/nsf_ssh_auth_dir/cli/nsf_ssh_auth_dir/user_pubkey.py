@@ -8,16 +8,38 @@ from nsf_ssh_auth_dir.cli.arguments import (
     cli_ssh_pubkey_argument,
     ensure_ssh_pubkey_or_fallback_or_fail
 )
+from nsf_ssh_auth_dir.cli.formatting import (OutputField, OutputFieldSet,
+                                             echo_records)
+from nsf_ssh_auth_dir.cli.options import (cli_output_fields_option,
+                                          cli_output_format_option)
 from nsf_ssh_auth_dir.click.error import CliError
+from nsf_ssh_auth_dir.file_pubkey import DEFAULT_MIN_RSA_BITS
 from nsf_ssh_auth_dir.repo_users import (
+    SshUsersRepoAccessError,
     SshUsersRepoFileAccessError,
     SshUsersRepoKeyAccessError
 )
 
+from nsf_ssh_auth_dir.repo_pubkey_validation import (
+    SshPubkeyValidationCache,
+    SshPubkeyValidationResult,
+    validate_ssh_auth_dir_pubkeys,
+)
 from nsf_ssh_auth_dir.repo_user_pubkeys import SshUserPubkeysRepoAccessError
 
 from ._ctx import CliCtx, pass_cli_ctx
 
+_VALIDATION_DEFAULT_FIELDS = ("user", "valid", "error")
+
+VALIDATION_FIELDS: OutputFieldSet[SshPubkeyValidationResult] = OutputFieldSet([
+    OutputField("user", lambda x: x.username),
+    OutputField("valid", lambda x: x.valid),
+    OutputField("error", lambda x: x.error),
+    OutputField(
+        "path", lambda x: None if x.filename is None else str(x.filename)),
+    OutputField("cached", lambda x: x.cached),
+], default=_VALIDATION_DEFAULT_FIELDS)
+
 
 @click.group()
 def pubkey() -> None:
@@ -110,3 +132,57 @@ def print(ctx: CliCtx, ssh_user_id: Optional[str]) -> None:
             click.echo(l.rstrip("\n"))
     except (SshUsersRepoFileAccessError, SshUsersRepoKeyAccessError) as e:
         raise CliError(str(e)) from e
+
+
+@pubkey.command()
+@click.option(
+    "--jobs", "-j", "jobs",
+    type=int,
+    default=None,
+    help="The number of worker processes. Defaults to the number of cpus.")
+@click.option(
+    "--min-rsa-bits", "min_rsa_bits",
+    type=int,
+    default=DEFAULT_MIN_RSA_BITS,
+    show_default=True,
+    help="The minimum size of valid rsa keys.")
+@click.option(
+    "--no-cache", "no_cache",
+    is_flag=True,
+    default=False,
+    help="Neither use nor update the persistent validation results cache.")
+@cli_output_format_option()
+@cli_output_fields_option(VALIDATION_FIELDS.names, _VALIDATION_DEFAULT_FIELDS)
+@pass_cli_ctx
+def validate(
+        ctx: CliCtx,
+        jobs: Optional[int],
+        min_rsa_bits: int,
+        no_cache: bool,
+        output_format: str,
+        output_fields: Optional[str]
+) -> None:
+    """Validate the *ssh public key* of every user.
+
+    Keys are fully decoded and checked. Results are cached by key
+    content so that only new or changed keys get validated again.
+    """
+    fields = VALIDATION_FIELDS.select(output_fields)
+
+    if no_cache:
+        cache = SshPubkeyValidationCache()
+    else:
+        cache = SshPubkeyValidationCache.mk_persistent()
+
+    try:
+        results = validate_ssh_auth_dir_pubkeys(
+            ctx.repo, cache, jobs, min_rsa_bits)
+    except SshUsersRepoAccessError as e:
+        raise CliError(str(e)) from e
+    cache.save()
+
+    echo_records(output_format, fields, VALIDATION_FIELDS, results)
+
+    n_invalid = sum(1 for r in results if not r.valid)
+    if n_invalid:
+        raise CliError(f"Found {n_invalid} invalid *ssh public key(s)*.")
@@ -1,5 +1,7 @@
 import click
-from typing import Any
+from typing import Any, Iterable, List
+
+from .formatting import OUTPUT_FORMATS
 
 
 def cli_force_flag() -> Any:
@@ -104,3 +106,56 @@ def cli_device_state_always_flag() -> Any:
             "When we want the user / group to be always authorized "
             "regardless of the current device state."),
     )
+
+
+def cli_output_format_option() -> Any:
+    return click.option(
+        "--format", "output_format",
+        type=click.Choice(OUTPUT_FORMATS),
+        default="text",
+        show_default=True,
+        help=(
+            "The output format. Records are streamed as they are "
+            "produced whatever the format ('json' being a single "
+            "array, 'ndjson' one object per line)."),
+        envvar='NSF_CLI_OUTPUT_FORMAT',
+    )
+
+
+def cli_output_fields_option(
+        field_names: List[str], default: Iterable[str] = ("name",)) -> Any:
+    fields_str = ", ".join(field_names)
+    default_str = ",".join(default)
+    return click.option(
+        "--fields", "output_fields",
+        type=str,
+        default=None,
+        help=(
+            "Comma separated list of fields to output for each item. "
+            f"Available fields: {fields_str}. "
+            f"Defaults to '{default_str}'."),
+    )
+
+
+def cli_compile_on_option() -> Any:
+    return click.option(
+        "--on", "device_state_ons",
+        type=str,
+        multiple=True,
+        help=(
+            "The device states considered active when compiling. All "
+            "states when unspecified."),
+        # autocompletion=list_ac_available_device_state
+    )
+
+
+def cli_access_diff_side_on_option(side: str) -> Any:
+    return click.option(
+        f"--on-{side}", f"device_state_ons_{side}",
+        type=str,
+        multiple=True,
+        help=(
+            f"The device states active on side '{side}' of the "
+            "comparison. All of this side's states when unspecified."),
+        # autocompletion=list_ac_available_device_state
+    )
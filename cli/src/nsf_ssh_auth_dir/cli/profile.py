@@ -0,0 +1,31 @@
+import cProfile
+from pathlib import Path
+
+import click
+
+from nsf_ssh_auth_dir._io_stats import (disable_io_stats, enable_io_stats,
+                                        format_io_stats_lines)
+
+
+def setup_io_stats(ctx: click.Context) -> None:
+    """Collect io counters until `ctx` closes, then print them."""
+    stats = enable_io_stats()
+
+    def on_close() -> None:
+        disable_io_stats()
+        for line in format_io_stats_lines(stats):
+            click.echo(f"stats: {line}", err=True)
+
+    ctx.call_on_close(on_close)
+
+
+def setup_profile(ctx: click.Context, out_filename: Path) -> None:
+    """Profile everything until `ctx` closes."""
+    profiler = cProfile.Profile()
+
+    def on_close() -> None:
+        profiler.disable()
+        profiler.dump_stats(str(out_filename))
+
+    ctx.call_on_close(on_close)
+    profiler.enable()
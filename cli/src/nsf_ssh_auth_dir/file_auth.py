@@ -1,16 +1,23 @@
 import logging
 from pathlib import Path
-from typing import Optional, Set
+from typing import List, Optional, Set
 
 from ._content_persistance_tools import (
     FileContentError,
     add_cond_to_dict_or_rm_key,
     dump_content_to_file,
-    get_opt_list_field_of_expected_type,
     load_content_from_file,
     mk_parent_dirs_opt,
 )
+from ._content_schema_tools import (ListOf, MapOf, Object, OfType, Opt,
+                                    SchemaValidator)
 from ._content_validation_tools import iter_duplicate_items
+from .file_entity_dir import (dump_plain_with_entity_dir,
+                              exists_with_entity_dir_opt,
+                              list_filenames_with_entity_dir_opt,
+                              load_names_with_entity_dir,
+                              load_plain_with_entity_dir, mk_entity_dir_opt)
+from .file_parse_cache import SshAuthDirParseCache
 from .policy_file_format import (
     SshAuthDirFileFormatDefaultPolicy,
     SshAuthDirFileFormatPolicy,
@@ -22,6 +29,7 @@ from .types_auth import (
     SshRawAuthDeviceUser,
 )
 from .types_base_errors import SshAuthDirFileError
+from .types_observer import NOOP_OBSERVER, SshAuthDirRepoObserver
 
 LOGGER = logging.getLogger(__name__)
 
@@ -39,63 +47,87 @@ class SshAuthFileFormatError(SshAuthFileError):
 
 
 def load_plain_ssh_auth_from_file(
-        filename: Path) -> SshPlainAuthT:
+        filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
+) -> SshPlainAuthT:
     try:
-        return load_content_from_file(filename)
+        return load_content_from_file(filename, observer)
     except FileContentError as e:
         raise SshAuthFileAccessError(
             f"Cannot load device state file: {str(e)}")
 
 
-def parse_ssh_auth_device_user_groups(
-        name: str,
-        plain: SshPlainAuthDeviceUserT) -> Set[str]:
-    groups = get_opt_list_field_of_expected_type(
-        plain, "ssh-groups", str, SshAuthFileFormatError)
+_SSH_AUTH_DEVICE_USER_SCHEMA = Object({
+    "ssh-groups": Opt(ListOf(OfType(str))),
+    "ssh-users": Opt(ListOf(OfType(str))),
+})
 
-    if groups is None:
-        groups = []
+_SSH_AUTH_DEVICE_USER_VALIDATOR = SchemaValidator(
+    _SSH_AUTH_DEVICE_USER_SCHEMA)
+_SSH_AUTH_VALIDATOR = SchemaValidator(Object({
+    "device-users": Opt(MapOf(_SSH_AUTH_DEVICE_USER_SCHEMA)),
+}))
 
-    dups = list(iter_duplicate_items(groups))
-    if dups:
-        dups_str = ", ".join(dups)
+
+def _mk_name_set(name: str, names: Optional[List[str]], what: str) -> Set[str]:
+    if names is None:
+        names = []
+
+    names_set = set(names)
+    if len(names_set) != len(names):
+        dups_str = ", ".join(iter_duplicate_items(names))
         LOGGER.warning(
-            f"Device user '{name}' contains duplicate groups: {{{dups_str}}}")
+            f"Device user '{name}' contains duplicate {what}: {{{dups_str}}}")
 
-    return set(groups)
+    return names_set
 
 
-def parse_ssh_auth_device_user_users(
+def _check_ssh_auth_device_user(
+        name: str,
+        plain: SshPlainAuthDeviceUserT) -> None:
+    _SSH_AUTH_DEVICE_USER_VALIDATOR.check(
+        plain, SshAuthFileFormatError, ((None, "device-users"), name))
+
+
+def parse_ssh_auth_device_user_groups(
         name: str,
         plain: SshPlainAuthDeviceUserT) -> Set[str]:
-    users = get_opt_list_field_of_expected_type(
-        plain, "ssh-users", str, SshAuthFileFormatError)
+    _check_ssh_auth_device_user(name, plain)
+    return _mk_name_set(name, plain.get("ssh-groups"), "groups")
 
-    if users is None:
-        users = []
 
-    dups = list(iter_duplicate_items(users))
-    if dups:
-        dups_str = ", ".join(dups)
-        LOGGER.warning(
-            f"Device user '{name}' contains duplicate users: {{{dups_str}}}")
+def parse_ssh_auth_device_user_users(
+        name: str,
+        plain: SshPlainAuthDeviceUserT) -> Set[str]:
+    _check_ssh_auth_device_user(name, plain)
+    return _mk_name_set(name, plain.get("ssh-users"), "users")
 
-    return set(users)
+
+def _mk_ssh_auth_device_user(
+        name: str,
+        plain: SshPlainAuthDeviceUserT) -> SshRawAuthDeviceUser:
+    groups = _mk_name_set(name, plain.get("ssh-groups"), "groups")
+    users = _mk_name_set(name, plain.get("ssh-users"), "users")
+    return SshRawAuthDeviceUser(plain, name, groups, users)
 
 
 def parse_ssh_auth_device_user(
         name: str,
         plain: SshPlainAuthDeviceUserT) -> SshRawAuthDeviceUser:
-    groups = parse_ssh_auth_device_user_groups(name, plain)
-    users = parse_ssh_auth_device_user_users(name, plain)
-    return SshRawAuthDeviceUser(plain, name, groups, users)
+    _check_ssh_auth_device_user(name, plain)
+    return _mk_ssh_auth_device_user(name, plain)
 
 
 def parse_ssh_auth(plain: SshPlainAuthT) -> SshRawAuth:
-    plain_device_users = plain.get("device-users", {})
+    """Raises:
+        SshAuthFileFormatError: Listing all of the content's errors.
+    """
+    _SSH_AUTH_VALIDATOR.check(plain, SshAuthFileFormatError)
+
+    plain_device_users = plain.get("device-users") or {}
 
     device_users_d = {
-        du_name: parse_ssh_auth_device_user(du_name, du_plain)
+        du_name: _mk_ssh_auth_device_user(du_name, du_plain)
         for du_name, du_plain in plain_device_users.items()
     }
 
@@ -103,16 +135,19 @@ def parse_ssh_auth(plain: SshPlainAuthT) -> SshRawAuth:
 
 
 def load_ssh_auth_from_file(
-        filename: Path) -> SshRawAuth:
-    plain = load_plain_ssh_auth_from_file(filename)
+        filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
+) -> SshRawAuth:
+    plain = load_plain_ssh_auth_from_file(filename, observer)
     return parse_ssh_auth(plain)
 
 
 def dump_plain_ssh_auth_to_file(
         auth: SshPlainAuthT,
-        out_filename: Path
+        out_filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
 ) -> None:
-    return dump_content_to_file(auth, out_filename)
+    return dump_content_to_file(auth, out_filename, observer)
 
 
 def dump_ssh_auth_device_user_to_plain_d(
@@ -168,28 +203,63 @@ def dump_ssh_auth_to_plain_d(
 
 def dump_ssh_auth_to_file(
         auth: SshRawAuth,
-        out_filename: Path
+        out_filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
 ) -> None:
     out_d = dump_ssh_auth_to_plain_d(auth)
-    return dump_plain_ssh_auth_to_file(out_d, out_filename)
+    return dump_plain_ssh_auth_to_file(out_d, out_filename, observer)
 
 
 class SshAuthLoader:
     def __init__(
             self,
             dir: Path, stem: str,
-            policy: Optional[SshAuthDirFileFormatPolicy] = None) -> None:
+            policy: Optional[SshAuthDirFileFormatPolicy] = None,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            entity_dir_suffix: Optional[str] = None,
+            parse_cache: Optional[SshAuthDirParseCache] = None
+    ) -> None:
+        self._observer = observer
+        self._parse_cache = parse_cache
         if policy is None:
             policy = SshAuthDirFileFormatDefaultPolicy()
 
         self._filename = policy.get_preferred_source_filename_for(dir, stem)
         assert 1 == sum(1 for _ in policy.get_source_filenames_for(dir, stem))
+        self._entity_dir = mk_entity_dir_opt(
+            dir, stem, policy, observer, entity_dir_suffix)
 
     def load(self) -> SshRawAuth:
-        return load_ssh_auth_from_file(self._filename)
+        if self._parse_cache is None:
+            return parse_ssh_auth(self.load_plain())
+
+        return self._parse_cache.load(
+            "auth", self.list_filenames(),
+            lambda: parse_ssh_auth(self.load_plain()))
 
     def load_plain(self) -> SshPlainAuthT:
-        return load_plain_ssh_auth_from_file(self._filename)
+        if self._entity_dir is None:
+            return load_plain_ssh_auth_from_file(self._filename, self._observer)
+
+        return load_plain_with_entity_dir(
+            self._filename, self._entity_dir, "device-users",
+            SshAuthFileAccessError, SshAuthFileFormatError, self._observer)
+
+    def list_filenames(self) -> List[Path]:
+        return list_filenames_with_entity_dir_opt(
+            self._filename, self._entity_dir)
+
+    def exists(self) -> bool:
+        return exists_with_entity_dir_opt(self._filename, self._entity_dir)
+
+    def load_names(self) -> List[str]:
+        """Without parsing any per entity file."""
+        if self._entity_dir is None:
+            return list(self.load_plain().get("device-users") or {})
+
+        return load_names_with_entity_dir(
+            self._filename, self._entity_dir, "device-users",
+            SshAuthFileAccessError, self._observer)
 
 
 def _mk_parent_dirs_opt(filename: Path, allow: bool) -> None:
@@ -200,17 +270,33 @@ class SshAuthDumper:
     def __init__(
             self,
             dir: Path, stem: str,
-            policy: SshAuthDirFileFormatPolicy) -> None:
+            policy: SshAuthDirFileFormatPolicy,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            entity_dir_suffix: Optional[str] = None
+    ) -> None:
+        self._observer = observer
         self._filename = policy.get_target_filename_for(dir, stem)
+        self._entity_dir = mk_entity_dir_opt(
+            dir, stem, policy, observer, entity_dir_suffix)
 
     def dump_plain(
             self,
             auth: SshPlainAuthT, mk_parent_dirs: bool = True) -> None:
         _mk_parent_dirs_opt(self._filename, mk_parent_dirs)
+        if self._entity_dir is not None:
+            return dump_plain_with_entity_dir(
+                auth, self._filename, self._entity_dir, "device-users",
+                SshAuthFileFormatError, self._observer)
+
         return dump_plain_ssh_auth_to_file(
-            auth, self._filename)
+            auth, self._filename, self._observer)
 
     def dump(self, auth: SshRawAuth, mk_parent_dirs: bool = True) -> None:
         _mk_parent_dirs_opt(self._filename, mk_parent_dirs)
+        if self._entity_dir is not None:
+            return dump_plain_with_entity_dir(
+                dump_ssh_auth_to_plain_d(auth), self._filename, self._entity_dir,
+                "device-users", SshAuthFileFormatError, self._observer)
+
         return dump_ssh_auth_to_file(
-            auth, self._filename)
+            auth, self._filename, self._observer)
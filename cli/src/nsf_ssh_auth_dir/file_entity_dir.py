@@ -0,0 +1,250 @@
+"""Per entity file layout support.
+
+Each entity (e.g.: a user) of a *ssh auth dir* file lives in its own
+`<entity name>.<ext>` file under a `<file stem><suffix>` dir instead of
+under the file's entity key (e.g.: `ssh-users`). The file itself remains
+and holds everything else (e.g.: `ssh-user-defaults`).
+
+Should match `nix-lib/loader.nix`'s `loadEntityDirAttrs`.
+"""
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from ._content_persistance_tools import (FileContentAccessError,
+                                         FileContentError,
+                                         FileContentPlainT,
+                                         dump_content_to_file_if_changed,
+                                         load_content_from_file)
+from ._file_txn_tools import file_exists, get_file_txn, unlink_file
+from .policy_file_format import SshAuthDirFileFormatPolicy
+from .types_observer import NOOP_OBSERVER, SshAuthDirRepoObserver
+
+# The `""` *device user* (i.e.: any *device user*) cannot be a filename.
+_EMPTY_NAME_FILE_STEM = "[ALL]"
+
+
+def encode_entity_file_stem(name: str) -> str:
+    if "" == name:
+        return _EMPTY_NAME_FILE_STEM
+    if "/" in name or name in (".", "..", _EMPTY_NAME_FILE_STEM):
+        raise ValueError(f"Cannot store entity '{name}' in its own file.")
+    return name
+
+
+def decode_entity_file_stem(stem: str) -> str:
+    if _EMPTY_NAME_FILE_STEM == stem:
+        return ""
+    return stem
+
+
+class SshAuthDirEntityDir:
+    """The dir holding one file per entity.
+
+    Listing names never parses any file.
+    """
+    def __init__(
+            self,
+            dir: Path,
+            policy: SshAuthDirFileFormatPolicy,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER
+    ) -> None:
+        self._dir = dir
+        self._policy = policy
+        self._observer = observer
+        self._suffix = policy.get_target_filename_for(dir, "_").suffix
+
+    @property
+    def dir(self) -> Path:
+        return self._dir
+
+    def exists(self) -> bool:
+        if self._dir.is_dir():
+            return True
+
+        txn = get_file_txn()
+        return txn is not None and any(
+            fn.parent == self._dir and content is not None
+            for fn, content in txn.changes.items())
+
+    def get_filename(self, name: str) -> Path:
+        return self._dir.joinpath(
+            f"{encode_entity_file_stem(name)}{self._suffix}")
+
+    def iter_names(self) -> Iterator[str]:
+        """In name order."""
+        filenames: Iterable[Path] = self._policy.iter_target_filenames_in(
+            self._dir)
+        txn = get_file_txn()
+        if txn is not None:
+            filenames = txn.overlay_dir_listing(
+                self._dir, filenames, self._suffix)
+        stems = (fn.name[:-len(fn.suffix)] for fn in filenames)
+        yield from (decode_entity_file_stem(s) for s in sorted(stems))
+
+    def load_plain(self, name: str) -> FileContentPlainT:
+        """Raises:
+            FileContentError: When missing or invalid.
+        """
+        return load_content_from_file(self.get_filename(name), self._observer)
+
+    def iter_plain(self) -> Iterator[FileContentPlainT]:
+        for name in self.iter_names():
+            yield self.load_plain(name)
+
+    def dump_all_plain(self, entities: Dict[str, FileContentPlainT]) -> int:
+        """Make this dir hold exactly `entities`.
+
+        Only the files whose content changed are written and the files of
+        entities no longer present are removed. Return the number of
+        written files.
+        """
+        if get_file_txn() is None:
+            # Otherwise created when the transaction gets applied.
+            self._dir.mkdir(parents=True, exist_ok=True)
+        stale = set(self.iter_names()) - set(entities.keys())
+        written = 0
+        for name, plain in entities.items():
+            if dump_content_to_file_if_changed(
+                    plain, self.get_filename(name), self._observer):
+                written += 1
+
+        for name in stale:
+            unlink_file(self.get_filename(name))
+        return written
+
+    def clear(self) -> None:
+        """Remove all entity files and the dir itself when left empty."""
+        if not self.exists():
+            return
+
+        for name in list(self.iter_names()):
+            unlink_file(self.get_filename(name))
+        if get_file_txn() is not None:
+            return
+        try:
+            self._dir.rmdir()
+        except OSError:
+            # Holds foreign files.
+            pass
+
+
+def load_plain_with_entity_dir(
+        filename: Path,
+        entity_dir: SshAuthDirEntityDir,
+        entity_key: str,
+        access_error_cls: Callable[[str], Exception],
+        format_error_cls: Callable[[str], Exception],
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
+) -> FileContentPlainT:
+    """Load `filename` with the content of `entity_dir` merged under
+        `entity_key`, as if loaded from a single file.
+
+    Either of these may be missing but not both.
+    """
+    try:
+        plain = load_content_from_file(filename, observer)
+    except FileContentAccessError as e:
+        if not entity_dir.exists():
+            raise access_error_cls(f"Cannot load file: {str(e)}") from e
+        plain = {}
+    except FileContentError as e:
+        raise access_error_cls(f"Cannot load file: {str(e)}") from e
+
+    entities = dict(plain.get(entity_key) or {})
+    for name in entity_dir.iter_names():
+        if name in entities:
+            raise format_error_cls(
+                f"'{name}' found both in '{filename}' and "
+                f"'{entity_dir.dir}'.")
+        try:
+            entities[name] = entity_dir.load_plain(name)
+        except FileContentError as e:
+            raise access_error_cls(
+                f"Cannot load '{name}' entity file: {str(e)}") from e
+
+    out = dict(plain)
+    out[entity_key] = entities
+    return out
+
+
+def load_names_with_entity_dir(
+        filename: Path,
+        entity_dir: SshAuthDirEntityDir,
+        entity_key: str,
+        access_error_cls: Callable[[str], Exception],
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
+) -> List[str]:
+    """Same names as `load_plain_with_entity_dir` but without parsing any
+        entity file.
+    """
+    plain: Optional[FileContentPlainT]
+    try:
+        plain = load_content_from_file(filename, observer)
+    except FileContentAccessError as e:
+        if not entity_dir.exists():
+            raise access_error_cls(f"Cannot load file: {str(e)}") from e
+        plain = None
+    except FileContentError as e:
+        raise access_error_cls(f"Cannot load file: {str(e)}") from e
+
+    out = list((plain or {}).get(entity_key) or {})
+    out.extend(entity_dir.iter_names())
+    return out
+
+
+def dump_plain_with_entity_dir(
+        plain: FileContentPlainT,
+        filename: Path,
+        entity_dir: SshAuthDirEntityDir,
+        entity_key: str,
+        format_error_cls: Callable[[str], Exception],
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
+) -> None:
+    """Split `plain` between `filename` and `entity_dir`.
+
+    `filename` keeps an empty `entity_key` as a cue to its format.
+    """
+    try:
+        entity_dir.dump_all_plain(dict(plain.get(entity_key) or {}))
+    except ValueError as e:
+        raise format_error_cls(str(e)) from e
+    rest = dict(plain)
+    rest[entity_key] = {}
+    dump_content_to_file_if_changed(rest, filename, observer)
+
+
+def list_filenames_with_entity_dir_opt(
+        filename: Path,
+        entity_dir: Optional[SshAuthDirEntityDir]
+) -> List[Path]:
+    """All files `load_plain_with_entity_dir` may read, existing or not."""
+    out = [filename]
+    if entity_dir is not None:
+        out.extend(entity_dir.get_filename(n) for n in entity_dir.iter_names())
+    return out
+
+
+def exists_with_entity_dir_opt(
+        filename: Path,
+        entity_dir: Optional[SshAuthDirEntityDir]
+) -> bool:
+    """Whether there is any content to load, telling a missing file apart
+        from an unreadable one.
+    """
+    if file_exists(filename):
+        return True
+    return entity_dir is not None and entity_dir.exists()
+
+
+def mk_entity_dir_opt(
+        dir: Path,
+        stem: str,
+        policy: SshAuthDirFileFormatPolicy,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+        suffix: Optional[str] = None
+) -> Optional[SshAuthDirEntityDir]:
+    """The `<stem><suffix>` entity dir of `<dir>/<stem>.<ext>` if any."""
+    if suffix is None:
+        return None
+    return SshAuthDirEntityDir(
+        dir.joinpath(f"{stem}{suffix}"), policy, observer)
@@ -1,19 +1,27 @@
 import logging
 from pathlib import Path
-from typing import Set
+from typing import List, Optional, Set
 
 from .types_base_errors import SshAuthDirFileError
+from .types_observer import NOOP_OBSERVER, SshAuthDirRepoObserver
 
 from ._content_persistance_tools import (
     FileContentError,
     dump_content_to_file,
     load_content_from_file,
-    get_opt_list_field_of_expected_type,
     mk_parent_dirs_opt,
     add_cond_to_dict_or_rm_key
 )
+from ._content_schema_tools import (ListOf, MapOf, Object, OfType, Opt,
+                                    SchemaValidator)
 from ._content_validation_tools import iter_duplicate_items
 
+from .file_entity_dir import (dump_plain_with_entity_dir,
+                              exists_with_entity_dir_opt,
+                              list_filenames_with_entity_dir_opt,
+                              load_names_with_entity_dir,
+                              load_plain_with_entity_dir, mk_entity_dir_opt)
+from .file_parse_cache import SshAuthDirParseCache
 from .policy_file_format import SshAuthDirFileFormatPolicy
 from .types_groups import SshPlainGroupsT, SshPlainGroupT, SshRawGroup, SshRawGroups
 
@@ -33,30 +41,50 @@ class SshGroupsFileFormatError(SshGroupsFileError):
 
 
 def load_plain_ssh_groups_from_file(
-        filename: Path) -> SshPlainGroupsT:
+        filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
+) -> SshPlainGroupsT:
     try:
-        return load_content_from_file(filename)
+        return load_content_from_file(filename, observer)
     except FileContentError as e:
         raise SshGroupsFileAccessError(
             f"Cannot load device state file: {str(e)}")
 
 
-def parse_ssh_group_members(
+_SSH_GROUP_SCHEMA = Object({
+    "members": Opt(ListOf(OfType(str))),
+})
+
+_SSH_GROUP_VALIDATOR = SchemaValidator(_SSH_GROUP_SCHEMA)
+_SSH_GROUPS_VALIDATOR = SchemaValidator(Object({
+    "ssh-groups": Opt(MapOf(_SSH_GROUP_SCHEMA)),
+}))
+
+
+def _mk_ssh_group_members(
         name: str,
         plain: SshPlainGroupT
 ) -> Set[str]:
-    members = get_opt_list_field_of_expected_type(
-        plain, "members", str, SshGroupsFileFormatError)
+    members = plain.get("members")
 
     if members is None:
         members = []
 
-    dups = list(iter_duplicate_items(members))
-    if dups:
-        dups_str = ", ".join(dups)
+    members_set = set(members)
+    if len(members_set) != len(members):
+        dups_str = ", ".join(iter_duplicate_items(members))
         LOGGER.warning(
             f"Group '{name}' contains duplicate members: {{{dups_str}}}")
-    return set(members)
+    return members_set
+
+
+def parse_ssh_group_members(
+        name: str,
+        plain: SshPlainGroupT
+) -> Set[str]:
+    _SSH_GROUP_VALIDATOR.check(
+        plain, SshGroupsFileFormatError, ((None, "ssh-groups"), name))
+    return _mk_ssh_group_members(name, plain)
 
 
 def parse_ssh_group(
@@ -70,11 +98,16 @@ def parse_ssh_group(
 def parse_ssh_groups(
         plain: SshPlainGroupsT
 ) -> SshRawGroups:
+    """Raises:
+        SshGroupsFileFormatError: Listing all of the content's errors.
+    """
+    _SSH_GROUPS_VALIDATOR.check(plain, SshGroupsFileFormatError)
 
-    plain_groups = plain.get("ssh-groups", {})
+    plain_groups = plain.get("ssh-groups") or {}
 
     groups_d = {
-        g_name: parse_ssh_group(g_name, g_plain)
+        g_name: SshRawGroup(
+            g_plain, g_name, _mk_ssh_group_members(g_name, g_plain))
         for g_name, g_plain in plain_groups.items()
     }
 
@@ -82,16 +115,19 @@ def parse_ssh_groups(
 
 
 def load_ssh_groups_from_file(
-        filename: Path) -> SshRawGroups:
-    plain = load_plain_ssh_groups_from_file(filename)
+        filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
+) -> SshRawGroups:
+    plain = load_plain_ssh_groups_from_file(filename, observer)
     return parse_ssh_groups(plain)
 
 
 def dump_plain_ssh_groups_to_file(
         groups: SshPlainGroupsT,
-        out_filename: Path
+        out_filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
 ) -> None:
-    return dump_content_to_file(groups, out_filename)
+    return dump_content_to_file(groups, out_filename, observer)
 
 
 def dump_ssh_group_to_plain_d(
@@ -134,25 +170,60 @@ def dump_ssh_groups_to_plain_d(
 
 def dump_ssh_groups_to_file(
         groups: SshRawGroups,
-        out_filename: Path
+        out_filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
 ) -> None:
     out_d = dump_ssh_groups_to_plain_d(groups)
-    return dump_plain_ssh_groups_to_file(out_d, out_filename)
+    return dump_plain_ssh_groups_to_file(out_d, out_filename, observer)
 
 
 class SshGroupsLoader:
     def __init__(
             self,
             dir: Path, stem: str,
-            policy: SshAuthDirFileFormatPolicy) -> None:
+            policy: SshAuthDirFileFormatPolicy,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            entity_dir_suffix: Optional[str] = None,
+            parse_cache: Optional[SshAuthDirParseCache] = None
+    ) -> None:
+        self._observer = observer
+        self._parse_cache = parse_cache
         self._filename = policy.get_preferred_source_filename_for(dir, stem)
         assert 1 == sum(1 for _ in policy.get_source_filenames_for(dir, stem))
+        self._entity_dir = mk_entity_dir_opt(
+            dir, stem, policy, observer, entity_dir_suffix)
 
     def load(self) -> SshRawGroups:
-        return load_ssh_groups_from_file(self._filename)
+        if self._parse_cache is None:
+            return parse_ssh_groups(self.load_plain())
+
+        return self._parse_cache.load(
+            "groups", self.list_filenames(),
+            lambda: parse_ssh_groups(self.load_plain()))
 
     def load_plain(self) -> SshPlainGroupsT:
-        return load_plain_ssh_groups_from_file(self._filename)
+        if self._entity_dir is None:
+            return load_plain_ssh_groups_from_file(self._filename, self._observer)
+
+        return load_plain_with_entity_dir(
+            self._filename, self._entity_dir, "ssh-groups",
+            SshGroupsFileAccessError, SshGroupsFileFormatError, self._observer)
+
+    def list_filenames(self) -> List[Path]:
+        return list_filenames_with_entity_dir_opt(
+            self._filename, self._entity_dir)
+
+    def exists(self) -> bool:
+        return exists_with_entity_dir_opt(self._filename, self._entity_dir)
+
+    def load_names(self) -> List[str]:
+        """Without parsing any per entity file."""
+        if self._entity_dir is None:
+            return list(self.load_plain().get("ssh-groups") or {})
+
+        return load_names_with_entity_dir(
+            self._filename, self._entity_dir, "ssh-groups",
+            SshGroupsFileAccessError, self._observer)
 
 
 def _mk_parent_dirs_opt(filename: Path, allow: bool) -> None:
@@ -163,14 +234,30 @@ class SshGroupsDumper:
     def __init__(
             self,
             dir: Path, stem: str,
-            policy: SshAuthDirFileFormatPolicy) -> None:
+            policy: SshAuthDirFileFormatPolicy,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            entity_dir_suffix: Optional[str] = None
+    ) -> None:
+        self._observer = observer
         self._filename = policy.get_target_filename_for(dir, stem)
+        self._entity_dir = mk_entity_dir_opt(
+            dir, stem, policy, observer, entity_dir_suffix)
 
     def dump_plain(self, groups: SshPlainGroupsT) -> None:
+        if self._entity_dir is not None:
+            return dump_plain_with_entity_dir(
+                groups, self._filename, self._entity_dir, "ssh-groups",
+                SshGroupsFileFormatError, self._observer)
+
         return dump_plain_ssh_groups_to_file(
-            groups, self._filename)
+            groups, self._filename, self._observer)
 
     def dump(self, groups: SshRawGroups, mk_parent_dirs: bool = True) -> None:
         _mk_parent_dirs_opt(self._filename, mk_parent_dirs)
+        if self._entity_dir is not None:
+            return dump_plain_with_entity_dir(
+                dump_ssh_groups_to_plain_d(groups), self._filename, self._entity_dir,
+                "ssh-groups", SshGroupsFileFormatError, self._observer)
+
         return dump_ssh_groups_to_file(
-            groups, self._filename)
+            groups, self._filename, self._observer)
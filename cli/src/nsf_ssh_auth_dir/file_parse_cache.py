@@ -0,0 +1,223 @@
+"""Opt-in, persistent cache of parsed *ssh auth dir* files.
+
+Loading large users, groups or auth files is dominated by their json /
+yaml decoding and the validation of their fields. This cache keeps the
+loaders' parse results, pickled, under
+`$XDG_CACHE_HOME/nsf-ssh-auth-dir/parse` so that later processes only
+unpickle them (see `SshUsersLoader` for what is kept of users files).
+
+An entry is only used when its key matches that of the loaded files as
+currently on disk: the absolute path, inode, size and mtime (in ns) of
+each of them (more than one when using entity dirs), along with a
+fingerprint of this library's parsing code. Files modified too recently
+for their mtime to tell apart a later same size modification (as git's
+*racily clean* files) are not cached. Loads within a file transaction
+bypass the cache, its pending changes not being on disk.
+
+Cache files are evicted in least recently used order once they total
+more than `max_bytes`. As with our other caches, failing to read or
+write the cache is never an error.
+"""
+import hashlib
+import os
+import pickle
+import time
+from pathlib import Path
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple, TypeVar
+
+from ._cache_tools import get_cache_dir
+from ._file_txn_tools import get_file_txn
+from ._io_stats import record_stat_call
+
+_T = TypeVar("_T")
+
+PARSE_CACHE_DIRNAME = "parse"
+DEFAULT_PARSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Bumped whenever the cached representation changes in a way the
+# library fingerprint would not catch.
+_CACHE_FORMAT_VERSION = 1
+_CACHE_SUFFIX = ".pickle"
+# Mtimes this close to now might not change on a further modification.
+_RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+# The modules defining how files are parsed and what they are parsed to.
+_LIBRARY_MODULE_PREFIXES = ("file_", "types_", "_content", "_lazy")
+
+_FileKeyT = Tuple[str, int, int, int]
+_KeyT = Tuple[int, str, str, Tuple[_FileKeyT, ...]]
+
+_library_fingerprint: Optional[str] = None
+
+
+def _get_library_fingerprint() -> str:
+    """Changes on any install or edit of the parsing code."""
+    global _library_fingerprint
+    if _library_fingerprint is None:
+        pkg_dir = Path(__file__).parent
+        h = hashlib.sha256()
+        for fn in sorted(pkg_dir.glob("*.py")):
+            if not fn.name.startswith(_LIBRARY_MODULE_PREFIXES):
+                continue
+            st = fn.stat()
+            h.update(f"{fn.name}:{st.st_size}:{st.st_mtime_ns};".encode())
+        _library_fingerprint = h.hexdigest()[:16]
+    return _library_fingerprint
+
+
+class SshAuthDirParseCacheStats(NamedTuple):
+    dir: Path
+    entries: int
+    size: int
+
+
+class SshAuthDirParseCache:
+    def __init__(
+            self,
+            dir: Optional[Path] = None,
+            max_bytes: int = DEFAULT_PARSE_CACHE_MAX_BYTES
+    ) -> None:
+        if dir is None:
+            dir = get_cache_dir().joinpath(PARSE_CACHE_DIRNAME)
+        self._dir = dir
+        self._max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def dir(self) -> Path:
+        return self._dir
+
+    def _mk_key(self, kind: str, filenames: List[Path]) -> Optional[_KeyT]:
+        """`None` when any of the files cannot be stat-ed."""
+        files = []
+        for fn in filenames:
+            try:
+                st = os.stat(fn)
+            except OSError:
+                return None
+            files.append((str(fn.absolute()), st.st_ino, st.st_size,
+                          st.st_mtime_ns))
+        record_stat_call(len(filenames))
+        return (_CACHE_FORMAT_VERSION, _get_library_fingerprint(), kind,
+                tuple(files))
+
+    def _get_cache_filename(self, kind: str, filename: Path) -> Path:
+        name_key = hashlib.sha256(
+            f"{kind}:{filename.absolute()}".encode()).hexdigest()[:32]
+        return self._dir.joinpath(f"{name_key}{_CACHE_SUFFIX}")
+
+    def _read(self, cache_filename: Path, key: _KeyT) -> Tuple[bool, Any]:
+        try:
+            with open(cache_filename, "rb") as f:
+                # The key first so that stale values are never unpickled.
+                if key != pickle.load(f):
+                    return False, None
+                value = pickle.load(f)
+        except Exception:
+            # Missing, torn or from an incompatible library.
+            return False, None
+
+        try:
+            # Marks it as recently used.
+            os.utime(cache_filename)
+        except OSError:
+            pass
+        return True, value
+
+    def _write(self, cache_filename: Path, key: _KeyT, value: Any) -> None:
+        tmp_filename = cache_filename.with_name(
+            f".{cache_filename.name}.{os.getpid()}.tmp")
+        try:
+            self._dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            with open(tmp_filename, "wb") as f:
+                pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_filename, cache_filename)
+        except (OSError, pickle.PicklingError):
+            try:
+                tmp_filename.unlink()
+            except OSError:
+                pass
+            return
+
+        self._evict()
+
+    def _list_entries(self) -> List[Tuple[int, int, Path]]:
+        """As `(mtime_ns, size, filename)`, least recently used first."""
+        out = []
+        try:
+            children = list(self._dir.iterdir())
+        except OSError:
+            return []
+        for fn in children:
+            if fn.suffix != _CACHE_SUFFIX or fn.name.startswith("."):
+                continue
+            try:
+                st = fn.stat()
+            except OSError:
+                continue
+            out.append((st.st_mtime_ns, st.st_size, fn))
+        return sorted(out)
+
+    def _evict(self) -> None:
+        entries = self._list_entries()
+        total = sum(size for _, size, _ in entries)
+        # Never evicts the entry just written.
+        for _, size, fn in entries[:-1]:
+            if total <= self._max_bytes:
+                break
+            try:
+                fn.unlink()
+            except OSError:
+                continue
+            total -= size
+
+    def load(
+            self,
+            kind: str,
+            filenames: List[Path],
+            parse_fn: Callable[[], _T]
+    ) -> _T:
+        """Return `parse_fn()`'s cached result for `filenames` as currently
+            on disk, calling it and caching its result on a miss.
+
+        `filenames`, whose first one identifies the entry, should be all
+        of the files `parse_fn` reads. Errors raised by `parse_fn` are
+        never cached.
+        """
+        if get_file_txn() is not None or not filenames:
+            return parse_fn()
+
+        key = self._mk_key(kind, filenames)
+        if key is None:
+            return parse_fn()
+
+        cache_filename = self._get_cache_filename(kind, filenames[0])
+        found, value = self._read(cache_filename, key)
+        if found:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        out = parse_fn()
+        racy_ns = time.time_ns() - _RACY_WINDOW_NS
+        if all(mtime_ns < racy_ns for _, _, _, mtime_ns in key[3]) \
+                and key == self._mk_key(kind, filenames):
+            self._write(cache_filename, key, out)
+        return out
+
+    def stats(self) -> SshAuthDirParseCacheStats:
+        entries = self._list_entries()
+        return SshAuthDirParseCacheStats(
+            self._dir, len(entries), sum(size for _, size, _ in entries))
+
+    def clear(self) -> int:
+        """Remove all cache files, returning how many were removed."""
+        removed = 0
+        for _, _, fn in self._list_entries():
+            try:
+                fn.unlink()
+            except OSError:
+                continue
+            removed += 1
+        return removed
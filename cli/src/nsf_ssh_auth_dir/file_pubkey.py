@@ -1,9 +1,15 @@
+import base64
+import binascii
+import hashlib
 import os
 import re
 from pathlib import Path
-from typing import Iterable, Iterator, Optional
+from typing import FrozenSet, Iterable, Iterator, List, Optional, Tuple
 
 from ._content_persistance_tools import mk_parent_dirs_opt
+from ._file_txn_tools import (get_file_txn, get_write_generation,
+                              read_file_bytes, write_file_bytes)
+from ._io_stats import record_read, record_stat_call, timed_phase
 from .types_base_errors import SshAuthDirFileError
 from .types_pubkey import (SshPubKey, SshPubKeyFileTemplateVars,
                            SshPubKeyLookupInfo, SshPubKeyLookupInfoOpt)
@@ -44,13 +50,14 @@ class SshPubkeyFileNotFoundUsingProvidedLookupInfoError(
 
 def load_ssh_pubkey(filename: Path) -> SshPubKey:
     try:
-        with open(filename) as in_f:
-            return SshPubKey(
-                text_lines=list(in_f)
-            )
+        with timed_phase("pubkey-read"):
+            content = read_file_bytes(filename)
     except FileNotFoundError as e:
         raise SshPubkeyFileAccessError(str(e)) from e
 
+    record_read(filename, len(content))
+    return SshPubKey.from_bytes(content)
+
 
 def get_user_home_ssh_dir() -> Path:
     return Path.home().joinpath(".ssh")
@@ -65,8 +72,125 @@ def load_user_home_ssh_pubkey() -> SshPubKey:
 
 
 def dump_ssh_pubkey(pubkey: SshPubKey, out_filename: Path) -> None:
-    with open(out_filename, "w") as out_f:
-        out_f.writelines(pubkey.text_lines)
+    write_file_bytes(out_filename, pubkey.content)
+
+
+def get_ssh_pubkey_fingerprint(pubkey: SshPubKey) -> Optional[str]:
+    """Return the `ssh-keygen -l` style *SHA256* fingerprint of the pubkey.
+
+    Only the first non empty line is considered. `None` is returned
+    when the key's blob is not valid base64.
+    """
+    for line in pubkey.text_lines:
+        ln_split = line.split()
+        if not ln_split:
+            continue
+
+        if len(ln_split) < 2:
+            return None
+
+        try:
+            blob = base64.b64decode(ln_split[1], validate=True)
+        except (binascii.Error, ValueError):
+            return None
+
+        digest = hashlib.sha256(blob).digest()
+        digest_b64 = base64.b64encode(digest).decode("ascii").rstrip("=")
+        return f"SHA256:{digest_b64}"
+
+    return None
+
+
+DEFAULT_MIN_RSA_BITS = 2048
+
+_SSH_ECDSA_CURVES = {
+    "ecdsa-sha2-nistp256": "nistp256",
+    "ecdsa-sha2-nistp384": "nistp384",
+    "ecdsa-sha2-nistp521": "nistp521",
+    "sk-ecdsa-sha2-nistp256@openssh.com": "nistp256",
+}
+
+
+def _read_ssh_string(blob: bytes, offset: int) -> Tuple[bytes, int]:
+    """Raises:
+        ValueError: When truncated.
+    """
+    end = offset + 4
+    if end > len(blob):
+        raise ValueError("truncated key blob")
+    n = int.from_bytes(blob[offset:end], "big")
+    if end + n > len(blob):
+        raise ValueError("truncated key blob")
+    return blob[end:end + n], end + n
+
+
+def _check_ssh_key_blob(
+        key_type: str, blob: bytes, min_rsa_bits: int) -> None:
+    """Raises:
+        ValueError: With the reason the key blob is invalid.
+    """
+    blob_type, offset = _read_ssh_string(blob, 0)
+    if blob_type != key_type.encode():
+        raise ValueError(
+            f"key type '{key_type}' does not match its blob's "
+            f"'{blob_type.decode(errors='replace')}'")
+
+    fields: List[bytes] = []
+    while offset < len(blob):
+        field, offset = _read_ssh_string(blob, offset)
+        fields.append(field)
+
+    if "ssh-rsa" == key_type:
+        if 2 != len(fields):
+            raise ValueError("expected an rsa exponent and modulus")
+        bits = int.from_bytes(fields[1], "big").bit_length()
+        if bits < min_rsa_bits:
+            raise ValueError(
+                f"rsa key of {bits} bits, at least {min_rsa_bits} required")
+    elif key_type in ("ssh-ed25519", "sk-ssh-ed25519@openssh.com"):
+        n_fields = 1 if "ssh-ed25519" == key_type else 2
+        if n_fields != len(fields) or 32 != len(fields[0]):
+            raise ValueError("expected a 32 bytes ed25519 key")
+    elif key_type in _SSH_ECDSA_CURVES:
+        n_fields = 3 if key_type.startswith("sk-") else 2
+        if n_fields != len(fields) \
+                or fields[0] != _SSH_ECDSA_CURVES[key_type].encode():
+            raise ValueError("expected the key's curve and point")
+    else:
+        raise ValueError(f"unsupported key type '{key_type}'")
+
+
+def validate_ssh_pubkey_lines(
+        text_lines: Iterable[str],
+        min_rsa_bits: int = DEFAULT_MIN_RSA_BITS
+) -> Optional[str]:
+    """Return why the pubkey is invalid, `None` when valid.
+
+    Each non empty, non comment line should be an `<type> <base64 blob>
+    [comment]` key whose blob embeds the same type and well formed key
+    fields. Rsa keys should be at least `min_rsa_bits` long.
+    """
+    n_keys = 0
+    for i, line in enumerate(text_lines, 1):
+        ln_split = line.split(maxsplit=2)
+        if not ln_split or ln_split[0].startswith("#"):
+            continue
+
+        n_keys += 1
+        if len(ln_split) < 2:
+            return f"line {i}: expected a key type and blob"
+
+        try:
+            blob = base64.b64decode(ln_split[1], validate=True)
+            _check_ssh_key_blob(ln_split[0], blob, min_rsa_bits)
+        except binascii.Error:
+            return f"line {i}: key blob is not valid base64"
+        except ValueError as e:
+            return f"line {i}: {e}"
+
+    if 0 == n_keys:
+        return "no key"
+    return None
 
 
 def expand_file_template_vars(
@@ -156,43 +280,192 @@ def merge_lookup_info(
     return out
 
 
+_USERNAME_TEMPLATE_VAR = "${ssh-user.name}"
+
+
+class SshPubkeyLookupPlan:
+    """A defaults lookup compiled once for all of the users sharing it
+        (i.e.: those without lookup overrides of their own).
+
+    Search dirs are made absolute and file templates pre-split around
+    the user name variable. Search dirs' listings are kept as indexes
+    so that resolving a user's pubkey is a few string joins and set
+    lookups. Indexes are dropped on any write through this package
+    (see `_file_txn_tools`) or, on `refresh`, when their dir changed.
+    """
+    def __init__(
+            self,
+            lookup: SshPubKeyLookupInfo,
+            ssh_auth_dir_root: Path
+    ) -> None:
+        assert lookup.file is None
+        # Shared by all users, thus never to be mutated.
+        self._lookup = lookup
+        self._dirs = [
+            str(_canonicalize_potentially_rel_path(sp, ssh_auth_dir_root))
+            for sp in lookup.file_search_path]
+        self._templates: List[Tuple[str, ...]] = []
+        for ft in lookup.file_template:
+            parts = tuple(ft.split(_USERNAME_TEMPLATE_VAR))
+            # Make sure no other variable remain in the file template.
+            assert re.search(r"\${[^}]*}", "".join(parts)) is None
+            self._templates.append(parts)
+        # Per search dir, its mtime and entries when listed.
+        self._indexes: List[Optional[Tuple[int, FrozenSet[str]]]] = \
+            [None] * len(self._dirs)
+        self._generation = get_write_generation()
+
+    @property
+    def lookup(self) -> SshPubKeyLookupInfo:
+        return self._lookup
+
+    def iter_filenames(self, username: str) -> Iterator[Path]:
+        for d in self._dirs:
+            for parts in self._templates:
+                yield Path(d, username.join(parts))
+
+    def _get_index(self, i: int) -> FrozenSet[str]:
+        generation = get_write_generation()
+        if generation != self._generation:
+            self.invalidate()
+            self._generation = generation
+
+        index = self._indexes[i]
+        if index is not None:
+            return index[1]
+
+        dir = self._dirs[i]
+        try:
+            # Before listing so that any later change is noticed.
+            mtime_ns = os.stat(dir).st_mtime_ns
+            names = frozenset(os.listdir(dir))
+        except OSError:
+            mtime_ns, names = -1, frozenset()
+        record_stat_call()
+        self._indexes[i] = (mtime_ns, names)
+        return names
+
+    def get_selected_filename(
+            self, username: str) -> Tuple[Optional[Path], int]:
+        """Return the first existing candidate if any, along with the
+            number of probed candidates.
+        """
+        probes = 0
+        for i, d in enumerate(self._dirs):
+            index = self._get_index(i)
+            for parts in self._templates:
+                probes += 1
+                name = username.join(parts)
+                if os.sep in name:
+                    # Not in the dir's listing, but in one of its subdirs.
+                    filename = Path(d, name)
+                    record_stat_call()
+                    if os.access(filename, os.R_OK):
+                        return filename, probes
+                elif name in index:
+                    return Path(d, name), probes
+        return None, probes
+
+    def refresh(self) -> None:
+        """Drop the indexes of the search dirs that changed since listed."""
+        for i, index in enumerate(self._indexes):
+            if index is None:
+                continue
+            try:
+                mtime_ns = os.stat(self._dirs[i]).st_mtime_ns
+            except OSError:
+                mtime_ns = -1
+            record_stat_call()
+            if mtime_ns != index[0]:
+                self._indexes[i] = None
+
+    def invalidate(self) -> None:
+        self._indexes = [None] * len(self._dirs)
+
+
+def is_empty_lookup_info(lookup: SshPubKeyLookupInfoOpt) -> bool:
+    return lookup.file is None and lookup.file_template is None \
+        and lookup.file_search_path is None
+
+
 class SshPubkeysDb:
     def __init__(
         self,
         user_lookup: SshPubKeyLookupInfoOpt,
         default_lookup: SshPubKeyLookupInfo,
         ssh_auth_dir_root: Path,
-        template_vars: SshPubKeyFileTemplateVars
+        template_vars: SshPubKeyFileTemplateVars,
+        plan: Optional[SshPubkeyLookupPlan] = None
     ) -> None:
+        """`plan`, when provided, must have been compiled from
+            `default_lookup` and `user_lookup` be empty.
+        """
         self._user_lookup = user_lookup
+        assert plan is None or is_empty_lookup_info(user_lookup)
+        self._plan = plan
         self._uncanonical_lookup = merge_lookup_info(
             [user_lookup], default_lookup
         )
-        self._lookup = canonicalize_lookup_info(
-            self._uncanonical_lookup,
-            ssh_auth_dir_root,
-            template_vars
-        )
+        self._canonical_lookup: Optional[SshPubKeyLookupInfo] = None
         self._ssh_auth_dir_root = ssh_auth_dir_root
         self._template_vars = template_vars
+        # Locations probed by `get_selected_filename` so far.
+        self.probes = 0
+
+    @property
+    def _lookup(self) -> SshPubKeyLookupInfo:
+        if self._canonical_lookup is None:
+            self._canonical_lookup = canonicalize_lookup_info(
+                self._uncanonical_lookup,
+                self._ssh_auth_dir_root,
+                self._template_vars
+            )
+        return self._canonical_lookup
 
     def iter_filenames(self) -> Iterator[Path]:
+        if self._plan is not None:
+            yield from self._plan.iter_filenames(self._template_vars.username)
+            return
+
         for sp in self._lookup.file_search_path:
             assert sp.is_absolute()
             for ft in self._lookup.file_template:
                 filename = sp.joinpath(ft)
                 yield filename
 
+    def iter_candidate_filenames(self) -> Iterator[Path]:
+        """Filenames the selected pubkey is looked up at, in order."""
+        if self._plan is None and self._lookup.file is not None:
+            yield self._lookup.file
+            return
+
+        yield from self.iter_filenames()
+
     def get_selected_filename(
             self) -> Path:
+        # A file transaction's pending writes are not on disk yet.
+        if self._plan is not None and get_file_txn() is None:
+            with timed_phase("pubkey-lookup"):
+                selected, probes = self._plan.get_selected_filename(
+                    self._template_vars.username)
+            self.probes += probes
+            if selected is not None:
+                return selected
+            raise SshPubkeyFileNotFoundUsingProvidedLookupInfoError(
+                self._lookup, "readable")
+
         lookup = self._lookup
 
         if lookup.file is not None:
+            self.probes += 1
             return lookup.file
 
-        for filename in self.iter_filenames():
-            if os.access(filename, os.R_OK):
-                return filename
+        with timed_phase("pubkey-lookup"):
+            for filename in self.iter_filenames():
+                self.probes += 1
+                record_stat_call()
+                if os.access(filename, os.R_OK):
+                    return filename
 
         raise SshPubkeyFileNotFoundUsingProvidedLookupInfoError(
             self._lookup, "readable")
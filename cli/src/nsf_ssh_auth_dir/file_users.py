@@ -1,17 +1,26 @@
 import logging
 from pathlib import Path
+from typing import List, Optional, Tuple
 
+from ._content_schema_tools import (ListOf, MapOf, Object, OfType, Opt,
+                                    SchemaValidator)
+from ._lazy_parsing_tools import LazyParsedDict
 from .types_base_errors import SshAuthDirFileError
+from .types_observer import NOOP_OBSERVER, SshAuthDirRepoObserver
 
 from ._content_persistance_tools import (
     FileContentError,
     dump_content_to_file,
-    get_opt_field_of_expected_type,
-    get_opt_list_field_of_expected_type,
     load_content_from_file,
     mk_parent_dirs_opt,
     add_cond_to_dict_or_rm_key
 )
+from .file_entity_dir import (dump_plain_with_entity_dir,
+                              exists_with_entity_dir_opt,
+                              list_filenames_with_entity_dir_opt,
+                              load_names_with_entity_dir,
+                              load_plain_with_entity_dir, mk_entity_dir_opt)
+from .file_parse_cache import SshAuthDirParseCache
 from .policy_file_format import SshAuthDirFileFormatPolicy
 from .types_users import (
     SshPlainUserDefaultsT,
@@ -38,93 +47,150 @@ class SshUsersFileFormatError(SshUsersFileError):
 
 
 def load_plain_ssh_users_from_file(
-        filename: Path) -> SshPlainUsersT:
+        filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
+) -> SshPlainUsersT:
     try:
-        return load_content_from_file(filename)
+        return load_content_from_file(filename, observer)
     except FileContentError as e:
         raise SshUsersFileAccessError(
             f"Cannot load device state file: {str(e)}")
 
 
-def parse_ssh_user_defaults(
+_SSH_USER_DEFAULTS_SCHEMA = Object({
+    "pubkey-file-template": Opt(ListOf(OfType(str))),
+    "pubkey-file-search-path": Opt(ListOf(OfType(str))),
+})
+
+_SSH_USER_SCHEMA = Object({
+    "pubkey-file-template": Opt(OfType(str)),
+    "pubkey-file-search-path": Opt(OfType(str)),
+    "pubkey-file": Opt(OfType(str)),
+})
+
+_SSH_USERS_FIELDS = {
+    "ssh-user-defaults": Opt(_SSH_USER_DEFAULTS_SCHEMA),
+}
+
+_SSH_USER_DEFAULTS_VALIDATOR = SchemaValidator(_SSH_USER_DEFAULTS_SCHEMA)
+_SSH_USER_VALIDATOR = SchemaValidator(_SSH_USER_SCHEMA)
+# Users are validated on access, see `parse_ssh_users`.
+_SSH_USERS_SHALLOW_VALIDATOR = SchemaValidator(Object({
+    **_SSH_USERS_FIELDS,
+    "ssh-users": Opt(OfType(dict)),
+}))
+_SSH_USERS_VALIDATOR = SchemaValidator(Object({
+    **_SSH_USERS_FIELDS,
+    "ssh-users": Opt(MapOf(_SSH_USER_SCHEMA)),
+}))
+
+_SSH_USERS_PATH = (None, "ssh-users")
+
+
+def validate_plain_ssh_users(plain: SshPlainUsersT) -> None:
+    """Validate the whole content at once, users included.
+
+    Raises:
+        SshUsersFileFormatError: Listing all of the content's errors.
+    """
+    _SSH_USERS_VALIDATOR.check(plain, SshUsersFileFormatError)
+
+
+def _mk_ssh_user_defaults(
     plain: SshPlainUserDefaultsT
 ) -> SshRawUserDefaults:
-    pubkey_file_template = get_opt_list_field_of_expected_type(
-        plain, "pubkey-file-template",
-        str, SshUsersFileFormatError)
-    pubkey_file_search_path = get_opt_list_field_of_expected_type(
-        plain, "pubkey-file-search-path",
-        str, SshUsersFileFormatError)
-
+    pubkey_file_search_path = plain.get("pubkey-file-search-path")
     if pubkey_file_search_path is not None:
         pubkey_file_search_path = [Path(sp) for sp in pubkey_file_search_path]
 
     return SshRawUserDefaults(
         plain,
-        pubkey_file_template,
+        plain.get("pubkey-file-template"),
         pubkey_file_search_path
     )
 
 
-def parse_ssh_user(
+def parse_ssh_user_defaults(
+    plain: SshPlainUserDefaultsT
+) -> SshRawUserDefaults:
+    _SSH_USER_DEFAULTS_VALIDATOR.check(
+        plain, SshUsersFileFormatError, (None, "ssh-user-defaults"))
+    return _mk_ssh_user_defaults(plain)
+
+
+def _parse_validated_ssh_user(
     name: str,
     plain: SshPlainUserT
 ) -> SshRawUser:
-    pubkey_file_template = get_opt_field_of_expected_type(
-        plain, "pubkey-file-template",
-        str, SshUsersFileFormatError)
-    pubkey_file_search_path = get_opt_field_of_expected_type(
-        plain, "pubkey-file-search-path",
-        str, SshUsersFileFormatError)
-    pubkey_file = get_opt_field_of_expected_type(
-        plain, "pubkey-file",
-        str, SshUsersFileFormatError)
-
+    """`parse_ssh_user` without its checks, for already validated users."""
+    pubkey_file_search_path = plain.get("pubkey-file-search-path")
     if pubkey_file_search_path is not None:
-        pubkey_file_search_path = [Path(sp) for sp in pubkey_file_search_path]
+        pubkey_file_search_path = Path(pubkey_file_search_path)
 
+    pubkey_file = plain.get("pubkey-file")
     if pubkey_file is not None:
         pubkey_file = Path(pubkey_file)
 
     return SshRawUser(
         plain,
         name,
-        pubkey_file_template,
+        plain.get("pubkey-file-template"),
         pubkey_file_search_path,
         pubkey_file
     )
 
 
+def parse_ssh_user(
+    name: str,
+    plain: SshPlainUserT
+) -> SshRawUser:
+    _SSH_USER_VALIDATOR.check(
+        plain, SshUsersFileFormatError, (_SSH_USERS_PATH, name))
+    return _parse_validated_ssh_user(name, plain)
+
+
 def parse_ssh_users(
-    plain: SshPlainUsersT
+    plain: SshPlainUsersT,
+    validated: bool = False
 ) -> SshRawUsers:
+    """`validated` when all of the users already passed `parse_ssh_user`
+        (e.g.: via `validate_plain_ssh_users`).
+    """
+    _SSH_USERS_SHALLOW_VALIDATOR.check(plain, SshUsersFileFormatError)
+
     plain_defaults = plain.get("ssh-user-defaults", None)
 
     defaults = None
     if plain_defaults is not None:
-        defaults = parse_ssh_user_defaults(plain_defaults)
+        defaults = _mk_ssh_user_defaults(plain_defaults)
 
-    plain_users = plain.get("ssh-users", {})
+    plain_users = plain.get("ssh-users")
+    if plain_users is None:
+        plain_users = {}
 
-    users_d = {
-        u_name: parse_ssh_user(u_name, u_plain)
-        for u_name, u_plain in plain_users.items()
-    }
+    # Each user's fields are only validated once this user is accessed
+    # so that single user lookups do not depend on the number of users.
+    users_d = LazyParsedDict(
+        plain_users,
+        _parse_validated_ssh_user if validated else parse_ssh_user)
 
     return SshRawUsers(plain, defaults, users_d)
 
 
 def load_ssh_users_from_file(
-        filename: Path) -> SshRawUsers:
-    plain = load_plain_ssh_users_from_file(filename)
+        filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
+) -> SshRawUsers:
+    plain = load_plain_ssh_users_from_file(filename, observer)
     return parse_ssh_users(plain)
 
 
 def dump_plain_ssh_users_to_file(
         users: SshPlainUsersT,
-        out_filename: Path
+        out_filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
 ) -> None:
-    return dump_content_to_file(users, out_filename)
+    return dump_content_to_file(users, out_filename, observer)
 
 
 def dump_ssh_user_defaults_to_plain_d(
@@ -190,8 +256,17 @@ def dump_ssh_users_to_plain_d(
             users.ssh_user_defaults)  # type: ignore
     )
 
+    ssh_users = users.ssh_users
     out_users_d = {}
-    for u_name, user in users.ssh_users.items():
+    for u_name in ssh_users:
+        unparsed = ssh_users.get_unparsed(u_name) \
+            if isinstance(ssh_users, LazyParsedDict) else None
+        if unparsed is not None:
+            # Never accessed, thus unchanged.
+            out_users_d[u_name] = unparsed
+            continue
+
+        user = ssh_users[u_name]
         # We use the in-user name. This might mean
         # that the user was renamed.
         if u_name != user.name:
@@ -211,25 +286,75 @@ def dump_ssh_users_to_plain_d(
 
 def dump_ssh_users_to_file(
         users: SshRawUsers,
-        out_filename: Path
+        out_filename: Path,
+        observer: SshAuthDirRepoObserver = NOOP_OBSERVER
 ) -> None:
     out_d = dump_ssh_users_to_plain_d(users)
-    return dump_plain_ssh_users_to_file(out_d, out_filename)
+    return dump_plain_ssh_users_to_file(out_d, out_filename, observer)
 
 
 class SshUsersLoader:
     def __init__(
             self,
             dir: Path, stem: str,
-            policy: SshAuthDirFileFormatPolicy) -> None:
+            policy: SshAuthDirFileFormatPolicy,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            entity_dir_suffix: Optional[str] = None,
+            parse_cache: Optional[SshAuthDirParseCache] = None
+    ) -> None:
+        self._observer = observer
+        self._parse_cache = parse_cache
         self._filename = policy.get_preferred_source_filename_for(dir, stem)
         assert 1 == sum(1 for _ in policy.get_source_filenames_for(dir, stem))
+        self._entity_dir = mk_entity_dir_opt(
+            dir, stem, policy, observer, entity_dir_suffix)
 
     def load(self) -> SshRawUsers:
-        return load_ssh_users_from_file(self._filename)
+        if self._parse_cache is None:
+            return parse_ssh_users(self.load_plain())
+
+        # Cached as plain content, faster to load than parsed users,
+        # whose users are then parsed without being validated again.
+        plain, validated = self._parse_cache.load(
+            "users", self.list_filenames(), self._load_plain_validated)
+        return parse_ssh_users(plain, validated)
+
+    def _load_plain_validated(self) -> Tuple[SshPlainUsersT, bool]:
+        """The plain content along with whether all of its users are valid.
+        """
+        plain = self.load_plain()
+        # Errors outside of users are raised at load, as without a cache.
+        parse_ssh_users(plain)
+        try:
+            validate_plain_ssh_users(plain)
+        except SshUsersFileFormatError:
+            # Raised on access, as without a cache.
+            return plain, False
+        return plain, True
 
     def load_plain(self) -> SshPlainUsersT:
-        return load_plain_ssh_users_from_file(self._filename)
+        if self._entity_dir is None:
+            return load_plain_ssh_users_from_file(self._filename, self._observer)
+
+        return load_plain_with_entity_dir(
+            self._filename, self._entity_dir, "ssh-users",
+            SshUsersFileAccessError, SshUsersFileFormatError, self._observer)
+
+    def list_filenames(self) -> List[Path]:
+        return list_filenames_with_entity_dir_opt(
+            self._filename, self._entity_dir)
+
+    def exists(self) -> bool:
+        return exists_with_entity_dir_opt(self._filename, self._entity_dir)
+
+    def load_names(self) -> List[str]:
+        """Without parsing any per entity file."""
+        if self._entity_dir is None:
+            return list(self.load_plain().get("ssh-users") or {})
+
+        return load_names_with_entity_dir(
+            self._filename, self._entity_dir, "ssh-users",
+            SshUsersFileAccessError, self._observer)
 
 
 def _mk_parent_dirs_opt(filename: Path, allow: bool) -> None:
@@ -240,15 +365,31 @@ class SshUsersDumper:
     def __init__(
             self,
             dir: Path, stem: str,
-            policy: SshAuthDirFileFormatPolicy) -> None:
+            policy: SshAuthDirFileFormatPolicy,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            entity_dir_suffix: Optional[str] = None
+    ) -> None:
+        self._observer = observer
         self._filename = policy.get_target_filename_for(dir, stem)
+        self._entity_dir = mk_entity_dir_opt(
+            dir, stem, policy, observer, entity_dir_suffix)
 
     def dump_plain(self, users: SshPlainUsersT, mk_parent_dirs=True) -> None:
         _mk_parent_dirs_opt(self._filename, mk_parent_dirs)
+        if self._entity_dir is not None:
+            return dump_plain_with_entity_dir(
+                users, self._filename, self._entity_dir, "ssh-users",
+                SshUsersFileFormatError, self._observer)
+
         return dump_plain_ssh_users_to_file(
-            users, self._filename)
+            users, self._filename, self._observer)
 
     def dump(self, users: SshRawUsers, mk_parent_dirs=True) -> None:
         _mk_parent_dirs_opt(self._filename, mk_parent_dirs)
+        if self._entity_dir is not None:
+            return dump_plain_with_entity_dir(
+                dump_ssh_users_to_plain_d(users), self._filename, self._entity_dir,
+                "ssh-users", SshUsersFileFormatError, self._observer)
+
         return dump_ssh_users_to_file(
-            users, self._filename)
+            users, self._filename, self._observer)
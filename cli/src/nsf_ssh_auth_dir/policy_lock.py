@@ -0,0 +1,87 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+
+DEFAULT_LOCK_TIMEOUT = 30.0
+DEFAULT_LOCK_POLL_INTERVAL = 0.01
+DEFAULT_OPTIMISTIC_MAX_RETRIES = 20
+DEFAULT_OPTIMISTIC_BACKOFF = 0.005
+
+
+class SshAuthDirLockPolicy(ABC):
+    @property
+    @abstractmethod
+    def enabled(self) -> bool:
+        pass
+
+    @property
+    @abstractmethod
+    def timeout(self) -> Optional[float]:
+        """In seconds. Wait forever when `None`."""
+        pass
+
+    @property
+    @abstractmethod
+    def poll_interval(self) -> float:
+        pass
+
+    @property
+    @abstractmethod
+    def optimistic(self) -> bool:
+        """Mutate files without holding their lock while mutating.
+
+        See `repo_mutation`.
+        """
+        pass
+
+    @property
+    @abstractmethod
+    def optimistic_max_retries(self) -> int:
+        pass
+
+    @property
+    @abstractmethod
+    def optimistic_backoff(self) -> float:
+        """The first retry's delay in seconds, doubled on each retry."""
+        pass
+
+
+class SshAuthDirLockDefaultPolicy(SshAuthDirLockPolicy):
+    def __init__(
+            self,
+            enabled: bool = True,
+            timeout: Optional[float] = DEFAULT_LOCK_TIMEOUT,
+            poll_interval: float = DEFAULT_LOCK_POLL_INTERVAL,
+            optimistic: bool = False,
+            optimistic_max_retries: int = DEFAULT_OPTIMISTIC_MAX_RETRIES,
+            optimistic_backoff: float = DEFAULT_OPTIMISTIC_BACKOFF
+    ) -> None:
+        self._enabled = enabled
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+        self._optimistic = optimistic
+        self._optimistic_max_retries = optimistic_max_retries
+        self._optimistic_backoff = optimistic_backoff
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @property
+    def timeout(self) -> Optional[float]:
+        return self._timeout
+
+    @property
+    def poll_interval(self) -> float:
+        return self._poll_interval
+
+    @property
+    def optimistic(self) -> bool:
+        return self._optimistic
+
+    @property
+    def optimistic_max_retries(self) -> int:
+        return self._optimistic_max_retries
+
+    @property
+    def optimistic_backoff(self) -> float:
+        return self._optimistic_backoff
@@ -1,9 +1,12 @@
 from abc import ABC, abstractmethod
+from typing import Optional
 
+from .file_parse_cache import SshAuthDirParseCache
 from .policy_file_format import (
     SshAuthDirFileFormatDefaultPolicy,
     SshAuthDirFileFormatPolicy,
 )
+from .policy_lock import SshAuthDirLockDefaultPolicy, SshAuthDirLockPolicy
 from .policy_pubkey import SshAuthDirPubkeyDefaultPolicy, SshAuthDirPubkeyPolicy
 
 
@@ -18,6 +21,11 @@ class SshAuthDirRepoPolicy(ABC):
     def pubkey(self) -> SshAuthDirPubkeyPolicy:
         pass
 
+    @property
+    @abstractmethod
+    def lock(self) -> SshAuthDirLockPolicy:
+        pass
+
     @property
     @abstractmethod
     def silent_create_file_users(self) -> bool:
@@ -33,10 +41,22 @@ class SshAuthDirRepoPolicy(ABC):
     def silent_create_file_auth(self) -> bool:
         pass
 
+    @property
+    def parse_cache(self) -> Optional[SshAuthDirParseCache]:
+        """Where loaded files' parse results are cached, if anywhere."""
+        return None
+
 
 class SshAuthDirRepoDefaultPolicy(SshAuthDirRepoPolicy):
-    def __init__(self) -> None:
-        pass
+    def __init__(
+            self,
+            lock: Optional[SshAuthDirLockPolicy] = None,
+            parse_cache: Optional[SshAuthDirParseCache] = None
+    ) -> None:
+        if lock is None:
+            lock = SshAuthDirLockDefaultPolicy()
+        self._lock = lock
+        self._parse_cache = parse_cache
 
     @property
     def file_format(self) -> SshAuthDirFileFormatPolicy:
@@ -46,6 +66,10 @@ class SshAuthDirRepoDefaultPolicy(SshAuthDirRepoPolicy):
     def pubkey(self) -> SshAuthDirPubkeyPolicy:
         return SshAuthDirPubkeyDefaultPolicy()
 
+    @property
+    def lock(self) -> SshAuthDirLockPolicy:
+        return self._lock
+
     @property
     def silent_create_file_users(self) -> bool:
         return True
@@ -57,3 +81,7 @@ class SshAuthDirRepoDefaultPolicy(SshAuthDirRepoPolicy):
     @property
     def silent_create_file_auth(self) -> bool:
         return True
+
+    @property
+    def parse_cache(self) -> Optional[SshAuthDirParseCache]:
+        return self._parse_cache
@@ -5,13 +5,20 @@ Should match `nix-lib/dir.nix` nix side module.
 TODO: It would be best were its default parameters shared via a common file.
 """
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from .policy_repo import SshAuthDirRepoDefaultPolicy, SshAuthDirRepoPolicy
 from .repo_auth import SshAuthSetRepo
-from .repo_groups import SshGroupsRepo
+from .repo_auth_device_users import SshAuthRepoFileAccessError
+from .repo_groups import SshGroupsRepo, SshGroupsRepoFileAccessError
+from .repo_journal import (recover_ssh_auth_dir_journals,
+                           ssh_auth_dir_transaction)
+from .repo_snapshot import SshAuthDirSnapshot
 from .repo_users import SshUsersRepo
+from .types_auth import SshRawAuth
+from .types_groups import SshRawGroups
 from .types_layout import SshAuthDirLayout
+from .types_observer import NOOP_OBSERVER, SshAuthDirRepoObserver
 
 
 class SshAuthDirRepo:
@@ -19,22 +26,38 @@ class SshAuthDirRepo:
             self,
             dir: Path,
             layout: SshAuthDirLayout,
-            policy: SshAuthDirRepoPolicy
+            policy: SshAuthDirRepoPolicy,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER
     ) -> None:
         self._dir = dir
         self._layout = layout
         self._policy = policy
+        self._observer = observer
 
     @property
     def dir(self) -> Path:
         return self._dir
 
+    @property
+    def layout(self) -> SshAuthDirLayout:
+        return self._layout
+
+    @property
+    def policy(self) -> SshAuthDirRepoPolicy:
+        return self._policy
+
+    @property
+    def observer(self) -> SshAuthDirRepoObserver:
+        return self._observer
+
     @property
     def users(self) -> SshUsersRepo:
         return SshUsersRepo(
             self.dir,
             self._layout.users.stem,
-            self._policy
+            self._policy,
+            self._observer,
+            self._layout.entity_dir_suffix
         )
 
     @property
@@ -43,7 +66,9 @@ class SshAuthDirRepo:
             self.dir,
             self._layout.groups.stem,
             self._policy,
-            self.users
+            self.users,
+            self._observer,
+            self._layout.entity_dir_suffix
         )
 
     @property
@@ -54,24 +79,102 @@ class SshAuthDirRepo:
             self._layout.auth_on.dirname,
             self._policy,
             self.users,
-            self.groups
+            self.groups,
+            self._observer,
+            self._layout.entity_dir_suffix
         )
 
+    def transaction(self) -> Any:
+        """A context manager applying all changes made to this repo
+            within it at once, or none when it raises.
+
+        See `repo_journal.ssh_auth_dir_transaction`.
+        """
+        return ssh_auth_dir_transaction(self.dir)
+
+    def load_snapshot(
+            self,
+            with_groups: bool = True,
+            with_auth: bool = True
+    ) -> SshAuthDirSnapshot:
+        """Load every file of this *ssh auth dir* exactly once.
+
+        Groups and auth files are not loaded at all when not needed
+        (`with_groups`, `with_auth`), the snapshot having none.
+
+        Raises:
+            SshUsersRepoAccessError: When the users file cannot be loaded.
+            SshGroupsRepoAccessError: When the groups file exists but
+                cannot be loaded.
+            SshAuthRepoAccessError: When an auth file exists but cannot
+                be loaded.
+        """
+        raw_users = self.users.load_raw()
+
+        # Group management is optional.
+        raw_groups = SshRawGroups.mk_empty()
+        if with_groups:
+            try:
+                raw_groups = self.groups.load_raw()
+            except SshGroupsRepoFileAccessError:
+                if self.groups.exists():
+                    raise  # re-raise, an invalid file.
+
+        raw_auths: Dict[Optional[str], SshRawAuth] = {}
+        for auth in (self.auth.all if with_auth else []):
+            try:
+                raw_auths[auth.state_name] = auth.device_users.load_raw()
+            except SshAuthRepoFileAccessError:
+                if auth.device_users.exists():
+                    raise  # re-raise, an invalid file.
+
+        return SshAuthDirSnapshot(
+            self.dir,
+            self._policy,
+            raw_users,
+            raw_groups,
+            raw_auths
+        )
+
+
+def detect_ssh_auth_dir_layout(dir: Path) -> SshAuthDirLayout:
+    """The default layout, with per entity dirs when any of the users,
+        groups or *authorized always* entity dir exists.
+    """
+    entity_dirs_layout = SshAuthDirLayout.mk_entity_dirs()
+    suffix = entity_dirs_layout.entity_dir_suffix
+    for stem in (
+            entity_dirs_layout.users.stem,
+            entity_dirs_layout.groups.stem,
+            entity_dirs_layout.device_state_always.stem):
+        if dir.joinpath(f"{stem}{suffix}").is_dir():
+            return entity_dirs_layout
+
+    return SshAuthDirLayout.mk_default()
+
 
 def mk_ssh_auth_dir_repo(
     dir: Path,
     layout: Optional[SshAuthDirLayout] = None,
-    policy: Optional[SshAuthDirRepoPolicy] = None
+    policy: Optional[SshAuthDirRepoPolicy] = None,
+    observer: Optional[SshAuthDirRepoObserver] = None
 ) -> SshAuthDirRepo:
 
     if layout is None:
-        layout = SshAuthDirLayout.mk_default()
+        layout = detect_ssh_auth_dir_layout(dir)
 
     if policy is None:
         policy = SshAuthDirRepoDefaultPolicy()
 
+    if observer is None:
+        observer = NOOP_OBSERVER
+
+    # Completes any commit interrupted by a crash.
+    recover_ssh_auth_dir_journals(dir, lock_policy=policy.lock)
+
     return SshAuthDirRepo(
         dir,
         layout,
-        policy
+        policy,
+        observer
     )
@@ -0,0 +1,254 @@
+"""Effective access of *ssh users* to *device users*.
+
+Should match the final set of authorized users the nix lib computes for a
+*device user* (see `nix-lib/auth.nix`): groups are expanded to their
+members, the special `""` *device user* applies to all *device users*
+and *authorized on* state sets are mixed on top of the *authorized
+always* set.
+"""
+from collections import OrderedDict
+from typing import (Dict, FrozenSet, Hashable, Iterable, List, NamedTuple,
+                    Optional, Sequence, Set, Tuple)
+
+from .repo_auth_device_users import SshAuthDeviceUser
+from .repo_snapshot import SshAuthDirSnapshot
+
+
+class SshAccessEntry(NamedTuple):
+    ssh_user: str
+    device_user: str
+    # `None` when granted through the *authorized always* set. Otherwise,
+    # the first (in lexicographic order) active state granting the access.
+    state: Optional[str]
+
+
+def _access_entry_sort_key(e: SshAccessEntry) -> Tuple[str, str, str]:
+    return (e.device_user, e.ssh_user, "" if e.state is None else e.state)
+
+
+def sort_ssh_access_entries(
+        entries: Iterable[SshAccessEntry]) -> List[SshAccessEntry]:
+    return sorted(entries, key=_access_entry_sort_key)
+
+
+# Everything a *device user*'s resolution depends upon, for a single
+# *authorized always* / *authorized on* set.
+_SourceSigT = Tuple[
+    Optional[str],
+    FrozenSet[str],
+    Tuple[Tuple[str, FrozenSet[str]], ...]]
+_InputSigT = Tuple[str, Tuple[_SourceSigT, ...]]
+
+
+class SshAccessResolverStats(NamedTuple):
+    resolved: int
+    reused: int
+    # Sources merged into a cached prefix (see `_MergedPrefixCache`).
+    merged: int = 0
+
+
+# Users granted so far, by name.
+_MergedT = Dict[str, SshAccessEntry]
+_EdgeKeyT = Tuple[int, Hashable]
+
+DEFAULT_MAX_MERGED_ENTRIES = 1000000
+
+
+class _MergedPrefixCache:
+    """The users granted by each prefix of a *device user*'s sources.
+
+    As sources are in precedence order, resolving `always, s1, s2` only
+    merges `s2` into the cached result of `always, s1`. Prefixes form a
+    trie whose edges each add one more source. Merged results are
+    evicted in least recently used order once their total number of
+    entries exceeds `max_entries`, along with the edge leading to them
+    (their descendants become unreachable and get evicted in turn).
+    """
+    _ROOT_ID = 0
+
+    def __init__(self, max_entries: int) -> None:
+        self._max_entries = max_entries
+        self._edges: Dict[_EdgeKeyT, int] = {}
+        self._merged: "OrderedDict[int, Tuple[_EdgeKeyT, _MergedT]]" = \
+            OrderedDict()
+        self._size = 0
+        self._next_id = self._ROOT_ID + 1
+        self.merged = 0
+
+    def _add(self, edge_key: _EdgeKeyT, merged: _MergedT) -> int:
+        node_id = self._next_id
+        self._next_id += 1
+        self._edges[edge_key] = node_id
+        self._merged[node_id] = (edge_key, merged)
+        self._size += len(merged)
+
+        # Never evicts the node just added.
+        while self._size > self._max_entries and 1 < len(self._merged):
+            _, (old_edge_key, old_merged) = self._merged.popitem(last=False)
+            del self._edges[old_edge_key]
+            self._size -= len(old_merged)
+        return node_id
+
+    @staticmethod
+    def _merge(
+            merged: _MergedT, du_name: str, source_sig: _SourceSigT
+    ) -> _MergedT:
+        state_name, users, groups_sig = source_sig
+        names = set(users)
+        for _, members in groups_sig:
+            names.update(members)
+
+        out = dict(merged)
+        for u_name in names:
+            if u_name not in out:
+                out[u_name] = SshAccessEntry(u_name, du_name, state_name)
+        return out
+
+    def get(
+            self, du_name: str, sources_sigs: Sequence[_SourceSigT]
+    ) -> _MergedT:
+        """The returned mapping is shared and must not be modified."""
+        # The first edge only selects the *device user*.
+        steps: List[Hashable] = [du_name]
+        steps.extend(sources_sigs)
+
+        node_id = self._ROOT_ID
+        merged: _MergedT = {}
+        for i, step in enumerate(steps):
+            edge_key = (node_id, step)
+            found_id = self._edges.get(edge_key)
+            if found_id is not None:
+                self._merged.move_to_end(found_id)
+                node_id = found_id
+                merged = self._merged[found_id][1]
+                continue
+
+            if 0 != i:
+                merged = self._merge(merged, du_name, sources_sigs[i - 1])
+                self.merged += 1
+            node_id = self._add(edge_key, merged)
+        return merged
+
+
+class SshAccessResolver:
+    """Resolves effective access, caching results per resolution inputs.
+
+    Resolutions are cached by the content of their inputs (authorized
+    users, groups and these groups' members) and not by where these
+    come from. Resolving 2 versions of an *ssh auth dir* with a same
+    resolver thus only ever resolves the *device users* whose inputs
+    differ between both.
+
+    Intermediate results are also cached per prefix of the active
+    states, holding at most `max_merged_entries` entries overall:
+    resolving every combination of a few states merges each state into
+    an already merged prefix once.
+    """
+    def __init__(
+            self, max_merged_entries: int = DEFAULT_MAX_MERGED_ENTRIES
+    ) -> None:
+        self._cache: Dict[_InputSigT, FrozenSet[SshAccessEntry]] = {}
+        self._prefixes = _MergedPrefixCache(max_merged_entries)
+        self._resolved = 0
+        self._reused = 0
+
+    @property
+    def stats(self) -> SshAccessResolverStats:
+        return SshAccessResolverStats(
+            self._resolved, self._reused, self._prefixes.merged)
+
+    def _mk_source_sig(
+            self,
+            snapshot: SshAuthDirSnapshot,
+            du_name: str,
+            state_name: Optional[str]
+    ) -> Optional[_SourceSigT]:
+        raw_auth = snapshot.get_raw_auth(state_name)
+        if raw_auth is None:
+            return None
+
+        users: Set[str] = set()
+        groups: Set[str] = set()
+        all_id = SshAuthDeviceUser.get_sentinel_id_for_all()
+        for name in {all_id, du_name}:
+            raw_du = raw_auth.device_users.get(name)
+            if raw_du is not None:
+                users.update(raw_du.ssh_users)
+                groups.update(raw_du.ssh_groups)
+
+        if not users and not groups:
+            return None
+
+        groups_sig = []
+        for g_name in sorted(groups):
+            raw_group = snapshot.get_raw_group(g_name)
+            # Dangling groups are ignored here. The nix lib would fail.
+            members = frozenset() if raw_group is None else raw_group.members
+            groups_sig.append((g_name, frozenset(members)))
+
+        return (state_name, frozenset(users), tuple(groups_sig))
+
+    def _mk_input_sig(
+            self,
+            snapshot: SshAuthDirSnapshot,
+            du_name: str,
+            on_states: List[str]
+    ) -> _InputSigT:
+        sources: List[Optional[str]] = [None]
+        sources.extend(on_states)
+        sigs = (self._mk_source_sig(snapshot, du_name, s) for s in sources)
+        return (du_name, tuple(s for s in sigs if s is not None))
+
+    def _resolve_sig(self, sig: _InputSigT) -> FrozenSet[SshAccessEntry]:
+        du_name, sources_sigs = sig
+        # Sources are in precedence order: always first, then states.
+        return frozenset(self._prefixes.get(du_name, sources_sigs).values())
+
+    def resolve_device_user(
+            self,
+            snapshot: SshAuthDirSnapshot,
+            du_name: str,
+            on_states: Iterable[str]
+    ) -> FrozenSet[SshAccessEntry]:
+        sig = self._mk_input_sig(snapshot, du_name, sorted(set(on_states)))
+        found = self._cache.get(sig)
+        if found is not None:
+            self._reused += 1
+            return found
+
+        self._resolved += 1
+        out = self._resolve_sig(sig)
+        self._cache[sig] = out
+        return out
+
+    def resolve(
+            self,
+            snapshot: SshAuthDirSnapshot,
+            on_states: Optional[Iterable[str]] = None
+    ) -> Set[SshAccessEntry]:
+        """Return the effective access of all *device users* when
+            `on_states` are active.
+
+        All of the *ssh auth dir*'s states are considered active when
+        `on_states` is `None`. The `""` *device user* stands for any
+        *device user* including those not explicitly mentioned.
+        """
+        states = snapshot.state_names if on_states is None else on_states
+        states = sorted(set(states))
+
+        out: Set[SshAccessEntry] = set()
+        for du_name in snapshot.device_users_names:
+            out.update(self.resolve_device_user(snapshot, du_name, states))
+        return out
+
+
+class SshAccessDiff(NamedTuple):
+    granted: List[SshAccessEntry]
+    revoked: List[SshAccessEntry]
+
+
+def diff_ssh_access(
+        a: Set[SshAccessEntry], b: Set[SshAccessEntry]) -> SshAccessDiff:
+    return SshAccessDiff(
+        sort_ssh_access_entries(b - a),
+        sort_ssh_access_entries(a - b))
@@ -0,0 +1,257 @@
+"""Asyncio facade over `SshAuthDirRepo`.
+
+File io and parsing run on a dedicated executor so that the event loop
+is never blocked. Concurrent loads of a same file are coalesced into a
+single read and writers are serialized per file.
+"""
+import asyncio
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import (Any, Awaitable, Callable, Dict, Iterable, List, Optional,
+                    Set, TypeVar)
+
+from .repo import SshAuthDirRepo
+from .repo_access import SshAccessEntry, SshAccessResolver
+from .repo_auth_device_users import SshAuthDeviceUsersRepo
+from .repo_groups import SshGroupsRepoFileAccessError
+from .repo_snapshot import SshAuthDirSnapshot
+from .types_auth import SshRawAuth
+from .types_groups import SshRawGroups
+from .types_pubkey import SshPubKey
+from .types_users import SshRawUsers
+
+FILE_KEY_USERS = "users"
+FILE_KEY_GROUPS = "groups"
+
+_T = TypeVar("_T")
+
+
+def mk_pubkey_file_key(username: str) -> str:
+    """The key of `username`'s pubkey file(s)."""
+    return f"pubkey/{username}"
+
+
+def mk_auth_file_key(state_name: Optional[str]) -> str:
+    """The key of the *authorized always* (`state_name` is `None`) or
+        *authorized on* state file.
+    """
+    if state_name is None:
+        return "auth-always"
+    return f"auth-on/{state_name}"
+
+
+def _get_device_users(
+        repo: SshAuthDirRepo,
+        state_name: Optional[str]) -> SshAuthDeviceUsersRepo:
+    if state_name is None:
+        return repo.auth.always.device_users
+    return repo.auth.on(state_name).device_users
+
+
+def _load_raw_groups_opt(repo: SshAuthDirRepo) -> SshRawGroups:
+    try:
+        return repo.groups.load_raw()
+    except SshGroupsRepoFileAccessError:
+        if repo.groups.exists():
+            raise  # re-raise, an invalid file.
+        # Group management is optional.
+        return SshRawGroups.mk_empty()
+
+
+class AsyncSshAuthDirRepo:
+    """Awaitable loads, queries and commits over a `SshAuthDirRepo`.
+
+    Should be used from a single event loop. Unless an `executor` is
+    provided, a dedicated thread pool is created and owned by this
+    object (see `aclose` / `async with`).
+    """
+    def __init__(
+            self,
+            repo: SshAuthDirRepo,
+            executor: Optional[Executor] = None,
+            max_workers: int = 4
+    ) -> None:
+        self._repo = repo
+        self._owns_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix="nsf-ssh-auth-dir")
+        self._executor = executor
+        self._inflight: Dict[str, 'asyncio.Future[Any]'] = {}
+        self._write_locks: Dict[str, asyncio.Lock] = {}
+        self._resolver = SshAccessResolver()
+        # The resolver's caches are not thread safe.
+        self._resolver_lock = threading.Lock()
+        # The number of actual executor loads, coalesced ones excluded.
+        self.loads = 0
+
+    @property
+    def repo(self) -> SshAuthDirRepo:
+        return self._repo
+
+    def close(self) -> None:
+        """Blocks until pending executor jobs are done, see `aclose` from
+            within the event loop.
+        """
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+
+    async def aclose(self) -> None:
+        """Same as `close` without blocking the event loop."""
+        if self._owns_executor:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.close)
+
+    async def __aenter__(self) -> 'AsyncSshAuthDirRepo':
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.aclose()
+
+    def _run(self, fn: Callable[..., _T], *args: Any) -> Awaitable[_T]:
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, fn, *args)
+
+    async def _load(self, key: str, fn: Callable[[], _T]) -> _T:
+        found = self._inflight.get(key)
+        if found is not None:
+            return await found
+
+        self.loads += 1
+        fut = asyncio.ensure_future(self._run(fn))
+        self._inflight[key] = fut
+        try:
+            return await fut
+        finally:
+            # Only loads started concurrently share a read.
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+
+    async def load_raw_users(self) -> SshRawUsers:
+        return await self._load(FILE_KEY_USERS, self._repo.users.load_raw)
+
+    async def load_raw_groups(self) -> SshRawGroups:
+        return await self._load(
+            FILE_KEY_GROUPS, lambda: _load_raw_groups_opt(self._repo))
+
+    async def load_raw_auth(self, state_name: Optional[str] = None) -> SshRawAuth:
+        return await self._load(
+            mk_auth_file_key(state_name),
+            _get_device_users(self._repo, state_name).load_raw)
+
+    async def load_snapshot(self) -> SshAuthDirSnapshot:
+        return await self._load("snapshot", self._repo.load_snapshot)
+
+    async def get_users_names(self) -> Set[str]:
+        return set((await self.load_raw_users()).ssh_users.keys())
+
+    async def get_groups_names(self) -> Set[str]:
+        return set((await self.load_raw_groups()).ssh_groups.keys())
+
+    async def get_state_names(self) -> Set[str]:
+        return await self._run(lambda: self._repo.auth.state_names)
+
+    async def get_device_users_names(
+            self, state_name: Optional[str] = None) -> Set[str]:
+        return set((await self.load_raw_auth(state_name)).device_users.keys())
+
+    async def get_user_pubkey(self, username: str) -> SshPubKey:
+        return await self._run(
+            lambda: self._repo.users[username].pubkey_selected)
+
+    async def resolve_access(
+            self,
+            on_states: Optional[Iterable[str]] = None
+    ) -> Set[SshAccessEntry]:
+        """See `SshAccessResolver.resolve`."""
+        snapshot = await self.load_snapshot()
+        return await self._run(self._resolve, snapshot, on_states)
+
+    def _resolve(
+            self,
+            snapshot: SshAuthDirSnapshot,
+            on_states: Optional[Iterable[str]]
+    ) -> Set[SshAccessEntry]:
+        with self._resolver_lock:
+            return self._resolver.resolve(snapshot, on_states)
+
+    def _get_write_lock(self, key: str) -> asyncio.Lock:
+        lock = self._write_locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._write_locks[key] = lock
+        return lock
+
+    async def commit(
+            self,
+            fn: Callable[[SshAuthDirRepo], _T],
+            file_keys: Iterable[str]
+    ) -> _T:
+        """Run `fn` against the wrapped repo on the executor while holding
+            the write locks of `file_keys`.
+
+        `file_keys` should list every file `fn` may write (see
+        `FILE_KEY_USERS`, `FILE_KEY_GROUPS`, `mk_pubkey_file_key` and
+        `mk_auth_file_key`).
+        Locks are always taken in the same order so that commits cannot
+        deadlock each others.
+        """
+        keys: List[str] = sorted(set(file_keys))
+        acquired: List[asyncio.Lock] = []
+        try:
+            for key in keys:
+                lock = self._get_write_lock(key)
+                await lock.acquire()
+                acquired.append(lock)
+            return await self._run(fn, self._repo)
+        finally:
+            # Loads still in flight may predate the write.
+            for key in keys + ["snapshot"]:
+                self._inflight.pop(key, None)
+            for lock in reversed(acquired):
+                lock.release()
+
+    async def add_user(
+            self, username: str, pubkey: Optional[SshPubKey] = None) -> None:
+        await self.commit(
+            lambda r: r.users.add(username, pubkey),
+            [FILE_KEY_USERS, mk_pubkey_file_key(username)])
+
+    async def rm_user(self, username: str) -> None:
+        # Also removes the user's pubkey files.
+        await self.commit(
+            lambda r: r.users.rm(username),
+            [FILE_KEY_USERS, mk_pubkey_file_key(username)])
+
+    async def add_group_member(self, groupname: str, username: str) -> None:
+        await self.commit(
+            lambda r: r.groups[groupname].add_member_by_id(username),
+            [FILE_KEY_GROUPS])
+
+    async def rm_group_member(self, groupname: str, username: str) -> None:
+        await self.commit(
+            lambda r: r.groups[groupname].rm_member_by_id(username),
+            [FILE_KEY_GROUPS])
+
+    async def authorize_user(
+            self,
+            device_user: str,
+            username: str,
+            state_name: Optional[str] = None
+    ) -> None:
+        await self.commit(
+            lambda r: _get_device_users(r, state_name).ensure(
+                device_user).authorize_user_by_id(username),
+            [mk_auth_file_key(state_name)])
+
+    async def deauthorize_user(
+            self,
+            device_user: str,
+            username: str,
+            state_name: Optional[str] = None
+    ) -> None:
+        await self.commit(
+            lambda r: _get_device_users(r, state_name)[
+                device_user].deauthorize_user_by_id(username),
+            [mk_auth_file_key(state_name)])
@@ -6,7 +6,9 @@ from .file_auth import SshAuthDumper, SshAuthLoader
 from .policy_repo import SshAuthDirRepoPolicy
 from .repo_auth_device_users import SshAuthDeviceUsersRepo
 from .repo_groups import SshGroupsRepo
+from .repo_lock import SshAuthDirFileLock, mk_ssh_auth_dir_file_lock
 from .repo_users import SshUsersRepo
+from .types_observer import NOOP_OBSERVER, SshAuthDirRepoObserver
 
 
 class SshAuthRepo(ABC):
@@ -51,15 +53,23 @@ class SshAuthCommonBase(SshAuthRepo):
             stem: str,
             policy: SshAuthDirRepoPolicy,
             users: SshUsersRepo,
-            groups: SshGroupsRepo
+            groups: SshGroupsRepo,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            entity_dir_suffix: Optional[str] = None,
+            lock: Optional[SshAuthDirFileLock] = None
     ) -> None:
         self._dir = dir
         self._stem = stem
+        self._lock = lock
         self._policy = policy
         self._users = users
         self._groups = groups
-        self._loader = SshAuthLoader(dir, stem, policy.file_format)
-        self._dumper = SshAuthDumper(dir, stem, policy.file_format)
+        self._observer = observer
+        self._loader = SshAuthLoader(
+            dir, stem, policy.file_format, observer, entity_dir_suffix,
+            policy.parse_cache)
+        self._dumper = SshAuthDumper(
+            dir, stem, policy.file_format, observer, entity_dir_suffix)
 
     @property
     def device_users(self) -> SshAuthDeviceUsersRepo:
@@ -67,7 +77,9 @@ class SshAuthCommonBase(SshAuthRepo):
             self._loader, self._dumper,
             self._policy,
             self._users, self._groups,
-            self.state_name
+            self.state_name,
+            self._observer,
+            self._lock
         )
 
 
@@ -89,7 +101,9 @@ class SshAuthSetRepo:
             device_state_on_dirname: str,
             policy: SshAuthDirRepoPolicy,
             users: SshUsersRepo,
-            groups: SshGroupsRepo
+            groups: SshGroupsRepo,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            entity_dir_suffix: Optional[str] = None
     ) -> None:
         self._dir = dir
         self._state_always_stem = device_state_always_stem
@@ -97,20 +111,31 @@ class SshAuthSetRepo:
         self._policy = policy
         self._users = users
         self._groups = groups
+        self._observer = observer
+        self._entity_dir_suffix = entity_dir_suffix
 
     @property
     def always(self) -> SshAuthAlwaysRepo:
         return SshAuthAlwaysRepo(
             self._dir, self._state_always_stem,
             self._policy,
-            self._users, self._groups
+            self._users, self._groups,
+            self._observer,
+            self._entity_dir_suffix,
+            mk_ssh_auth_dir_file_lock(
+                self._dir, self._state_always_stem, self._policy.lock)
         )
 
     def on(self, state_id: str) -> SshAuthOnRepo:
         return SshAuthOnRepo(
             self._state_on_dir,
             state_id, self._policy,
-            self._users, self._groups
+            self._users, self._groups,
+            self._observer,
+            self._entity_dir_suffix,
+            mk_ssh_auth_dir_file_lock(
+                self._dir, f"{self._state_on_dir.name}/{state_id}",
+                self._policy.lock)
         )
 
     def _iter_existing_on_files(self) -> Iterator[Path]:
@@ -118,19 +143,35 @@ class SshAuthSetRepo:
         yield from self._policy.file_format.iter_target_filenames_in(
             state_on_dir)
 
+    def _iter_existing_on_entity_dirs_states(self) -> Iterator[str]:
+        suffix = self._entity_dir_suffix
+        if suffix is None or not self._state_on_dir.is_dir():
+            return
+
+        for fp in self._state_on_dir.iterdir():
+            if fp.name.endswith(suffix) and fp.is_dir():
+                yield fp.name[:-len(suffix)]
+
     def _get_existing_always_file(self) -> Optional[Path]:
         filename = self._policy.file_format.get_target_filename_for(
             self._dir, self._state_always_stem)
-        if not filename.exists():
-            return None
+        if filename.exists():
+            return filename
+
+        suffix = self._entity_dir_suffix
+        if suffix is not None and self._dir.joinpath(
+                f"{self._state_always_stem}{suffix}").is_dir():
+            return filename
 
-        return filename
+        return None
 
     @property
     def state_names(self) -> Set[str]:
-        return {
+        out = {
             fp.stem for fp in self._iter_existing_on_files()
         }
+        out.update(self._iter_existing_on_entity_dirs_states())
+        return out
 
     @property
     def all(self) -> Iterator[SshAuthRepo]:
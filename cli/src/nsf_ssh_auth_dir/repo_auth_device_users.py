@@ -1,4 +1,5 @@
-from typing import Callable, Iterator, Optional, Set, Tuple, Type
+import functools
+from typing import Callable, Iterator, List, Optional, Set, Tuple, Type
 
 from .file_auth import (
     SshAuthDumper,
@@ -9,9 +10,20 @@ from .file_auth import (
     SshRawAuthDeviceUser
 )
 from .policy_repo import SshAuthDirRepoPolicy
+from .repo_lock import SshAuthDirFileLock, mk_unlocked_file_lock
+from .repo_mutation import (SshAuthDirFileMutator, add_to_set,
+                            discard_from_set)
 from .repo_users import SshUser, SshUsersRepo
 from .repo_groups import SshGroup, SshGroupsRepo
 from .types_base_errors import SshAuthDirRepoError
+from .types_observer import (NOOP_OBSERVER, SshAuthDirRepoObserver,
+                             observed_mutation)
+
+
+# Updates a raw *device user* in place, possibly more than once (see
+# `repo_mutation`).
+# Return whether the *device user* changed.
+_DeviceUserUpdateFnT = Callable[[SshRawAuthDeviceUser], bool]
 
 
 class SshAuthRepoError(SshAuthDirRepoError):
@@ -82,16 +94,19 @@ class SshAuthDeviceUser:
     def __init__(
             self,
             raw: SshRawAuthDeviceUser,
-            update_raw_fn: Callable[[SshRawAuthDeviceUser], SshRawAuthDeviceUser],
+            update_raw_fn: Callable[[_DeviceUserUpdateFnT], SshRawAuthDeviceUser],
             users: SshUsersRepo,
             groups: SshGroupsRepo,
-            state_name: Optional[str]
+            state_name: Optional[str],
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER
     ) -> None:
         self._raw = raw
         self._update_raw_fn = update_raw_fn
         self._users = users
         self._groups = groups
         self._state_name = state_name
+        self._observer = observer
+        self._observed_attrs = {"device-user": raw.name, "state": state_name}
 
     @property
     def name(self) -> str:
@@ -140,6 +155,7 @@ class SshAuthDeviceUser:
     def authorized_users(self) -> Iterator[SshUser]:
         yield from self.iter_authorized_users()
 
+    @observed_mutation("auth.user.authorize")
     def authorize_user_by_id(
             self, user_id: str, force: bool = False) -> None:
         if not force and user_id not in self._users:
@@ -154,23 +170,22 @@ class SshAuthDeviceUser:
                 f"'{self.formatted_name}'. Already authorized."
             )
 
-        self._raw.ssh_users.add(user_id)
-        self._raw = self._update_raw_fn(self._raw)
+        self._raw = self._update_raw_fn(
+            lambda raw: add_to_set(raw.ssh_users, user_id))
 
+    @observed_mutation("auth.user.deauthorize")
     def deauthorize_user_by_id(
             self, authorized_user_id: str, force: bool = False) -> None:
         # IDEA: Consider adding a flag to warn when user part of one of
         # the authorized group.
-        try:
-            self._raw.ssh_users.remove(authorized_user_id)
-        except KeyError as e:
-            if not force:
-                raise SshAuthRepoKeyAccessError(
-                    f"No such user: '{authorized_user_id}' "
-                    "authorized to *device user* '{self.formatted_name}'."
-                    "Can't be deauthorized."
-                ) from e
-        self._raw = self._update_raw_fn(self._raw)
+        if not force and authorized_user_id not in self._raw.ssh_users:
+            raise SshAuthRepoKeyAccessError(
+                f"No such user: '{authorized_user_id}' "
+                "authorized to *device user* '{self.formatted_name}'."
+                "Can't be deauthorized."
+            )
+        self._raw = self._update_raw_fn(
+            lambda raw: discard_from_set(raw.ssh_users, authorized_user_id))
 
     @property
     def authorized_groups_names(self) -> Set[str]:
@@ -194,6 +209,7 @@ class SshAuthDeviceUser:
     def authorized_groups(self) -> Iterator[SshGroup]:
         yield from self.iter_authorized_groups()
 
+    @observed_mutation("auth.group.authorize")
     def authorize_group_by_id(
             self, group_id: str, force: bool = False) -> None:
         if not force and group_id not in self._groups:
@@ -208,21 +224,20 @@ class SshAuthDeviceUser:
                 f"'{self.formatted_name}'. Already authorized."
             )
 
-        self._raw.ssh_groups.add(group_id)
-        self._raw = self._update_raw_fn(self._raw)
+        self._raw = self._update_raw_fn(
+            lambda raw: add_to_set(raw.ssh_groups, group_id))
 
+    @observed_mutation("auth.group.deauthorize")
     def deauthorize_group_by_id(
             self, authorized_group_id: str, force: bool = False) -> None:
-        try:
-            self._raw.ssh_groups.remove(authorized_group_id)
-        except KeyError as e:
-            if not force:
-                raise SshAuthRepoKeyAccessError(
-                    f"No such group: '{authorized_group_id}' "
-                    f"authorized to *device user* '{self.formatted_name}'."
-                    "Can't be deauthorized."
-                ) from e
-        self._raw = self._update_raw_fn(self._raw)
+        if not force and authorized_group_id not in self._raw.ssh_groups:
+            raise SshAuthRepoKeyAccessError(
+                f"No such group: '{authorized_group_id}' "
+                f"authorized to *device user* '{self.formatted_name}'."
+                "Can't be deauthorized."
+            )
+        self._raw = self._update_raw_fn(
+            lambda raw: discard_from_set(raw.ssh_groups, authorized_group_id))
 
 
 class SshAuthDeviceUsersRepo:
@@ -233,51 +248,77 @@ class SshAuthDeviceUsersRepo:
             policy: SshAuthDirRepoPolicy,
             users: SshUsersRepo,
             groups: SshGroupsRepo,
-            state_name: Optional[str]
+            state_name: Optional[str],
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            lock: Optional[SshAuthDirFileLock] = None
     ) -> None:
+        if lock is None:
+            lock = mk_unlocked_file_lock()
         self._policy = policy
+        self._lock = lock
+        self._mutator = SshAuthDirFileMutator(
+            self._load_raw, self._dump_raw,
+            auth_loader.list_filenames, lock)
         self._auth_loader = auth_loader
         self._auth_dumper = auth_dumper
         self._users = users
         self._groups = groups
         self._state_name = state_name
+        self._observer = observer
+        self._observed_attrs = {"state": state_name}
 
     @property
     def state_name(self) -> Optional[str]:
         return self._state_name
 
     def _update_raw_device_user(
-            self, raw_du: SshRawAuthDeviceUser) -> SshRawAuthDeviceUser:
-        raw = self._load_raw()
-
-        if raw_du.name not in raw.device_users:
-            raise SshAuthRepoKeyAccessError(
-                f"No such *device user*: '{raw_du.name}'. Can't be updated.")
+            self, du_name: str, update_fn: _DeviceUserUpdateFnT
+    ) -> SshRawAuthDeviceUser:
+        updated: List[SshRawAuthDeviceUser] = []
 
-        raw.device_users[raw_du.name] = raw_du
-        self._dump_raw(raw)
+        def op(raw: SshRawAuth) -> bool:
+            try:
+                raw_du = raw.device_users[du_name]
+            except KeyError as e:
+                raise SshAuthRepoKeyAccessError(
+                    f"No such *device user*: '{du_name}'. "
+                    "Can't be updated.") from e
+            updated[:] = [raw_du]
+            return update_fn(raw_du)
 
-        raw = self._load_raw()
-        return raw.device_users[raw_du.name]
+        self._mutator.mutate(op)
+        return updated[0]
 
     def _mk_du(
             self, raw: SshRawAuthDeviceUser
     ) -> SshAuthDeviceUser:
         return SshAuthDeviceUser(
             raw,
-            self._update_raw_device_user,
+            functools.partial(self._update_raw_device_user, raw.name),
             self._users,
             self._groups,
-            self._state_name
+            self._state_name,
+            self._observer
         )
 
     def _load_raw(self) -> SshRawAuth:
         try:
-            return self._auth_loader.load()
+            with self._lock.shared():
+                return self._auth_loader.load()
         except SshAuthFileError as e:
             ECls = get_auth_repo_err_cls_from_auth_file_err(e)
             raise ECls(str(e)) from e
 
+    def load_raw(self) -> SshRawAuth:
+        """Load a raw snapshot of the whole auth file."""
+        return self._load_raw()
+
+    def exists(self) -> bool:
+        """Whether the auth file exists, telling a missing file apart
+            from an invalid one when loading fails.
+        """
+        return self._auth_loader.exists()
+
     def _dump_raw(self, raw: SshRawAuth) -> None:
         try:
             return self._auth_dumper.dump(raw)
@@ -318,14 +359,18 @@ class SshAuthDeviceUsersRepo:
         du, _ = self._get_w_raw_set(du_name)
         return du
 
+    @observed_mutation("auth.device-user.del")
     def __delitem__(self, du_name: str) -> None:
-        raw_auth = self._load_raw()
-        try:
-            del raw_auth.device_users[du_name]
-        except KeyError as e:
-            raise SshAuthRepoKeyAccessError(
-                f"No such *device user*: '{du_name}'. Can't be deleted.") from e
-        self._dump_raw(raw_auth)
+        def op(raw_auth: SshRawAuth) -> bool:
+            try:
+                del raw_auth.device_users[du_name]
+            except KeyError as e:
+                raise SshAuthRepoKeyAccessError(
+                    f"No such *device user*: '{du_name}'. "
+                    "Can't be deleted.") from e
+            return True
+
+        self._mutator.mutate(op)
 
     def get(self, du_name: str,
             default: Optional[SshAuthDeviceUser] = None) -> Optional[SshAuthDeviceUser]:
@@ -340,27 +385,34 @@ class SshAuthDeviceUsersRepo:
         return self.get(
             SshAuthDeviceUser.get_sentinel_id_for_all(), default)
 
-    def add(
-            self,
-            du_name: str,
-            exist_ok: bool = False
-    ) -> SshAuthDeviceUser:
+    def _load_raw_or_empty(self) -> SshRawAuth:
         try:
-            raw_auth = self._load_raw()
+            return self._load_raw()
         except SshAuthRepoFileAccessError:
             if not self._policy.silent_create_file_auth:
                 raise  # re-raise
 
-            raw_auth = SshRawAuth.mk_empty()
+            return SshRawAuth.mk_empty()
+
+    @observed_mutation("auth.device-user.add")
+    def add(
+            self,
+            du_name: str,
+            exist_ok: bool = False
+    ) -> SshAuthDeviceUser:
+        def op(raw_auth: SshRawAuth) -> bool:
+            if du_name in raw_auth.device_users:
+                if not exist_ok:
+                    raise SshAuthRepoDeviceUserAlreadyExistsError(
+                        f"Failed to add *device user* '{du_name}'. "
+                        "Already exists.")
+                return False
 
-        if du_name in raw_auth.device_users:
-            if not exist_ok:
-                raise SshAuthRepoDeviceUserAlreadyExistsError(
-                    f"Failed to add *device user* '{du_name}'. Already exists.")
-        else:
             raw_auth.device_users[du_name] = SshRawAuthDeviceUser.mk_new(
                 du_name)
-            self._dump_raw(raw_auth)
+            return True
+
+        self._mutator.mutate(op, self._load_raw_or_empty)
 
         du = self[du_name]
         return du
@@ -373,12 +425,20 @@ class SshAuthDeviceUsersRepo:
             SshAuthDeviceUser.get_sentinel_id_for_all(),
             exist_ok=True)
 
+    @observed_mutation("auth.device-user.rm")
     def rm(
             self, du_name: str
     ) -> SshAuthDeviceUser:
-        du, raw_auth = self._get_w_raw_set(du_name)
+        du = self[du_name]
+
+        def op(raw_auth: SshRawAuth) -> bool:
+            try:
+                del raw_auth.device_users[du_name]
+            except KeyError as e:
+                raise SshAuthRepoKeyAccessError(
+                    f"No such *device user*: '{du_name}'. "
+                    "Can't be removed.") from e
+            return True
 
-        # Should exist as we successfully retrieved the *device user*.
-        del raw_auth.device_users[du_name]
-        self._dump_raw(raw_auth)
+        self._mutator.mutate(op)
         return du
@@ -0,0 +1,240 @@
+"""Append only feed of the logical mutations of an *ssh auth dir*.
+
+`SshAuthDirChangeFeedObserver` appends one NDJSON record per effective
+mutation (see `types_observer.observed_mutation`) to
+`.nsf-ssh-auth-dir/changes/changes.ndjson`:
+
+```json
+{"seq": 42, "time": 1700000000.0, "op": "group.member.add",
+ "attrs": {"group": "my-group", "user_id": "my-user", "force": false}}
+```
+
+Sequence numbers increase by one across processes, which allows
+consumers (e.g.: indexes or compiled outputs) to remember the last
+record they saw and only process the newer ones (see
+`iter_ssh_auth_dir_changes`). Public keys are recorded as their
+fingerprint.
+
+The feed is rotated to `changes.<last seq>.ndjson` once it exceeds
+`max_bytes`, only the `max_files` most recent rotated files are kept.
+"""
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ._file_txn_tools import FileTxn, get_file_txn
+from .file_pubkey import get_ssh_pubkey_fingerprint
+from .repo_lock import (LOCKS_DIRNAME, SshAuthDirFileLock,
+                        ensure_internal_dir)
+from .types_observer import (SshAuthDirMutationEvent, SshAuthDirRepoEvent,
+                             SshAuthDirRepoObserver)
+from .types_pubkey import SshPubKey
+
+CHANGE_FEED_DIRNAME = ".nsf-ssh-auth-dir/changes"
+CHANGE_FEED_FILENAME = "changes.ndjson"
+
+DEFAULT_CHANGE_FEED_MAX_BYTES = 1024 * 1024
+DEFAULT_CHANGE_FEED_MAX_FILES = 8
+
+_ROTATED_PREFIX = "changes."
+_ROTATED_SUFFIX = ".ndjson"
+# Large enough for any single record's line.
+_TAIL_READ_SIZE = 64 * 1024
+
+
+def _to_json_value(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, SshPubKey):
+        return {"fingerprint": get_ssh_pubkey_fingerprint(value)}
+    if isinstance(value, dict):
+        return {str(k): _to_json_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_to_json_value(v) for v in value]
+    return str(value)
+
+
+def _get_rotated_seq(filename: Path) -> Optional[int]:
+    name = filename.name
+    if not name.startswith(_ROTATED_PREFIX) \
+            or not name.endswith(_ROTATED_SUFFIX):
+        return None
+    try:
+        return int(name[len(_ROTATED_PREFIX):-len(_ROTATED_SUFFIX)])
+    except ValueError:
+        return None
+
+
+def _list_rotated(dir: Path) -> List[Tuple[int, Path]]:
+    """Oldest first."""
+    try:
+        children = list(dir.iterdir())
+    except FileNotFoundError:
+        return []
+    out = []
+    for fn in children:
+        seq = _get_rotated_seq(fn)
+        if seq is not None:
+            out.append((seq, fn))
+    return sorted(out)
+
+
+def _read_last_seq(filename: Path) -> Optional[int]:
+    try:
+        with open(filename, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - _TAIL_READ_SIZE))
+            tail = f.read()
+    except FileNotFoundError:
+        return None
+
+    for line in reversed(tail.splitlines()):
+        try:
+            return int(json.loads(line)["seq"])
+        except (ValueError, KeyError, TypeError):
+            # Torn or foreign line.
+            continue
+    return None
+
+
+class SshAuthDirChangeFeedObserver(SshAuthDirRepoObserver):
+    """Appends a record to the dir's change feed per mutation event.
+
+    Mutations made within a transaction (see `repo_journal`) are only
+    recorded once it commits.
+    """
+    def __init__(
+            self,
+            dir: Path,
+            max_bytes: int = DEFAULT_CHANGE_FEED_MAX_BYTES,
+            max_files: int = DEFAULT_CHANGE_FEED_MAX_FILES
+    ) -> None:
+        self._feed_dir = dir.joinpath(CHANGE_FEED_DIRNAME)
+        self._filename = self._feed_dir.joinpath(CHANGE_FEED_FILENAME)
+        self._max_bytes = max_bytes
+        self._max_files = max_files
+        # Serializes writers, including those of other processes.
+        self._lock = SshAuthDirFileLock(
+            dir.joinpath(LOCKS_DIRNAME, "changes.lock"))
+        # The feed's last seq as of our last append, valid as long as
+        # the feed's stat signature did not change since.
+        self._last: Optional[Tuple[Tuple[int, int], int]] = None
+        # Records of the current transaction's mutations.
+        self._pending_txn: Optional[FileTxn] = None
+        self._pending: List[Dict[str, Any]] = []
+
+    @property
+    def filename(self) -> Path:
+        return self._filename
+
+    def on_event(self, event: SshAuthDirRepoEvent) -> None:
+        if not isinstance(event, SshAuthDirMutationEvent):
+            return
+
+        record = {
+            "time": time.time(),
+            "op": event.op,
+            "attrs": _to_json_value(event.attrs),
+        }
+        txn = get_file_txn()
+        if txn is None:
+            self._append([record])
+            return
+
+        if self._pending_txn is not txn:
+            self._pending_txn = txn
+            self._pending = []
+            txn.on_commit(self._append_pending)
+        self._pending.append(record)
+
+    def _append_pending(self) -> None:
+        pending = self._pending
+        self._pending_txn = None
+        self._pending = []
+        self._append(pending)
+
+    def _get_stat_key(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self._filename)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size)
+
+    def _load_last_seq(self, stat_key: Optional[Tuple[int, int]]) -> int:
+        if self._last is not None and self._last[0] == stat_key:
+            return self._last[1]
+
+        seq = _read_last_seq(self._filename)
+        if seq is not None:
+            return seq
+
+        # Empty or missing feed, as after a rotation.
+        rotated = _list_rotated(self._feed_dir)
+        return rotated[-1][0] if rotated else 0
+
+    def _rotate(self, last_seq: int) -> None:
+        self._filename.rename(self._feed_dir.joinpath(
+            f"{_ROTATED_PREFIX}{last_seq:012d}{_ROTATED_SUFFIX}"))
+        rotated = _list_rotated(self._feed_dir)
+        for _, fn in rotated[:max(0, len(rotated) - self._max_files)]:
+            fn.unlink()
+
+    def _append(self, records: List[Dict[str, Any]]) -> None:
+        with self._lock.exclusive():
+            ensure_internal_dir(self._feed_dir)
+            stat_key = self._get_stat_key()
+            seq = self._load_last_seq(stat_key)
+            if stat_key is not None and stat_key[1] >= self._max_bytes:
+                self._rotate(seq)
+
+            lines = []
+            for record in records:
+                seq += 1
+                lines.append(json.dumps({"seq": seq, **record}) + "\n")
+            # A single write per append, whole lines only.
+            with open(self._filename, "ab") as f:
+                f.write("".join(lines).encode())
+
+            new_stat_key = self._get_stat_key()
+            assert new_stat_key is not None
+            self._last = (new_stat_key, seq)
+
+
+def _read_lines(filename: Path) -> List[bytes]:
+    try:
+        with open(filename, "rb") as f:
+            return f.readlines()
+    except FileNotFoundError:
+        # Removed by a rotation meanwhile.
+        return []
+
+
+def iter_ssh_auth_dir_changes(
+        dir: Path, since: int = 0) -> Iterator[Dict[str, Any]]:
+    """Iterate over the change feed's records whose seq is greater than
+        `since`, oldest first.
+
+    Records older than the oldest kept rotated file are lost. Rotated
+    files are skipped without being read when all their records are
+    older than `since`.
+    """
+    feed_dir = dir.joinpath(CHANGE_FEED_DIRNAME)
+    # Read first so that a concurrent rotation can only lead to
+    # duplicates, skipped below, rather than missed records.
+    current_lines = _read_lines(feed_dir.joinpath(CHANGE_FEED_FILENAME))
+    files_lines = [
+        _read_lines(fn)
+        for last_seq, fn in _list_rotated(feed_dir) if last_seq > since]
+    files_lines.append(current_lines)
+
+    for lines in files_lines:
+        for line in lines:
+            if not line.endswith(b"\n"):
+                # Being appended.
+                break
+            record = json.loads(line)
+            if record["seq"] > since:
+                since = record["seq"]
+                yield record
@@ -0,0 +1,351 @@
+"""Compile *ssh auth dirs* to per *device user* authorized keys.
+
+Should match what `nix-lib/users.nix`'s `listPubKeysContentForSshUsers`
+yields for the final set of authorized users of a *device user* (see
+`repo_access`): the content of each of these users' pubkey file in
+user name order.
+
+Many *ssh auth dirs* can be compiled at once on a process pool (see
+`compile_many_ssh_auth_dirs`).
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import (Dict, Iterable, Iterator, List, Mapping, NamedTuple,
+                    Optional, Tuple, Union)
+
+from .file_entity_dir import mk_entity_dir_opt
+from .file_pubkey import load_ssh_pubkey
+from .policy_repo import SshAuthDirRepoDefaultPolicy, SshAuthDirRepoPolicy
+from .repo import SshAuthDirRepo, mk_ssh_auth_dir_repo
+from .repo_access import SshAccessResolver
+from .repo_access_bitset import SshAccessBitsetResolver
+from .repo_snapshot import SshAuthDirSnapshot
+from .types_base_errors import SshAuthDirRepoError
+from .types_layout import SshAuthDirLayout
+from .types_pubkey import SshPubKey
+
+
+class SshAuthDirCompileError(SshAuthDirRepoError):
+    pass
+
+
+_StatKeyT = Tuple[int, int, int]
+
+
+class SshPubkeyContentCache:
+    """Loaded pubkeys keyed by filename and validated by stat signature.
+
+    Pubkeys are most often shared by many *ssh auth dirs* (e.g.: a fleet
+    wide public keys dir). Reusing a same cache across dirs avoids
+    reading these more than once.
+    """
+    def __init__(
+            self,
+            entries: Optional[Dict[str, Tuple[_StatKeyT, SshPubKey]]] = None
+    ) -> None:
+        self._entries = dict(entries) if entries is not None else {}
+        self.loaded = 0
+        self.reused = 0
+
+    @property
+    def entries(self) -> Dict[str, Tuple[_StatKeyT, SshPubKey]]:
+        return self._entries
+
+    def load(self, filename: Path) -> SshPubKey:
+        st = os.stat(filename)
+        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        found = self._entries.get(str(filename))
+        if found is not None and found[0] == key:
+            self.reused += 1
+            return found[1]
+
+        pubkey = load_ssh_pubkey(filename)
+        self.loaded += 1
+        self._entries[str(filename)] = (key, pubkey)
+        return pubkey
+
+
+def _format_pubkey(pubkey: SshPubKey) -> bytes:
+    """The pubkey file's content itself unless its newlines need fixing."""
+    out = pubkey.content
+    if b"\r" in out:
+        # Universal newlines, as `SshPubKey.text_lines`.
+        out = out.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    if out and not out.endswith(b"\n"):
+        out += b"\n"
+    return out
+
+
+CompiledPartsT = Dict[str, List[bytes]]
+
+
+def compile_ssh_auth_dir_snapshot_parts(
+        snapshot: SshAuthDirSnapshot,
+        on_states: Optional[Iterable[str]] = None,
+        resolver: Optional[SshAccessResolver] = None,
+        pubkey_cache: Optional[SshPubkeyContentCache] = None
+) -> CompiledPartsT:
+    """Return the parts of each *device user*'s authorized keys file:
+        the content of each authorized user's pubkey file, shared
+        between *device users* rather than copied.
+
+    See `compile_ssh_auth_dir_snapshot`.
+    """
+    if resolver is None:
+        resolver = SshAccessResolver()
+    if pubkey_cache is None:
+        pubkey_cache = SshPubkeyContentCache()
+
+    du_users: Dict[str, List[str]]
+    if isinstance(resolver, SshAccessBitsetResolver):
+        # Granting states do not matter here.
+        du_users = resolver.resolve_users_names(snapshot, on_states)
+    else:
+        du_users = {du_name: [] for du_name in snapshot.device_users_names}
+        for e in resolver.resolve(snapshot, on_states):
+            du_users[e.device_user].append(e.ssh_user)
+
+    pubkeys: Dict[str, bytes] = {}
+
+    def get_pubkey(username: str) -> bytes:
+        found = pubkeys.get(username)
+        if found is not None:
+            return found
+
+        try:
+            filename = snapshot.get_user(username).pubkeys.selected_filename
+            out = _format_pubkey(pubkey_cache.load(filename))
+        except KeyError as e:
+            raise SshAuthDirCompileError(
+                f"Authorized user '{username}' does not exist.") from e
+        except (SshAuthDirRepoError, OSError) as e:
+            raise SshAuthDirCompileError(
+                f"Failed to load user '{username}' pubkey: {e}") from e
+
+        pubkeys[username] = out
+        return out
+
+    return {
+        du_name: [get_pubkey(u) for u in sorted(users)]
+        for du_name, users in sorted(du_users.items())
+    }
+
+
+def join_compiled_parts(parts: CompiledPartsT) -> Dict[str, str]:
+    return {
+        du_name: b"".join(du_parts).decode()
+        for du_name, du_parts in parts.items()
+    }
+
+
+def compile_ssh_auth_dir_snapshot(
+        snapshot: SshAuthDirSnapshot,
+        on_states: Optional[Iterable[str]] = None,
+        resolver: Optional[SshAccessResolver] = None,
+        pubkey_cache: Optional[SshPubkeyContentCache] = None
+) -> Dict[str, str]:
+    """Return the authorized keys file content of each *device user*.
+
+    The `""` *device user* stands for any *device user* not explicitly
+    mentioned. See `SshAccessResolver.resolve` regarding `on_states`.
+
+    Raises:
+        SshAuthDirCompileError: When an authorized user does not exist
+            or its pubkey cannot be loaded.
+    """
+    return join_compiled_parts(compile_ssh_auth_dir_snapshot_parts(
+        snapshot, on_states, resolver, pubkey_cache))
+
+
+def compile_ssh_auth_dir_parts(
+        repo: SshAuthDirRepo,
+        on_states: Optional[Iterable[str]] = None,
+        pubkey_cache: Optional[SshPubkeyContentCache] = None
+) -> CompiledPartsT:
+    """Raises:
+        SshAuthDirCompileError: See `compile_ssh_auth_dir_snapshot`.
+    """
+    try:
+        snapshot = repo.load_snapshot()
+    except SshAuthDirRepoError as e:
+        # Any of the users, groups or auth files being unreadable or
+        # invalid.
+        raise SshAuthDirCompileError(str(e)) from e
+
+    return compile_ssh_auth_dir_snapshot_parts(
+        snapshot, on_states, SshAccessBitsetResolver(), pubkey_cache)
+
+
+def compile_ssh_auth_dir(
+        repo: SshAuthDirRepo,
+        on_states: Optional[Iterable[str]] = None,
+        pubkey_cache: Optional[SshPubkeyContentCache] = None
+) -> Dict[str, str]:
+    """Raises:
+        SshAuthDirCompileError: See `compile_ssh_auth_dir_snapshot`.
+    """
+    return join_compiled_parts(
+        compile_ssh_auth_dir_parts(repo, on_states, pubkey_cache))
+
+
+def iter_ssh_auth_dirs(
+        root: Path,
+        layout: Optional[SshAuthDirLayout] = None,
+        policy: Optional[SshAuthDirRepoPolicy] = None
+) -> Iterator[Path]:
+    """Yield, in sorted order, the dirs under `root` (included) having a
+        users file or users entity dir.
+
+    `layout` defaults to one with entity dirs so that dirs having only
+    a users entity dir are found too (see `detect_ssh_auth_dir_layout`).
+    """
+    if layout is None:
+        layout = SshAuthDirLayout.mk_entity_dirs()
+    if policy is None:
+        policy = SshAuthDirRepoDefaultPolicy()
+
+    users_stem = layout.users.stem
+    ff_policy = policy.file_format
+    for dirpath, dirnames, _ in os.walk(root):
+        # In place so that `os.walk` honors it.
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        dir = Path(dirpath)
+        entity_dir = mk_entity_dir_opt(
+            dir, users_stem, ff_policy, suffix=layout.entity_dir_suffix)
+        if any(fn.exists() for fn in ff_policy.get_source_filenames_for(
+                dir, users_stem)) \
+                or entity_dir is not None and entity_dir.exists():
+            yield dir
+
+
+class SshAuthDirCompileResult(NamedTuple):
+    dir: Path
+    # `None` on failure.
+    authorized_keys: Optional[Dict[str, str]]
+    error: Optional[str]
+    # Wall time in seconds.
+    duration: float
+
+
+# Per worker process, reused by all of the dirs sharded to this worker.
+_WORKER_PUBKEY_CACHE = SshPubkeyContentCache()
+
+
+def _init_compile_worker(
+        seed: Optional[Dict[str, Tuple[_StatKeyT, SshPubKey]]]) -> None:
+    global _WORKER_PUBKEY_CACHE
+    _WORKER_PUBKEY_CACHE = SshPubkeyContentCache(seed)
+
+
+def _compile_one(
+        args: Tuple[Path, Optional[List[str]]]) -> SshAuthDirCompileResult:
+    dir, on_states = args
+    start = time.perf_counter()
+    try:
+        out = compile_ssh_auth_dir(
+            mk_ssh_auth_dir_repo(dir), on_states, _WORKER_PUBKEY_CACHE)
+    except SshAuthDirRepoError as e:
+        # Also when creating the repo (e.g.: a journal left by an
+        # interrupted transaction failing to recover).
+        return SshAuthDirCompileResult(
+            dir, None, str(e), time.perf_counter() - start)
+    return SshAuthDirCompileResult(
+        dir, out, None, time.perf_counter() - start)
+
+
+def compile_many_ssh_auth_dirs(
+        dirs: Iterable[Path],
+        on_states: Optional[Iterable[str]] = None,
+        jobs: Optional[int] = None,
+        pubkey_cache: Optional[SshPubkeyContentCache] = None
+) -> Iterator[SshAuthDirCompileResult]:
+    """Compile each of `dirs` (default layout and policy) and yield the
+        results in `dirs` order whatever the number of `jobs`.
+
+    Failures are reported as results. `jobs` defaults to the number of
+    cpus, `1` compiling in process. When provided, `pubkey_cache` seeds
+    each worker's own cache (a copy, workers never write it back).
+    """
+    states = None if on_states is None else sorted(set(on_states))
+    tasks = [(d, states) for d in dirs]
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(tasks)))
+
+    seed = None if pubkey_cache is None else pubkey_cache.entries
+    if 1 == jobs:
+        _init_compile_worker(seed)
+        yield from map(_compile_one, tasks)
+        return
+
+    # Sharded in chunks to amortize the inter process overhead while
+    # still balancing uneven dirs across workers.
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_compile_worker,
+            initargs=(seed,)) as executor:
+        yield from executor.map(_compile_one, tasks, chunksize=chunksize)
+
+
+def get_authorized_keys_basename(du_name: str) -> str:
+    if "" == du_name:
+        # Cannot clash with a valid unix user name.
+        return "[ALL].authorized_keys"
+    return f"{du_name}.authorized_keys"
+
+
+def _get_iov_max() -> int:
+    try:
+        return max(1, os.sysconf("SC_IOV_MAX"))
+    except (AttributeError, ValueError, OSError):
+        return 1024
+
+
+_IOV_MAX = _get_iov_max()
+
+
+def _writev_all(fd: int, parts: List[bytes]) -> None:
+    i = 0
+    while i < len(parts):
+        batch = parts[i:i + _IOV_MAX]
+        written = os.writev(fd, batch)
+        if written == sum(map(len, batch)):
+            i += len(batch)
+            continue
+
+        # Short write, rare with regular files.
+        for part in batch:
+            if written < len(part):
+                break
+            written -= len(part)
+            i += 1
+        rest = memoryview(parts[i])[written:]
+        while rest:
+            rest = rest[os.write(fd, rest):]
+        i += 1
+
+
+def dump_compiled_authorized_keys(
+        out_dir: Path,
+        authorized_keys: Mapping[str, Union[str, List[bytes]]]
+) -> List[Path]:
+    """Write one authorized keys file per *device user* to `out_dir`.
+
+    Compiled parts (see `compile_ssh_auth_dir_parts`) are written with
+    a few vectored writes per file, without being joined first.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out = []
+    for du_name, content in sorted(authorized_keys.items()):
+        filename = out_dir.joinpath(get_authorized_keys_basename(du_name))
+        parts = [content.encode()] if isinstance(content, str) else content
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            _writev_all(fd, parts)
+        finally:
+            os.close(fd)
+        out.append(filename)
+    return out
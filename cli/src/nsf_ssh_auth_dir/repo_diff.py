@@ -0,0 +1,140 @@
+"""Semantic, parsed content level differences between 2 versions of an
+*ssh auth dir*'s files.
+
+Each file kind is compared independently from the others so that
+unchanged files never have to be parsed.
+"""
+from typing import Iterator, NamedTuple, Optional
+
+from .repo_auth_device_users import SshAuthDeviceUser
+from .types_auth import SshRawAuth
+from .types_groups import SshRawGroups
+from .types_users import SshRawUsers
+
+CHANGE_OP_ADDED = "added"
+CHANGE_OP_REMOVED = "removed"
+CHANGE_OP_CHANGED = "changed"
+
+CHANGE_ENTITY_USER = "user"
+CHANGE_ENTITY_USER_DEFAULTS = "user-defaults"
+CHANGE_ENTITY_GROUP = "group"
+CHANGE_ENTITY_GROUP_MEMBER = "group-member"
+CHANGE_ENTITY_AUTH_USER = "auth-user"
+CHANGE_ENTITY_AUTH_GROUP = "auth-group"
+CHANGE_ENTITY_PUBKEY_FILE = "pubkey-file"
+
+
+def format_device_user_name(name: str) -> str:
+    if SshAuthDeviceUser.get_sentinel_id_for_all() == name:
+        return "[ALL]"
+    return f"'{name}'"
+
+
+def _fmt_state(state_name: Optional[str]) -> str:
+    if state_name is None:
+        return "always"
+    return f"on state '{state_name}'"
+
+
+class SshAuthDirChange(NamedTuple):
+    op: str
+    entity: str
+    name: str
+    # The group / *device user* for membership / authorization changes.
+    target: Optional[str] = None
+    # Only for authorizations, `None` being the *authorized always* set.
+    state: Optional[str] = None
+
+    @property
+    def description(self) -> str:
+        if CHANGE_ENTITY_GROUP_MEMBER == self.entity:
+            assert self.target is not None
+            prep = "to" if CHANGE_OP_ADDED == self.op else "from"
+            return (
+                f"user '{self.name}' {self.op} {prep} group '{self.target}'")
+
+        if self.entity in (CHANGE_ENTITY_AUTH_USER, CHANGE_ENTITY_AUTH_GROUP):
+            assert self.target is not None
+            kind = "user" if CHANGE_ENTITY_AUTH_USER == self.entity else "group"
+            verb = (
+                "authorized" if CHANGE_OP_ADDED == self.op
+                else "no longer authorized")
+            return (
+                f"{kind} '{self.name}' {verb} to "
+                f"{format_device_user_name(self.target)} {_fmt_state(self.state)}")
+
+        if CHANGE_ENTITY_USER_DEFAULTS == self.entity:
+            return f"user defaults {self.op}"
+
+        if CHANGE_ENTITY_PUBKEY_FILE == self.entity:
+            return f"public key file '{self.name}' {self.op}"
+
+        return f"{self.entity} '{self.name}' {self.op}"
+
+
+def iter_ssh_users_changes(
+        a: SshRawUsers, b: SshRawUsers) -> Iterator[SshAuthDirChange]:
+    if a.plain.get("ssh-user-defaults") != b.plain.get("ssh-user-defaults"):
+        yield SshAuthDirChange(
+            CHANGE_OP_CHANGED, CHANGE_ENTITY_USER_DEFAULTS, "")
+
+    for name, user in a.ssh_users.items():
+        b_user = b.ssh_users.get(name)
+        if b_user is None:
+            yield SshAuthDirChange(CHANGE_OP_REMOVED, CHANGE_ENTITY_USER, name)
+        elif user.plain != b_user.plain:
+            yield SshAuthDirChange(CHANGE_OP_CHANGED, CHANGE_ENTITY_USER, name)
+
+    for name in b.ssh_users.keys():
+        if name not in a.ssh_users:
+            yield SshAuthDirChange(CHANGE_OP_ADDED, CHANGE_ENTITY_USER, name)
+
+
+def iter_ssh_groups_changes(
+        a: SshRawGroups, b: SshRawGroups) -> Iterator[SshAuthDirChange]:
+    for name in a.ssh_groups.keys():
+        if name not in b.ssh_groups:
+            yield SshAuthDirChange(
+                CHANGE_OP_REMOVED, CHANGE_ENTITY_GROUP, name)
+
+    for name in b.ssh_groups.keys():
+        if name not in a.ssh_groups:
+            yield SshAuthDirChange(CHANGE_OP_ADDED, CHANGE_ENTITY_GROUP, name)
+
+    for name in sorted(set(a.ssh_groups) | set(b.ssh_groups)):
+        a_group = a.ssh_groups.get(name)
+        b_group = b.ssh_groups.get(name)
+        a_members = set() if a_group is None else a_group.members
+        b_members = set() if b_group is None else b_group.members
+        for m_name in sorted(a_members - b_members):
+            yield SshAuthDirChange(
+                CHANGE_OP_REMOVED, CHANGE_ENTITY_GROUP_MEMBER, m_name, name)
+        for m_name in sorted(b_members - a_members):
+            yield SshAuthDirChange(
+                CHANGE_OP_ADDED, CHANGE_ENTITY_GROUP_MEMBER, m_name, name)
+
+
+def iter_ssh_auth_changes(
+        state_name: Optional[str],
+        a: SshRawAuth,
+        b: SshRawAuth
+) -> Iterator[SshAuthDirChange]:
+    """Changes to a single *authorized always* (`state_name` is `None`)
+        or *authorized on* state set.
+    """
+    for du_name in sorted(set(a.device_users) | set(b.device_users)):
+        a_du = a.device_users.get(du_name)
+        b_du = b.device_users.get(du_name)
+        for entity, a_set, b_set in [
+                (CHANGE_ENTITY_AUTH_USER,
+                    set() if a_du is None else a_du.ssh_users,
+                    set() if b_du is None else b_du.ssh_users),
+                (CHANGE_ENTITY_AUTH_GROUP,
+                    set() if a_du is None else a_du.ssh_groups,
+                    set() if b_du is None else b_du.ssh_groups)]:
+            for name in sorted(a_set - b_set):
+                yield SshAuthDirChange(
+                    CHANGE_OP_REMOVED, entity, name, du_name, state_name)
+            for name in sorted(b_set - a_set):
+                yield SshAuthDirChange(
+                    CHANGE_OP_ADDED, entity, name, du_name, state_name)
@@ -0,0 +1,268 @@
+"""Export a whole *ssh auth dir* as a single, pre-resolved json snapshot.
+
+Meant for `nix-lib/resolved.nix`'s `loadAuthDirResolved` which would
+otherwise redo the users, groups and auth merge logic in the nix
+evaluator for each device. The snapshot holds:
+
+ -  `ssh-users`: each user's selected pubkey file along with its
+    content, inlined.
+ -  `ssh-groups`: each group's members.
+ -  `device-users`: the *authorized always* set and each
+    *authorized on* state's set, with groups expanded to their members.
+    Sets are kept apart so that any combination of states can be
+    merged by the loader (a mere union of users).
+ -  `srcs`: the files each of these come from.
+ -  `content-hash`: the `repo_hash` digest of the dir along with each
+    of the hashed files. Loaders only trust the snapshot while these
+    files' digests still yield this digest and while each entity dir
+    (e.g.: `users.d`) still lists the same file names, files added to
+    these not being among the hashed ones.
+
+The snapshot is canonical: the same dir content always exports to the
+same bytes.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from .repo import SshAuthDirRepo
+from .repo_compile import SshPubkeyContentCache
+from .repo_hash import (SshAuthDirFileHashCache, compute_ssh_auth_dir_hash,
+                        list_file_set_filenames)
+from .repo_snapshot import SshAuthDirSnapshot
+from .types_base_errors import SshAuthDirRepoError
+from .types_layout import SshAuthDirEntityDirsLayout
+
+RESOLVED_SNAPSHOT_FORMAT = "nsf-ssh-auth-dir-resolved"
+RESOLVED_SNAPSHOT_VERSION = 2
+
+
+class SshAuthDirExportError(SshAuthDirRepoError):
+    pass
+
+
+PlainResolvedSnapshotT = Dict[str, Any]
+
+
+def _to_snapshot_path(dir: Path, filename: Path) -> str:
+    """Relative to the *ssh auth dir* when within it, as `repo_hash`."""
+    try:
+        return filename.relative_to(dir).as_posix()
+    except ValueError:
+        return str(filename)
+
+
+def _mk_plain_src(
+        repo: SshAuthDirRepo, in_dir: Path, stem: str) -> Dict[str, Any]:
+    filenames = list_file_set_filenames(
+        repo.policy.file_format, in_dir, stem,
+        repo.layout.entity_dir_suffix)
+    return {
+        # `.` for the *ssh auth dir* itself.
+        "dir": _to_snapshot_path(repo.dir, in_dir),
+        "stem": stem,
+        "files": [
+            _to_snapshot_path(repo.dir, fn)
+            for fn in filenames if fn.exists()],
+    }
+
+
+def _mk_plain_entity_dir(
+        repo: SshAuthDirRepo, in_dir: Path, stem: str, suffix: str
+) -> Dict[str, Any]:
+    entity_dir = in_dir.joinpath(f"{stem}{suffix}")
+    try:
+        # All names, as nix's `builtins.readDir`. `None` when missing
+        # so that adding the dir is noticed too.
+        names = sorted(os.listdir(entity_dir)) \
+            if entity_dir.exists() else None
+    except OSError as e:
+        raise SshAuthDirExportError(
+            f"Cannot list entity dir '{entity_dir}': {e}") from e
+    return {"path": _to_snapshot_path(repo.dir, entity_dir), "names": names}
+
+
+def _mk_plain_users(
+        snapshot: SshAuthDirSnapshot,
+        pubkey_cache: SshPubkeyContentCache
+) -> Dict[str, Any]:
+    out = {}
+    for u_name in sorted(snapshot.users_names):
+        try:
+            filename = snapshot.get_user(u_name).pubkeys.selected_filename
+            content = pubkey_cache.load(filename).content.decode()
+        except (SshAuthDirRepoError, OSError, UnicodeDecodeError) as e:
+            raise SshAuthDirExportError(
+                f"Failed to load user '{u_name}' pubkey: {e}") from e
+
+        out[u_name] = {"pubkey": {
+            "file": _to_snapshot_path(snapshot.dir, filename),
+            "content": content,
+        }}
+    return out
+
+
+def _mk_plain_groups(snapshot: SshAuthDirSnapshot) -> Dict[str, Any]:
+    out = {}
+    for g_name in sorted(snapshot.groups_names):
+        members = snapshot.get_group_members_names(g_name)
+        for m_name in members:
+            if not snapshot.has_user(m_name):
+                raise SshAuthDirExportError(
+                    f"Group '{g_name}' member '{m_name}' does not exist.")
+        out[g_name] = {"members": members}
+    return out
+
+
+def _mk_plain_device_users(
+        snapshot: SshAuthDirSnapshot,
+        state_name: Optional[str]
+) -> Dict[str, Any]:
+    raw_auth = snapshot.get_raw_auth(state_name)
+    if raw_auth is None:
+        return {}
+
+    out = {}
+    for du_name, du in sorted(raw_auth.device_users.items()):
+        users: Set[str] = set()
+        for u_name in du.ssh_users:
+            if not snapshot.has_user(u_name):
+                raise SshAuthDirExportError(
+                    f"Device user '{du_name}' authorized user "
+                    f"'{u_name}' does not exist.")
+            users.add(u_name)
+
+        for g_name in du.ssh_groups:
+            if not snapshot.has_group(g_name):
+                raise SshAuthDirExportError(
+                    f"Device user '{du_name}' authorized group "
+                    f"'{g_name}' does not exist.")
+            users.update(snapshot.get_group_members_names(g_name))
+
+        out[du_name] = {"ssh-users": sorted(users)}
+    return out
+
+
+def export_resolved_ssh_auth_dir(
+        repo: SshAuthDirRepo,
+        hash_cache: Optional[SshAuthDirFileHashCache] = None,
+        pubkey_cache: Optional[SshPubkeyContentCache] = None
+) -> PlainResolvedSnapshotT:
+    """Raises:
+        SshAuthDirExportError: When the dir does not resolve (e.g.: a
+            file is invalid, an authorized user does not exist or its
+            pubkey cannot be loaded) or when it changed while being
+            exported.
+    """
+    if hash_cache is None:
+        hash_cache = SshAuthDirFileHashCache()
+    if pubkey_cache is None:
+        pubkey_cache = SshPubkeyContentCache()
+
+    # Hashed both before and after loading so that the recorded digest
+    # is that of what was loaded.
+    dir_hash = compute_ssh_auth_dir_hash(repo, hash_cache)
+
+    try:
+        snapshot = repo.load_snapshot()
+    except SshAuthDirRepoError as e:
+        # Any of the users, groups or auth files being unreadable or
+        # invalid.
+        raise SshAuthDirExportError(str(e)) from e
+
+    layout = repo.layout
+    auth_on_dir = repo.dir.joinpath(layout.auth_on.dirname)
+    state_names = snapshot.state_names
+    # Whatever the layout, as the nix lib's default cfg always merges
+    # entity dirs: one added since the export must be noticed too.
+    suffix = layout.entity_dir_suffix \
+        or SshAuthDirEntityDirsLayout.mk_default().suffix
+    entity_dirs = [
+        _mk_plain_entity_dir(repo, in_dir, stem, suffix)
+        for in_dir, stem in [
+            (repo.dir, layout.users.stem),
+            (repo.dir, layout.groups.stem),
+            (repo.dir, layout.device_state_always.stem),
+            *((auth_on_dir, s) for s in state_names)]]
+    out: PlainResolvedSnapshotT = {
+        "format": RESOLVED_SNAPSHOT_FORMAT,
+        "version": RESOLVED_SNAPSHOT_VERSION,
+        "ssh-users": _mk_plain_users(snapshot, pubkey_cache),
+        "ssh-groups": _mk_plain_groups(snapshot),
+        "device-users": {
+            "authorized-always": _mk_plain_device_users(snapshot, None),
+            "authorized-on": {
+                s: _mk_plain_device_users(snapshot, s)
+                for s in state_names},
+        },
+        "srcs": {
+            "users": _mk_plain_src(repo, repo.dir, layout.users.stem),
+            "groups": _mk_plain_src(repo, repo.dir, layout.groups.stem),
+            "authorized-always": _mk_plain_src(
+                repo, repo.dir, layout.device_state_always.stem),
+            "authorized-on": {
+                s: _mk_plain_src(repo, auth_on_dir, s)
+                for s in state_names},
+        },
+        "content-hash": {
+            "digest": dir_hash.digest,
+            # In digest order.
+            "files": [
+                {"kind": e.kind, "path": e.path, "digest": e.digest}
+                for e in dir_hash.entries],
+            "entity-dirs": entity_dirs,
+        },
+    }
+
+    if compute_ssh_auth_dir_hash(repo, hash_cache) != dir_hash:
+        raise SshAuthDirExportError(
+            "The *ssh auth dir* changed while being exported.")
+    return out
+
+
+def dumps_resolved_snapshot(plain: PlainResolvedSnapshotT) -> str:
+    return json.dumps(
+        plain, sort_keys=True, separators=(",", ":"),
+        ensure_ascii=False) + "\n"
+
+
+def dump_resolved_snapshot(
+        plain: PlainResolvedSnapshotT, out_filename: Path) -> None:
+    """Replace `out_filename` at once so that readers (e.g.: a nix
+        evaluation) never see a partially written snapshot.
+    """
+    tmp_filename = out_filename.with_name(
+        f".{out_filename.name}.{os.getpid()}.tmp")
+    try:
+        tmp_filename.write_text(dumps_resolved_snapshot(plain))
+        os.replace(tmp_filename, out_filename)
+    except BaseException:
+        try:
+            tmp_filename.unlink()
+        except OSError:
+            pass
+        raise
+
+
+def list_resolved_snapshot_users(
+        plain: PlainResolvedSnapshotT,
+        on_states: Optional[List[str]] = None
+) -> Dict[str, List[str]]:
+    """The users authorized to each *device user* (the `""` *device
+        user* not being merged into the others), `on_states` being all
+        of the snapshot's states when `None`.
+
+    The same merge `loadAuthDirResolved` does.
+    """
+    device_users = plain["device-users"]
+    if on_states is None:
+        on_states = sorted(device_users["authorized-on"].keys())
+
+    sources = [device_users["authorized-always"]]
+    sources.extend(device_users["authorized-on"].get(s, {}) for s in on_states)
+    out: Dict[str, Set[str]] = {}
+    for source in sources:
+        for du_name, du in source.items():
+            out.setdefault(du_name, set()).update(du["ssh-users"])
+    return {du_name: sorted(users) for du_name, users in sorted(out.items())}
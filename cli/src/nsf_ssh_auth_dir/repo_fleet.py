@@ -0,0 +1,207 @@
+"""Persistent, cross *ssh auth dirs* index of authorizations.
+
+Maps each *ssh user* to every (*ssh auth dir*, state, *device user*,
+group) it is authorized through, whether directly or as a member of an
+authorized group. The index is updated incrementally: only the dirs
+whose users, groups or auth files digest (see `repo_hash`) changed are
+reindexed.
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from ._cache_tools import (dump_json_cache_file, get_dir_cache_filename,
+                           load_json_cache_file)
+from .repo import SshAuthDirRepo, mk_ssh_auth_dir_repo
+from .repo_compile import iter_ssh_auth_dirs
+from .repo_hash import SshAuthDirFileHashCache, compute_ssh_auth_dir_hash
+from .types_base_errors import SshAuthDirRepoError
+
+_INDEX_FORMAT_VERSION = 1
+
+# `[state, device user, via group]`.
+_RawEntryT = List[Optional[str]]
+
+
+class SshFleetIndexEntry(NamedTuple):
+    # Relative to the index's root.
+    dir: str
+    # `None` when part of the *authorized always* set.
+    state: Optional[str]
+    device_user: str
+    # `None` when directly authorized.
+    via_group: Optional[str]
+
+
+class SshFleetIndexUpdateStats(NamedTuple):
+    reindexed: int
+    reused: int
+    removed: int
+    # Dirs which could not be indexed (e.g.: invalid users file).
+    failed: Dict[str, str]
+
+
+class _DirIndex(NamedTuple):
+    digest: str
+    users: Dict[str, List[_RawEntryT]]
+
+
+def _mk_entry(rel_dir: str, raw: _RawEntryT) -> SshFleetIndexEntry:
+    state, du_name, via_group = raw
+    assert du_name is not None
+    return SshFleetIndexEntry(rel_dir, state, du_name, via_group)
+
+
+def _index_dir(repo: SshAuthDirRepo) -> Dict[str, List[_RawEntryT]]:
+    """Raises:
+        SshAuthDirRepoError: When any of the dir's files cannot be loaded.
+    """
+    snapshot = repo.load_snapshot()
+    # Authorized users need not exist, these are worth reporting too
+    # whether authorized directly or as authorized groups' members.
+    names = set(snapshot.users_names)
+    for state_name in [None, *snapshot.state_names]:
+        raw_auth = snapshot.get_raw_auth(state_name)
+        if raw_auth is None:
+            continue
+        for raw_du in raw_auth.device_users.values():
+            names.update(raw_du.ssh_users)
+            for g_name in raw_du.ssh_groups:
+                raw_group = snapshot.get_raw_group(g_name)
+                if raw_group is not None:
+                    names.update(raw_group.members)
+
+    out: Dict[str, List[_RawEntryT]] = {}
+    for u_name in sorted(names):
+        entries = snapshot.get_user_auth_entries(u_name)
+        if entries:
+            out[u_name] = [
+                [e.state_name, e.device_user_name, e.via_group_name]
+                for e in entries]
+    return out
+
+
+class SshFleetIndex:
+    """The index of all *ssh auth dirs* found under `root`.
+
+    Persisted to the user's cache dir unless `persistent` is false.
+    """
+    def __init__(self, root: Path, persistent: bool = True) -> None:
+        self._root = root.absolute()
+        self._filename: Optional[Path] = None
+        hashes_filename: Optional[Path] = None
+        if persistent:
+            self._filename = get_dir_cache_filename(
+                self._root, "fleet-index", ".json")
+            hashes_filename = get_dir_cache_filename(
+                self._root, "fleet-file-hashes", ".json")
+        # A single stat keyed cache for all dirs' files.
+        self._hash_cache = SshAuthDirFileHashCache(hashes_filename)
+        self._dirs: Dict[str, _DirIndex] = {}
+        self._by_user: Optional[Dict[str, List[SshFleetIndexEntry]]] = None
+        if self._filename is not None:
+            self._load(self._filename)
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    @property
+    def dirs(self) -> List[str]:
+        return sorted(self._dirs.keys())
+
+    def _load(self, filename: Path) -> None:
+        content = load_json_cache_file(filename)
+        if not isinstance(content, dict) \
+                or _INDEX_FORMAT_VERSION != content.get("version"):
+            return
+
+        try:
+            self._dirs = {
+                d: _DirIndex(v["digest"], dict(v["users"]))
+                for d, v in content["dirs"].items()
+            }
+        except (KeyError, TypeError, AttributeError):
+            self._dirs = {}
+
+    def save(self) -> None:
+        self._hash_cache.save()
+        if self._filename is None:
+            return
+
+        content: Dict[str, Any] = {
+            "version": _INDEX_FORMAT_VERSION,
+            "dirs": {
+                d: {"digest": v.digest, "users": v.users}
+                for d, v in self._dirs.items()
+            },
+        }
+        dump_json_cache_file(self._filename, content)
+
+    def _to_rel_dir(self, dir: Path) -> str:
+        try:
+            return dir.relative_to(self._root).as_posix()
+        except ValueError:
+            return str(dir)
+
+    def update(
+            self, dirs: Optional[Iterable[Path]] = None
+    ) -> SshFleetIndexUpdateStats:
+        """Reindex the dirs whose content changed.
+
+        `dirs` defaults to all *ssh auth dirs* under the root. Dirs no
+        longer found are dropped from the index. Dirs failing to be
+        indexed keep their previous entries, if any.
+        """
+        if dirs is None:
+            dirs = iter_ssh_auth_dirs(self._root)
+
+        reindexed = 0
+        reused = 0
+        failed: Dict[str, str] = {}
+        found: Dict[str, _DirIndex] = {}
+        for dir in dirs:
+            rel_dir = self._to_rel_dir(dir)
+            try:
+                repo = mk_ssh_auth_dir_repo(dir)
+                digest = compute_ssh_auth_dir_hash(
+                    repo, self._hash_cache, with_pubkeys=False).digest
+                prev = self._dirs.get(rel_dir)
+                if prev is not None and prev.digest == digest:
+                    reused += 1
+                    found[rel_dir] = prev
+                    continue
+
+                found[rel_dir] = _DirIndex(digest, _index_dir(repo))
+            except SshAuthDirRepoError as e:
+                # Any dir failing (e.g.: an invalid file or a journal
+                # failing to recover) is reported, not raised.
+                failed[rel_dir] = str(e)
+                prev = self._dirs.get(rel_dir)
+                if prev is not None:
+                    found[rel_dir] = prev
+                continue
+            reindexed += 1
+
+        removed = len(set(self._dirs.keys()) - set(found.keys()))
+        self._dirs = found
+        self._by_user = None
+        return SshFleetIndexUpdateStats(reindexed, reused, removed, failed)
+
+    def _ensure_by_user(self) -> Dict[str, List[SshFleetIndexEntry]]:
+        if self._by_user is None:
+            by_user: Dict[str, List[SshFleetIndexEntry]] = {}
+            for rel_dir in self.dirs:
+                for u_name, raw_entries in self._dirs[rel_dir].users.items():
+                    by_user.setdefault(u_name, []).extend(
+                        _mk_entry(rel_dir, raw) for raw in raw_entries)
+            self._by_user = by_user
+
+        return self._by_user
+
+    def who(self, username: str) -> List[SshFleetIndexEntry]:
+        """Where `username` is authorized, in dir order."""
+        return list(self._ensure_by_user().get(username, []))
+
+    @property
+    def users_names(self) -> List[str]:
+        return sorted(self._ensure_by_user().keys())
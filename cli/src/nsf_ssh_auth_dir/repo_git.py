@@ -0,0 +1,433 @@
+"""Read only access to an *ssh auth dir*'s files as tracked by `git`.
+
+A single `git ls-tree` process lists the files of interest at a given
+revision and a single `git cat-file --batch` process streams all the
+needed blobs. Work tree files are read directly from disk and their
+git object id computed locally so that files unchanged between both
+sides are neither fetched nor parsed.
+"""
+import hashlib
+import subprocess
+from abc import ABC, abstractmethod
+from pathlib import Path, PurePosixPath
+from typing import (Any, Callable, Dict, Iterable, Iterator, List,
+                    NamedTuple, Optional, Tuple, TypeVar)
+
+from ._content_persistance_tools import (FileContentError,
+                                         parse_content_from_bytes)
+from .file_auth import parse_ssh_auth
+from .file_groups import parse_ssh_groups
+from .file_pubkey import get_default_pubkey_rdir
+from .file_users import parse_ssh_users
+from .repo import SshAuthDirRepo
+from .repo_diff import (CHANGE_ENTITY_PUBKEY_FILE, CHANGE_OP_ADDED,
+                        CHANGE_OP_CHANGED, CHANGE_OP_REMOVED,
+                        SshAuthDirChange, iter_ssh_auth_changes,
+                        iter_ssh_groups_changes, iter_ssh_users_changes)
+from .repo_snapshot import SshAuthDirSnapshot
+from .types_auth import SshRawAuth
+from .types_base_errors import SshAuthDirFileError, SshAuthDirRepoError
+from .types_groups import SshRawGroups
+from .types_users import SshRawUsers
+
+
+class SshAuthDirGitError(SshAuthDirRepoError):
+    pass
+
+
+_ParsedT = TypeVar("_ParsedT")
+
+
+FILE_KIND_USERS = "users"
+FILE_KIND_GROUPS = "groups"
+FILE_KIND_AUTH = "auth"
+FILE_KIND_PUBKEY = "pubkey"
+
+
+class SshAuthDirTrackedFile(NamedTuple):
+    # Posix path relative to the *ssh auth dir*.
+    relpath: str
+    kind: str
+    # Only for auth files, `None` being the *authorized always* file.
+    state_name: Optional[str] = None
+
+
+class _TrackedFilesLayout:
+    """Maps paths relative to the *ssh auth dir* to their file kind.
+
+    Raises:
+        SshAuthDirGitError: When the layout has per entity files (e.g.:
+            `users.d/my-user.json`), not supported here.
+    """
+    def __init__(self, repo: SshAuthDirRepo) -> None:
+        ff_policy = repo.policy.file_format
+        layout = repo.layout
+        dir = repo.dir
+
+        if layout.entity_dir_suffix is not None:
+            # Their changes would otherwise silently go unnoticed.
+            raise SshAuthDirGitError(
+                "Git revisions of *ssh auth dirs* with per entity files "
+                f"(i.e.: '<stem>{layout.entity_dir_suffix}' dirs) are not "
+                "supported. See `layout convert`.")
+
+        def to_rel(fn: Path) -> str:
+            return fn.relative_to(dir).as_posix()
+
+        self.users = to_rel(
+            ff_policy.get_preferred_source_filename_for(dir, layout.users.stem))
+        self.groups = to_rel(
+            ff_policy.get_preferred_source_filename_for(dir, layout.groups.stem))
+        self.auth_always = to_rel(
+            ff_policy.get_preferred_source_filename_for(
+                dir, layout.device_state_always.stem))
+        self.auth_on_dir = layout.auth_on.dirname
+        self.auth_on_suffix = ff_policy.get_target_filename_for(
+            dir, "x").suffix
+        self.pubkeys_dir = PurePosixPath(get_default_pubkey_rdir()).as_posix()
+
+    @property
+    def ls_paths(self) -> List[str]:
+        return [
+            self.users, self.groups, self.auth_always,
+            f"{self.auth_on_dir}/", f"{self.pubkeys_dir}/"
+        ]
+
+    def classify(self, relpath: str) -> Optional[SshAuthDirTrackedFile]:
+        if self.users == relpath:
+            return SshAuthDirTrackedFile(relpath, FILE_KIND_USERS)
+        if self.groups == relpath:
+            return SshAuthDirTrackedFile(relpath, FILE_KIND_GROUPS)
+        if self.auth_always == relpath:
+            return SshAuthDirTrackedFile(relpath, FILE_KIND_AUTH)
+
+        pp = PurePosixPath(relpath)
+        parent = pp.parent.as_posix()
+        if parent == self.auth_on_dir and pp.suffix == self.auth_on_suffix:
+            return SshAuthDirTrackedFile(relpath, FILE_KIND_AUTH, pp.stem)
+        if parent == self.pubkeys_dir:
+            return SshAuthDirTrackedFile(relpath, FILE_KIND_PUBKEY)
+        return None
+
+
+def _run_git(
+        dir: Path, args: List[str], input: Optional[bytes] = None) -> bytes:
+    try:
+        p = subprocess.run(
+            ["git", "-C", str(dir)] + args,
+            input=input,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True)
+    except FileNotFoundError as e:
+        raise SshAuthDirGitError(f"Cannot run git: {str(e)}") from e
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr.decode(errors="replace").strip()
+        raise SshAuthDirGitError(
+            f"'git {args[0]}' failed: {stderr}") from e
+    return p.stdout
+
+
+def _ls_tree(dir: Path, rev: str, paths: List[str]) -> Dict[str, str]:
+    """Return the object id of each tracked file under `paths` at `rev`.
+
+    Paths are relative to `dir`, both in and out.
+    """
+    out = _run_git(dir, ["ls-tree", "-r", "-z", rev, "--"] + paths)
+    files: Dict[str, str] = {}
+    for entry in out.split(b"\0"):
+        if not entry:
+            continue
+        meta, path = entry.split(b"\t", 1)
+        _, obj_type, oid = meta.split(b" ")
+        if b"blob" == obj_type:
+            files[path.decode()] = oid.decode()
+    return files
+
+
+def _cat_file_batch(dir: Path, oids: Iterable[str]) -> Dict[str, bytes]:
+    """Stream the content of all `oids` through a single git process."""
+    oids = list(dict.fromkeys(oids))
+    if not oids:
+        return {}
+
+    out = _run_git(
+        dir, ["cat-file", "--batch"],
+        input="".join(f"{oid}\n" for oid in oids).encode())
+
+    contents: Dict[str, bytes] = {}
+    pos = 0
+    for oid in oids:
+        eol = out.index(b"\n", pos)
+        header = out[pos:eol].split(b" ")
+        pos = eol + 1
+        if b"missing" == header[-1]:
+            raise SshAuthDirGitError(f"Missing git object: '{oid}'.")
+        size = int(header[2])
+        contents[oid] = out[pos:pos + size]
+        # Each content is followed by a line feed.
+        pos += size + 1
+    return contents
+
+
+def _hash_git_blob(content: bytes, oid_len: int) -> str:
+    """Same as what `git hash-object` would output for `content`."""
+    # Sha256 repositories have 64 hex chars object ids.
+    h = hashlib.sha256() if 64 == oid_len else hashlib.sha1()
+    h.update(b"blob %d\0" % len(content))
+    h.update(content)
+    return h.hexdigest()
+
+
+class SshAuthDirGitTree(ABC):
+    """The *ssh auth dir* tracked files at some revision."""
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        pass
+
+    @property
+    @abstractmethod
+    def files(self) -> Dict[str, str]:
+        """Object id of each file indexed by their relative path."""
+        pass
+
+    @abstractmethod
+    def get_contents(self, relpaths: Iterable[str]) -> Dict[str, bytes]:
+        pass
+
+
+class SshAuthDirGitRevTree(SshAuthDirGitTree):
+    def __init__(
+            self, dir: Path, rev: str, layout: _TrackedFilesLayout) -> None:
+        self._dir = dir
+        self._rev = rev
+        self._files = _ls_tree(dir, rev, layout.ls_paths)
+
+    @property
+    def name(self) -> str:
+        return self._rev
+
+    @property
+    def files(self) -> Dict[str, str]:
+        return self._files
+
+    @property
+    def oid_len(self) -> Optional[int]:
+        for oid in self._files.values():
+            return len(oid)
+        return None
+
+    def get_contents(self, relpaths: Iterable[str]) -> Dict[str, bytes]:
+        relpaths = list(relpaths)
+        by_oid = _cat_file_batch(
+            self._dir, (self._files[rp] for rp in relpaths))
+        return {rp: by_oid[self._files[rp]] for rp in relpaths}
+
+
+class SshAuthDirGitWorkTree(SshAuthDirGitTree):
+    def __init__(
+            self, dir: Path, layout: _TrackedFilesLayout,
+            oid_len: Optional[int] = None) -> None:
+        self._dir = dir
+        self._oid_len = 40 if oid_len is None else oid_len
+        self._contents: Dict[str, bytes] = {}
+        self._files: Dict[str, str] = {}
+
+        candidates = [
+            Path(layout.users), Path(layout.groups),
+            Path(layout.auth_always)]
+        for sub_dir in [layout.auth_on_dir, layout.pubkeys_dir]:
+            abs_sub_dir = dir.joinpath(sub_dir)
+            if abs_sub_dir.is_dir():
+                candidates.extend(
+                    fp.relative_to(dir) for fp in abs_sub_dir.iterdir())
+
+        for rel_fp in candidates:
+            relpath = rel_fp.as_posix()
+            if layout.classify(relpath) is None:
+                continue
+            try:
+                with open(dir.joinpath(rel_fp), "rb") as f:
+                    content = f.read()
+            except (FileNotFoundError, IsADirectoryError):
+                continue
+            self._contents[relpath] = content
+            self._files[relpath] = _hash_git_blob(content, self._oid_len)
+
+    @property
+    def name(self) -> str:
+        return "work tree"
+
+    @property
+    def files(self) -> Dict[str, str]:
+        return self._files
+
+    def get_contents(self, relpaths: Iterable[str]) -> Dict[str, bytes]:
+        return {rp: self._contents[rp] for rp in relpaths}
+
+
+def _parse_tracked_file(
+        tree_name: str,
+        relpath: str,
+        content: bytes,
+        parse_fn: Callable[[Any], _ParsedT]
+) -> _ParsedT:
+    try:
+        plain = parse_content_from_bytes(
+            content, PurePosixPath(relpath).suffix)
+        return parse_fn(plain)
+    except (FileContentError, SshAuthDirFileError) as e:
+        raise SshAuthDirGitError(
+            f"Cannot parse '{relpath}' from {tree_name}: {str(e)}") from e
+
+
+def _parse_users(tree: SshAuthDirGitTree, relpath: str,
+                 content: Optional[bytes]) -> SshRawUsers:
+    if content is None:
+        return SshRawUsers.mk_empty()
+    return _parse_tracked_file(tree.name, relpath, content, parse_ssh_users)
+
+
+def _parse_groups(tree: SshAuthDirGitTree, relpath: str,
+                  content: Optional[bytes]) -> SshRawGroups:
+    if content is None:
+        return SshRawGroups.mk_empty()
+    return _parse_tracked_file(tree.name, relpath, content, parse_ssh_groups)
+
+
+def _parse_auth(tree: SshAuthDirGitTree, relpath: str,
+                content: Optional[bytes]) -> SshRawAuth:
+    if content is None:
+        return SshRawAuth.mk_empty()
+    return _parse_tracked_file(tree.name, relpath, content, parse_ssh_auth)
+
+
+class SshAuthDirGitRepo:
+    """Compare / load the *ssh auth dir* at some git revision.
+
+    The `None` revision stands for the work tree.
+    """
+    def __init__(self, repo: SshAuthDirRepo) -> None:
+        self._repo = repo
+        self._layout = _TrackedFilesLayout(repo)
+
+    @property
+    def dir(self) -> Path:
+        return self._repo.dir
+
+    def get_tree(
+            self, rev: Optional[str],
+            oid_len: Optional[int] = None) -> SshAuthDirGitTree:
+        if rev is None:
+            return SshAuthDirGitWorkTree(self.dir, self._layout, oid_len)
+        return SshAuthDirGitRevTree(self.dir, rev, self._layout)
+
+    def _get_tree_pair(
+            self, a_rev: Optional[str], b_rev: Optional[str]
+    ) -> Tuple[SshAuthDirGitTree, SshAuthDirGitTree]:
+        rev_trees = {
+            rev: SshAuthDirGitRevTree(self.dir, rev, self._layout)
+            for rev in (a_rev, b_rev) if rev is not None
+        }
+        # Work tree object ids should use the same hash as the repo's.
+        oid_len = next(
+            (t.oid_len for t in rev_trees.values() if t.oid_len is not None),
+            None)
+
+        def get(rev: Optional[str]) -> SshAuthDirGitTree:
+            if rev is None:
+                return SshAuthDirGitWorkTree(self.dir, self._layout, oid_len)
+            return rev_trees[rev]
+
+        return get(a_rev), get(b_rev)
+
+    def iter_changed_files(
+            self, a: SshAuthDirGitTree, b: SshAuthDirGitTree
+    ) -> Iterator[SshAuthDirTrackedFile]:
+        for relpath in sorted(set(a.files) | set(b.files)):
+            if a.files.get(relpath) == b.files.get(relpath):
+                continue
+            tf = self._layout.classify(relpath)
+            if tf is not None:
+                yield tf
+
+    def iter_changes(
+            self,
+            a_rev: Optional[str] = "HEAD",
+            b_rev: Optional[str] = None
+    ) -> Iterator[SshAuthDirChange]:
+        """Semantic changes from `a_rev` to `b_rev`.
+
+        Raises:
+            SshAuthDirGitError: When git fails or a changed file cannot
+                be parsed.
+        """
+        a, b = self._get_tree_pair(a_rev, b_rev)
+        changed = list(self.iter_changed_files(a, b))
+        parsed = [tf for tf in changed if FILE_KIND_PUBKEY != tf.kind]
+        a_contents = a.get_contents(
+            tf.relpath for tf in parsed if tf.relpath in a.files)
+        b_contents = b.get_contents(
+            tf.relpath for tf in parsed if tf.relpath in b.files)
+
+        # Same order as the nix lib: users, groups, then auth.
+        kind_order = [
+            FILE_KIND_USERS, FILE_KIND_GROUPS, FILE_KIND_AUTH,
+            FILE_KIND_PUBKEY]
+        changed.sort(key=lambda tf: (
+            kind_order.index(tf.kind), tf.state_name is not None,
+            tf.relpath))
+
+        for tf in changed:
+            a_c = a_contents.get(tf.relpath)
+            b_c = b_contents.get(tf.relpath)
+            if FILE_KIND_USERS == tf.kind:
+                yield from iter_ssh_users_changes(
+                    _parse_users(a, tf.relpath, a_c),
+                    _parse_users(b, tf.relpath, b_c))
+            elif FILE_KIND_GROUPS == tf.kind:
+                yield from iter_ssh_groups_changes(
+                    _parse_groups(a, tf.relpath, a_c),
+                    _parse_groups(b, tf.relpath, b_c))
+            elif FILE_KIND_AUTH == tf.kind:
+                yield from iter_ssh_auth_changes(
+                    tf.state_name,
+                    _parse_auth(a, tf.relpath, a_c),
+                    _parse_auth(b, tf.relpath, b_c))
+            else:
+                assert FILE_KIND_PUBKEY == tf.kind
+                if tf.relpath not in a.files:
+                    op = CHANGE_OP_ADDED
+                elif tf.relpath not in b.files:
+                    op = CHANGE_OP_REMOVED
+                else:
+                    op = CHANGE_OP_CHANGED
+                yield SshAuthDirChange(op, CHANGE_ENTITY_PUBKEY_FILE, tf.relpath)
+
+    def load_snapshot(self, rev: Optional[str]) -> SshAuthDirSnapshot:
+        """Load all of the *ssh auth dir*'s files at `rev` at once.
+
+        Missing files are considered empty.
+        """
+        tree = self.get_tree(rev)
+        tfs = [
+            tf for tf in map(self._layout.classify, tree.files)
+            if tf is not None and FILE_KIND_PUBKEY != tf.kind]
+        contents = tree.get_contents(tf.relpath for tf in tfs)
+
+        raw_users = SshRawUsers.mk_empty()
+        raw_groups = SshRawGroups.mk_empty()
+        raw_auths: Dict[Optional[str], SshRawAuth] = {}
+        for tf in tfs:
+            content = contents[tf.relpath]
+            if FILE_KIND_USERS == tf.kind:
+                raw_users = _parse_users(tree, tf.relpath, content)
+            elif FILE_KIND_GROUPS == tf.kind:
+                raw_groups = _parse_groups(tree, tf.relpath, content)
+            else:
+                raw_auths[tf.state_name] = _parse_auth(
+                    tree, tf.relpath, content)
+
+        return SshAuthDirSnapshot(
+            self.dir, self._repo.policy, raw_users, raw_groups, raw_auths)
@@ -1,12 +1,24 @@
+import functools
 from pathlib import Path
-from typing import Set, Type, Optional, Iterator, Tuple, Callable
+from typing import Set, Type, Optional, Iterator, List, Tuple, Callable
 
 from .file_groups import (SshGroupsDumper, SshGroupsFileAccessError,
                           SshGroupsFileError, SshGroupsLoader, SshRawGroup,
                           SshRawGroups)
 from .policy_repo import SshAuthDirRepoPolicy
+from .repo_lock import mk_ssh_auth_dir_file_lock
+from .repo_mutation import (SshAuthDirFileMutator, add_to_set,
+                            discard_from_set)
 from .types_base_errors import SshAuthDirRepoError
 from .repo_users import SshUsersRepo, SshUser
+from .types_observer import (NOOP_OBSERVER, SshAuthDirRepoObserver,
+                             observed_mutation)
+
+
+# Updates a raw group in place, possibly more than once (see
+# `repo_mutation`).
+# Return whether the group changed.
+_GroupUpdateFnT = Callable[[SshRawGroup], bool]
 
 
 class SshGroupsRepoError(SshAuthDirRepoError):
@@ -60,13 +72,16 @@ class SshGroup:
             self,
             sa_root_dir: Path,
             raw: SshRawGroup,
-            update_raw_fn: Callable[[SshRawGroup], SshRawGroup],
-            users: SshUsersRepo
+            update_raw_fn: Callable[[_GroupUpdateFnT], SshRawGroup],
+            users: SshUsersRepo,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER
     ) -> None:
         self._sa_root_dir = sa_root_dir
         self._raw = raw
         self._update_raw_fn = update_raw_fn
         self._users = users
+        self._observer = observer
+        self._observed_attrs = {"group": raw.name}
 
     @property
     def name(self) -> str:
@@ -94,6 +109,7 @@ class SshGroup:
     def members(self) -> Iterator[SshUser]:
         yield from self.iter_members()
 
+    @observed_mutation("group.member.add")
     def add_member_by_id(
             self, user_id: str, force: bool = False) -> None:
         if not force and user_id not in self._users:
@@ -108,46 +124,59 @@ class SshGroup:
                 f"'{self.name}'. Already a member of this group."
             )
 
-        self._raw.members.add(user_id)
-        self._raw = self._update_raw_fn(self._raw)
+        self._raw = self._update_raw_fn(
+            lambda raw: add_to_set(raw.members, user_id))
 
+    @observed_mutation("group.member.rm")
     def rm_member_by_id(
             self, member_id: str, force: bool = False) -> None:
-        try:
-            self._raw.members.remove(member_id)
-        except KeyError as e:
-            if not force:
-                raise SshGroupsRepoKeyAccessError(
-                    f"No such '{self.name}' group member: '{member_id}'. "
-                    "Can't be removed."
-                ) from e
-        self._raw = self._update_raw_fn(self._raw)
+        if not force and member_id not in self._raw.members:
+            raise SshGroupsRepoKeyAccessError(
+                f"No such '{self.name}' group member: '{member_id}'. "
+                "Can't be removed."
+            )
+        self._raw = self._update_raw_fn(
+            lambda raw: discard_from_set(raw.members, member_id))
 
 
 class SshGroupsRepo:
     def __init__(
             self, dir: Path, stem: str,
             policy: SshAuthDirRepoPolicy,
-            users: SshUsersRepo
+            users: SshUsersRepo,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            entity_dir_suffix: Optional[str] = None
     ) -> None:
         self._sa_root_dir = dir
         self._policy = policy
-        self._groups_loader = SshGroupsLoader(dir, stem, policy.file_format)
-        self._groups_dumper = SshGroupsDumper(dir, stem, policy.file_format)
+        self._observer = observer
+        self._groups_loader = SshGroupsLoader(
+            dir, stem, policy.file_format, observer, entity_dir_suffix,
+            policy.parse_cache)
+        self._groups_dumper = SshGroupsDumper(
+            dir, stem, policy.file_format, observer, entity_dir_suffix)
+        self._lock = mk_ssh_auth_dir_file_lock(dir, stem, policy.lock)
+        self._mutator = SshAuthDirFileMutator(
+            self._load_raw, self._dump_raw,
+            self._groups_loader.list_filenames, self._lock)
         self._users = users
 
-    def _update_raw_group(self, raw_group: SshRawGroup) -> SshRawGroup:
-        raw = self._load_raw()
+    def _update_raw_group(
+            self, groupname: str, update_fn: _GroupUpdateFnT
+    ) -> SshRawGroup:
+        updated: List[SshRawGroup] = []
 
-        if raw_group.name not in raw.ssh_groups:
-            raise SshGroupsRepoKeyAccessError(
-                f"No such group: '{raw_group.name}'. Can't be updated.")
-
-        raw.ssh_groups[raw_group.name] = raw_group
-        self._dump_raw(raw)
+        def op(raw: SshRawGroups) -> bool:
+            try:
+                raw_group = raw.ssh_groups[groupname]
+            except KeyError as e:
+                raise SshGroupsRepoKeyAccessError(
+                    f"No such group: '{groupname}'. Can't be updated.") from e
+            updated[:] = [raw_group]
+            return update_fn(raw_group)
 
-        raw = self._load_raw()
-        return raw.ssh_groups[raw_group.name]
+        self._mutator.mutate(op)
+        return updated[0]
 
     def _mk_group(
             self, raw: SshRawGroup
@@ -155,17 +184,29 @@ class SshGroupsRepo:
         return SshGroup(
             self._sa_root_dir,
             raw,
-            self._update_raw_group,
-            self._users
+            functools.partial(self._update_raw_group, raw.name),
+            self._users,
+            self._observer
         )
 
     def _load_raw(self) -> SshRawGroups:
         try:
-            return self._groups_loader.load()
+            with self._lock.shared():
+                return self._groups_loader.load()
         except SshGroupsFileError as e:
             ECls = get_groups_repo_err_cls_from_groups_file_err(e)
             raise ECls(str(e)) from e
 
+    def load_raw(self) -> SshRawGroups:
+        """Load a raw snapshot of the whole groups file."""
+        return self._load_raw()
+
+    def exists(self) -> bool:
+        """Whether the groups file exists, telling a missing file apart
+            from an invalid one when loading fails.
+        """
+        return self._groups_loader.exists()
+
     def _dump_raw(self, raw: SshRawGroups) -> None:
         try:
             return self._groups_dumper.dump(raw)
@@ -175,10 +216,12 @@ class SshGroupsRepo:
 
     @property
     def names(self) -> Set[str]:
-        raw_groups = self._load_raw()
-        return {
-            name for name in raw_groups.ssh_groups.keys()
-        }
+        try:
+            with self._lock.shared():
+                return set(self._groups_loader.load_names())
+        except SshGroupsFileError as e:
+            ECls = get_groups_repo_err_cls_from_groups_file_err(e)
+            raise ECls(str(e)) from e
 
     def __iter__(self) -> Iterator[SshGroup]:
         raw_groups = self._load_raw()
@@ -206,14 +249,17 @@ class SshGroupsRepo:
         group, _ = self._get_w_raw_set(groupname)
         return group
 
+    @observed_mutation("group.del")
     def __delitem__(self, groupname: str) -> None:
-        raw_groups = self._load_raw()
-        try:
-            del raw_groups.ssh_groups[groupname]
-        except KeyError as e:
-            raise SshGroupsRepoKeyAccessError(
-                f"No such group: '{groupname}'. Can't be deleted.") from e
-        self._dump_raw(raw_groups)
+        def op(raw_groups: SshRawGroups) -> bool:
+            try:
+                del raw_groups.ssh_groups[groupname]
+            except KeyError as e:
+                raise SshGroupsRepoKeyAccessError(
+                    f"No such group: '{groupname}'. Can't be deleted.") from e
+            return True
+
+        self._mutator.mutate(op)
 
     def get(self, groupname: str,
             default: Optional[SshGroup] = None) -> Optional[SshGroup]:
@@ -222,27 +268,33 @@ class SshGroupsRepo:
         except SshGroupsRepoKeyAccessError:
             return default
 
-    def add(
-            self,
-            groupname: str,
-            exist_ok: bool = False
-    ) -> SshGroup:
+    def _load_raw_or_empty(self) -> SshRawGroups:
         try:
-            raw_groups = self._load_raw()
+            return self._load_raw()
         except SshGroupsRepoFileAccessError:
             if not self._policy.silent_create_file_groups:
                 raise  # re-raise
 
-            raw_groups = SshRawGroups.mk_empty()
+            return SshRawGroups.mk_empty()
+
+    @observed_mutation("group.add")
+    def add(
+            self,
+            groupname: str,
+            exist_ok: bool = False
+    ) -> SshGroup:
+        def op(raw_groups: SshRawGroups) -> bool:
+            if groupname in raw_groups.ssh_groups:
+                if not exist_ok:
+                    raise SshGroupsRepoGroupAlreadyExistsError(
+                        f"Failed to add group '{groupname}'. Already exists.")
+                return False
 
-        if groupname in raw_groups.ssh_groups:
-            if not exist_ok:
-                raise SshGroupsRepoGroupAlreadyExistsError(
-                    f"Failed to add group '{groupname}'. Already exists.")
-        else:
             raw_groups.ssh_groups[groupname] = SshRawGroup.mk_new(
                 groupname)
-            self._dump_raw(raw_groups)
+            return True
+
+        self._mutator.mutate(op, self._load_raw_or_empty)
 
         group = self.get(groupname, None)
         assert group is not None
@@ -252,15 +304,20 @@ class SshGroupsRepo:
     def ensure(self, groupname: str) -> SshGroup:
         return self.add(groupname, exist_ok=True)
 
+    @observed_mutation("group.rm")
     def rm(
             self, groupname: str, force: bool = False
     ) -> None:
-        try:
-            group, raw_groups = self._get_w_raw_set(groupname)
+        def op(raw_groups: SshRawGroups) -> bool:
+            try:
+                del raw_groups.ssh_groups[groupname]
+            except KeyError as e:
+                raise SshGroupsRepoKeyAccessError(
+                    f"No such group: '{groupname}'. Can't be removed.") from e
+            return True
 
-            # Should exist as we successfully retrieved the group.
-            del raw_groups.ssh_groups[groupname]
-            self._dump_raw(raw_groups)
+        try:
+            self._mutator.mutate(op)
         except (SshGroupsRepoFileAccessError, SshGroupsRepoKeyAccessError):
             if not force:
                 raise  # re-raise
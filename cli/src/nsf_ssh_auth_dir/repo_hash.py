@@ -0,0 +1,281 @@
+"""Merkle style content digest of a whole *ssh auth dir*.
+
+The digest covers the users, groups and auth files as well as the
+public key files referenced by users. Each file is hashed on its own
+and the dir's digest is computed over the sorted list of
+`<kind> <path> <file digest>` lines. Individual file digests are kept
+in a stat keyed cache so that, after editing a single file, only this
+file gets rehashed.
+
+Any cache (compiled output, resolved *device users*, completion data,
+etc) can use the dir's digest as key.
+"""
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from ._cache_tools import (dump_json_cache_file, get_dir_cache_filename,
+                           load_json_cache_file)
+from .policy_file_format import SshAuthDirFileFormatPolicy
+from .repo import SshAuthDirRepo
+from .repo_user_pubkeys import get_pubkey_lookup_plan
+from .repo_users import SshUser, SshUsersRepoAccessError
+
+HASH_KIND_USERS = "users"
+HASH_KIND_GROUPS = "groups"
+HASH_KIND_AUTH_ALWAYS = "auth-always"
+HASH_KIND_AUTH_ON = "auth-on"
+HASH_KIND_PUBKEY = "pubkey"
+
+_CACHE_FORMAT_VERSION = 1
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+class SshAuthDirHashEntry(NamedTuple):
+    kind: str
+    # Relative to the *ssh auth dir* when within it, absolute otherwise.
+    path: str
+    digest: str
+
+
+class SshAuthDirHash(NamedTuple):
+    digest: str
+    entries: List[SshAuthDirHashEntry]
+
+
+_StatKeyT = Tuple[int, int, int, int]
+
+
+def _mk_stat_key(st: os.stat_result) -> _StatKeyT:
+    return (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+
+def _hash_file(filename: Path) -> str:
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class SshAuthDirFileHashCache:
+    """Per file digests keyed by the file's stat signature.
+
+    In memory only unless a `filename` is provided in which case
+    `save` persists it.
+    """
+    def __init__(self, filename: Optional[Path] = None) -> None:
+        self._filename = filename
+        self._files: Dict[str, Tuple[_StatKeyT, str]] = {}
+        # Pubkey lookup candidates of each user, keyed by the users
+        # file's digest.
+        self._pubkey_candidates: Dict[str, List[List[str]]] = {}
+        self._dirty = False
+        self.hashed = 0
+        self.reused = 0
+        if filename is not None:
+            self._load(filename)
+
+    @classmethod
+    def mk_persistent_for(cls, dir: Path) -> 'SshAuthDirFileHashCache':
+        return cls(get_dir_cache_filename(dir, "file-hashes", ".json"))
+
+    def _load(self, filename: Path) -> None:
+        content = load_json_cache_file(filename)
+        if not isinstance(content, dict) \
+                or _CACHE_FORMAT_VERSION != content.get("version"):
+            return
+
+        try:
+            self._files = {
+                fn: (tuple(v[0]), v[1])
+                for fn, v in content["files"].items()
+            }
+            self._pubkey_candidates = dict(content["pubkey-candidates"])
+        except (KeyError, TypeError, IndexError, AttributeError):
+            self._files = {}
+            self._pubkey_candidates = {}
+
+    def save(self) -> None:
+        if self._filename is None or not self._dirty:
+            return
+
+        content: Dict[str, Any] = {
+            "version": _CACHE_FORMAT_VERSION,
+            "files": {
+                fn: [list(k), d] for fn, (k, d) in self._files.items()},
+            "pubkey-candidates": self._pubkey_candidates,
+        }
+        dump_json_cache_file(self._filename, content)
+        self._dirty = False
+
+    def get_file_digest(self, filename: Path) -> Optional[str]:
+        """Return `None` when the file does not exist."""
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+
+        key = _mk_stat_key(st)
+        cached = self._files.get(str(filename))
+        if cached is not None and cached[0] == key:
+            self.reused += 1
+            return cached[1]
+
+        try:
+            digest = _hash_file(filename)
+        except OSError:
+            return None
+
+        self.hashed += 1
+        self._files[str(filename)] = (key, digest)
+        self._dirty = True
+        return digest
+
+    def get_pubkey_candidates(
+            self, users_digest: str) -> Optional[List[List[str]]]:
+        return self._pubkey_candidates.get(users_digest)
+
+    def set_pubkey_candidates(
+            self, users_digest: str, candidates: List[List[str]]) -> None:
+        # Only the current users file's candidates are worth keeping.
+        self._pubkey_candidates = {users_digest: candidates}
+        self._dirty = True
+
+
+def _to_entry_path(dir: Path, filename: Path) -> str:
+    try:
+        return filename.relative_to(dir).as_posix()
+    except ValueError:
+        return str(filename)
+
+
+def _get_pubkey_candidates(
+        repo: SshAuthDirRepo,
+        cache: SshAuthDirFileHashCache,
+        users_digest: str
+) -> List[List[str]]:
+    cached = cache.get_pubkey_candidates(users_digest)
+    if cached is not None:
+        return cached
+
+    try:
+        raw_users = repo.users.load_raw()
+    except SshUsersRepoAccessError:
+        # An invalid users file still has a digest but references nothing.
+        raw_users = None
+
+    out: List[List[str]] = []
+    if raw_users is not None:
+        lookup_plan = get_pubkey_lookup_plan(
+            repo.dir, raw_users.ssh_user_defaults, repo.policy.pubkey)
+        for raw_user in raw_users.ssh_users.values():
+            user = SshUser(
+                repo.dir, raw_user, raw_users.ssh_user_defaults,
+                repo.policy.pubkey, lookup_plan=lookup_plan)
+            out.append([str(fn) for fn in user.pubkeys.candidate_filenames])
+
+    cache.set_pubkey_candidates(users_digest, out)
+    return out
+
+
+def list_file_set_filenames(
+        ff_policy: SshAuthDirFileFormatPolicy,
+        in_dir: Path,
+        stem: str,
+        entity_dir_suffix: Optional[str]
+) -> List[Path]:
+    out = [ff_policy.get_preferred_source_filename_for(in_dir, stem)]
+    if entity_dir_suffix is not None:
+        out.extend(sorted(ff_policy.iter_target_filenames_in(
+            in_dir.joinpath(f"{stem}{entity_dir_suffix}"))))
+    return out
+
+
+def _digest_file_set(
+        dir: Path, digests: List[Tuple[Path, Optional[str]]]) -> Optional[str]:
+    # Entity names are file names, thus the paths.
+    lines = [
+        f"{_to_entry_path(dir, fn)} {digest}\n"
+        for fn, digest in digests if digest is not None]
+    if not lines:
+        return None
+    return hashlib.sha256("".join(lines).encode()).hexdigest()
+
+
+class _HashEntriesCollector:
+    def __init__(
+            self,
+            dir: Path,
+            cache: SshAuthDirFileHashCache,
+            ff_policy: SshAuthDirFileFormatPolicy,
+            entity_dir_suffix: Optional[str]
+    ) -> None:
+        self._dir = dir
+        self._cache = cache
+        self._ff_policy = ff_policy
+        self._suffix = entity_dir_suffix
+        self.entries: Dict[str, SshAuthDirHashEntry] = {}
+
+    def add(self, kind: str, filename: Path) -> Optional[str]:
+        digest = self._cache.get_file_digest(filename)
+        if digest is not None:
+            path = _to_entry_path(self._dir, filename)
+            self.entries[path] = SshAuthDirHashEntry(kind, path, digest)
+        return digest
+
+    def add_file_set(
+            self, kind: str, in_dir: Path, stem: str) -> Optional[str]:
+        """The file and, with a per entity layout, its entity files.
+
+        Return a digest of the whole set.
+        """
+        filenames = list_file_set_filenames(
+            self._ff_policy, in_dir, stem, self._suffix)
+        digests = [(fn, self.add(kind, fn)) for fn in filenames]
+        if self._suffix is None:
+            return digests[0][1]
+        return _digest_file_set(self._dir, digests)
+
+
+def compute_ssh_auth_dir_hash(
+        repo: SshAuthDirRepo,
+        cache: Optional[SshAuthDirFileHashCache] = None,
+        with_pubkeys: bool = True
+) -> SshAuthDirHash:
+    """`with_pubkeys` allows one to only digest the users, groups and
+        auth files (e.g.: for indexes of authorizations).
+    """
+    if cache is None:
+        cache = SshAuthDirFileHashCache()
+
+    dir = repo.dir
+    layout = repo.layout
+    collector = _HashEntriesCollector(
+        dir, cache, repo.policy.file_format, layout.entity_dir_suffix)
+    add = collector.add
+    add_file_set = collector.add_file_set
+
+    users_digest = add_file_set(HASH_KIND_USERS, dir, layout.users.stem)
+    add_file_set(HASH_KIND_GROUPS, dir, layout.groups.stem)
+    add_file_set(
+        HASH_KIND_AUTH_ALWAYS, dir, layout.device_state_always.stem)
+    auth_on_dir = dir.joinpath(layout.auth_on.dirname)
+    for state_name in sorted(repo.auth.state_names):
+        add_file_set(HASH_KIND_AUTH_ON, auth_on_dir, state_name)
+
+    if with_pubkeys and users_digest is not None:
+        for candidates in _get_pubkey_candidates(repo, cache, users_digest):
+            # Only the selected (i.e.: first existing) candidate counts.
+            for candidate in candidates:
+                if add(HASH_KIND_PUBKEY, Path(candidate)) is not None:
+                    break
+
+    entries = collector.entries
+    sorted_entries = [entries[p] for p in sorted(entries.keys())]
+    h = hashlib.sha256()
+    for e in sorted_entries:
+        h.update(f"{e.kind} {e.path} {e.digest}\n".encode())
+
+    return SshAuthDirHash(h.hexdigest(), sorted_entries)
@@ -0,0 +1,210 @@
+"""Bulk import of *ssh users* from existing pubkeys.
+
+Pubkeys are gathered from dirs of `*.pub` files and / or `authorized_keys`
+style files, deduplicated by fingerprint and all new users get added
+with a single write of the users file (see `SshUsersRepo.add_many`).
+"""
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from .file_pubkey import get_ssh_pubkey_fingerprint, load_ssh_pubkey
+from .repo import SshAuthDirRepo
+from .repo_users import SshUsersRepoAccessError
+from .types_base_errors import SshAuthDirRepoError
+from .types_pubkey import SshPubKey
+
+IMPORT_STATUS_ADDED = "added"
+IMPORT_STATUS_DUPLICATE_KEY = "duplicate-key"
+IMPORT_STATUS_EXISTING_USER = "existing-user"
+IMPORT_STATUS_INVALID = "invalid"
+
+DEFAULT_PUB_FILE_NAME_TEMPLATE = "{stem}"
+DEFAULT_AUTHORIZED_KEYS_NAME_TEMPLATE = "{comment_user}"
+
+# Options (e.g.: `command="..."`) may precede the key type.
+_AUTHORIZED_KEY_RE = re.compile(
+    r"(?:^|\s)((?:ssh|ecdsa|sk)-\S+)\s+([A-Za-z0-9+/=]+)(?:\s+(.*))?$")
+_INVALID_NAME_CHARS_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class SshUsersImportError(SshAuthDirRepoError):
+    pass
+
+
+class SshUserImportCandidate(NamedTuple):
+    # `None` when no valid name could be derived.
+    name: Optional[str]
+    pubkey: SshPubKey
+    # `None` when not a valid pubkey.
+    fingerprint: Optional[str]
+    # Where the pubkey comes from (`<filename>[:<line number>]`).
+    source: str
+
+
+class SshUserImportResult(NamedTuple):
+    candidate: SshUserImportCandidate
+    status: str
+
+
+def _sanitize_user_name(name: str) -> Optional[str]:
+    out = _INVALID_NAME_CHARS_RE.sub("-", name).strip("-.")
+    return out if out else None
+
+
+def derive_user_name(template: str, **template_vars: str) -> Optional[str]:
+    """Expand `template` (e.g.: `{comment_user}`) into a valid user name.
+
+    Available vars are `stem`, `comment` and `comment_user` (the part of
+    the comment before the `@`). Return `None` when empty.
+
+    Raises:
+        SshUsersImportError: When the template references unknown vars.
+    """
+    try:
+        name = template.format(**template_vars)
+    except (KeyError, IndexError, ValueError) as e:
+        raise SshUsersImportError(
+            f"Invalid user name template '{template}': {e}") from e
+    return _sanitize_user_name(name)
+
+
+def _mk_template_vars(stem: str, comment: str) -> Dict[str, str]:
+    return {
+        "stem": stem,
+        "comment": comment,
+        "comment_user": comment.split("@", 1)[0],
+    }
+
+
+def _get_pubkey_comment(pubkey: SshPubKey) -> str:
+    for line in pubkey.text_lines:
+        ln_split = line.split(None, 2)
+        if len(ln_split) >= 3:
+            return ln_split[2].strip()
+        if ln_split:
+            break
+    return ""
+
+
+def iter_pub_files_candidates(
+        dir: Path,
+        name_template: str = DEFAULT_PUB_FILE_NAME_TEMPLATE
+) -> Iterator[SshUserImportCandidate]:
+    """One candidate per `*.pub` file of `dir`, in filename order."""
+    for filename in sorted(dir.glob("*.pub")):
+        pubkey = load_ssh_pubkey(filename)
+        yield SshUserImportCandidate(
+            derive_user_name(name_template, **_mk_template_vars(
+                filename.name[:-len(".pub")], _get_pubkey_comment(pubkey))),
+            pubkey,
+            get_ssh_pubkey_fingerprint(pubkey),
+            str(filename)
+        )
+
+
+def iter_authorized_keys_candidates(
+        filename: Path,
+        name_template: str = DEFAULT_AUTHORIZED_KEYS_NAME_TEMPLATE
+) -> Iterator[SshUserImportCandidate]:
+    """One candidate per key line of an `authorized_keys` style file.
+
+    Key options are dropped.
+    """
+    with open(filename) as in_f:
+        for i, line in enumerate(in_f, start=1):
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#"):
+                continue
+
+            source = f"{filename}:{i}"
+            m = _AUTHORIZED_KEY_RE.search(stripped)
+            if m is None:
+                yield SshUserImportCandidate(
+                    None, SshPubKey([line]), None, source)
+                continue
+
+            key_type, blob, comment = m.group(1), m.group(2), m.group(3)
+            comment = "" if comment is None else comment.strip()
+            key_line = " ".join(x for x in [key_type, blob, comment] if x)
+            pubkey = SshPubKey([f"{key_line}\n"])
+            yield SshUserImportCandidate(
+                derive_user_name(name_template, **_mk_template_vars(
+                    filename.stem, comment)),
+                pubkey,
+                get_ssh_pubkey_fingerprint(pubkey),
+                source
+            )
+
+
+def iter_import_candidates(
+        sources: Iterable[Path],
+        name_template: Optional[str] = None
+) -> Iterator[SshUserImportCandidate]:
+    """Dirs are scanned for `*.pub` files, files are parsed as
+        `authorized_keys`.
+    """
+    for source in sources:
+        if source.is_dir():
+            yield from iter_pub_files_candidates(
+                source, name_template or DEFAULT_PUB_FILE_NAME_TEMPLATE)
+        else:
+            yield from iter_authorized_keys_candidates(
+                source,
+                name_template or DEFAULT_AUTHORIZED_KEYS_NAME_TEMPLATE)
+
+
+def _load_existing_fingerprints(repo: SshAuthDirRepo) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    try:
+        users = list(repo.users)
+    except SshUsersRepoAccessError:
+        return out
+
+    for user in users:
+        try:
+            fp = get_ssh_pubkey_fingerprint(user.pubkey_selected)
+        except SshUsersRepoAccessError:
+            continue
+        if fp is not None:
+            out.setdefault(fp, user.name)
+    return out
+
+
+def import_ssh_users(
+        repo: SshAuthDirRepo,
+        candidates: Iterable[SshUserImportCandidate],
+        dry_run: bool = False
+) -> List[SshUserImportResult]:
+    """Add a user for each candidate with a valid name and pubkey.
+
+    Candidates whose fingerprint matches an existing user's or an
+    earlier candidate's pubkey are skipped, as are those whose name is
+    already taken. All new users are written at once.
+    """
+    seen_fps = _load_existing_fingerprints(repo)
+    try:
+        taken = set(repo.users.names)
+    except SshUsersRepoAccessError:
+        taken = set()
+
+    results: List[SshUserImportResult] = []
+    to_add: List[SshUserImportCandidate] = []
+    for c in candidates:
+        if c.name is None or c.fingerprint is None:
+            status = IMPORT_STATUS_INVALID
+        elif c.fingerprint in seen_fps:
+            status = IMPORT_STATUS_DUPLICATE_KEY
+        elif c.name in taken:
+            status = IMPORT_STATUS_EXISTING_USER
+        else:
+            status = IMPORT_STATUS_ADDED
+            seen_fps[c.fingerprint] = c.name
+            taken.add(c.name)
+            to_add.append(c)
+        results.append(SshUserImportResult(c, status))
+
+    if to_add and not dry_run:
+        repo.users.add_many([(c.name, c.pubkey) for c in to_add if c.name])
+
+    return results
@@ -0,0 +1,348 @@
+"""Atomic changes spanning several *ssh auth dir* files.
+
+Within `ssh_auth_dir_transaction`, file writes and removals are only
+recorded (see `_file_txn_tools`) and the exclusive locks of the
+mutated files are held until the end. On commit:
+
+1.  The before and after content of each changed file is written to a
+    journal file under `.nsf-ssh-auth-dir/journal/`, synced then
+    renamed in place. This rename is the commit point.
+2.  All changes are applied, each file being replaced atomically.
+3.  A single sync barrier makes them durable, after which the journal
+    is removed.
+
+Journals left behind by an interrupted commit are replayed (or rolled
+back on request) by `recover_ssh_auth_dir_journals`, which runs
+whenever a repo is opened. Recovery takes the locks the commit held.
+Replaying writes each file's after content whatever its current one:
+files are not synced before being renamed in place, so a crash may
+leave one torn, indistinguishable from a change. Rolling back however
+refuses to overwrite a file matching neither its before nor its after
+content. Journals not yet renamed in place are discarded, nothing
+having been applied from them.
+"""
+import base64
+import fcntl
+import json
+import os
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from ._file_txn_tools import (FileTxn, bump_write_generation, fsync_paths,
+                              get_file_txn, set_file_txn)
+from .policy_lock import SshAuthDirLockDefaultPolicy, SshAuthDirLockPolicy
+from .repo_lock import ensure_internal_dir, mk_ssh_auth_dir_file_lock
+from .types_base_errors import SshAuthDirRepoError
+
+JOURNAL_DIRNAME = ".nsf-ssh-auth-dir/journal"
+
+_FORMAT_VERSION = 1
+_JOURNAL_SUFFIX = ".json"
+_TMP_SUFFIX = ".tmp"
+
+
+class SshAuthDirJournalError(SshAuthDirRepoError):
+    pass
+
+
+class _JournalEntry(NamedTuple):
+    filename: Path
+    # `None` when the file does not exist.
+    before: Optional[bytes]
+    after: Optional[bytes]
+    rm_empty_parent: bool
+
+
+class _Journal(NamedTuple):
+    entries: List[_JournalEntry]
+    # The stems of the file locks held by the commit (see
+    # `mk_ssh_auth_dir_file_lock`), in lock order.
+    lock_stems: List[str]
+
+
+def _encode_content(content: Optional[bytes]) -> Optional[str]:
+    if content is None:
+        return None
+    return base64.b64encode(content).decode("ascii")
+
+
+def _decode_content(content: Optional[str]) -> Optional[bytes]:
+    if content is None:
+        return None
+    return base64.b64decode(content)
+
+
+def _to_entry_path(dir: Path, filename: Path) -> str:
+    try:
+        return filename.relative_to(dir).as_posix()
+    except ValueError:
+        return str(filename)
+
+
+def _read_or_none(filename: Path) -> Optional[bytes]:
+    try:
+        with open(filename, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _dump_journal(
+        dir: Path,
+        entries: List[_JournalEntry],
+        lock_filenames: Iterable[Path]
+) -> bytes:
+    content = {
+        "version": _FORMAT_VERSION,
+        "locks": sorted(fn.stem for fn in lock_filenames),
+        "entries": [
+            {
+                "path": _to_entry_path(dir, e.filename),
+                "before": _encode_content(e.before),
+                "after": _encode_content(e.after),
+                "rm-empty-parent": e.rm_empty_parent,
+            }
+            for e in entries
+        ],
+    }
+    return json.dumps(content).encode()
+
+
+def _load_journal(dir: Path, filename: Path) -> _Journal:
+    try:
+        with open(filename, "rb") as f:
+            content: Any = json.load(f)
+        if _FORMAT_VERSION != content["version"]:
+            raise ValueError(f"unsupported version: {content['version']}")
+        entries = [
+            _JournalEntry(
+                dir.joinpath(e["path"]),
+                _decode_content(e["before"]),
+                _decode_content(e["after"]),
+                bool(e["rm-empty-parent"]),
+            )
+            for e in content["entries"]
+        ]
+        # Absent from journals written before locks were recorded.
+        lock_stems = sorted(str(stem) for stem in content.get("locks", []))
+        return _Journal(entries, lock_stems)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise SshAuthDirJournalError(
+            f"Invalid journal file: '{filename}': {e}") from e
+
+
+def _fsync_dir(dir: Path) -> None:
+    fd = os.open(dir, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_journal(journal_dir: Path, content: bytes) -> Tuple[Path, int]:
+    """Return the committed journal's filename as well as a fd holding
+        its exclusive lock, telling recovery its owner is still alive.
+    """
+    ensure_internal_dir(journal_dir)
+    stem = f"txn-{time.time_ns()}-{os.getpid()}"
+    tmp_filename = journal_dir.joinpath(f"{stem}{_TMP_SUFFIX}")
+    filename = journal_dir.joinpath(f"{stem}{_JOURNAL_SUFFIX}")
+
+    fd = os.open(tmp_filename, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.write(fd, content)
+        os.fsync(fd)
+        os.rename(tmp_filename, filename)
+        _fsync_dir(journal_dir)
+    except BaseException:
+        os.close(fd)
+        try:
+            tmp_filename.unlink()
+        except OSError:
+            pass
+        raise
+
+    return filename, fd
+
+
+def _replace_file(filename: Path, content: bytes) -> None:
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    tmp_filename = filename.with_name(f".{filename.name}{_TMP_SUFFIX}")
+    with open(tmp_filename, "wb") as f:
+        f.write(content)
+    os.replace(tmp_filename, filename)
+
+
+def _apply(entries: List[_JournalEntry], rollback: bool = False) -> None:
+    for e in entries:
+        content = e.before if rollback else e.after
+        if content is not None:
+            _replace_file(e.filename, content)
+            continue
+
+        try:
+            e.filename.unlink()
+        except FileNotFoundError:
+            pass
+        if e.rm_empty_parent:
+            try:
+                e.filename.parent.rmdir()
+            except OSError:
+                pass
+
+    bump_write_generation()
+    # The single sync barrier.
+    fsync_paths(e.filename for e in entries)
+
+
+def _commit(dir: Path, txn: FileTxn) -> None:
+    if not txn.changes:
+        return
+
+    # The exclusive locks held by the transaction keep the files as
+    # they were loaded.
+    entries = [
+        _JournalEntry(
+            fn, _read_or_none(fn), after, fn in txn.rm_empty_parents)
+        for fn, after in txn.changes.items()
+    ]
+    journal_dir = dir.joinpath(JOURNAL_DIRNAME)
+    filename, fd = _write_journal(
+        journal_dir, _dump_journal(dir, entries, txn.lock_filenames))
+    try:
+        _apply(entries)
+        filename.unlink()
+        _fsync_dir(journal_dir)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def ssh_auth_dir_transaction(dir: Path) -> Iterator[FileTxn]:
+    """Apply all file changes made by the `with` block at once, or none
+        when it raises.
+
+    Nested transactions join the outermost one.
+
+    Raises:
+        SshAuthDirLockTimeoutError: When a mutated file's lock cannot be
+            taken, leaving no changes.
+    """
+    outer = get_file_txn()
+    if outer is not None:
+        yield outer
+        return
+
+    txn = FileTxn()
+    set_file_txn(txn)
+    try:
+        yield txn
+        set_file_txn(None)
+        _commit(dir, txn)
+        txn.run_on_commit()
+    finally:
+        set_file_txn(None)
+        txn.release()
+
+
+def _try_lock(filename: Path) -> Optional[int]:
+    try:
+        fd = os.open(filename, os.O_RDWR)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    if 0 == os.fstat(fd).st_nlink:
+        # Removed by its owner while waiting for the lock.
+        os.close(fd)
+        return None
+    return fd
+
+
+def _check_rollbackable(filename: Path, entries: List[_JournalEntry]) -> None:
+    """Each file is expected either as it was before the commit or as the
+        commit left it, anything else having been changed since (or torn
+        by a crash, which only replaying repairs).
+    """
+    for e in entries:
+        current = _read_or_none(e.filename)
+        if current != e.before and current != e.after:
+            raise SshAuthDirJournalError(
+                f"Cannot roll back journal '{filename}': '{e.filename}' "
+                "changed since it was committed. Replay it instead or "
+                "resolve the conflict and remove the journal.")
+
+
+def _recover_journal(
+        dir: Path,
+        filename: Path,
+        rollback: bool,
+        lock_policy: SshAuthDirLockPolicy
+) -> bool:
+    fd = _try_lock(filename)
+    if fd is None:
+        # Being committed or recovered by another process.
+        return False
+
+    try:
+        if filename.suffix == _TMP_SUFFIX:
+            # Never committed.
+            filename.unlink()
+            return False
+
+        journal = _load_journal(dir, filename)
+        with ExitStack() as locks:
+            # In sorted order so that concurrent recoveries never
+            # deadlock.
+            for lock_stem in journal.lock_stems:
+                locks.enter_context(mk_ssh_auth_dir_file_lock(
+                    dir, lock_stem, lock_policy).exclusive())
+
+            if rollback:
+                _check_rollbackable(filename, journal.entries)
+            _apply(journal.entries, rollback)
+            filename.unlink()
+    finally:
+        os.close(fd)
+    return True
+
+
+def recover_ssh_auth_dir_journals(
+        dir: Path,
+        rollback: bool = False,
+        lock_policy: Optional[SshAuthDirLockPolicy] = None
+) -> List[Path]:
+    """Replay the journals of interrupted commits, oldest first.
+
+    When `rollback`, restore the files as they were before these
+    commits instead. Return the recovered journals.
+
+    Raises:
+        SshAuthDirJournalError: When a journal cannot be read or, on
+            `rollback`, one of its files changed since it was committed.
+        SshAuthDirLockTimeoutError: When a journaled file's lock cannot
+            be taken.
+    """
+    if lock_policy is None:
+        lock_policy = SshAuthDirLockDefaultPolicy()
+
+    journal_dir = dir.joinpath(JOURNAL_DIRNAME)
+    if not journal_dir.is_dir():
+        return []
+
+    filenames = sorted(
+        journal_dir.glob(f"txn-*{_TMP_SUFFIX}")) + sorted(
+        journal_dir.glob(f"txn-*{_JOURNAL_SUFFIX}"),
+        reverse=rollback)
+    out = [
+        fn for fn in filenames
+        if _recover_journal(dir, fn, rollback, lock_policy)]
+    if out:
+        _fsync_dir(journal_dir)
+    return out
@@ -0,0 +1,138 @@
+"""Conversion of *ssh auth dirs* between the single file and the per
+entity file layouts (see `SshAuthDirLayout.entity_dirs`).
+"""
+from pathlib import Path
+from typing import Any, List, NamedTuple, Type
+
+from .file_auth import SshAuthDumper, SshAuthFileError, SshAuthLoader
+from .file_entity_dir import mk_entity_dir_opt
+from .file_groups import SshGroupsDumper, SshGroupsFileError, SshGroupsLoader
+from .file_users import SshUsersDumper, SshUsersFileError, SshUsersLoader
+from .repo import SshAuthDirRepo, mk_ssh_auth_dir_repo
+from .types_base_errors import SshAuthDirFileError, SshAuthDirRepoError
+from .types_layout import SshAuthDirLayout
+
+LAYOUT_NAME_SINGLE_FILES = "single-files"
+LAYOUT_NAME_ENTITY_DIRS = "entity-dirs"
+
+
+class SshAuthDirLayoutError(SshAuthDirRepoError):
+    pass
+
+
+def get_ssh_auth_dir_layout_name(layout: SshAuthDirLayout) -> str:
+    if layout.entity_dirs is None:
+        return LAYOUT_NAME_SINGLE_FILES
+    return LAYOUT_NAME_ENTITY_DIRS
+
+
+def mk_ssh_auth_dir_layout_from_name(name: str) -> SshAuthDirLayout:
+    if LAYOUT_NAME_SINGLE_FILES == name:
+        return SshAuthDirLayout.mk_default()
+    if LAYOUT_NAME_ENTITY_DIRS == name:
+        return SshAuthDirLayout.mk_entity_dirs()
+    raise SshAuthDirLayoutError(f"Unknown layout: '{name}'.")
+
+
+class _LayoutFile(NamedTuple):
+    dir: Path
+    stem: str
+    loader_cls: Type[Any]
+    dumper_cls: Type[Any]
+    error_cls: Type[SshAuthDirFileError]
+
+
+def _list_layout_files(repo: SshAuthDirRepo) -> List[_LayoutFile]:
+    layout = repo.layout
+    dir = repo.dir
+    out = [
+        _LayoutFile(
+            dir, layout.users.stem,
+            SshUsersLoader, SshUsersDumper, SshUsersFileError),
+        _LayoutFile(
+            dir, layout.groups.stem,
+            SshGroupsLoader, SshGroupsDumper, SshGroupsFileError),
+        _LayoutFile(
+            dir, layout.device_state_always.stem,
+            SshAuthLoader, SshAuthDumper, SshAuthFileError),
+    ]
+    auth_on_dir = dir.joinpath(layout.auth_on.dirname)
+    for state_name in sorted(repo.auth.state_names):
+        out.append(_LayoutFile(
+            auth_on_dir, state_name,
+            SshAuthLoader, SshAuthDumper, SshAuthFileError))
+    return out
+
+
+def _is_same_files(lhs: SshAuthDirLayout, rhs: SshAuthDirLayout) -> bool:
+    return (lhs.users.stem, lhs.groups.stem,
+            lhs.device_state_always.stem, lhs.auth_on.dirname) \
+        == (rhs.users.stem, rhs.groups.stem,
+            rhs.device_state_always.stem, rhs.auth_on.dirname)
+
+
+def _exists(repo: SshAuthDirRepo, lf: _LayoutFile) -> bool:
+    ff_policy = repo.policy.file_format
+    if any(fn.exists() for fn in ff_policy.get_source_filenames_for(
+            lf.dir, lf.stem)):
+        return True
+
+    entity_dir = mk_entity_dir_opt(
+        lf.dir, lf.stem, ff_policy, suffix=repo.layout.entity_dir_suffix)
+    return entity_dir is not None and entity_dir.exists()
+
+
+def convert_ssh_auth_dir_layout(
+        repo: SshAuthDirRepo,
+        to_layout: SshAuthDirLayout
+) -> SshAuthDirRepo:
+    """Rewrite `repo`'s files in place to `to_layout` and return the
+        repo for the new layout.
+
+    Everything is loaded before anything gets written so that an invalid
+    file leaves the dir untouched. Entities found in their own file end
+    up after the ones found in the single file, in name order.
+
+    Raises:
+        SshAuthDirLayoutError: When `to_layout` uses different file names
+            or some file cannot be converted.
+    """
+    if not _is_same_files(repo.layout, to_layout):
+        raise SshAuthDirLayoutError(
+            "Only the per entity dirs may differ between layouts.")
+
+    ff_policy = repo.policy.file_format
+    observer = repo.observer
+    from_suffix = repo.layout.entity_dir_suffix
+    to_suffix = to_layout.entity_dir_suffix
+
+    loaded = []
+    for lf in _list_layout_files(repo):
+        loader = lf.loader_cls(
+            lf.dir, lf.stem, ff_policy, observer, from_suffix)
+        try:
+            loaded.append((lf, loader.load_plain()))
+        except lf.error_cls as e:
+            if not _exists(repo, lf):
+                # Optional files stay missing.
+                continue
+            raise SshAuthDirLayoutError(
+                f"Cannot convert '{lf.stem}': {str(e)}") from e
+
+    for lf, plain in loaded:
+        dumper = lf.dumper_cls(
+            lf.dir, lf.stem, ff_policy, observer, to_suffix)
+        try:
+            dumper.dump_plain(plain)
+        except lf.error_cls as e:
+            raise SshAuthDirLayoutError(
+                f"Cannot convert '{lf.stem}': {str(e)}") from e
+
+        if from_suffix is not None and from_suffix != to_suffix:
+            from_entity_dir = mk_entity_dir_opt(
+                lf.dir, lf.stem, ff_policy, observer, from_suffix)
+            assert from_entity_dir is not None
+            from_entity_dir.clear()
+
+    return mk_ssh_auth_dir_repo(
+        repo.dir, to_layout, repo.policy, observer)
@@ -0,0 +1,225 @@
+"""Advisory locking of *ssh auth dir* files between processes.
+
+Each file (e.g.: the groups file or a state's auth file) has its own
+`fcntl.flock` lock file under `.nsf-ssh-auth-dir/locks/`: readers take
+it shared and writers exclusive for the whole load, mutate, dump cycle
+(or only for the dump when optimistic, see `repo_mutation`). Unrelated
+files can thus be written concurrently.
+
+Locks are reentrant within a process. A shared lock is upgraded in
+place when an exclusive one is requested by its holder, which is not
+atomic as far as other processes are concerned.
+
+Shared locks are best effort: readers of a dir where lock files cannot
+be created (e.g.: a read-only checkout or nix store path) go unlocked,
+nothing being able to write there anyway.
+"""
+import errno
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from ._io_stats import record_lock_wait
+from .policy_lock import SshAuthDirLockDefaultPolicy, SshAuthDirLockPolicy
+from .types_base_errors import SshAuthDirRepoError
+
+LOCKS_DIRNAME = ".nsf-ssh-auth-dir/locks"
+
+
+class SshAuthDirLockError(SshAuthDirRepoError):
+    pass
+
+
+class SshAuthDirLockTimeoutError(SshAuthDirLockError):
+    pass
+
+
+# Lock files cannot be created, the dir being read-only to us.
+_READ_ONLY_ERRNOS = (errno.EROFS, errno.EACCES, errno.EPERM)
+
+
+class _HeldLock:
+    """The process wide state of a single lock file."""
+    def __init__(self) -> None:
+        # Serializes threads, the `flock` lock being per process.
+        self.mutex = threading.RLock()
+        self.fd: Optional[int] = None
+        # One entry per nested acquisition, `True` when exclusive. `fd`
+        # stays `None` for unlocked readers.
+        self.modes: List[bool] = []
+
+
+_HELD: Dict[str, _HeldLock] = {}
+_HELD_MUTEX = threading.Lock()
+
+
+def _get_held(filename: Path) -> _HeldLock:
+    with _HELD_MUTEX:
+        return _HELD.setdefault(str(filename), _HeldLock())
+
+
+def ensure_internal_dir(dir: Path) -> None:
+    """Create a dir under `.nsf-ssh-auth-dir` (e.g.: `locks`)."""
+    if dir.is_dir():
+        return
+
+    dir.mkdir(parents=True, exist_ok=True)
+    # Such files have no business in the *ssh auth dir*'s history.
+    gitignore = dir.parent.joinpath(".gitignore")
+    if not gitignore.exists():
+        gitignore.write_text("*\n")
+
+
+class SshAuthDirFileLock:
+    def __init__(
+            self,
+            filename: Path,
+            policy: Optional[SshAuthDirLockPolicy] = None
+    ) -> None:
+        if policy is None:
+            policy = SshAuthDirLockDefaultPolicy()
+        self._filename = filename
+        self._policy = policy
+
+    @property
+    def filename(self) -> Path:
+        return self._filename
+
+    @property
+    def policy(self) -> SshAuthDirLockPolicy:
+        return self._policy
+
+    def _flock(self, fd: int, exclusive: bool, start: float) -> None:
+        op = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        waited = False
+        timeout = self._policy.timeout
+        while True:
+            try:
+                fcntl.flock(fd, op | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                pass
+
+            waited = True
+            elapsed = time.perf_counter() - start
+            if timeout is not None and elapsed >= timeout:
+                record_lock_wait(elapsed, timed_out=True)
+                raise SshAuthDirLockTimeoutError(
+                    f"Timed out after {elapsed:.3f}s waiting for "
+                    f"'{self._filename}' lock.")
+            time.sleep(self._policy.poll_interval)
+
+        if waited:
+            record_lock_wait(time.perf_counter() - start)
+
+    def _acquire(self, held: _HeldLock, exclusive: bool) -> None:
+        start = time.perf_counter()
+        timeout = self._policy.timeout
+        if not held.mutex.acquire(timeout=-1 if timeout is None else timeout):
+            elapsed = time.perf_counter() - start
+            record_lock_wait(elapsed, timed_out=True)
+            raise SshAuthDirLockTimeoutError(
+                f"Timed out after {elapsed:.3f}s waiting for "
+                f"'{self._filename}' lock.")
+
+        try:
+            if held.fd is None:
+                fd = self._open(exclusive)
+                if fd is not None:
+                    try:
+                        self._flock(fd, exclusive, start)
+                    except BaseException:
+                        os.close(fd)
+                        raise
+                    # Possibly upgrading an unlocked read.
+                    held.fd = fd
+            elif exclusive and not any(held.modes):
+                self._upgrade(held.fd, start)
+        except BaseException:
+            held.mutex.release()
+            raise
+
+        held.modes.append(exclusive)
+
+    def _open(self, exclusive: bool) -> Optional[int]:
+        """The lock file's fd, `None` when a shared lock goes unlocked."""
+        try:
+            ensure_internal_dir(self._filename.parent)
+            return os.open(self._filename, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            if not exclusive and e.errno in _READ_ONLY_ERRNOS:
+                return None
+            raise SshAuthDirLockError(
+                f"Cannot open '{self._filename}' lock: {str(e)}") from e
+
+    def _upgrade(self, fd: int, start: float) -> None:
+        try:
+            self._flock(fd, True, start)
+        except BaseException:
+            # A failed conversion may already have dropped the shared
+            # lock, which is still ours as far as `modes` is concerned.
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            raise
+
+    def _release(self, held: _HeldLock) -> None:
+        exclusive = held.modes.pop()
+        if held.fd is None:
+            # An unlocked read.
+            pass
+        elif not held.modes:
+            fcntl.flock(held.fd, fcntl.LOCK_UN)
+            os.close(held.fd)
+            held.fd = None
+        elif exclusive and not any(held.modes):
+            # Back to the shared lock held before the upgrade.
+            fcntl.flock(held.fd, fcntl.LOCK_SH)
+        held.mutex.release()
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        if not self._policy.enabled:
+            yield
+            return
+
+        held = _get_held(self._filename)
+        self._acquire(held, exclusive)
+        try:
+            yield
+        finally:
+            self._release(held)
+
+    def shared(self) -> Any:
+        """Raises:
+            SshAuthDirLockTimeoutError: See `SshAuthDirLockPolicy.timeout`.
+        """
+        return self._locked(False)
+
+    def exclusive(self) -> Any:
+        """Raises:
+            SshAuthDirLockTimeoutError: See `SshAuthDirLockPolicy.timeout`.
+            SshAuthDirLockError: When the lock file cannot be created
+                (e.g.: a read-only dir).
+        """
+        return self._locked(True)
+
+
+def mk_ssh_auth_dir_file_lock(
+        dir: Path,
+        rel_stem: str,
+        policy: SshAuthDirLockPolicy
+) -> SshAuthDirFileLock:
+    """The lock of the `<dir>/<rel_stem>.<ext>` *ssh auth dir* file
+        (e.g.: `authorized-on/my-state`).
+    """
+    lock_stem = rel_stem.replace("/", ".")
+    return SshAuthDirFileLock(
+        dir.joinpath(LOCKS_DIRNAME, f"{lock_stem}.lock"), policy)
+
+
+def mk_unlocked_file_lock() -> SshAuthDirFileLock:
+    return SshAuthDirFileLock(
+        Path(os.devnull), SshAuthDirLockDefaultPolicy(enabled=False))
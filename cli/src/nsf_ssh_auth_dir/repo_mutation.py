@@ -0,0 +1,167 @@
+"""Load, mutate, dump cycles of a single *ssh auth dir* file.
+
+By default, the file's lock is held exclusively for the whole cycle (see
+`repo_lock`). With an optimistic lock policy, the content digest of the
+loaded file version is remembered instead and verified right before
+dumping, the lock then being held only for this verify and dump step.
+On conflict, the logical operation is re-applied to a fresh load and
+retried with a jittered exponential backoff.
+
+Operations may thus run more than once and should only ever depend on
+the raw content they are given. Within a transaction (see
+`repo_journal`), the lock is held until the transaction ends.
+"""
+import hashlib
+import random
+import time
+from pathlib import Path
+from typing import (Callable, Generic, Iterable, List, Optional, Set,
+                    Tuple, TypeVar)
+
+from ._file_txn_tools import get_file_txn
+from ._io_stats import record_conflict
+from .repo_lock import SshAuthDirFileLock
+from .types_base_errors import SshAuthDirRepoError
+from .types_observer import record_mutation_change
+
+_RawT = TypeVar("_RawT")
+_T = TypeVar("_T")
+
+# Return whether the raw content changed and should thus be dumped.
+MutationOpT = Callable[[_RawT], bool]
+
+_MAX_BACKOFF = 0.5
+
+
+class SshAuthDirConflictError(SshAuthDirRepoError):
+    pass
+
+
+def add_to_set(s: Set[_T], item: _T) -> bool:
+    """Same as `s.add(item)`, returning whether `s` changed."""
+    if item in s:
+        return False
+    s.add(item)
+    return True
+
+
+def discard_from_set(s: Set[_T], item: _T) -> bool:
+    """Same as `s.discard(item)`, returning whether `s` changed."""
+    if item not in s:
+        return False
+    s.remove(item)
+    return True
+
+
+def compute_file_set_digest(filenames: Iterable[Path]) -> str:
+    """Missing files are part of the digest too."""
+    h = hashlib.sha256()
+    for fn in filenames:
+        h.update(f"{fn.name}\0".encode())
+        try:
+            content = fn.read_bytes()
+        except FileNotFoundError:
+            h.update(b"\1")
+            continue
+        h.update(b"\0")
+        h.update(len(content).to_bytes(8, "little"))
+        h.update(content)
+    return h.hexdigest()
+
+
+class SshAuthDirFileMutator(Generic[_RawT]):
+    def __init__(
+            self,
+            load_fn: Callable[[], _RawT],
+            dump_fn: Callable[[_RawT], None],
+            list_filenames_fn: Callable[[], List[Path]],
+            lock: SshAuthDirFileLock
+    ) -> None:
+        self._load_fn = load_fn
+        self._dump_fn = dump_fn
+        self._list_filenames_fn = list_filenames_fn
+        self._lock = lock
+        self.conflicts = 0
+
+    def _get_digest(self) -> str:
+        return compute_file_set_digest(self._list_filenames_fn())
+
+    def _mutate_locked(
+            self,
+            op: MutationOpT[_RawT],
+            load_fn: Callable[[], _RawT]
+    ) -> None:
+        with self._lock.exclusive():
+            raw = load_fn()
+            if op(raw):
+                self._dump_fn(raw)
+                record_mutation_change()
+
+    def _load_w_digest(
+            self, load_fn: Callable[[], _RawT]) -> Tuple[_RawT, str]:
+        # Writers dump under the exclusive lock.
+        with self._lock.shared():
+            return (load_fn(), self._get_digest())
+
+    def _try_mutate_optimistic(
+            self,
+            op: MutationOpT[_RawT],
+            load_fn: Callable[[], _RawT]
+    ) -> bool:
+        raw, digest = self._load_w_digest(load_fn)
+        if not op(raw):
+            return True
+
+        with self._lock.exclusive():
+            if digest != self._get_digest():
+                return False
+            self._dump_fn(raw)
+        record_mutation_change()
+        return True
+
+    def mutate(
+            self,
+            op: MutationOpT[_RawT],
+            load_fn: Optional[Callable[[], _RawT]] = None
+    ) -> None:
+        """Apply `op` to the loaded raw content and dump it when changed.
+
+        `load_fn` overrides the default load (e.g.: to start from empty
+        content when the file is missing).
+
+        Raises:
+            SshAuthDirConflictError: When optimistic and the file kept
+                changing for the maximum number of retries.
+        """
+        if load_fn is None:
+            load_fn = self._load_fn
+
+        txn = get_file_txn()
+        if txn is not None:
+            # Nothing gets written before the transaction commits, until
+            # which the file must not change.
+            if self._lock.policy.enabled:
+                txn.hold_lock(self._lock.exclusive(), self._lock.filename)
+            else:
+                txn.hold(self._lock.exclusive())
+            self._mutate_locked(op, load_fn)
+            return
+
+        policy = self._lock.policy
+        if not policy.enabled or not policy.optimistic:
+            self._mutate_locked(op, load_fn)
+            return
+
+        delay = policy.optimistic_backoff
+        for _ in range(policy.optimistic_max_retries + 1):
+            if self._try_mutate_optimistic(op, load_fn):
+                return
+
+            self.conflicts += 1
+            record_conflict()
+            time.sleep(random.uniform(0.5, 1.5) * delay)
+            delay = min(delay * 2, _MAX_BACKOFF)
+
+        raise SshAuthDirConflictError(
+            f"'{self._lock.filename.stem}' file kept changing after "
+            f"{policy.optimistic_max_retries} retries.")
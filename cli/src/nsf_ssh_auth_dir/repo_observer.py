@@ -0,0 +1,127 @@
+"""Ready made observers of the repository layer's events.
+
+See `types_observer` for the events themselves.
+"""
+import math
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from .types_observer import (SshAuthDirFileDumpEvent, SshAuthDirFileLoadEvent,
+                             SshAuthDirMutationEvent, SshAuthDirRepoEvent,
+                             SshAuthDirRepoObserver)
+
+
+def get_event_timing_key(event: SshAuthDirRepoEvent) -> str:
+    """The key events are aggregated under (e.g.: `file-load` or
+        `mutation:user.add`).
+    """
+    if isinstance(event, SshAuthDirMutationEvent):
+        return f"{event.kind}:{event.op}"
+    return event.kind
+
+
+def _get_event_nbytes(event: SshAuthDirRepoEvent) -> int:
+    if isinstance(event, (SshAuthDirFileLoadEvent, SshAuthDirFileDumpEvent)):
+        return event.nbytes
+    return 0
+
+
+def _get_histogram_bucket(duration: float) -> int:
+    # Bucket `n` holds durations in the `[2^(n-1), 2^n[` microseconds range,
+    # bucket 0 anything below a microsecond.
+    us = int(duration * 1e6)
+    if us < 1:
+        return 0
+    return int(math.log2(us)) + 1
+
+
+class SshAuthDirRepoTimingStats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.nbytes = 0
+        self.histogram: Dict[int, int] = {}
+
+    @property
+    def mean(self) -> float:
+        if 0 == self.count:
+            return 0.0
+        return self.total / self.count
+
+    def add(self, duration: float, nbytes: int = 0) -> None:
+        self.count += 1
+        self.total += duration
+        self.nbytes += nbytes
+        if self.min is None or duration < self.min:
+            self.min = duration
+        if self.max is None or duration > self.max:
+            self.max = duration
+        bucket = _get_histogram_bucket(duration)
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+
+class SshAuthDirRepoTimingSummaryEntry(NamedTuple):
+    key: str
+    calls: int
+    total: float
+    mean: float
+    min: float
+    max: float
+    nbytes: int
+
+
+class SshAuthDirRepoTimingCollector(SshAuthDirRepoObserver):
+    """Aggregates event counts, durations and sizes per event key."""
+    def __init__(self) -> None:
+        self._stats: Dict[str, SshAuthDirRepoTimingStats] = {}
+
+    def on_event(self, event: SshAuthDirRepoEvent) -> None:
+        key = get_event_timing_key(event)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = SshAuthDirRepoTimingStats()
+            self._stats[key] = stats
+        stats.add(event.duration, _get_event_nbytes(event))
+
+    @property
+    def keys(self) -> List[str]:
+        return sorted(self._stats.keys())
+
+    def __getitem__(self, key: str) -> SshAuthDirRepoTimingStats:
+        return self._stats[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._stats
+
+    def summary(self) -> List[SshAuthDirRepoTimingSummaryEntry]:
+        out = []
+        for key in self.keys:
+            s = self._stats[key]
+            assert s.min is not None and s.max is not None
+            out.append(SshAuthDirRepoTimingSummaryEntry(
+                key, s.count, s.total, s.mean, s.min, s.max, s.nbytes))
+        return out
+
+    def clear(self) -> None:
+        self._stats = {}
+
+
+class SshAuthDirRepoMultiObserver(SshAuthDirRepoObserver):
+    """Forwards events to each of its enabled observers."""
+    def __init__(self, observers: Iterable[SshAuthDirRepoObserver]) -> None:
+        self._observers = [o for o in observers if o.enabled]
+        self.enabled = bool(self._observers)
+
+    def on_event(self, event: SshAuthDirRepoEvent) -> None:
+        for o in self._observers:
+            o.on_event(event)
+
+
+def format_timing_summary_lines(
+        collector: SshAuthDirRepoTimingCollector) -> Iterator[str]:
+    for e in collector.summary():
+        yield (
+            f"{e.key}: {e.calls} calls, total {e.total:.6f}s, "
+            f"mean {e.mean:.6f}s, min {e.min:.6f}s, max {e.max:.6f}s"
+            + (f", {e.nbytes} bytes" if e.nbytes else ""))
@@ -0,0 +1,426 @@
+"""Module defining a stack of *ssh auth dirs* seen as a single one.
+
+Should match the `loadAuthDirWExtra` nix side function (see
+`nix-lib/dir.nix`) where a dir's content can be extended with
+*inherited* (lower priority) and *override* (higher priority)
+users, groups and auth.
+
+Merging is performed lazily and on a per key basis: looking up a
+single user only probes each layer's users for this particular key.
+Merged results are memoized per layer stack and shared between
+overlay instances over the same (unchanged) stack of dirs.
+"""
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import (Dict, FrozenSet, Iterable, Iterator, List, Optional,
+                    Sequence, Set, Tuple)
+
+from .repo import SshAuthDirRepo
+from .repo_auth_device_users import (SshAuthDeviceUser,
+                                     SshAuthRepoFileAccessError)
+from .repo_groups import SshGroupsRepoFileAccessError
+from .repo_users import SshUser, SshUsersRepoFileAccessError
+from .types_auth import SshRawAuth, SshRawAuthDeviceUser
+from .types_base_errors import SshAuthDirRepoError
+from .types_groups import SshRawGroup, SshRawGroups
+from .types_users import SshRawUser, SshRawUsers
+
+
+class SshAuthDirOverlayError(SshAuthDirRepoError):
+    pass
+
+
+class SshAuthDirOverlayKeyAccessError(SshAuthDirOverlayError, KeyError):
+    pass
+
+
+LAYER_ROLE_INHERITED = "inherited"
+LAYER_ROLE_BASE = "base"
+LAYER_ROLE_OVERRIDE = "override"
+
+MERGE_METHOD_WHOLE_OVERRIDE = "whole-override"
+MERGE_METHOD_PIECEWISE_MIX = "piecewise-mix"
+
+
+@dataclass(frozen=True)
+class SshAuthDirOverlayMergeMethods:
+    """How same name items of 2 layers are merged.
+
+    See `nix-lib/groups.nix` and `nix-lib/auth.nix` for the
+    description of each method and more importantly the security
+    implications of `piecewise-mix`.
+    """
+    group_member_set: str = MERGE_METHOD_WHOLE_OVERRIDE
+    device_user_authorized_set: str = MERGE_METHOD_WHOLE_OVERRIDE
+
+
+@dataclass(frozen=True)
+class SshAuthDirOverlayMergePolicy:
+    # Used when merging *inherited* layers into the *base* one.
+    inherited: SshAuthDirOverlayMergeMethods = SshAuthDirOverlayMergeMethods()
+    # Used when merging *override* layers on top of the result.
+    override: SshAuthDirOverlayMergeMethods = SshAuthDirOverlayMergeMethods()
+
+
+@dataclass
+class SshAuthDirOverlayLayer:
+    repo: SshAuthDirRepo
+    role: str
+
+
+class _LayerRaw:
+    """Lazily loaded raw content of a single layer."""
+    def __init__(self, repo: SshAuthDirRepo) -> None:
+        self.repo = repo
+        self._users: Optional[SshRawUsers] = None
+        self._groups: Optional[SshRawGroups] = None
+        self._auths: Dict[Optional[str], Optional[SshRawAuth]] = {}
+
+    @property
+    def users(self) -> SshRawUsers:
+        if self._users is None:
+            try:
+                self._users = self.repo.users.load_raw()
+            except SshUsersRepoFileAccessError:
+                if self.repo.users.exists():
+                    raise  # re-raise, an invalid file.
+                # A layer might only bring auth or groups.
+                self._users = SshRawUsers.mk_empty()
+        return self._users
+
+    @property
+    def groups(self) -> SshRawGroups:
+        if self._groups is None:
+            try:
+                self._groups = self.repo.groups.load_raw()
+            except SshGroupsRepoFileAccessError:
+                if self.repo.groups.exists():
+                    raise  # re-raise, an invalid file.
+                self._groups = SshRawGroups.mk_empty()
+        return self._groups
+
+    def get_auth(self, state_name: Optional[str]) -> Optional[SshRawAuth]:
+        if state_name not in self._auths:
+            auth_set = self.repo.auth
+            if state_name is None:
+                du_repo = auth_set.always.device_users
+            else:
+                du_repo = auth_set.on(state_name).device_users
+            try:
+                self._auths[state_name] = du_repo.load_raw()
+            except SshAuthRepoFileAccessError:
+                if du_repo.exists():
+                    raise  # re-raise, an invalid file.
+                self._auths[state_name] = None
+        return self._auths[state_name]
+
+    def get_device_user(
+            self, du_name: str, on_states: Tuple[str, ...]
+    ) -> Optional[SshRawAuthDeviceUser]:
+        """The layer's internal *authorized always* / *authorized on*
+            merge which always is a piecewise mix.
+        """
+        out: Optional[SshRawAuthDeviceUser] = None
+        for state_name in (None,) + on_states:
+            auth = self.get_auth(state_name)
+            if auth is None or du_name not in auth.device_users:
+                continue
+
+            du = auth.device_users[du_name]
+            if out is None:
+                out = SshRawAuthDeviceUser.mk_new(du_name)
+            out.ssh_users.update(du.ssh_users)
+            out.ssh_groups.update(du.ssh_groups)
+        return out
+
+
+_StackKeyT = Tuple[Tuple[str, str], ...]
+_StackSigT = Tuple[Tuple[str, int, int], ...]
+
+
+class _OverlayMergedViews:
+    def __init__(self, layers: Sequence[SshAuthDirOverlayLayer]) -> None:
+        self.layers_raw = [_LayerRaw(ly.repo) for ly in layers]
+        self.users: Dict[str, Optional[Tuple[int, SshRawUser]]] = {}
+        self.groups: Dict[str, Optional[FrozenSet[str]]] = {}
+        self.device_users: Dict[
+            Tuple[str, Tuple[str, ...]],
+            Optional[Tuple[FrozenSet[str], FrozenSet[str]]]] = {}
+
+
+def _stat_sig(filename: Path) -> Tuple[str, int, int]:
+    try:
+        st = os.stat(filename)
+    except FileNotFoundError:
+        return (str(filename), -1, -1)
+    return (str(filename), st.st_mtime_ns, st.st_size)
+
+
+def _iter_layer_files(repo: SshAuthDirRepo) -> Iterator[Path]:
+    ff_policy = repo.policy.file_format
+    layout = repo.layout
+    suffix = layout.entity_dir_suffix
+
+    def iter_entity_dir_files(in_dir: Path, stem: str) -> Iterator[Path]:
+        if suffix is None:
+            return
+        entity_dir = in_dir.joinpath(f"{stem}{suffix}")
+        # Adding / removing an entity file changes the dir's mtime.
+        yield entity_dir
+        yield from ff_policy.iter_target_filenames_in(entity_dir)
+
+    for stem in (
+            layout.users.stem,
+            layout.groups.stem,
+            layout.device_state_always.stem):
+        yield from ff_policy.get_source_filenames_for(repo.dir, stem)
+        yield from iter_entity_dir_files(repo.dir, stem)
+    auth_on_dir = repo.dir.joinpath(layout.auth_on.dirname)
+    # Adding / removing a state file changes the dir's mtime.
+    yield auth_on_dir
+    yield from ff_policy.iter_target_filenames_in(auth_on_dir)
+    if suffix is not None:
+        for state_name in sorted(repo.auth.state_names):
+            yield from iter_entity_dir_files(auth_on_dir, state_name)
+
+
+def _mk_stack_sig(layers: Sequence[SshAuthDirOverlayLayer]) -> _StackSigT:
+    return tuple(
+        _stat_sig(fn) for ly in layers for fn in _iter_layer_files(ly.repo))
+
+
+# Merged views shared by overlays over a same stack of dirs.
+_MERGED_VIEWS_CACHE: Dict[_StackKeyT, Tuple[_StackSigT, _OverlayMergedViews]] = {}
+
+
+def _get_merged_views(
+        layers: Sequence[SshAuthDirOverlayLayer]) -> _OverlayMergedViews:
+    key = tuple((str(ly.repo.dir), ly.role) for ly in layers)
+    sig = _mk_stack_sig(layers)
+    cached = _MERGED_VIEWS_CACHE.get(key)
+    if cached is not None and cached[0] == sig:
+        return cached[1]
+
+    views = _OverlayMergedViews(layers)
+    _MERGED_VIEWS_CACHE[key] = (sig, views)
+    return views
+
+
+def clear_ssh_auth_dir_overlay_cache() -> None:
+    _MERGED_VIEWS_CACHE.clear()
+
+
+class SshAuthDirOverlayRepo:
+    """A read-only view over a stack of *ssh auth dirs*.
+
+    Layers are ordered from lowest to highest priority: *inherited*
+    layers first, then the *base* dir and finally *override* layers.
+    As with the nix lib, the rightmost (highest priority) definition
+    wins for same name items unless a `piecewise-mix` method was
+    selected through the merge policy.
+    """
+    def __init__(
+            self,
+            layers: Sequence[SshAuthDirOverlayLayer],
+            policy: Optional[SshAuthDirOverlayMergePolicy] = None
+    ) -> None:
+        assert layers
+        if policy is None:
+            policy = SshAuthDirOverlayMergePolicy()
+
+        self._layers = list(layers)
+        self._policy = policy
+        self._views = _get_merged_views(self._layers)
+
+    @property
+    def layers(self) -> List[SshAuthDirOverlayLayer]:
+        return list(self._layers)
+
+    def _get_merge_methods(self, idx: int) -> SshAuthDirOverlayMergeMethods:
+        if LAYER_ROLE_OVERRIDE == self._layers[idx].role:
+            return self._policy.override
+        return self._policy.inherited
+
+    def _iter_layers_raw_top_down(self) -> Iterator[Tuple[int, _LayerRaw]]:
+        layers_raw = self._views.layers_raw
+        for idx in range(len(layers_raw) - 1, -1, -1):
+            yield idx, layers_raw[idx]
+
+    @property
+    def users_names(self) -> List[str]:
+        out: Dict[str, None] = {}
+        for lr in self._views.layers_raw:
+            out.update((n, None) for n in lr.users.ssh_users.keys())
+        return list(out.keys())
+
+    def _find_user(self, username: str) -> Optional[Tuple[int, SshRawUser]]:
+        cache = self._views.users
+        if username not in cache:
+            found = None
+            for idx, lr in self._iter_layers_raw_top_down():
+                raw = lr.users.ssh_users.get(username)
+                if raw is not None:
+                    found = (idx, raw)
+                    break
+            cache[username] = found
+        return cache[username]
+
+    def __contains__(self, username: str) -> bool:
+        return self._find_user(username) is not None
+
+    def get_user(self, username: str) -> SshUser:
+        """Return the highest priority definition of the user.
+
+        The user's pubkey is resolved relative to the dir of the layer
+        defining it using this layer's user defaults.
+        """
+        found = self._find_user(username)
+        if found is None:
+            raise SshAuthDirOverlayKeyAccessError(
+                f"No such user: '{username}' in any layer.")
+
+        idx, raw = found
+        lr = self._views.layers_raw[idx]
+        return SshUser(
+            lr.repo.dir, raw, lr.users.ssh_user_defaults,
+            lr.repo.policy.pubkey)
+
+    def get_user_layer(self, username: str) -> SshAuthDirOverlayLayer:
+        found = self._find_user(username)
+        if found is None:
+            raise SshAuthDirOverlayKeyAccessError(
+                f"No such user: '{username}' in any layer.")
+        return self._layers[found[0]]
+
+    @property
+    def groups_names(self) -> List[str]:
+        out: Dict[str, None] = {}
+        for lr in self._views.layers_raw:
+            out.update((n, None) for n in lr.groups.ssh_groups.keys())
+        return list(out.keys())
+
+    def _merge_group_members(self, groupname: str) -> Optional[FrozenSet[str]]:
+        # Fold bottom up, same as the nix lib's `mergeListOfGroupBundles`.
+        out: Optional[Set[str]] = None
+        for idx, lr in enumerate(self._views.layers_raw):
+            raw: Optional[SshRawGroup] = lr.groups.ssh_groups.get(groupname)
+            if raw is None:
+                continue
+
+            method = self._get_merge_methods(idx).group_member_set
+            if out is None or MERGE_METHOD_WHOLE_OVERRIDE == method:
+                out = set(raw.members)
+            else:
+                assert MERGE_METHOD_PIECEWISE_MIX == method
+                out.update(raw.members)
+
+        return None if out is None else frozenset(out)
+
+    def get_group_members_names(self, groupname: str) -> Set[str]:
+        cache = self._views.groups
+        if groupname not in cache:
+            cache[groupname] = self._merge_group_members(groupname)
+
+        members = cache[groupname]
+        if members is None:
+            raise SshAuthDirOverlayKeyAccessError(
+                f"No such group: '{groupname}' in any layer.")
+        return set(members)
+
+    def _merge_device_user(
+            self, du_name: str, on_states: Tuple[str, ...]
+    ) -> Optional[Tuple[FrozenSet[str], FrozenSet[str]]]:
+        users: Optional[Set[str]] = None
+        groups: Set[str] = set()
+        for idx, lr in enumerate(self._views.layers_raw):
+            raw = lr.get_device_user(du_name, on_states)
+            if raw is None:
+                continue
+
+            method = self._get_merge_methods(idx).device_user_authorized_set
+            if users is None or MERGE_METHOD_WHOLE_OVERRIDE == method:
+                users = set(raw.ssh_users)
+                groups = set(raw.ssh_groups)
+            else:
+                assert MERGE_METHOD_PIECEWISE_MIX == method
+                users.update(raw.ssh_users)
+                groups.update(raw.ssh_groups)
+
+        if users is None:
+            return None
+        return (frozenset(users), frozenset(groups))
+
+    def _get_device_user(
+            self, du_name: str, on_states: Iterable[str]
+    ) -> Optional[Tuple[FrozenSet[str], FrozenSet[str]]]:
+        # State precedence is lexicographic which is what sorting gives us.
+        states = tuple(sorted(set(on_states)))
+        key = (du_name, states)
+        cache = self._views.device_users
+        if key not in cache:
+            cache[key] = self._merge_device_user(du_name, states)
+        return cache[key]
+
+    def get_device_user_authorized_names(
+            self, du_name: str, on_states: Iterable[str] = ()
+    ) -> Tuple[Set[str], Set[str]]:
+        """Return the merged (*ssh users*, *ssh groups*) directly
+            authorized to the *device user* when in specified states.
+        """
+        found = self._get_device_user(du_name, on_states)
+        if found is None:
+            raise SshAuthDirOverlayKeyAccessError(
+                f"No such *device user*: '{du_name}' in any layer.")
+        return set(found[0]), set(found[1])
+
+    def _expand_device_user(
+            self, du_name: str, on_states: Iterable[str]) -> Set[str]:
+        found = self._get_device_user(du_name, on_states)
+        if found is None:
+            return set()
+
+        users, groups = found
+        out = set(users)
+        for g_name in groups:
+            # Dangling groups are ignored here. The nix lib would fail.
+            try:
+                out.update(self.get_group_members_names(g_name))
+            except SshAuthDirOverlayKeyAccessError:
+                pass
+        return out
+
+    def get_final_device_user_ssh_users_names(
+            self, du_name: str, on_states: Iterable[str] = ()
+    ) -> Set[str]:
+        """Return the effective *ssh users* authorized to *device user*.
+
+        This includes users authorized through groups and through the
+        special `""` all *device users* definition, same as the nix lib's
+        `mkAuthDirDeviceUser`.
+        """
+        on_states = list(on_states)
+        all_id = SshAuthDeviceUser.get_sentinel_id_for_all()
+        out = self._expand_device_user(all_id, on_states)
+        if all_id != du_name:
+            out.update(self._expand_device_user(du_name, on_states))
+        return out
+
+
+def mk_ssh_auth_dir_overlay_repo(
+        base: SshAuthDirRepo,
+        inherited: Iterable[SshAuthDirRepo] = (),
+        override: Iterable[SshAuthDirRepo] = (),
+        policy: Optional[SshAuthDirOverlayMergePolicy] = None
+) -> SshAuthDirOverlayRepo:
+    """Stack *inherited* dirs below and *override* dirs above `base`.
+
+    Within each list, rightmost dirs have priority.
+    """
+    layers = [
+        SshAuthDirOverlayLayer(r, LAYER_ROLE_INHERITED) for r in inherited
+    ]
+    layers.append(SshAuthDirOverlayLayer(base, LAYER_ROLE_BASE))
+    layers.extend(
+        SshAuthDirOverlayLayer(r, LAYER_ROLE_OVERRIDE) for r in override)
+    return SshAuthDirOverlayRepo(layers, policy)
@@ -0,0 +1,182 @@
+"""Validation of the selected public key of every user of a repo.
+
+Validation results are cached by the sha256 of the key file's content
+(and the validation parameters), in a per user store shared by all
+*ssh auth dirs*. Only new or changed keys thus get validated, on a
+process pool when there are enough of them.
+"""
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from ._cache_tools import (dump_json_cache_file, get_cache_dir,
+                           load_json_cache_file)
+from ._file_txn_tools import read_file_bytes
+from .file_pubkey import DEFAULT_MIN_RSA_BITS, validate_ssh_pubkey_lines
+from .repo import SshAuthDirRepo
+from .repo_user_pubkeys import SshUserPubkeysRepoError
+
+_CACHE_FORMAT_VERSION = 1
+DEFAULT_MAX_CACHE_ENTRIES = 100000
+# Below this many keys to validate, a pool costs more than it saves.
+_MIN_KEYS_PER_JOB = 64
+
+
+class SshPubkeyValidationResult(NamedTuple):
+    username: str
+    # `None` when the user has no pubkey.
+    filename: Optional[Path]
+    # `None` when valid.
+    error: Optional[str]
+    cached: bool
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+
+class SshPubkeyValidationCache:
+    """Validation errors (`None` when valid) keyed by content digest.
+
+    In memory only unless a `filename` is provided in which case
+    `save` persists it.
+    """
+    def __init__(
+            self,
+            filename: Optional[Path] = None,
+            max_entries: int = DEFAULT_MAX_CACHE_ENTRIES
+    ) -> None:
+        self._filename = filename
+        self._max_entries = max_entries
+        # In insertion order, oldest first.
+        self._entries: Dict[str, Optional[str]] = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        if filename is not None:
+            self._load(filename)
+
+    @classmethod
+    def mk_persistent(cls) -> 'SshPubkeyValidationCache':
+        return cls(get_cache_dir().joinpath("pubkey-validation.json"))
+
+    def _load(self, filename: Path) -> None:
+        content = load_json_cache_file(filename)
+        if not isinstance(content, dict) \
+                or _CACHE_FORMAT_VERSION != content.get("version"):
+            return
+
+        entries = content.get("entries")
+        if isinstance(entries, dict) and all(
+                e is None or isinstance(e, str) for e in entries.values()):
+            self._entries = entries
+
+    def save(self) -> None:
+        if self._filename is None or not self._dirty:
+            return
+
+        dump_json_cache_file(self._filename, {
+            "version": _CACHE_FORMAT_VERSION,
+            "entries": self._entries,
+        })
+        self._dirty = False
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[str]:
+        return self._entries.get(key)
+
+    def set(self, key: str, error: Optional[str]) -> None:
+        self._entries[key] = error
+        excess = len(self._entries) - self._max_entries
+        if excess > 0:
+            for k in list(self._entries)[:excess]:
+                del self._entries[k]
+        self._dirty = True
+
+
+def _mk_cache_key(content: bytes, min_rsa_bits: int) -> str:
+    return f"{hashlib.sha256(content).hexdigest()}:{min_rsa_bits}"
+
+
+def _validate_one(task: Tuple[bytes, int]) -> Optional[str]:
+    content, min_rsa_bits = task
+    try:
+        # Universal newlines, as `load_ssh_pubkey`.
+        text_lines = list(io.StringIO(content.decode(), newline=None))
+    except UnicodeDecodeError:
+        return "not utf-8 text"
+    return validate_ssh_pubkey_lines(text_lines, min_rsa_bits)
+
+
+def _validate_all(
+        tasks: List[Tuple[bytes, int]],
+        jobs: Optional[int]
+) -> List[Optional[str]]:
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(tasks) // _MIN_KEYS_PER_JOB))
+    if 1 == jobs:
+        return list(map(_validate_one, tasks))
+
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(_validate_one, tasks, chunksize=chunksize))
+
+
+def validate_ssh_auth_dir_pubkeys(
+        repo: SshAuthDirRepo,
+        cache: Optional[SshPubkeyValidationCache] = None,
+        jobs: Optional[int] = None,
+        min_rsa_bits: int = DEFAULT_MIN_RSA_BITS
+) -> List[SshPubkeyValidationResult]:
+    """Validate the selected pubkey of each user, in users file order.
+
+    Keys not in `cache` are validated on up to `jobs` worker processes
+    (defaults to the number of cpus) then added to it. It is up to the
+    caller to `save` the cache.
+
+    Raises:
+        SshUsersRepoAccessError: When the users file cannot be loaded.
+    """
+    if cache is None:
+        cache = SshPubkeyValidationCache()
+
+    out: List[SshPubkeyValidationResult] = []
+    # Indexes in `out` awaiting validation, per cache key.
+    pending: Dict[str, List[int]] = {}
+    tasks: List[Tuple[bytes, int]] = []
+    for user in repo.users:
+        try:
+            filename = user.pubkeys.selected_filename
+            content = read_file_bytes(filename)
+        except (SshUserPubkeysRepoError, OSError) as e:
+            out.append(SshPubkeyValidationResult(
+                user.name, None, str(e), False))
+            continue
+
+        key = _mk_cache_key(content, min_rsa_bits)
+        if key in cache:
+            cache.hits += 1
+            out.append(SshPubkeyValidationResult(
+                user.name, filename, cache.get(key), True))
+            continue
+
+        if key not in pending:
+            cache.misses += 1
+            pending[key] = []
+            tasks.append((content, min_rsa_bits))
+        pending[key].append(len(out))
+        out.append(SshPubkeyValidationResult(
+            user.name, filename, None, False))
+
+    for key, error in zip(pending, _validate_all(tasks, jobs)):
+        cache.set(key, error)
+        for i in pending[key]:
+            out[i] = out[i]._replace(error=error)
+
+    return out
@@ -0,0 +1,169 @@
+"""A read-only, loaded once view over a whole *ssh auth dir*.
+
+The regular repositories reload their file on each access which is
+what we want when mutating. Query heavy code (e.g.: listing all users
+along with their groups and authorizations) would however reload and
+reparse the same files once per item. A snapshot loads each file
+exactly once and builds its reverse indexes lazily.
+"""
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from .file_pubkey import SshPubkeyLookupPlan
+from .policy_repo import SshAuthDirRepoPolicy
+from .repo_user_pubkeys import get_pubkey_lookup_plan
+from .repo_users import SshUser
+from .types_auth import SshRawAuth
+from .types_groups import SshRawGroup, SshRawGroups
+from .types_users import SshRawUsers
+
+
+class SshAuthEntry(NamedTuple):
+    """A single *ssh user* / *ssh group* to *device user* authorization."""
+    # `None` when part of the *authorized always* set.
+    state_name: Optional[str]
+    device_user_name: str
+    # `None` when directly authorized.
+    via_group_name: Optional[str]
+
+
+class SshAuthDirSnapshot:
+    def __init__(
+            self,
+            dir: Path,
+            policy: SshAuthDirRepoPolicy,
+            raw_users: SshRawUsers,
+            raw_groups: SshRawGroups,
+            raw_auths: Dict[Optional[str], SshRawAuth]
+    ) -> None:
+        self._dir = dir
+        self._policy = policy
+        self._raw_users = raw_users
+        self._raw_groups = raw_groups
+        # Keyed by state name, `None` being the *authorized always* set.
+        self._raw_auths = raw_auths
+        self._user_groups: Optional[Dict[str, List[str]]] = None
+        self._user_auths: Optional[Dict[str, List[SshAuthEntry]]] = None
+        self._group_auths: Optional[Dict[str, List[SshAuthEntry]]] = None
+        # Shared by all of the snapshot's users, resolved on first use.
+        self._lookup_plan: Optional[SshPubkeyLookupPlan] = None
+        self._lookup_plan_resolved = False
+
+    @property
+    def dir(self) -> Path:
+        return self._dir
+
+    @property
+    def users_names(self) -> List[str]:
+        return list(self._raw_users.ssh_users.keys())
+
+    @property
+    def groups_names(self) -> List[str]:
+        return list(self._raw_groups.ssh_groups.keys())
+
+    @property
+    def state_names(self) -> List[str]:
+        return sorted(s for s in self._raw_auths.keys() if s is not None)
+
+    def get_raw_auth(self, state_name: Optional[str]) -> Optional[SshRawAuth]:
+        """`None` state being the *authorized always* set."""
+        return self._raw_auths.get(state_name)
+
+    def get_raw_group(self, groupname: str) -> Optional[SshRawGroup]:
+        return self._raw_groups.ssh_groups.get(groupname)
+
+    @property
+    def device_users_names(self) -> List[str]:
+        """All *device users* mentioned in any of the auth sets."""
+        out: Dict[str, None] = {}
+        for raw_auth in self._raw_auths.values():
+            out.update((n, None) for n in raw_auth.device_users.keys())
+        return sorted(out.keys())
+
+    def has_user(self, username: str) -> bool:
+        return username in self._raw_users.ssh_users
+
+    def has_group(self, groupname: str) -> bool:
+        return groupname in self._raw_groups.ssh_groups
+
+    def get_user(self, username: str) -> SshUser:
+        """Raises `KeyError` when no such user."""
+        raw = self._raw_users.ssh_users[username]
+        if not self._lookup_plan_resolved:
+            self._lookup_plan = get_pubkey_lookup_plan(
+                self._dir, self._raw_users.ssh_user_defaults,
+                self._policy.pubkey)
+            self._lookup_plan_resolved = True
+        return SshUser(
+            self._dir,
+            raw,
+            self._raw_users.ssh_user_defaults,
+            self._policy.pubkey,
+            lookup_plan=self._lookup_plan
+        )
+
+    def iter_users(self) -> Iterator[SshUser]:
+        for name in self._raw_users.ssh_users.keys():
+            yield self.get_user(name)
+
+    def get_group_members_names(self, groupname: str) -> List[str]:
+        """Raises `KeyError` when no such group."""
+        return sorted(self._raw_groups.ssh_groups[groupname].members)
+
+    def _ensure_user_groups(self) -> Dict[str, List[str]]:
+        if self._user_groups is None:
+            user_groups: Dict[str, List[str]] = {}
+            for g_name, group in self._raw_groups.ssh_groups.items():
+                for m_name in group.members:
+                    user_groups.setdefault(m_name, []).append(g_name)
+            self._user_groups = user_groups
+
+        return self._user_groups
+
+    def get_user_groups_names(self, username: str) -> List[str]:
+        return sorted(self._ensure_user_groups().get(username, []))
+
+    def _ensure_auths(self) -> None:
+        if self._user_auths is not None:
+            return
+
+        user_auths: Dict[str, List[SshAuthEntry]] = {}
+        group_auths: Dict[str, List[SshAuthEntry]] = {}
+        state_names: List[Optional[str]] = [None]
+        state_names.extend(self.state_names)
+
+        for state_name in state_names:
+            raw_auth = self._raw_auths.get(state_name)
+            if raw_auth is None:
+                continue
+
+            for du_name, du in raw_auth.device_users.items():
+                for u_name in sorted(du.ssh_users):
+                    user_auths.setdefault(u_name, []).append(
+                        SshAuthEntry(state_name, du_name, None))
+
+                for g_name in sorted(du.ssh_groups):
+                    group_auths.setdefault(g_name, []).append(
+                        SshAuthEntry(state_name, du_name, None))
+
+                    raw_group = self._raw_groups.ssh_groups.get(g_name)
+                    if raw_group is None:
+                        continue
+
+                    for m_name in sorted(raw_group.members):
+                        user_auths.setdefault(m_name, []).append(
+                            SshAuthEntry(state_name, du_name, g_name))
+
+        self._user_auths = user_auths
+        self._group_auths = group_auths
+
+    def get_user_auth_entries(self, username: str) -> List[SshAuthEntry]:
+        """Return both direct and through group authorizations of user."""
+        self._ensure_auths()
+        assert self._user_auths is not None
+        return list(self._user_auths.get(username, []))
+
+    def get_group_auth_entries(self, groupname: str) -> List[SshAuthEntry]:
+        self._ensure_auths()
+        assert self._group_auths is not None
+        return list(self._group_auths.get(groupname, []))
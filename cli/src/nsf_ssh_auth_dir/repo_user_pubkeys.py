@@ -1,17 +1,24 @@
+from collections import OrderedDict
 from pathlib import Path
-from typing import Iterator, Optional, Type
+from typing import Iterator, List, Optional, Tuple, Type
 
+from ._file_txn_tools import file_exists, unlink_file
 from .file_pubkey import (
+    SshPubkeyLookupPlan,
     SshPubkeysDb,
     SshPubkeyDumper,
     SshPubkeyFileError,
     SshPubkeyFileAccessError,
     SshPukeyLoader,
+    is_empty_lookup_info,
     merge_lookup_info,
     load_ssh_pubkey
 )
 from .policy_repo import SshAuthDirPubkeyPolicy
 from .types_base_errors import SshAuthDirRepoError
+from .types_observer import (NOOP_OBSERVER, SshAuthDirPubkeyResolutionEvent,
+                             SshAuthDirRepoObserver, get_observer_clock,
+                             observed_mutation, record_mutation_change)
 from .types_pubkey import (
     SshPubKey,
     SshPubKeyFileTemplateVars,
@@ -41,18 +48,81 @@ def get_user_pubkeys_repo_err_cls_from_pubkey_file_err(
     return SshUserPubkeysRepoAccessError
 
 
+def mk_pubkey_defaults_lookup_info(
+        raw_defaults: Optional[SshRawUserDefaults],
+        pubkey_policy: SshAuthDirPubkeyPolicy
+) -> SshPubKeyLookupInfo:
+    lkups = []
+
+    if raw_defaults:
+        lkups.append(SshPubKeyLookupInfoOpt(
+            raw_defaults.pubkey_file_template,
+            raw_defaults.pubkey_file_search_path,
+            None
+        ))
+
+    default = pubkey_policy.default_lookup_info
+    return merge_lookup_info(lkups, default)
+
+
+_LookupPlanKeyT = Tuple[str, Tuple[str, ...], Tuple[str, ...]]
+_MAX_LOOKUP_PLANS = 32
+_lookup_plans: "OrderedDict[_LookupPlanKeyT, SshPubkeyLookupPlan]" = \
+    OrderedDict()
+
+
+def get_pubkey_lookup_plan(
+        sa_root_dir: Path,
+        raw_defaults: Optional[SshRawUserDefaults],
+        pubkey_policy: SshAuthDirPubkeyPolicy
+) -> Optional[SshPubkeyLookupPlan]:
+    """The lookup plan shared by the users of a users file version
+        without lookup overrides of their own.
+
+    Plans are kept for reuse by later loads of the same defaults and
+    refreshed on each reuse. `None` when the defaults pin a single file.
+    """
+    lookup = mk_pubkey_defaults_lookup_info(raw_defaults, pubkey_policy)
+    if lookup.file is not None:
+        return None
+
+    key = (
+        str(sa_root_dir),
+        tuple(lookup.file_template),
+        tuple(str(sp) for sp in lookup.file_search_path))
+    plan = _lookup_plans.get(key)
+    if plan is not None:
+        _lookup_plans.move_to_end(key)
+        plan.refresh()
+        return plan
+
+    plan = SshPubkeyLookupPlan(lookup, sa_root_dir)
+    _lookup_plans[key] = plan
+    while len(_lookup_plans) > _MAX_LOOKUP_PLANS:
+        _lookup_plans.popitem(last=False)
+    return plan
+
+
 class SshUserPubkeysRepo:
     def __init__(
             self,
             sa_root_dir: Path,
             raw: SshRawUser,
             raw_defaults: Optional[SshRawUserDefaults],
-            pubkey_policy: SshAuthDirPubkeyPolicy
+            pubkey_policy: SshAuthDirPubkeyPolicy,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            lookup_plan: Optional[SshPubkeyLookupPlan] = None
     ) -> None:
+        """`lookup_plan`, when provided, must have been obtained via
+            `get_pubkey_lookup_plan` for the same defaults.
+        """
         self._sa_root_dir = sa_root_dir
         self._raw = raw
         self._raw_defaults = raw_defaults
         self._pubkey_policy = pubkey_policy
+        self._observer = observer
+        self._lookup_plan = lookup_plan
+        self._observed_attrs = {"user": raw.name}
 
     @property
     def name(self) -> str:
@@ -71,25 +141,24 @@ class SshUserPubkeysRepo:
             self._raw.pubkey_file
         )
 
-    def _mk_pubkey_defaults_lookup_info(self) -> SshPubKeyLookupInfo:
-        lkups = []
-
-        if self._raw_defaults:
-            lkups.append(SshPubKeyLookupInfoOpt(
-                self._raw_defaults.pubkey_file_template,
-                self._raw_defaults.pubkey_file_search_path,
-                None
-            ))
-
-        default = self._pubkey_policy.default_lookup_info
-        return merge_lookup_info(lkups, default)
-
     def _mk_db(self) -> SshPubkeysDb:
+        user_lookup = self._mk_pubkey_user_lookup_info()
+        plan = self._lookup_plan
+        if plan is not None and is_empty_lookup_info(user_lookup):
+            # The plan's lookup is already the merged defaults, left
+            # untouched when merging an empty user lookup.
+            default_lookup = plan.lookup
+        else:
+            plan = None
+            default_lookup = mk_pubkey_defaults_lookup_info(
+                self._raw_defaults, self._pubkey_policy)
+
         return SshPubkeysDb(
-            self._mk_pubkey_user_lookup_info(),
-            self._mk_pubkey_defaults_lookup_info(),
+            user_lookup,
+            default_lookup,
             self._sa_root_dir,
-            self._mk_pubkey_template_vars()
+            self._mk_pubkey_template_vars(),
+            plan
         )
 
     def _mk_loader(self) -> SshPukeyLoader:
@@ -102,15 +171,34 @@ class SshUserPubkeysRepo:
     def filenames(self) -> Iterator[Path]:
         db = self._mk_db()
         for fn in db.iter_filenames():
-            if not fn.exists():
+            if not file_exists(fn):
                 continue
             yield fn
 
+    @property
+    def candidate_filenames(self) -> List[Path]:
+        """Filenames the selected pubkey is looked up at, in order."""
+        return list(self._mk_db().iter_candidate_filenames())
+
+    def _get_selected_filename(self) -> Path:
+        db = self._mk_db()
+        observer = self._observer
+        if not observer.enabled:
+            return SshPukeyLoader(db).selected_filename
+
+        filename: Optional[Path] = None
+        start = get_observer_clock()
+        try:
+            filename = SshPukeyLoader(db).selected_filename
+            return filename
+        finally:
+            observer.on_event(SshAuthDirPubkeyResolutionEvent(
+                get_observer_clock() - start, self.name, filename, db.probes))
+
     @property
     def selected_filename(self) -> Path:
-        loader = self._mk_loader()
         try:
-            return loader.selected_filename
+            return self._get_selected_filename()
         except SshPubkeyFileError as e:
             ECls = get_user_pubkeys_repo_err_cls_from_pubkey_file_err(e)
             raise ECls(str(e)) from e
@@ -126,9 +214,8 @@ class SshUserPubkeysRepo:
 
     @property
     def selected(self) -> SshPubKey:
-        loader = self._mk_loader()
         try:
-            return loader.load_selected()
+            return load_ssh_pubkey(self._get_selected_filename())
         except SshPubkeyFileError as e:
             ECls = get_user_pubkeys_repo_err_cls_from_pubkey_file_err(e)
             raise ECls(str(e)) from e
@@ -143,6 +230,7 @@ class SshUserPubkeysRepo:
             raise ECls(str(e)) from e
 
     @default.setter
+    @observed_mutation("user.pubkey.set-default")
     def default(self, pubkey: SshPubKey) -> None:
         dumper = self._mk_dumper()
 
@@ -151,18 +239,13 @@ class SshUserPubkeysRepo:
         except SshPubkeyFileError as e:
             ECls = get_user_pubkeys_repo_err_cls_from_pubkey_file_err(e)
             raise ECls(str(e)) from e
+        record_mutation_change()
 
     def __iter__(self) -> Iterator[SshPubKey]:
         for fn in self.filenames:
             yield load_ssh_pubkey(fn)
 
     def rm_all(self) -> None:
-        for fn in self.filenames:
-            fn.unlink()
-
-            # Attempt to cleanup empty pubkey dir
-            # if possible.
-            try:
-                fn.parent.rmdir()
-            except OSError:
-                pass
+        for fn in list(self.filenames):
+            # Also attempts to cleanup the pubkey dir when left empty.
+            unlink_file(fn, rm_empty_parent=True)
@@ -1,6 +1,7 @@
 from pathlib import Path
-from typing import Iterator, Optional, Type, Tuple, Set
+from typing import Iterator, List, Optional, Type, Tuple, Set
 
+from ._lazy_parsing_tools import LazyParsedDict
 from .file_users import (
     SshUsersDumper,
     SshUsersFileAccessError,
@@ -8,12 +9,18 @@ from .file_users import (
     SshUsersLoader,
 )
 from .policy_repo import SshAuthDirPubkeyPolicy, SshAuthDirRepoPolicy
+from .repo_lock import mk_ssh_auth_dir_file_lock
+from .repo_mutation import SshAuthDirFileMutator
+from .file_pubkey import SshPubkeyLookupPlan
 from .repo_user_pubkeys import (
     SshUserPubkeysRepo,
     SshUserPubkeysRepoError,
     SshUserPubkeysRepoFileAccessError,
+    get_pubkey_lookup_plan,
 )
 from .types_base_errors import SshAuthDirRepoError
+from .types_observer import (NOOP_OBSERVER, SshAuthDirRepoObserver,
+                             observed_mutation)
 from .types_pubkey import SshPubKey
 from .types_users import SshRawUser, SshRawUserDefaults, SshRawUsers
 
@@ -58,19 +65,28 @@ def get_users_repo_err_cls_from_user_pubkeys_repo_err(
     return SshUsersRepoAccessError
 
 
+def _map_users_file_err(e: Exception) -> Exception:
+    assert isinstance(e, SshUsersFileError)
+    ECls = get_users_repo_err_cls_from_users_file_err(e)
+    return ECls(str(e))
+
+
 class SshUser:
     def __init__(
             self,
             sa_root_dir: Path,
             raw: SshRawUser,
             raw_defaults: Optional[SshRawUserDefaults],
-            pubkey_policy: SshAuthDirPubkeyPolicy
+            pubkey_policy: SshAuthDirPubkeyPolicy,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            lookup_plan: Optional[SshPubkeyLookupPlan] = None
     ) -> None:
         self._sa_root_dir = sa_root_dir
         self._raw = raw
         self._raw_defaults = raw_defaults
         self._pubkeys = SshUserPubkeysRepo(
-            sa_root_dir, raw, raw_defaults, pubkey_policy)
+            sa_root_dir, raw, raw_defaults, pubkey_policy, observer,
+            lookup_plan)
 
     @property
     def name(self) -> str:
@@ -108,31 +124,66 @@ class SshUser:
 class SshUsersRepo:
     def __init__(
             self, dir: Path, stem: str,
-            policy: SshAuthDirRepoPolicy
+            policy: SshAuthDirRepoPolicy,
+            observer: SshAuthDirRepoObserver = NOOP_OBSERVER,
+            entity_dir_suffix: Optional[str] = None
     ) -> None:
         self._sa_root_dir = dir
         self._policy = policy
-        self._users_loader = SshUsersLoader(dir, stem, policy.file_format)
-        self._users_dumper = SshUsersDumper(dir, stem, policy.file_format)
+        self._observer = observer
+        self._users_loader = SshUsersLoader(
+            dir, stem, policy.file_format, observer, entity_dir_suffix,
+            policy.parse_cache)
+        self._users_dumper = SshUsersDumper(
+            dir, stem, policy.file_format, observer, entity_dir_suffix)
+        self._lock = mk_ssh_auth_dir_file_lock(dir, stem, policy.lock)
+        self._mutator = SshAuthDirFileMutator(
+            self._load_raw, self._dump_raw,
+            self._users_loader.list_filenames, self._lock)
 
     def _mk_user(
             self, raw: SshRawUser,
-            raw_defaults: Optional[SshRawUserDefaults]
+            raw_defaults: Optional[SshRawUserDefaults],
+            lookup_plan: Optional[SshPubkeyLookupPlan]
     ) -> SshUser:
         return SshUser(
             self._sa_root_dir,
             raw,
             raw_defaults,
-            self._policy.pubkey
+            self._policy.pubkey,
+            self._observer,
+            lookup_plan
         )
 
+    def _get_lookup_plan(
+            self, raw_users: SshRawUsers) -> Optional[SshPubkeyLookupPlan]:
+        return get_pubkey_lookup_plan(
+            self._sa_root_dir, raw_users.ssh_user_defaults,
+            self._policy.pubkey)
+
     def _load_raw(self) -> SshRawUsers:
         try:
-            return self._users_loader.load()
+            with self._lock.shared():
+                out = self._users_loader.load()
         except SshUsersFileError as e:
             ECls = get_users_repo_err_cls_from_users_file_err(e)
             raise ECls(str(e)) from e
 
+        if isinstance(out.ssh_users, LazyParsedDict):
+            out.ssh_users.map_parse_errors(
+                SshUsersFileError, _map_users_file_err)
+        return out
+
+    def load_raw(self) -> SshRawUsers:
+        """Load a raw snapshot of the whole users file."""
+        return self._load_raw()
+
+    def exists(self) -> bool:
+        """Whether the users file exists, telling a missing file apart
+            from an invalid one when loading fails.
+        """
+        return self._users_loader.exists()
+
     def _dump_raw(self, raw: SshRawUsers) -> None:
         try:
             return self._users_dumper.dump(raw)
@@ -142,17 +193,22 @@ class SshUsersRepo:
 
     @property
     def names(self) -> Set[str]:
-        raw_users = self._load_raw()
-        return {
-            name for name in raw_users.ssh_users.keys()
-        }
+        try:
+            with self._lock.shared():
+                return set(self._users_loader.load_names())
+        except SshUsersFileError as e:
+            ECls = get_users_repo_err_cls_from_users_file_err(e)
+            raise ECls(str(e)) from e
 
     def __iter__(self) -> Iterator[SshUser]:
         raw_users = self._load_raw()
+        # Compiled once for all of this load's users.
+        lookup_plan = self._get_lookup_plan(raw_users)
         for name, user in raw_users.ssh_users.items():
             yield self._mk_user(
                 user,
-                raw_users.ssh_user_defaults)
+                raw_users.ssh_user_defaults,
+                lookup_plan)
 
     def __contains__(self, username: str) -> bool:
         raw_users = self._load_raw()
@@ -164,7 +220,8 @@ class SshUsersRepo:
             return (
                 self._mk_user(
                     raw_users.ssh_users[username],
-                    raw_users.ssh_user_defaults
+                    raw_users.ssh_user_defaults,
+                    self._get_lookup_plan(raw_users)
                 ),
                 raw_users
             )
@@ -176,14 +233,17 @@ class SshUsersRepo:
         user, _ = self._get_w_raw_set(username)
         return user
 
+    @observed_mutation("user.del")
     def __delitem__(self, username: str) -> None:
-        raw_users = self._load_raw()
-        try:
-            del raw_users.ssh_users[username]
-        except KeyError as e:
-            raise SshUsersRepoKeyAccessError(
-                f"No such user: '{username}'. Can't be deleted.") from e
-        self._dump_raw(raw_users)
+        def op(raw_users: SshRawUsers) -> bool:
+            try:
+                del raw_users.ssh_users[username]
+            except KeyError as e:
+                raise SshUsersRepoKeyAccessError(
+                    f"No such user: '{username}'. Can't be deleted.") from e
+            return True
+
+        self._mutator.mutate(op)
 
     def get(self, username: str,
             default: Optional[SshUser] = None) -> Optional[SshUser]:
@@ -192,29 +252,33 @@ class SshUsersRepo:
         except SshUsersRepoKeyAccessError:
             return default
 
+    def _load_raw_or_empty(self) -> SshRawUsers:
+        try:
+            return self._load_raw()
+        except SshUsersRepoFileAccessError:
+            if not self._policy.silent_create_file_users:
+                raise  # re-raise
+
+            return SshRawUsers.mk_empty()
+
+    @observed_mutation("user.add")
     def add(
             self,
             username: str,
             pubkey: Optional[SshPubKey] = None,
             exist_ok: bool = False
     ) -> SshUser:
-        try:
-            raw_users = self._load_raw()
-        except SshUsersRepoFileAccessError:
-            if not self._policy.silent_create_file_users:
-                raise  # re-raise
+        def op(raw_users: SshRawUsers) -> bool:
+            if username in raw_users.ssh_users:
+                if not exist_ok:
+                    raise SshUsersRepoUserAlreadyExistsError(
+                        f"Failed to add user '{username}'. Already exists.")
+                return False
 
-            raw_users = SshRawUsers.mk_empty()
-
-        if username in raw_users.ssh_users:
-            if not exist_ok:
-                raise SshUsersRepoUserAlreadyExistsError(
-                    f"Failed to add user '{username}'. Already exists.")
-        else:
-            raw_users.ssh_users[username] = SshRawUser.mk_new(
-                username)
-            self._dump_raw(raw_users)
+            raw_users.ssh_users[username] = SshRawUser.mk_new(username)
+            return True
 
+        self._mutator.mutate(op, self._load_raw_or_empty)
         user = self[username]
 
         if pubkey is not None:
@@ -222,19 +286,67 @@ class SshUsersRepo:
 
         return user
 
+    @observed_mutation("user.add-many")
+    def add_many(
+            self,
+            users: List[Tuple[str, Optional[SshPubKey]]],
+            exist_ok: bool = False
+    ) -> List[str]:
+        """Add all `users` with a single write of the users file.
+
+        Unlike `add` called in a loop, this does not reload nor rewrite
+        the users file once per user. Return the names of the users
+        actually added (i.e.: those which did not already exist).
+        """
+        added: List[Tuple[SshRawUser, Optional[SshPubKey]]] = []
+        raw_defaults: List[Optional[SshRawUserDefaults]] = [None]
+
+        def op(raw_users: SshRawUsers) -> bool:
+            # Retried on conflicts.
+            added.clear()
+            raw_defaults[0] = raw_users.ssh_user_defaults
+            for username, pubkey in users:
+                if username in raw_users.ssh_users:
+                    if not exist_ok:
+                        raise SshUsersRepoUserAlreadyExistsError(
+                            f"Failed to add user '{username}'. "
+                            "Already exists.")
+                    continue
+
+                raw_user = SshRawUser.mk_new(username)
+                raw_users.ssh_users[username] = raw_user
+                added.append((raw_user, pubkey))
+            return bool(added)
+
+        self._mutator.mutate(op, self._load_raw_or_empty)
+
+        for raw_user, pubkey in added:
+            if pubkey is not None:
+                self._mk_user(
+                    raw_user, raw_defaults[0], None
+                ).pubkey_default = pubkey
+
+        return [raw_user.name for raw_user, _ in added]
+
+    @observed_mutation("user.rm")
     def rm(
             self, username: str, with_pubkeys=True,
             force: bool = False
     ) -> None:
-        try:
-            user, raw_users = self._get_w_raw_set(username)
+        def op(raw_users: SshRawUsers) -> bool:
+            try:
+                del raw_users.ssh_users[username]
+            except KeyError as e:
+                raise SshUsersRepoKeyAccessError(
+                    f"No such user: '{username}'. Can't be removed.") from e
+            return True
 
+        try:
+            user = self[username]
             if with_pubkeys:
                 user.pubkeys.rm_all()
 
-            # Should exist as we successfully retrieved the user.
-            del raw_users.ssh_users[username]
-            self._dump_raw(raw_users)
+            self._mutator.mutate(op)
         except (SshUsersRepoFileAccessError, SshUsersRepoKeyAccessError):
             if not force:
                 raise  # re-raise
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
@@ -54,12 +55,34 @@ class SshAuthDirAuthOnSubDirLayout(SshAuthDirSubDirLayout):
         )
 
 
+@dataclass
+class SshAuthDirEntityDirsLayout:
+    """Each user, group and *device user* authorization in its own file
+        under a `<file stem><suffix>` dir (e.g.: `users.d/my-user.json`).
+    """
+    suffix: str
+
+    @classmethod
+    def mk_default(cls) -> 'SshAuthDirEntityDirsLayout':
+        return cls(
+            suffix=".d"
+        )
+
+
 @dataclass
 class SshAuthDirLayout:
     users: SshAuthDirUsersFileLayout
     groups: SshAuthDirGroupsFileLayout
     device_state_always: SshAuthDirAuthAlwaysFileLayout
     auth_on: SshAuthDirAuthOnSubDirLayout
+    # `None` when all entities live in their file.
+    entity_dirs: Optional[SshAuthDirEntityDirsLayout] = None
+
+    @property
+    def entity_dir_suffix(self) -> Optional[str]:
+        if self.entity_dirs is None:
+            return None
+        return self.entity_dirs.suffix
 
     @classmethod
     def mk_default(cls) -> 'SshAuthDirLayout':
@@ -69,3 +92,9 @@ class SshAuthDirLayout:
             device_state_always=SshAuthDirAuthAlwaysFileLayout.mk_default(),
             auth_on=SshAuthDirAuthOnSubDirLayout.mk_default()
         )
+
+    @classmethod
+    def mk_entity_dirs(cls) -> 'SshAuthDirLayout':
+        out = cls.mk_default()
+        out.entity_dirs = SshAuthDirEntityDirsLayout.mk_default()
+        return out
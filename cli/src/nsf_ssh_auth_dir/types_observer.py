@@ -0,0 +1,158 @@
+"""Structured events emitted by the repository layer.
+
+Hot paths only time and build events when the observer is `enabled`
+which the no-op default observer is not.
+"""
+import functools
+import inspect
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, TypeVar, cast
+
+
+@dataclass(frozen=True)
+class SshAuthDirRepoEvent(ABC):
+    # Wall time in seconds.
+    duration: float
+
+    @property
+    @abstractmethod
+    def kind(self) -> str:
+        pass
+
+
+@dataclass(frozen=True)
+class SshAuthDirFileLoadEvent(SshAuthDirRepoEvent):
+    """A file's raw content was read."""
+    filename: Path
+    nbytes: int
+
+    @property
+    def kind(self) -> str:
+        return "file-load"
+
+
+@dataclass(frozen=True)
+class SshAuthDirFileParseEvent(SshAuthDirRepoEvent):
+    """A file's raw content was parsed to a plain dict."""
+    filename: Path
+
+    @property
+    def kind(self) -> str:
+        return "file-parse"
+
+
+@dataclass(frozen=True)
+class SshAuthDirFileDumpEvent(SshAuthDirRepoEvent):
+    filename: Path
+    nbytes: int
+
+    @property
+    def kind(self) -> str:
+        return "file-dump"
+
+
+@dataclass(frozen=True)
+class SshAuthDirPubkeyResolutionEvent(SshAuthDirRepoEvent):
+    username: str
+    # `None` when not found.
+    filename: Optional[Path]
+    # The number of candidate locations probed.
+    probes: int
+
+    @property
+    def kind(self) -> str:
+        return "pubkey-resolution"
+
+
+@dataclass(frozen=True)
+class SshAuthDirMutationEvent(SshAuthDirRepoEvent):
+    """A successful mutating operation (e.g.: `user.add`)."""
+    op: str
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def kind(self) -> str:
+        return "mutation"
+
+
+class SshAuthDirRepoObserver(ABC):
+    # Whether events should be built at all.
+    enabled = True
+
+    @abstractmethod
+    def on_event(self, event: SshAuthDirRepoEvent) -> None:
+        pass
+
+
+class SshAuthDirRepoNoopObserver(SshAuthDirRepoObserver):
+    enabled = False
+
+    def on_event(self, event: SshAuthDirRepoEvent) -> None:
+        pass
+
+
+NOOP_OBSERVER = SshAuthDirRepoNoopObserver()
+
+
+def get_observer_clock() -> float:
+    return time.perf_counter()
+
+
+_FnT = TypeVar("_FnT", bound=Callable[..., Any])
+
+# Per thread count of actual content changes (see `record_mutation_change`).
+_LOCAL = threading.local()
+
+
+def _get_mutation_changes() -> int:
+    return getattr(_LOCAL, "changes", 0)
+
+
+def record_mutation_change() -> None:
+    """Tell the `observed_mutation` methods being run that they actually
+        changed some file's content.
+    """
+    _LOCAL.changes = _get_mutation_changes() + 1
+
+
+def observed_mutation(op: str) -> Callable[[_FnT], _FnT]:
+    """Emit a `SshAuthDirMutationEvent` whenever the decorated method
+        succeeds and actually changed some content (e.g.: not when
+        ensuring an already existing group).
+
+    The decorated method's object should have an `_observer` attribute.
+    Event attributes are the method's arguments merged with the
+    object's optional `_observed_attrs` (e.g.: the group a member is
+    added to).
+    """
+    def decorator(fn: _FnT) -> _FnT:
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+            observer: SshAuthDirRepoObserver = self._observer
+            if not observer.enabled:
+                return fn(self, *args, **kwargs)
+
+            changes = _get_mutation_changes()
+            start = get_observer_clock()
+            out = fn(self, *args, **kwargs)
+            duration = get_observer_clock() - start
+            if _get_mutation_changes() == changes:
+                return out
+
+            bound = sig.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            attrs = dict(getattr(self, "_observed_attrs", {}))
+            attrs.update(
+                (k, v) for k, v in bound.arguments.items() if "self" != k)
+            observer.on_event(SshAuthDirMutationEvent(duration, op, attrs))
+            return out
+
+        return cast(_FnT, wrapper)
+
+    return decorator
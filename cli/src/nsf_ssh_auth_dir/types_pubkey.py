@@ -1,5 +1,6 @@
+import io
 from dataclasses import dataclass
-from typing import List, Optional, Iterable
+from typing import List, Optional, Iterable, Tuple
 from pathlib import Path
 
 
@@ -22,8 +23,60 @@ class SshPubKeyLookupInfoOpt:
     file: Optional[Path]
 
 
-@dataclass
 class SshPubKey:
+    """The content of an ssh pubkey file.
+
+    Either of its raw `content` or its `text_lines` is computed from the
+    other on first access only. Pubkeys loaded from files (see
+    `load_ssh_pubkey`) are thus copied to outputs (see `repo_compile`)
+    without ever being decoded.
+    """
     # IDEA: Type (rsa, etc).
-    # Line of the ssh pubkey file including line jump.
-    text_lines: List[str]
+    __slots__ = ("_content", "_text_lines")
+
+    def __init__(
+            self,
+            text_lines: Optional[List[str]] = None,
+            content: Optional[bytes] = None
+    ) -> None:
+        assert (text_lines is None) != (content is None)
+        self._text_lines = text_lines
+        self._content = content
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> 'SshPubKey':
+        return cls(content=content)
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            assert self._text_lines is not None
+            self._content = "".join(self._text_lines).encode()
+        return self._content
+
+    @property
+    def text_lines(self) -> List[str]:
+        """Lines of the ssh pubkey file including line jump.
+
+        Universal newlines, as when reading the file in text mode.
+        """
+        if self._text_lines is None:
+            assert self._content is not None
+            self._text_lines = list(io.StringIO(
+                self._content.decode(), newline=None))
+        return self._text_lines
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, SshPubKey):
+            return NotImplemented
+        return self.text_lines == other.text_lines
+
+    def __repr__(self) -> str:
+        return f"SshPubKey(text_lines={self.text_lines!r})"
+
+    def __getstate__(self) -> Tuple[bytes]:
+        return (self.content,)
+
+    def __setstate__(self, state: Tuple[bytes]) -> None:
+        self._content, = state
+        self._text_lines = None
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Dict, Any, Iterable, Optional
+from typing import Dict, Any, Iterable, MutableMapping, Optional
 from pathlib import Path
 
 SshPlainUserDefaultsT = Dict[str, Any]
@@ -31,7 +31,8 @@ class SshRawUser:
 class SshRawUsers:
     plain: SshPlainUsersT
     ssh_user_defaults: Optional[SshRawUserDefaults]
-    ssh_users: Dict[str, SshRawUser]
+    # Entries might only get parsed on access (see `parse_ssh_users`).
+    ssh_users: MutableMapping[str, SshRawUser]
 
     @classmethod
     def mk_empty(cls) -> 'SshRawUsers':
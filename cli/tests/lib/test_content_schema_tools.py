@@ -0,0 +1,58 @@
+import pytest
+
+from nsf_ssh_auth_dir._content_schema_tools import (ListOf, MapOf, Object,
+                                                    OfType, Opt,
+                                                    SchemaValidator)
+from nsf_ssh_auth_dir.file_auth import SshAuthFileFormatError, parse_ssh_auth
+from nsf_ssh_auth_dir.file_users import (SshUsersFileFormatError,
+                                         parse_ssh_users,
+                                         validate_plain_ssh_users)
+
+
+def test_schema_validator_collects_all_errors() -> None:
+    validator = SchemaValidator(Object({
+        "name": OfType(str),
+        "tags": Opt(ListOf(OfType(str))),
+        "items": Opt(MapOf(Object({"size": Opt(OfType(int))}))),
+    }))
+    assert [] == validator.iter_errors({"name": "a", "tags": None})
+    assert [
+        "$['name']: not in expected type set {str} but instead was found "
+        "to be of type 'NoneType'.",
+        "$['tags'][1]: not in expected type set {str} but instead was "
+        "found to be of type 'int'.",
+        "$['items']['b']['size']: not in expected type set {int, NoneType} "
+        "but instead was found to be of type 'str'.",
+        "$['items']['c']: not in expected type set {dict} but instead was "
+        "found to be of type 'list'.",
+    ] == validator.iter_errors({
+        "tags": ["x", 1],
+        "items": {"a": {"size": 1}, "b": {"size": "1"}, "c": []},
+    })
+
+
+def test_file_schemas() -> None:
+    plain = {
+        "ssh-user-defaults": {"pubkey-file-search-path": ["./a", "./b"]},
+        "ssh-users": {
+            "my-user-a": {"pubkey-file": "./a.pub"},
+            "my-user-b": {"pubkey-file": 1},
+            "my-user-c": {"pubkey-file-template": ["a"]},
+        },
+    }
+    # Users are only validated on access.
+    users = parse_ssh_users(plain).ssh_users
+    assert "a.pub" == str(users["my-user-a"].pubkey_file)
+    with pytest.raises(SshUsersFileFormatError, match=r"\['my-user-b'\]"):
+        users["my-user-b"]
+
+    with pytest.raises(SshUsersFileFormatError) as e:
+        validate_plain_ssh_users(plain)
+    assert str(e.value).startswith("2 errors:")
+
+    with pytest.raises(
+            SshAuthFileFormatError,
+            match=r"\$\['device-users'\]\['du'\]\['ssh-users'\]\[0\]"):
+        parse_ssh_auth({"device-users": {"du": {"ssh-users": [1]}}})
+    assert {"a"} == parse_ssh_auth({"device-users": {
+        "du": {"ssh-users": ["a", "a"]}}}).device_users["du"].ssh_users
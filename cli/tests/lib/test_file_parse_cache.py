@@ -0,0 +1,63 @@
+import os
+from pathlib import Path
+
+from nsf_ssh_auth_dir.file_parse_cache import SshAuthDirParseCache
+from nsf_ssh_auth_dir.policy_repo import SshAuthDirRepoDefaultPolicy
+from nsf_ssh_auth_dir.repo import SshAuthDirRepo, mk_ssh_auth_dir_repo
+
+
+def _age_files(dir: Path) -> None:
+    """Past the window within which files are not cached."""
+    for fn in dir.rglob("*.json"):
+        os.utime(fn, (1, 1))
+
+
+def _mk_repo(dir: Path, cache: SshAuthDirParseCache) -> SshAuthDirRepo:
+    return mk_ssh_auth_dir_repo(
+        dir, policy=SshAuthDirRepoDefaultPolicy(parse_cache=cache))
+
+
+def test_parse_cache_hits_and_invalidation(
+        tmp_case2_dir: Path, tmp_path: Path) -> None:
+    cache = SshAuthDirParseCache(tmp_path.joinpath("cache"))
+    repo = _mk_repo(tmp_case2_dir, cache)
+
+    # Recently modified files are never cached.
+    os.utime(tmp_case2_dir.joinpath("users.json"))
+    repo.users.load_raw()
+    assert (0, 1, 0) == (cache.hits, cache.misses, cache.stats().entries)
+
+    _age_files(tmp_case2_dir)
+    expected = list(repo.users.load_raw().ssh_users)
+    groups = repo.groups.load_raw().ssh_groups["my-group-1"].members
+    assert (0, 3, 2) == (cache.hits, cache.misses, cache.stats().entries)
+    assert expected == list(repo.users.load_raw().ssh_users)
+    assert groups == repo.groups.load_raw().ssh_groups["my-group-1"].members
+    assert 2 == cache.hits
+
+    # Any change to the file is a miss.
+    repo.users.add("my-user-x")
+    assert expected + ["my-user-x"] == list(repo.users.load_raw().ssh_users)
+    _age_files(tmp_case2_dir)
+    repo.users.load_raw()
+    assert expected + ["my-user-x"] == list(repo.users.load_raw().ssh_users)
+
+    # Transactions read their own pending changes.
+    with repo.transaction():
+        repo.users.add("my-user-y")
+        assert "my-user-y" in repo.users.load_raw().ssh_users
+
+    assert 2 == cache.clear()
+    assert 0 == cache.stats().entries
+
+
+def test_parse_cache_eviction(tmp_case2_dir: Path, tmp_path: Path) -> None:
+    cache = SshAuthDirParseCache(tmp_path.joinpath("cache"), max_bytes=1)
+    repo = _mk_repo(tmp_case2_dir, cache)
+    _age_files(tmp_case2_dir)
+    repo.users.load_raw()
+    repo.groups.load_raw()
+    # Only the most recently written entry is kept.
+    assert 1 == cache.stats().entries
+    repo.groups.load_raw()
+    assert 1 == cache.hits
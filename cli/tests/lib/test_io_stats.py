@@ -0,0 +1,30 @@
+from pathlib import Path
+
+from nsf_ssh_auth_dir._io_stats import (disable_io_stats, enable_io_stats,
+                                        get_io_stats)
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+
+
+def test_io_stats_case_2(tmp_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    assert get_io_stats() is None
+
+    stats = enable_io_stats()
+    try:
+        repo.users["my-user-a"].pubkeys.selected
+        repo.groups.add("my-group-4")
+    finally:
+        disable_io_stats()
+
+    users_fn = str(tmp_case2_dir.joinpath("users.json"))
+    groups_fn = str(tmp_case2_dir.joinpath("groups.json"))
+    assert stats.parses[users_fn] >= 1
+    assert stats.dumps == {groups_fn: 1}
+    assert stats.bytes_written > 0
+    assert stats.stat_calls == 1
+    assert set(stats.phase_times) == {
+        "read", "parse", "dump", "pubkey-lookup", "pubkey-read"}
+
+    # Nothing is recorded once disabled.
+    repo.users["my-user-b"]
+    assert stats.stat_calls == 1
@@ -0,0 +1,89 @@
+from pathlib import Path
+
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_access import (SshAccessEntry, SshAccessResolver,
+                                          diff_ssh_access)
+from nsf_ssh_auth_dir.repo_access_bitset import SshAccessBitsetResolver
+
+
+def test_resolve_access_case_2(tmp_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    snapshot = repo.load_snapshot()
+    resolver = SshAccessResolver()
+
+    access = resolver.resolve_device_user(
+        snapshot, "my-device-user-d", ["my-state-s3", "my-state-s1"])
+    assert access == {
+        # The `""` device user applies to all device users.
+        SshAccessEntry("my-ssh-user-e", "my-device-user-d", None),
+        SshAccessEntry("my-user-a", "my-device-user-d", "my-state-s1"),
+        # `s1` has precedence over `s3`.
+        SshAccessEntry("my-user-b", "my-device-user-d", "my-state-s1"),
+        SshAccessEntry("my-user-c", "my-device-user-d", "my-state-s3"),
+        SshAccessEntry("my-ssh-user-d", "my-device-user-d", "my-state-s3"),
+    }
+
+    always = resolver.resolve(snapshot, [])
+    assert SshAccessEntry("my-user-b", "my-device-user-c", None) in always
+    assert not any(e.state is not None for e in always)
+
+
+def test_access_diff_case_2(tmp_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    resolver = SshAccessResolver()
+    access_a = resolver.resolve(repo.load_snapshot())
+    n_device_users = resolver.stats.resolved
+
+    repo.groups["my-group-2"].add_member_by_id("my-user-d")
+    access_b = resolver.resolve(repo.load_snapshot())
+
+    assert diff_ssh_access(access_a, access_b) == (
+        [
+            SshAccessEntry("my-user-d", "my-device-user-c", None),
+            SshAccessEntry("my-user-d", "my-device-user-d", "my-state-s3"),
+        ],
+        [])
+
+    # Only device users depending on the changed group were re-resolved.
+    assert resolver.stats.resolved == n_device_users + 2
+
+
+def test_bitset_resolver_same_as_sets_case_2(tmp_case2_dir: Path) -> None:
+    snapshot = mk_ssh_auth_dir_repo(tmp_case2_dir).load_snapshot()
+    sets = SshAccessResolver()
+    bitsets = SshAccessBitsetResolver()
+
+    states = ["my-state-s3", "my-state-s1"]
+    for du_name in snapshot.device_users_names:
+        assert bitsets.resolve_device_user(snapshot, du_name, states) \
+            == sets.resolve_device_user(snapshot, du_name, states)
+    assert bitsets.resolve(snapshot) == sets.resolve(snapshot)
+    assert bitsets.resolve(snapshot, []) == sets.resolve(snapshot, [])
+
+    names = bitsets.resolve_users_names(snapshot)
+    assert {
+        (du, u) for du, us in names.items() for u in us
+    } == {(e.device_user, e.ssh_user) for e in sets.resolve(snapshot)}
+
+
+def test_resolve_all_states_subsets_shares_prefixes(
+        tmp_case2_dir: Path) -> None:
+    snapshot = mk_ssh_auth_dir_repo(tmp_case2_dir).load_snapshot()
+    states = snapshot.state_names
+    subsets = [
+        [s for i, s in enumerate(states) if mask >> i & 1]
+        for mask in range(1 << len(states))]
+    assert 3 <= len(states)
+
+    resolver = SshAccessResolver()
+    # Evicts everything but the last merged prefix.
+    uncached = SshAccessResolver(max_merged_entries=0)
+    du_name = "my-device-user-d"
+    for on_states in reversed(subsets):
+        assert resolver.resolve_device_user(snapshot, du_name, on_states) \
+            == uncached.resolve_device_user(snapshot, du_name, on_states)
+
+    # Each state combination is merged at most once, from its longest
+    # prefix (always + the combination).
+    assert resolver.stats.merged <= len(subsets) + 1
+    assert uncached.stats.merged > resolver.stats.merged
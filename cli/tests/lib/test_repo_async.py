@@ -0,0 +1,70 @@
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_access import SshAccessEntry
+from nsf_ssh_auth_dir.repo_async import AsyncSshAuthDirRepo
+from nsf_ssh_auth_dir.repo_groups import SshGroupsRepoAccessError
+
+
+def test_async_repo_case_2(tmp_case2_dir: Path) -> None:
+    async def run() -> None:
+        async with AsyncSshAuthDirRepo(
+                mk_ssh_auth_dir_repo(tmp_case2_dir)) as arepo:
+            # Concurrent loads of a same file share a single read.
+            names = await asyncio.gather(
+                *(arepo.get_users_names() for _ in range(8)))
+            assert 1 == arepo.loads
+            assert all(n == names[0] for n in names)
+            assert "my-user-a" in names[0]
+
+            # Concurrent writers to a same file do not lose updates.
+            await asyncio.gather(*(
+                arepo.authorize_user("my-device-user-x", u)
+                for u in ["my-user-a", "my-user-b", "my-user-c"]))
+            raw_auth = await arepo.load_raw_auth()
+            assert raw_auth.device_users["my-device-user-x"].ssh_users == {
+                "my-user-a", "my-user-b", "my-user-c"}
+
+            access = await arepo.resolve_access([])
+            assert SshAccessEntry(
+                "my-user-b", "my-device-user-x", None) in access
+
+    asyncio.run(run())
+
+
+def test_async_repo_groups_file(tmp_case1_dir: Path) -> None:
+    async def run() -> None:
+        async with AsyncSshAuthDirRepo(
+                mk_ssh_auth_dir_repo(tmp_case1_dir)) as arepo:
+            # Group management is optional.
+            assert set() == await arepo.get_groups_names()
+
+            # Invalid files are not missing ones.
+            tmp_case1_dir.joinpath("groups.json").write_text("{ not json")
+            with pytest.raises(SshGroupsRepoAccessError):
+                await arepo.get_groups_names()
+
+    asyncio.run(run())
+
+
+def test_async_repo_aclose_does_not_block_loop(tmp_case1_dir: Path) -> None:
+    async def run() -> None:
+        arepo = AsyncSshAuthDirRepo(mk_ssh_auth_dir_repo(tmp_case1_dir))
+        done = threading.Event()
+        job = asyncio.ensure_future(
+            arepo.commit(lambda r: done.wait(5), []))
+        await asyncio.sleep(0)
+
+        closing = asyncio.ensure_future(arepo.aclose())
+        await asyncio.sleep(0.05)
+        # Still waiting for the pending job, the loop running meanwhile.
+        assert not closing.done()
+        done.set()
+        await closing
+        assert await job
+
+    asyncio.run(run())
@@ -0,0 +1,81 @@
+from pathlib import Path
+
+import pytest
+
+from nsf_ssh_auth_dir.file_pubkey import get_ssh_pubkey_fingerprint
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_change_feed import (CHANGE_FEED_DIRNAME,
+                                               SshAuthDirChangeFeedObserver,
+                                               iter_ssh_auth_dir_changes)
+
+
+def test_change_feed_records_mutations(tmp_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(
+        tmp_case2_dir,
+        observer=SshAuthDirChangeFeedObserver(tmp_case2_dir))
+    pubkey = repo.users["my-user-a"].pubkey_default
+    repo.users.add("my-user-x", pubkey)
+    repo.groups["my-group-1"].add_member_by_id("my-user-x")
+    repo.auth.on("my-state-s1").device_users.ensure(
+        "my-device-user-d").authorize_user_by_id("my-user-x")
+
+    with pytest.raises(RuntimeError):
+        with repo.transaction():
+            repo.groups.add("my-group-x")
+            raise RuntimeError()
+
+    records = list(iter_ssh_auth_dir_changes(tmp_case2_dir))
+    assert [1, 2, 3, 4] == [r["seq"] for r in records]
+    # The *device user* already existed, its `ensure` changing nothing.
+    assert [
+        "user.pubkey.set-default", "user.add", "group.member.add",
+        "auth.user.authorize",
+    ] == [r["op"] for r in records]
+    assert {"fingerprint": get_ssh_pubkey_fingerprint(pubkey)} \
+        == records[1]["attrs"]["pubkey"]
+    assert {"device-user": "my-device-user-d", "state": "my-state-s1",
+            "user_id": "my-user-x", "force": False} == records[3]["attrs"]
+
+    # Another process' observer carries on the sequence.
+    repo = mk_ssh_auth_dir_repo(
+        tmp_case2_dir,
+        observer=SshAuthDirChangeFeedObserver(tmp_case2_dir))
+    with repo.transaction():
+        repo.groups.add("my-group-y")
+        repo.groups.add("my-group-z")
+    assert [(5, "group.add"), (6, "group.add")] == [
+        (r["seq"], r["op"])
+        for r in iter_ssh_auth_dir_changes(tmp_case2_dir, since=4)]
+
+
+def test_change_feed_skips_noop_mutations(tmp_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(
+        tmp_case2_dir,
+        observer=SshAuthDirChangeFeedObserver(tmp_case2_dir))
+    repo.groups.ensure("my-group-x")
+    repo.groups.ensure("my-group-x")
+    repo.groups["my-group-1"].add_member_by_id("my-user-a", force=True)
+    repo.auth.always.device_users["my-device-user-d"].deauthorize_user_by_id(
+        "my-user-q", force=True)
+
+    assert [(1, "group.add")] == [
+        (r["seq"], r["op"]) for r in iter_ssh_auth_dir_changes(tmp_case2_dir)]
+
+
+def test_change_feed_rotation(tmp_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(
+        tmp_case2_dir,
+        observer=SshAuthDirChangeFeedObserver(
+            tmp_case2_dir, max_bytes=1, max_files=2))
+    for i in range(5):
+        repo.groups.add(f"my-group-x{i}")
+
+    feed_dir = tmp_case2_dir.joinpath(CHANGE_FEED_DIRNAME)
+    assert [
+        "changes.000000000003.ndjson", "changes.000000000004.ndjson",
+        "changes.ndjson",
+    ] == sorted(fn.name for fn in feed_dir.iterdir())
+    assert [3, 4, 5] == [
+        r["seq"] for r in iter_ssh_auth_dir_changes(tmp_case2_dir)]
+    assert [5] == [
+        r["seq"] for r in iter_ssh_auth_dir_changes(tmp_case2_dir, 4)]
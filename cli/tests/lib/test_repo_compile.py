@@ -0,0 +1,80 @@
+from pathlib import Path
+
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_compile import (SshPubkeyContentCache,
+                                           compile_many_ssh_auth_dirs,
+                                           compile_ssh_auth_dir,
+                                           compile_ssh_auth_dir_parts,
+                                           dump_compiled_authorized_keys,
+                                           iter_ssh_auth_dirs)
+
+
+def test_compile_case_1(tmp_case1_dir: Path) -> None:
+    cache = SshPubkeyContentCache()
+    compiled = compile_ssh_auth_dir(
+        mk_ssh_auth_dir_repo(tmp_case1_dir), pubkey_cache=cache)
+    pk_b = tmp_case1_dir.joinpath("public-keys/my-user-b.pub").read_text()
+    assert sorted(compiled.keys()) == [
+        "my-device-user-a", "my-device-user-b", "my-device-user-c"]
+    assert compiled["my-device-user-c"].strip() == pk_b.strip()
+    # A pubkey shared by 2 *device users* is loaded once.
+    assert 2 == cache.loaded
+
+
+def test_compile_parts_and_dump(tmp_case1_dir: Path, tmp_path: Path) -> None:
+    pk_b_fn = tmp_case1_dir.joinpath("public-keys/my-user-b.pub")
+    pk_b_fn.write_bytes(b"ssh-ed25519 AAAA b@host\r\n# no newline")
+    repo = mk_ssh_auth_dir_repo(tmp_case1_dir)
+    parts = compile_ssh_auth_dir_parts(repo)
+    # Newlines normalized and terminated.
+    assert [b"ssh-ed25519 AAAA b@host\n# no newline\n"] \
+        == parts["my-device-user-c"]
+    assert {k: b"".join(v).decode() for k, v in parts.items()} \
+        == compile_ssh_auth_dir(repo)
+
+    filenames = dump_compiled_authorized_keys(tmp_path, parts)
+    assert [fn.name for fn in filenames] == [
+        "my-device-user-a.authorized_keys",
+        "my-device-user-b.authorized_keys",
+        "my-device-user-c.authorized_keys"]
+    assert b"".join(parts["my-device-user-a"]) == filenames[0].read_bytes()
+
+
+def test_compile_many(
+        tmp_case1_dir: Path, tmp_case2_dir: Path, tmp_path: Path) -> None:
+    root = tmp_path.joinpath("root")
+    root.joinpath("a").mkdir(parents=True)
+    tmp_case1_dir.rename(root.joinpath("a/device-ssh"))
+    tmp_case2_dir.rename(root.joinpath("b"))
+    dirs = list(iter_ssh_auth_dirs(root))
+    assert dirs == [root.joinpath("a/device-ssh"), root.joinpath("b")]
+
+    seq = list(compile_many_ssh_auth_dirs(dirs, jobs=1))
+    par = list(compile_many_ssh_auth_dirs(dirs, jobs=2))
+    # Deterministic whatever the number of jobs.
+    assert [r[:3] for r in seq] == [r[:3] for r in par]
+    # Partial failures are reported, not raised. The case 2 dir
+    # authorizes a user which does not exist.
+    assert seq[0].error is None and seq[0].authorized_keys
+    assert seq[1].authorized_keys is None
+    assert "my-ssh-user-e" in str(seq[1].error)
+
+
+def test_iter_ssh_auth_dirs_w_entity_dirs(
+        tmp_case1_dir: Path, tmp_path: Path) -> None:
+    root = tmp_path.joinpath("root")
+    root.mkdir()
+    tmp_case1_dir.rename(root.joinpath("a"))
+    # Only a users entity dir.
+    root.joinpath("b/users.d").mkdir(parents=True)
+    root.joinpath("b/users.d/my-user-z.json").write_text("{}")
+    root.joinpath("c/groups.d").mkdir(parents=True)
+    assert list(iter_ssh_auth_dirs(root)) \
+        == [root.joinpath("a"), root.joinpath("b")]
+
+
+def test_compile_many_invalid_file(tmp_case1_dir: Path) -> None:
+    tmp_case1_dir.joinpath("groups.json").write_text("{ not json")
+    [result] = compile_many_ssh_auth_dirs([tmp_case1_dir], jobs=1)
+    assert result.authorized_keys is None
+    assert "Not a valid json file" in str(result.error)
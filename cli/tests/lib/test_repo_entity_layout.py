@@ -0,0 +1,92 @@
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import pytest
+
+from nsf_ssh_auth_dir.repo import SshAuthDirRepo, mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_hash import compute_ssh_auth_dir_hash
+from nsf_ssh_auth_dir.repo_layout import convert_ssh_auth_dir_layout
+from nsf_ssh_auth_dir.repo_users import SshUsersRepoAccessError
+from nsf_ssh_auth_dir.types_layout import SshAuthDirLayout
+
+
+def _load_all(repo: SshAuthDirRepo) -> Tuple[Any, Any, Dict[Optional[str], Any]]:
+    return (
+        repo.users.load_raw(),
+        repo.groups.load_raw(),
+        {a.state_name: a.device_users.load_raw() for a in repo.auth.all}
+    )
+
+
+def _zero_mtimes(dir: Path) -> None:
+    for fn in dir.iterdir():
+        os.utime(fn, ns=(0, 0))
+
+
+def _changed(dir: Path) -> set:
+    return {fn.name for fn in dir.iterdir() if 0 != fn.stat().st_mtime_ns}
+
+
+def test_entity_layout_convert_round_trip(tmp_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    assert repo.layout.entity_dirs is None
+    expected = _load_all(repo)
+
+    e_repo = convert_ssh_auth_dir_layout(
+        repo, SshAuthDirLayout.mk_entity_dirs())
+    assert tmp_case2_dir.joinpath("users.d/my-user-a.json").exists()
+    assert tmp_case2_dir.joinpath("authorized-always.d/[ALL].json").exists()
+    assert tmp_case2_dir.joinpath(
+        "authorized-on/my-state-s1.d").is_dir()
+    assert _load_all(e_repo) == expected
+    # Detected.
+    assert mk_ssh_auth_dir_repo(tmp_case2_dir).layout == e_repo.layout
+
+    repo = convert_ssh_auth_dir_layout(e_repo, SshAuthDirLayout.mk_default())
+    assert not tmp_case2_dir.joinpath("users.d").exists()
+    assert not tmp_case2_dir.joinpath("authorized-on/my-state-s1.d").exists()
+    assert _load_all(repo) == expected
+    assert mk_ssh_auth_dir_repo(tmp_case2_dir).layout.entity_dirs is None
+
+
+def test_entity_layout_edit_rewrites_entity_file_only(
+        tmp_case2_dir: Path) -> None:
+    repo = convert_ssh_auth_dir_layout(
+        mk_ssh_auth_dir_repo(tmp_case2_dir),
+        SshAuthDirLayout.mk_entity_dirs())
+    users_dir = tmp_case2_dir.joinpath("users.d")
+    groups_dir = tmp_case2_dir.joinpath("groups.d")
+    h1 = compute_ssh_auth_dir_hash(repo)
+    _zero_mtimes(users_dir)
+    _zero_mtimes(groups_dir)
+    _zero_mtimes(tmp_case2_dir)
+
+    repo.users.add("my-user-f")
+    assert {"my-user-f.json"} == _changed(users_dir)
+    assert set() == _changed(tmp_case2_dir) - {"users.d"}
+
+    repo.groups["my-group-3"].add_member_by_id("my-user-f")
+    assert {"my-group-3.json"} == _changed(groups_dir)
+    assert compute_ssh_auth_dir_hash(repo).digest != h1.digest
+
+    del repo.users["my-user-f"]
+    assert not users_dir.joinpath("my-user-f.json").exists()
+
+
+def test_entity_layout_lazy_names(tmp_case2_dir: Path) -> None:
+    repo = convert_ssh_auth_dir_layout(
+        mk_ssh_auth_dir_repo(tmp_case2_dir),
+        SshAuthDirLayout.mk_entity_dirs())
+    tmp_case2_dir.joinpath("users.d/my-user-b.json").write_text("{")
+
+    # Listing never parses entity files.
+    assert "my-user-b" in repo.users.names
+    with pytest.raises(SshUsersRepoAccessError):
+        repo.users.load_raw()
+
+    tmp_case2_dir.joinpath("users.d/my-user-b.json").write_text("{}")
+    tmp_case2_dir.joinpath("users.json").write_text(
+        '{"ssh-users": {"my-user-a": {}}}')
+    with pytest.raises(SshUsersRepoAccessError):
+        repo.users.load_raw()
@@ -0,0 +1,121 @@
+import hashlib
+import json
+from pathlib import Path
+
+import pytest
+
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_export import (SshAuthDirExportError,
+                                          dump_resolved_snapshot,
+                                          dumps_resolved_snapshot,
+                                          export_resolved_ssh_auth_dir,
+                                          list_resolved_snapshot_users)
+from nsf_ssh_auth_dir.repo_hash import compute_ssh_auth_dir_hash
+
+
+def _hash_listed_files(dir: Path, plain) -> str:
+    """What `nix-lib/resolved.nix` checks the snapshot against."""
+    h = hashlib.sha256()
+    for e in plain["content-hash"]["files"]:
+        digest = hashlib.sha256(
+            dir.joinpath(e["path"]).read_bytes()).hexdigest()
+        h.update(f"{e['kind']} {e['path']} {digest}\n".encode())
+    return h.hexdigest()
+
+
+def _entity_dirs_up_to_date(dir: Path, plain) -> bool:
+    """Whether the recorded entity dirs' listings are still the same,
+        as `nix-lib/resolved.nix` checks.
+    """
+    for e in plain["content-hash"]["entity-dirs"]:
+        entity_dir = dir.joinpath(e["path"])
+        names = sorted(p.name for p in entity_dir.iterdir()) \
+            if entity_dir.exists() else None
+        if names != e["names"]:
+            return False
+    return True
+
+
+def test_export_resolved_case_1(tmp_case1_dir: Path, tmp_path: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case1_dir)
+    plain = export_resolved_ssh_auth_dir(repo)
+
+    pk_b = tmp_case1_dir.joinpath("public-keys/my-user-b.pub").read_text()
+    assert {"file": "public-keys/my-user-b.pub", "content": pk_b} \
+        == plain["ssh-users"]["my-user-b"]["pubkey"]
+    assert list_resolved_snapshot_users(plain) == {
+        "my-device-user-a": ["my-user-a"],
+        "my-device-user-b": ["my-user-b"],
+        "my-device-user-c": ["my-user-b"]}
+    assert ["users.json"] == plain["srcs"]["users"]["files"]
+
+    digest = plain["content-hash"]["digest"]
+    assert compute_ssh_auth_dir_hash(repo).digest == digest
+    assert _hash_listed_files(tmp_case1_dir, plain) == digest
+
+    # Canonical.
+    assert dumps_resolved_snapshot(export_resolved_ssh_auth_dir(repo)) \
+        == dumps_resolved_snapshot(plain)
+    out_fn = tmp_path.joinpath("resolved.json")
+    dump_resolved_snapshot(plain, out_fn)
+    assert plain == json.loads(out_fn.read_text())
+
+    # Stale once any of the sources change.
+    tmp_case1_dir.joinpath("public-keys/my-user-b.pub").write_text("changed")
+    assert _hash_listed_files(tmp_case1_dir, plain) != digest
+
+
+def test_export_resolved_entity_dirs(tmp_case1_dir: Path) -> None:
+    # Entity dirs are recorded even when missing, the default layout
+    # not having any.
+    plain = export_resolved_ssh_auth_dir(mk_ssh_auth_dir_repo(tmp_case1_dir))
+    assert {"path": "users.d", "names": None} \
+        in plain["content-hash"]["entity-dirs"]
+    assert _entity_dirs_up_to_date(tmp_case1_dir, plain)
+
+    # Added files are not among the hashed ones but change the listing.
+    users_d = tmp_case1_dir.joinpath("users.d")
+    users_d.mkdir()
+    assert not _entity_dirs_up_to_date(tmp_case1_dir, plain)
+
+    plain = export_resolved_ssh_auth_dir(mk_ssh_auth_dir_repo(tmp_case1_dir))
+    assert _entity_dirs_up_to_date(tmp_case1_dir, plain)
+    digest = plain["content-hash"]["digest"]
+    users_d.joinpath("my-user-z.json").write_text("{}")
+    assert _hash_listed_files(tmp_case1_dir, plain) == digest
+    assert not _entity_dirs_up_to_date(tmp_case1_dir, plain)
+
+
+def test_export_resolved_states_and_groups(tmp_case1_dir: Path) -> None:
+    tmp_case1_dir.joinpath("groups.json").write_text(json.dumps({
+        "ssh-groups": {"my-group": {"members": ["my-user-d", "my-user-c"]}}}))
+    tmp_case1_dir.joinpath("authorized-on").mkdir()
+    tmp_case1_dir.joinpath("authorized-on/my-state.json").write_text(
+        json.dumps({"device-users": {"my-device-user-a": {
+            "ssh-users": ["my-user-e"], "ssh-groups": ["my-group"]}}}))
+
+    plain = export_resolved_ssh_auth_dir(mk_ssh_auth_dir_repo(tmp_case1_dir))
+    assert {"members": ["my-user-c", "my-user-d"]} \
+        == plain["ssh-groups"]["my-group"]
+    assert ["my-user-c", "my-user-d", "my-user-e"] == plain[
+        "device-users"]["authorized-on"]["my-state"][
+            "my-device-user-a"]["ssh-users"]
+    assert ["my-user-a", "my-user-c", "my-user-d", "my-user-e"] \
+        == list_resolved_snapshot_users(plain)["my-device-user-a"]
+    assert ["my-user-a"] == list_resolved_snapshot_users(
+        plain, [])["my-device-user-a"]
+    assert {"dir": "authorized-on", "stem": "my-state",
+            "files": ["authorized-on/my-state.json"]} \
+        == plain["srcs"]["authorized-on"]["my-state"]
+
+
+def test_export_resolved_unresolvable(tmp_case2_dir: Path) -> None:
+    # The case 2 dir authorizes a user which does not exist.
+    with pytest.raises(SshAuthDirExportError):
+        export_resolved_ssh_auth_dir(mk_ssh_auth_dir_repo(tmp_case2_dir))
+
+
+def test_export_resolved_invalid_auth_file(tmp_case1_dir: Path) -> None:
+    tmp_case1_dir.joinpath("authorized-always.json").write_text("{ not json")
+    with pytest.raises(SshAuthDirExportError):
+        export_resolved_ssh_auth_dir(mk_ssh_auth_dir_repo(tmp_case1_dir))
@@ -0,0 +1,53 @@
+import json
+from pathlib import Path
+
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_fleet import SshFleetIndex, SshFleetIndexEntry
+
+
+def test_fleet_index(
+        tmp_case1_dir: Path, tmp_case2_dir: Path, tmp_path: Path,
+        monkeypatch) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path.joinpath("cache")))
+    root = tmp_path.joinpath("root")
+    root.mkdir()
+    tmp_case1_dir.rename(root.joinpath("a"))
+    tmp_case2_dir.rename(root.joinpath("b"))
+
+    index = SshFleetIndex(root)
+    assert 2 == index.update().reindexed
+    index.save()
+    assert index.who("my-user-b") == [
+        SshFleetIndexEntry("a", None, "my-device-user-b", None),
+        SshFleetIndexEntry("a", None, "my-device-user-c", None),
+        SshFleetIndexEntry("b", None, "my-device-user-a", "my-group-1"),
+        SshFleetIndexEntry("b", None, "my-device-user-c", "my-group-2"),
+        SshFleetIndexEntry("b", "my-state-s1", "my-device-user-d", "my-group-1"),
+        SshFleetIndexEntry("b", "my-state-s3", "my-device-user-d", "my-group-2"),
+    ]
+
+    # Persisted and incrementally updated.
+    mk_ssh_auth_dir_repo(root.joinpath("a")).auth.always.device_users[
+        "my-device-user-c"].deauthorize_user_by_id("my-user-b")
+    index = SshFleetIndex(root)
+    stats = index.update()
+    assert (1, 1) == (stats.reindexed, stats.reused)
+    assert [e.dir for e in index.who("my-user-b")] == ["a"] + ["b"] * 4
+
+    # Non existing users authorized only as groups members are indexed.
+    groups_fn = root.joinpath("b/groups.json")
+    raw_groups = json.loads(groups_fn.read_text())
+    raw_groups["ssh-groups"]["my-group-1"]["members"].append("my-user-z")
+    groups_fn.write_text(json.dumps(raw_groups))
+    assert 1 == index.update().reindexed
+    assert SshFleetIndexEntry("b", None, "my-device-user-a", "my-group-1") \
+        in index.who("my-user-z")
+
+    # Invalid dirs are reported as failures, keeping their previous
+    # entries, the others still indexed.
+    root.joinpath("a/authorized-always.json").write_text("{ not json")
+    stats = index.update()
+    assert ["a"] == list(stats.failed)
+    assert 0 == stats.removed
+    assert ["a", "b"] == index.dirs
+    assert [e.dir for e in index.who("my-user-b")] == ["a"] + ["b"] * 4
@@ -0,0 +1,71 @@
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_git import SshAuthDirGitError, SshAuthDirGitRepo
+from nsf_ssh_auth_dir.types_layout import SshAuthDirLayout
+
+
+def _git(dir: Path, *args: str) -> None:
+    subprocess.run(
+        ["git", "-C", str(dir), "-c", "user.name=t", "-c", "user.email=t@t"]
+        + list(args), check=True, stdout=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def git_case2_dir(tmp_case2_dir: Path) -> Path:
+    # The *ssh auth dir* is a sub directory of the git repository.
+    _git(tmp_case2_dir.parent, "init", "-q")
+    _git(tmp_case2_dir.parent, "add", ".")
+    _git(tmp_case2_dir.parent, "commit", "-q", "-m", "init")
+    return tmp_case2_dir
+
+
+def test_git_changes_case_2(git_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(git_case2_dir)
+    git_repo = SshAuthDirGitRepo(repo)
+    assert list(git_repo.iter_changes()) == []
+
+    repo.groups["my-group-3"].add_member_by_id("my-user-d")
+    repo.auth.on("my-state-s2").device_users.add(
+        "root").authorize_user_by_id("my-user-a")
+    repo.users.rm("my-user-e", with_pubkeys=False)
+    git_case2_dir.joinpath("public-keys/my-user-c.pub").write_text("new")
+
+    descs = [c.description for c in git_repo.iter_changes()]
+    assert descs == [
+        "user 'my-user-e' removed",
+        "user 'my-user-d' added to group 'my-group-3'",
+        "user 'my-user-a' authorized to 'root' on state 'my-state-s2'",
+        "public key file 'public-keys/my-user-c.pub' changed",
+    ]
+
+    _git(git_case2_dir, "commit", "-q", "-a", "-m", "change")
+    assert list(git_repo.iter_changes()) == []
+    assert [
+        c.description for c in git_repo.iter_changes("HEAD~1", "HEAD")
+    ] == descs
+
+    snapshot = git_repo.load_snapshot("HEAD~1")
+    assert "my-user-e" in snapshot.users_names
+    assert snapshot.get_group_members_names("my-group-3") == ["my-user-c"]
+
+
+def test_git_changes_errors(git_case2_dir: Path) -> None:
+    git_repo = SshAuthDirGitRepo(mk_ssh_auth_dir_repo(git_case2_dir))
+    with pytest.raises(SshAuthDirGitError):
+        list(git_repo.iter_changes("does-not-exist"))
+
+    git_case2_dir.joinpath("groups.json").write_text(json.dumps([]))
+    with pytest.raises(SshAuthDirGitError):
+        list(git_repo.iter_changes())
+
+
+def test_git_entity_dirs_unsupported(git_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(
+        git_case2_dir, SshAuthDirLayout.mk_entity_dirs())
+    with pytest.raises(SshAuthDirGitError):
+        SshAuthDirGitRepo(repo)
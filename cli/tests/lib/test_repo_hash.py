@@ -0,0 +1,56 @@
+import os
+from pathlib import Path
+
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_hash import (HASH_KIND_PUBKEY,
+                                        SshAuthDirFileHashCache,
+                                        compute_ssh_auth_dir_hash)
+
+
+def test_hash_case_2(tmp_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    cache = SshAuthDirFileHashCache()
+
+    h1 = compute_ssh_auth_dir_hash(repo, cache)
+    assert [e.path for e in h1.entries if HASH_KIND_PUBKEY == e.kind] == [
+        "public-keys/my-user-a.pub", "public-keys/my-user-b.pub",
+        "public-keys/my-user-c.pub", "public-keys/my-user-d.pub"]
+    n_files = len(h1.entries)
+    assert cache.hashed == n_files
+
+    # Nothing changed, nothing rehashed.
+    assert compute_ssh_auth_dir_hash(repo, cache) == h1
+    assert cache.hashed == n_files
+
+    # A single file edit, a single file rehashed.
+    pk_fn = tmp_case2_dir.joinpath("public-keys/my-user-c.pub")
+    pk_fn.write_text("changed")
+    h2 = compute_ssh_auth_dir_hash(repo, cache)
+    assert h2.digest != h1.digest
+    assert cache.hashed == n_files + 1
+
+    # Same content, same digest whatever the cache.
+    assert compute_ssh_auth_dir_hash(repo) == h2
+
+    # Unreferenced files do not count.
+    tmp_case2_dir.joinpath("public-keys/unknown.pub").write_text("x")
+    assert compute_ssh_auth_dir_hash(repo, cache).digest == h2.digest
+
+
+def test_hash_persistent_cache(
+        tmp_case1_dir: Path, tmp_path: Path, monkeypatch) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path.joinpath("cache")))
+    repo = mk_ssh_auth_dir_repo(tmp_case1_dir)
+
+    cache = SshAuthDirFileHashCache.mk_persistent_for(repo.dir)
+    h1 = compute_ssh_auth_dir_hash(repo, cache)
+    cache.save()
+
+    cache = SshAuthDirFileHashCache.mk_persistent_for(repo.dir)
+    assert compute_ssh_auth_dir_hash(repo, cache) == h1
+    assert 0 == cache.hashed
+
+    users_fn = tmp_case1_dir.joinpath("users.json")
+    os.utime(users_fn, ns=(0, 0))
+    assert compute_ssh_auth_dir_hash(repo, cache) == h1
+    assert 1 == cache.hashed
@@ -0,0 +1,47 @@
+import base64
+from pathlib import Path
+
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_import import (IMPORT_STATUS_ADDED,
+                                          IMPORT_STATUS_DUPLICATE_KEY,
+                                          IMPORT_STATUS_EXISTING_USER,
+                                          IMPORT_STATUS_INVALID,
+                                          import_ssh_users,
+                                          iter_import_candidates)
+from nsf_ssh_auth_dir.repo_observer import SshAuthDirRepoTimingCollector
+
+
+def _mk_key_line(seed: int, comment: str) -> str:
+    blob = b"\x00\x00\x00\x0bssh-ed25519" + bytes([seed]) * 32
+    return f"ssh-ed25519 {base64.b64encode(blob).decode()} {comment}\n"
+
+
+def test_import_users(tmp_case1_dir: Path, tmp_path: Path) -> None:
+    pubs_dir = tmp_path.joinpath("pubs")
+    pubs_dir.mkdir()
+    pubs_dir.joinpath("alice.pub").write_text(_mk_key_line(1, "alice@a"))
+    pubs_dir.joinpath("bob.pub").write_text(_mk_key_line(1, "bob@b"))
+    ak_file = tmp_path.joinpath("authorized_keys")
+    ak_file.write_text(
+        "# Comment.\n"
+        + 'command="ls",no-pty ' + _mk_key_line(2, "carol@host")
+        + "not a key\n"
+        + _mk_key_line(3, "my-user-a@host"))
+
+    collector = SshAuthDirRepoTimingCollector()
+    repo = mk_ssh_auth_dir_repo(tmp_case1_dir, observer=collector)
+    results = import_ssh_users(
+        repo, iter_import_candidates([pubs_dir, ak_file]))
+
+    assert [(r.candidate.name, r.status) for r in results] == [
+        ("alice", IMPORT_STATUS_ADDED),
+        ("bob", IMPORT_STATUS_DUPLICATE_KEY),
+        ("carol", IMPORT_STATUS_ADDED),
+        (None, IMPORT_STATUS_INVALID),
+        ("my-user-a", IMPORT_STATUS_EXISTING_USER),
+    ]
+    # All users added with a single users file write.
+    assert 1 == collector["file-dump"].count
+    # Key options are dropped.
+    assert repo.users["carol"].pubkey_selected.text_lines == [
+        _mk_key_line(2, "carol@host")]
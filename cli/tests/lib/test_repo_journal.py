@@ -0,0 +1,144 @@
+import json
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from nsf_ssh_auth_dir import repo_journal
+from nsf_ssh_auth_dir.repo import SshAuthDirRepo, mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_journal import (JOURNAL_DIRNAME,
+                                           SshAuthDirJournalError,
+                                           recover_ssh_auth_dir_journals)
+
+
+def _read_all(dir: Path) -> Dict[str, bytes]:
+    return {
+        fn.relative_to(dir).as_posix(): fn.read_bytes()
+        for fn in dir.rglob("*")
+        if fn.is_file() and ".nsf-ssh-auth-dir" not in fn.parts
+    }
+
+
+def _rm_user_b(repo: SshAuthDirRepo) -> None:
+    repo.groups["my-group-1"].rm_member_by_id("my-user-b")
+    repo.groups["my-group-2"].rm_member_by_id("my-user-b")
+    repo.auth.always.device_users["my-device-user-d"].authorize_user_by_id(
+        "my-user-a")
+    repo.users.rm("my-user-b")
+
+
+def test_transaction_applies_all_changes_at_once(
+        tmp_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    before = _read_all(tmp_case2_dir)
+    with repo.transaction():
+        _rm_user_b(repo)
+        # Pending changes are visible to the transaction only.
+        assert "my-user-b" not in repo.users.names
+        assert before == _read_all(tmp_case2_dir)
+
+    assert "my-user-b" not in repo.users.names
+    assert "my-user-b" not in repo.groups["my-group-2"].members_names
+    assert not tmp_case2_dir.joinpath("public-keys/my-user-b.pub").exists()
+    assert not list(tmp_case2_dir.joinpath(JOURNAL_DIRNAME).iterdir())
+
+
+def test_transaction_discards_changes_on_error(tmp_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    before = _read_all(tmp_case2_dir)
+    with pytest.raises(RuntimeError):
+        with repo.transaction():
+            _rm_user_b(repo)
+            raise RuntimeError()
+
+    assert before == _read_all(tmp_case2_dir)
+    # Locks were released.
+    repo.users.add("my-user-x")
+
+
+@pytest.mark.parametrize("rollback", [False, True])
+def test_recover_interrupted_commit(
+        tmp_case2_dir: Path,
+        monkeypatch: pytest.MonkeyPatch,
+        rollback: bool
+) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    pubkey = tmp_case2_dir.joinpath("public-keys/my-user-b.pub").read_bytes()
+    with repo.transaction():
+        _rm_user_b(repo)
+    after = _read_all(tmp_case2_dir)
+
+    repo.users.add("my-user-b")
+    repo.groups["my-group-1"].add_member_by_id("my-user-b")
+    repo.groups["my-group-2"].add_member_by_id("my-user-b")
+    repo.auth.always.device_users["my-device-user-d"].deauthorize_user_by_id(
+        "my-user-a")
+    tmp_case2_dir.joinpath("public-keys/my-user-b.pub").write_bytes(pubkey)
+    before = _read_all(tmp_case2_dir)
+
+    def crashing_apply(*args, **kwargs) -> None:
+        raise KeyboardInterrupt()
+
+    # Crashes right after the commit point.
+    monkeypatch.setattr(repo_journal, "_apply", crashing_apply)
+    with pytest.raises(KeyboardInterrupt):
+        with repo.transaction():
+            _rm_user_b(repo)
+    monkeypatch.undo()
+
+    journals = recover_ssh_auth_dir_journals(tmp_case2_dir, rollback)
+    assert 1 == len(journals)
+    assert (before if rollback else after) == _read_all(tmp_case2_dir)
+    assert [] == recover_ssh_auth_dir_journals(tmp_case2_dir)
+
+
+def test_rollback_refuses_changed_files(
+        tmp_case2_dir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+
+    def crashing_apply(*args, **kwargs) -> None:
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(repo_journal, "_apply", crashing_apply)
+    with pytest.raises(KeyboardInterrupt):
+        with repo.transaction():
+            _rm_user_b(repo)
+    monkeypatch.undo()
+
+    [journal] = tmp_case2_dir.joinpath(JOURNAL_DIRNAME).iterdir()
+    # The locks held by the commit, taken again by recovery.
+    assert ["authorized-always", "groups", "users"] == json.loads(
+        journal.read_text())["locks"]
+
+    # Neither as before nor as after the commit.
+    groups_file = tmp_case2_dir.joinpath("groups.json")
+    groups_file.write_text('{"ssh-groups": {}}')
+    with pytest.raises(SshAuthDirJournalError):
+        recover_ssh_auth_dir_journals(tmp_case2_dir, rollback=True)
+    assert '{"ssh-groups": {}}' == groups_file.read_text()
+    assert journal.exists()
+
+
+def test_replay_repairs_torn_files(
+        tmp_case2_dir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    with repo.transaction():
+        _rm_user_b(repo)
+    after = _read_all(tmp_case2_dir)
+    with repo.transaction():
+        repo.users.add("my-user-b")
+
+    def crashing_apply(*args, **kwargs) -> None:
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(repo_journal, "_apply", crashing_apply)
+    with pytest.raises(KeyboardInterrupt):
+        with repo.transaction():
+            repo.users.rm("my-user-b")
+    monkeypatch.undo()
+
+    # As a crash right after an unsynced file was renamed in place may
+    # leave it.
+    tmp_case2_dir.joinpath("users.json").write_bytes(b"")
+    assert 1 == len(recover_ssh_auth_dir_journals(tmp_case2_dir))
+    assert after == _read_all(tmp_case2_dir)
@@ -0,0 +1,120 @@
+import errno
+import fcntl
+import multiprocessing
+import os
+from pathlib import Path
+
+import pytest
+
+from nsf_ssh_auth_dir import repo_lock
+from nsf_ssh_auth_dir._io_stats import disable_io_stats, enable_io_stats
+from nsf_ssh_auth_dir.policy_lock import SshAuthDirLockDefaultPolicy
+from nsf_ssh_auth_dir.policy_repo import SshAuthDirRepoDefaultPolicy
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_lock import (LOCKS_DIRNAME, SshAuthDirLockError,
+                                        SshAuthDirLockTimeoutError)
+
+_N_MEMBERS = 20
+
+
+def _add_members(dir: Path, worker: int) -> None:
+    repo = mk_ssh_auth_dir_repo(dir)
+    groups = repo.groups
+    du = repo.auth.always.device_users.ensure(f"my-du-{worker}")
+    for i in range(_N_MEMBERS):
+        groups[f"my-group-w{worker}"].add_member_by_id(
+            f"my-user-{i}", force=True)
+        du.authorize_user_by_id(f"my-user-{i}", force=True)
+
+
+def test_concurrent_writers_do_not_lose_updates(tmp_case2_dir: Path) -> None:
+    n_workers = 4
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    for w in range(n_workers):
+        repo.groups.add(f"my-group-w{w}")
+
+    ctx = multiprocessing.get_context("fork")
+    workers = [
+        ctx.Process(target=_add_members, args=(tmp_case2_dir, w))
+        for w in range(n_workers)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    assert all(0 == p.exitcode for p in workers)
+
+    raw_groups = repo.groups.load_raw()
+    raw_auth = repo.auth.always.device_users.load_raw()
+    for w in range(n_workers):
+        assert _N_MEMBERS == len(raw_groups.ssh_groups[f"my-group-w{w}"].members)
+        assert _N_MEMBERS == len(raw_auth.device_users[f"my-du-{w}"].ssh_users)
+
+    locks_dir = tmp_case2_dir.joinpath(LOCKS_DIRNAME)
+    assert locks_dir.joinpath("groups.lock").exists()
+    assert "*\n" == locks_dir.parent.joinpath(".gitignore").read_text()
+
+
+def test_lock_timeout(tmp_case2_dir: Path) -> None:
+    policy = SshAuthDirRepoDefaultPolicy(
+        SshAuthDirLockDefaultPolicy(timeout=0.05))
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir, policy=policy)
+    # Warms up the lock file.
+    repo.groups.add("my-group-x")
+
+    lock_fn = tmp_case2_dir.joinpath(LOCKS_DIRNAME, "groups.lock")
+    fd = os.open(lock_fn, os.O_RDWR)
+    stats = enable_io_stats()
+    try:
+        # Another open file description conflicts, even in this process.
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        with pytest.raises(SshAuthDirLockTimeoutError):
+            repo.groups.add("my-group-y")
+        # Unrelated files remain writable.
+        repo.users.add("my-user-y")
+    finally:
+        disable_io_stats()
+        os.close(fd)
+
+    assert 1 == stats.lock_timeouts
+    assert "my-group-y" not in repo.groups.names
+
+
+def test_read_only_dir(
+        tmp_case2_dir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    def read_only(dir: Path) -> None:
+        raise OSError(errno.EROFS, "Read-only file system", str(dir))
+
+    # As on a read-only mount, which root would otherwise write anyway.
+    monkeypatch.setattr(repo_lock, "ensure_internal_dir", read_only)
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+
+    # Readers go unlocked.
+    assert "my-user-a" in repo.users.names
+    assert repo.load_snapshot().groups_names
+    assert not tmp_case2_dir.joinpath(
+        LOCKS_DIRNAME, "groups.lock").exists()
+
+    # Writers fail with a repo error.
+    with pytest.raises(SshAuthDirLockError):
+        repo.groups.add("my-group-x")
+    assert "my-group-x" not in repo.groups.names
+
+
+def test_failed_lock_upgrade_keeps_shared_lock(tmp_case2_dir: Path) -> None:
+    lock = repo_lock.mk_ssh_auth_dir_file_lock(
+        tmp_case2_dir, "groups", SshAuthDirLockDefaultPolicy(timeout=0.05))
+    with lock.shared():
+        fd = os.open(lock.filename, os.O_RDWR)
+        try:
+            # Another open file description sharing the lock.
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            with pytest.raises(SshAuthDirLockTimeoutError):
+                with lock.exclusive():
+                    pass
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+            # Still held shared: taking it exclusive elsewhere fails.
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        finally:
+            os.close(fd)
@@ -0,0 +1,66 @@
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+from nsf_ssh_auth_dir.policy_lock import SshAuthDirLockDefaultPolicy
+from nsf_ssh_auth_dir.policy_repo import SshAuthDirRepoDefaultPolicy
+from nsf_ssh_auth_dir.repo import SshAuthDirRepo, mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_groups import SshGroupsRepoKeyAccessError
+
+_N_WORKERS = 6
+_N_EDITS = 15
+
+
+def _mk_optimistic_repo(dir: Path) -> SshAuthDirRepo:
+    return mk_ssh_auth_dir_repo(dir, policy=SshAuthDirRepoDefaultPolicy(
+        SshAuthDirLockDefaultPolicy(optimistic=True)))
+
+
+def _edit(dir: Path, worker: int) -> None:
+    repo = _mk_optimistic_repo(dir)
+    du = repo.auth.always.device_users[f"my-du-{worker}"]
+    for i in range(_N_EDITS):
+        # All workers edit the same group entry.
+        repo.groups["my-group-shared"].add_member_by_id(
+            f"my-user-{worker}-{i}", force=True)
+        du.authorize_user_by_id(f"my-user-{i}", force=True)
+
+
+def test_optimistic_writers_do_not_lose_updates(tmp_case2_dir: Path) -> None:
+    repo = _mk_optimistic_repo(tmp_case2_dir)
+    repo.groups.add("my-group-shared")
+    for w in range(_N_WORKERS):
+        repo.auth.always.device_users.add(f"my-du-{w}")
+
+    ctx = multiprocessing.get_context("fork")
+    workers = [
+        ctx.Process(target=_edit, args=(tmp_case2_dir, w))
+        for w in range(_N_WORKERS)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    assert all(0 == p.exitcode for p in workers)
+
+    members = repo.groups["my-group-shared"].members_names
+    assert _N_WORKERS * _N_EDITS == len(members)
+    raw_auth = repo.auth.always.device_users.load_raw()
+    for w in range(_N_WORKERS):
+        assert _N_EDITS == len(raw_auth.device_users[f"my-du-{w}"].ssh_users)
+
+
+def test_optimistic_op_reapplied_on_fresh_content(
+        tmp_case2_dir: Path) -> None:
+    repo = _mk_optimistic_repo(tmp_case2_dir)
+    group = repo.groups["my-group-1"]
+    # Concurrently edited after `group` was loaded.
+    repo.groups["my-group-1"].add_member_by_id("my-user-d")
+
+    group.add_member_by_id("my-user-e")
+    assert {"my-user-d", "my-user-e"} <= repo.groups[
+        "my-group-1"].members_names
+
+    del repo.groups["my-group-1"]
+    with pytest.raises(SshGroupsRepoKeyAccessError):
+        group.add_member_by_id("my-user-c", force=True)
@@ -0,0 +1,75 @@
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_groups import SshGroupsRepoKeyAccessError
+from nsf_ssh_auth_dir.repo_observer import (SshAuthDirRepoMultiObserver,
+                                            SshAuthDirRepoTimingCollector)
+from nsf_ssh_auth_dir.types_observer import (NOOP_OBSERVER,
+                                             SshAuthDirMutationEvent,
+                                             SshAuthDirPubkeyResolutionEvent,
+                                             SshAuthDirRepoEvent,
+                                             SshAuthDirRepoObserver)
+
+
+class _RecordingObserver(SshAuthDirRepoObserver):
+    def __init__(self) -> None:
+        self.events: List[SshAuthDirRepoEvent] = []
+
+    def on_event(self, event: SshAuthDirRepoEvent) -> None:
+        self.events.append(event)
+
+
+def test_observer_events_case_2(tmp_case2_dir: Path) -> None:
+    recorder = _RecordingObserver()
+    collector = SshAuthDirRepoTimingCollector()
+    repo = mk_ssh_auth_dir_repo(
+        tmp_case2_dir,
+        observer=SshAuthDirRepoMultiObserver([recorder, collector]))
+
+    repo.groups["my-group-2"].add_member_by_id("my-user-d")
+    mutations = [
+        e for e in recorder.events if isinstance(e, SshAuthDirMutationEvent)]
+    assert [(e.op, e.attrs) for e in mutations] == [
+        ("group.member.add",
+            {"group": "my-group-2", "user_id": "my-user-d", "force": False})]
+    assert 1 == collector["file-dump"].count
+    assert collector["file-load"].nbytes > 0
+    assert 1 == collector["mutation:group.member.add"].count
+
+    # Failed mutations are not reported.
+    with pytest.raises(SshGroupsRepoKeyAccessError):
+        repo.groups["my-group-2"].rm_member_by_id("unknown")
+    assert 1 == collector["mutation:group.member.add"].count
+    assert "mutation:group.member.rm" not in collector
+
+    repo.auth.always.device_users.ensure("my-device-user-x")
+    last = recorder.events[-1]
+    assert isinstance(last, SshAuthDirMutationEvent)
+    assert "auth.device-user.add" == last.op
+    assert last.attrs["state"] is None and last.attrs["exist_ok"]
+
+    repo.users["my-user-a"].pubkeys.selected
+    resolution = recorder.events[-1]
+    assert isinstance(resolution, SshAuthDirPubkeyResolutionEvent)
+    assert "my-user-a" == resolution.username
+    assert resolution.filename is not None and 1 <= resolution.probes
+
+    summary = {e.key: e for e in collector.summary()}
+    assert summary["file-parse"].calls == collector["file-parse"].count
+    assert sum(collector["file-load"].histogram.values()) \
+        == collector["file-load"].count
+
+
+def test_observer_disabled_by_default(tmp_case1_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case1_dir)
+    assert repo.observer is NOOP_OBSERVER
+    assert not SshAuthDirRepoMultiObserver([NOOP_OBSERVER]).enabled
+
+
+def test_event_kind_is_abstract() -> None:
+    with pytest.raises(TypeError):
+        SshAuthDirRepoEvent(0.0)  # type: ignore[abstract]
+    assert "mutation" == SshAuthDirMutationEvent(0.0, "user.add").kind
@@ -0,0 +1,134 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+import pytest
+
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_groups import SshGroupsRepoAccessError
+from nsf_ssh_auth_dir.repo_overlay import (
+    MERGE_METHOD_PIECEWISE_MIX, SshAuthDirOverlayKeyAccessError,
+    SshAuthDirOverlayMergeMethods, SshAuthDirOverlayMergePolicy,
+    mk_ssh_auth_dir_overlay_repo)
+
+
+def _write_json(filename: Path, content: Dict[str, Any]) -> None:
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    with open(filename, "w") as f:
+        json.dump(content, f)
+
+
+def _mk_override_dir(tmp_path: Path) -> Path:
+    o_dir = tmp_path.joinpath("override")
+    _write_json(o_dir.joinpath("users.json"), {"ssh-users": {
+        "my-user-b": {},
+        "my-user-z": {},
+    }})
+    _write_json(o_dir.joinpath("groups.json"), {"ssh-groups": {
+        "my-group-1": {"members": ["my-user-z"]},
+    }})
+    _write_json(o_dir.joinpath("authorized-on/my-state-s1.json"), {
+        "device-users": {
+            "my-device-user-c": {"ssh-users": ["my-user-z"]},
+        }})
+    return o_dir
+
+
+def test_overlay_case_2(tmp_case2_dir: Path, tmp_path: Path) -> None:
+    base = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    override = mk_ssh_auth_dir_repo(_mk_override_dir(tmp_path))
+    overlay = mk_ssh_auth_dir_overlay_repo(base, override=[override])
+
+    assert overlay.users_names == [
+        "my-user-a", "my-user-b", "my-user-c", "my-user-d", "my-user-e",
+        "my-user-z"]
+
+    # Rightmost definition wins, pubkey relative to its own dir.
+    assert overlay.get_user_layer("my-user-b").repo is override
+    assert overlay.get_user("my-user-b").pubkeys.default_filename == (
+        override.dir.joinpath("public-keys/my-user-b.pub"))
+    assert overlay.get_user_layer("my-user-a").repo is base
+    assert "my-user-q" not in overlay
+    with pytest.raises(SshAuthDirOverlayKeyAccessError):
+        overlay.get_user("my-user-q")
+
+    # Groups are whole overridden by default.
+    assert overlay.get_group_members_names("my-group-1") == {"my-user-z"}
+    assert overlay.get_group_members_names("my-group-2") == {
+        "my-user-b", "my-user-c"}
+
+    # Always and on state sets are mixed within the base layer.
+    assert overlay.get_device_user_authorized_names(
+        "my-device-user-d", ["my-state-s1", "my-state-s3"]) == (
+            {"my-ssh-user-d"}, {"my-group-1", "my-group-2"})
+
+    # Whole device user override.
+    assert overlay.get_device_user_authorized_names(
+        "my-device-user-c") == ({"my-ssh-user-d"}, {"my-group-2"})
+    assert overlay.get_device_user_authorized_names(
+        "my-device-user-c", ["my-state-s1"]) == ({"my-user-z"}, set())
+
+    # Final device user includes the `""` all device users set.
+    assert overlay.get_final_device_user_ssh_users_names(
+        "my-device-user-a") == {"my-ssh-user-e", "my-user-z"}
+    assert overlay.get_final_device_user_ssh_users_names(
+        "my-device-user-q") == {"my-ssh-user-e"}
+
+
+def test_overlay_piecewise_mix(tmp_case2_dir: Path, tmp_path: Path) -> None:
+    base = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    override = mk_ssh_auth_dir_repo(_mk_override_dir(tmp_path))
+    mix = SshAuthDirOverlayMergeMethods(
+        MERGE_METHOD_PIECEWISE_MIX, MERGE_METHOD_PIECEWISE_MIX)
+    overlay = mk_ssh_auth_dir_overlay_repo(
+        override, inherited=[base],
+        policy=SshAuthDirOverlayMergePolicy(inherited=mix))
+
+    assert overlay.get_user_layer("my-user-b").repo is override
+    assert overlay.get_group_members_names("my-group-1") == {
+        "my-user-a", "my-user-b", "my-user-z"}
+    assert overlay.get_device_user_authorized_names(
+        "my-device-user-c", ["my-state-s1"]) == (
+            {"my-ssh-user-d", "my-user-z"}, {"my-group-2"})
+
+
+def test_overlay_layer_files(tmp_case2_dir: Path, tmp_path: Path) -> None:
+    o_dir = tmp_path.joinpath("override")
+    # A layer might only bring auth.
+    _write_json(o_dir.joinpath("authorized-always.json"), {
+        "device-users": {"my-device-user-c": {"ssh-users": ["my-user-a"]}}})
+    base = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    overlay = mk_ssh_auth_dir_overlay_repo(
+        base, override=[mk_ssh_auth_dir_repo(o_dir)])
+    assert overlay.get_device_user_authorized_names(
+        "my-device-user-c") == ({"my-user-a"}, set())
+
+    # Invalid files are not missing ones.
+    o_dir.joinpath("groups.json").write_text("{ not json")
+    overlay = mk_ssh_auth_dir_overlay_repo(
+        base, override=[mk_ssh_auth_dir_repo(o_dir)])
+    with pytest.raises(SshGroupsRepoAccessError):
+        overlay.get_group_members_names("my-group-1")
+
+
+def test_overlay_merged_views_invalidation(
+        tmp_case2_dir: Path, tmp_path: Path) -> None:
+    base = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    o_dir = _mk_override_dir(tmp_path)
+    override = mk_ssh_auth_dir_repo(o_dir)
+
+    overlay1 = mk_ssh_auth_dir_overlay_repo(base, override=[override])
+    assert "my-user-y" not in overlay1
+    overlay2 = mk_ssh_auth_dir_overlay_repo(base, override=[override])
+    assert overlay2._views is overlay1._views
+
+    users_fn = o_dir.joinpath("users.json")
+    _write_json(users_fn, {"ssh-users": {"my-user-y": {}}})
+    st = users_fn.stat()
+    os.utime(users_fn, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+
+    overlay3 = mk_ssh_auth_dir_overlay_repo(base, override=[override])
+    assert overlay3._views is not overlay1._views
+    assert "my-user-y" in overlay3
+    assert overlay3.get_user_layer("my-user-b").repo is base
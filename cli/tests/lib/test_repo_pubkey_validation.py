@@ -0,0 +1,81 @@
+import base64
+from pathlib import Path
+
+import pytest
+
+from nsf_ssh_auth_dir import repo_pubkey_validation
+from nsf_ssh_auth_dir.file_pubkey import validate_ssh_pubkey_lines
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_pubkey_validation import (
+    SshPubkeyValidationCache, validate_ssh_auth_dir_pubkeys)
+
+
+def _ssh_string(value: bytes) -> bytes:
+    return len(value).to_bytes(4, "big") + value
+
+
+def _mk_pubkey_line(key_type: str, *fields: bytes) -> str:
+    blob = b"".join(map(_ssh_string, (key_type.encode(),) + fields))
+    return f"{key_type} {base64.b64encode(blob).decode()} my@host\n"
+
+
+def _mk_rsa_line(bits: int) -> str:
+    modulus = (1 << (bits - 1)) | 1
+    return _mk_pubkey_line(
+        "ssh-rsa", b"\x01\x00\x01",
+        b"\x00" + modulus.to_bytes(bits // 8, "big"))
+
+
+_ED25519_LINE = _mk_pubkey_line("ssh-ed25519", b"\x07" * 32)
+
+
+def test_validate_ssh_pubkey_lines() -> None:
+    assert validate_ssh_pubkey_lines([_ED25519_LINE]) is None
+    assert validate_ssh_pubkey_lines(["# comment\n", _mk_rsa_line(2048)]) \
+        is None
+    assert validate_ssh_pubkey_lines([
+        _mk_pubkey_line("ecdsa-sha2-nistp256", b"nistp256", b"\x04")]) is None
+
+    assert "at least 2048" in (validate_ssh_pubkey_lines(
+        [_mk_rsa_line(1024)]) or "")
+    assert validate_ssh_pubkey_lines([_mk_rsa_line(1024)], 1024) is None
+    assert "does not match" in (validate_ssh_pubkey_lines(
+        [_ED25519_LINE.replace("ssh-ed25519", "ssh-rsa", 1)]) or "")
+    assert "base64" in (validate_ssh_pubkey_lines(["ssh-rsa AAA$\n"]) or "")
+    assert "truncated" in (validate_ssh_pubkey_lines(
+        [f"ssh-ed25519 {base64.b64encode(b'x' * 8).decode()}\n"]) or "")
+    assert "32 bytes" in (validate_ssh_pubkey_lines(
+        [_mk_pubkey_line("ssh-ed25519", b"\x07" * 31)]) or "")
+    assert "no key" == validate_ssh_pubkey_lines(["\n"])
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_validate_ssh_auth_dir_pubkeys(
+        tmp_case2_dir: Path,
+        monkeypatch: pytest.MonkeyPatch,
+        jobs: int
+) -> None:
+    monkeypatch.setattr(repo_pubkey_validation, "_MIN_KEYS_PER_JOB", 1)
+    pubkeys_dir = tmp_case2_dir.joinpath("public-keys")
+    pubkeys_dir.joinpath("my-user-a.pub").write_text(_ED25519_LINE)
+    pubkeys_dir.joinpath("my-user-b.pub").write_text(_ED25519_LINE)
+    pubkeys_dir.joinpath("my-user-c.pub").write_text(_mk_rsa_line(1024))
+
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    cache_fn = tmp_case2_dir.parent.joinpath("validation-cache.json")
+    cache = SshPubkeyValidationCache(cache_fn)
+    results = validate_ssh_auth_dir_pubkeys(repo, cache, jobs)
+    assert ["my-user-a", "my-user-b", "my-user-c", "my-user-d",
+            "my-user-e"] == [r.username for r in results]
+    assert [True, True, False, False, False] == [r.valid for r in results]
+    assert results[4].filename is None
+    # Identical keys are validated once.
+    assert (0, 3) == (cache.hits, cache.misses)
+    cache.save()
+
+    pubkeys_dir.joinpath("my-user-c.pub").write_text(_mk_rsa_line(4096))
+    cache = SshPubkeyValidationCache(cache_fn)
+    results = validate_ssh_auth_dir_pubkeys(repo, cache, jobs)
+    assert [True, True, True, False, False] == [r.valid for r in results]
+    assert [True, True, False, True] == [r.cached for r in results[:4]]
+    assert (3, 1) == (cache.hits, cache.misses)
@@ -0,0 +1,91 @@
+import logging
+from pathlib import Path
+
+import pytest
+
+from nsf_ssh_auth_dir.file_pubkey import get_ssh_pubkey_fingerprint
+from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_auth_device_users import SshAuthRepoAccessError
+from nsf_ssh_auth_dir.repo_groups import SshGroupsRepoAccessError
+from nsf_ssh_auth_dir.repo_snapshot import SshAuthEntry
+from nsf_ssh_auth_dir.types_pubkey import SshPubKey
+
+LOGGER = logging.getLogger(__name__)
+
+
+def test_snapshot_case_2(tmp_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    LOGGER.info(f"repo: {repo.dir}")
+
+    snapshot = repo.load_snapshot()
+
+    assert set(snapshot.users_names) == set(repo.users.names)
+    assert set(snapshot.groups_names) == set(repo.groups.names)
+    assert snapshot.state_names == [
+        "my-state-s1", "my-state-s2", "my-state-s3"]
+
+    assert snapshot.get_user_groups_names("my-user-b") == [
+        "my-group-1", "my-group-2"]
+    assert snapshot.get_user_groups_names("my-user-d") == []
+
+    assert snapshot.get_user_auth_entries("my-user-a") == [
+        SshAuthEntry(None, "my-device-user-a", "my-group-1"),
+        SshAuthEntry("my-state-s1", "my-device-user-d", "my-group-1"),
+    ]
+
+    assert snapshot.get_group_auth_entries("my-group-2") == [
+        SshAuthEntry(None, "my-device-user-c", None),
+        SshAuthEntry("my-state-s3", "my-device-user-d", None),
+    ]
+
+    user_b = snapshot.get_user("my-user-b")
+    assert user_b.pubkey_selected.text_lines == ["my-user-b.pub"]
+
+
+def test_snapshot_case_1_wo_groups_file(tmp_case1_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case1_dir)
+    snapshot = repo.load_snapshot()
+
+    assert snapshot.groups_names == []
+    assert snapshot.state_names == []
+    assert snapshot.get_user_auth_entries("my-user-b") == [
+        SshAuthEntry(None, "my-device-user-b", None),
+        SshAuthEntry(None, "my-device-user-c", None),
+    ]
+
+
+def test_snapshot_invalid_groups_or_auth_file(tmp_case1_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case1_dir)
+
+    # Only missing files are optional, invalid ones are not empty ones.
+    groups_file = tmp_case1_dir.joinpath("groups.json")
+    groups_file.write_text("{ not json")
+    with pytest.raises(SshGroupsRepoAccessError):
+        repo.load_snapshot()
+
+    groups_file.unlink()
+    tmp_case1_dir.joinpath("authorized-always.json").write_text("{ not json")
+    with pytest.raises(SshAuthRepoAccessError):
+        repo.load_snapshot()
+
+
+def test_snapshot_users_only(tmp_case2_dir: Path) -> None:
+    # Files not needed are not even read.
+    tmp_case2_dir.joinpath("groups.json").write_text("{ not json")
+    tmp_case2_dir.joinpath(
+        "authorized-on/my-state-s1.json").write_text("{ not json")
+    snapshot = mk_ssh_auth_dir_repo(tmp_case2_dir).load_snapshot(
+        with_groups=False, with_auth=False)
+    assert "my-user-a" in snapshot.users_names
+    assert [] == snapshot.groups_names
+    assert [] == snapshot.state_names
+
+
+def test_pubkey_fingerprint() -> None:
+    # Same as `ssh-keygen -lf` would print for this (truncated) key blob.
+    pk = SshPubKey(["ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIA== my@host\n"])
+    assert get_ssh_pubkey_fingerprint(pk) == (
+        "SHA256:xGib3+FptS+cITct2V7iFK9qKkm/QSPPdJstK0JtCps")
+
+    assert get_ssh_pubkey_fingerprint(SshPubKey(["my-user-a.pub"])) is None
+    assert get_ssh_pubkey_fingerprint(SshPubKey([])) is None
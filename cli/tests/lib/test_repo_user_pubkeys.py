@@ -1,9 +1,13 @@
 
 
 import logging
-from typing import Iterable
+import os
+from typing import Iterable, List
 from pathlib import Path
 from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo
+from nsf_ssh_auth_dir.repo_user_pubkeys import get_pubkey_lookup_plan
+from nsf_ssh_auth_dir.repo_users import SshUser
+from nsf_ssh_auth_dir.types_pubkey import SshPubKey
 
 LOGGER = logging.getLogger(__name__)
 
@@ -56,3 +60,42 @@ def test_ls_user_pubkeys_case_2(tmp_case2_dir: Path) -> None:
     _check_pubkeys_filenames(repo.dir, ub_pk_fns, {
         "public-keys/my-user-b.pub"
     })
+
+
+def test_pubkey_lookup_plan_case_1(tmp_case1_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case1_dir)
+    raw_users = repo.users.load_raw()
+    defaults = raw_users.ssh_user_defaults
+    plan = get_pubkey_lookup_plan(repo.dir, defaults, repo.policy.pubkey)
+    assert plan is not None
+
+    def get_users(with_plan: bool) -> List[SshUser]:
+        return [
+            SshUser(
+                repo.dir, raw, defaults, repo.policy.pubkey,
+                lookup_plan=plan if with_plan else None)
+            for raw in raw_users.ssh_users.values()]
+
+    def selected() -> List[Path]:
+        return [u.pubkeys.selected_filename for u in get_users(True)]
+
+    expected = [u.pubkeys.selected_filename for u in get_users(False)]
+    assert expected == selected()
+    assert [list(u.pubkeys.candidate_filenames) for u in get_users(False)] \
+        == [list(u.pubkeys.candidate_filenames) for u in get_users(True)]
+
+    # A write through the repo drops the plan's indexes.
+    user_f = repo.users["my-user-f"]
+    user_f.pubkey_default = SshPubKey(["f\n"])
+    expected[5] = user_f.pubkeys.default_filename
+    assert expected == selected()
+
+    # An external change is only seen once the plan is refreshed.
+    override_dir = tmp_case1_dir.joinpath("public-keys-override")
+    override_dir.joinpath("my-user-e.pub").write_text("e\n")
+    os.utime(override_dir, ns=(1, 1))
+    assert expected == selected()
+    assert plan is get_pubkey_lookup_plan(
+        repo.dir, defaults, repo.policy.pubkey)
+    expected[4] = override_dir.joinpath("my-user-e.pub")
+    assert expected == selected()
@@ -3,7 +3,8 @@ import logging
 from typing import Set
 from pathlib import Path
 from nsf_ssh_auth_dir.repo import mk_ssh_auth_dir_repo, SshAuthDirRepo
-from nsf_ssh_auth_dir.repo_users import SshUsersRepoFileAccessError, SshPubKey
+from nsf_ssh_auth_dir.repo_users import (SshPubKey, SshUsersRepoAccessError,
+                                         SshUsersRepoFileAccessError)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -145,3 +146,25 @@ def test_add_user_set_pubkey_case_2(tmp_case2_dir: Path) -> None:
     LOGGER.info(f"repo: {repo.dir}")
 
     _check_add_user_set_pubkey(repo, get_expected_usernames_case2())
+
+
+def test_get_user_only_parses_this_user(tmp_case2_dir: Path) -> None:
+    repo = mk_ssh_auth_dir_repo(tmp_case2_dir)
+    users_fn = tmp_case2_dir.joinpath("users.json")
+    users_fn.write_text(
+        '{"ssh-users": {"my-user-a": {}, "my-user-b": {"pubkey-file": 3}}}')
+
+    raw_users = repo.users.load_raw()
+    assert "my-user-b" in raw_users.ssh_users
+    assert "my-user-a" == raw_users.ssh_users["my-user-a"].name
+    assert 1 == raw_users.ssh_users.parsed  # type: ignore
+
+    # Invalid entries only fail once accessed.
+    assert "my-user-a" == repo.users["my-user-a"].name
+    with pytest.raises(SshUsersRepoAccessError):
+        repo.users["my-user-b"]
+
+    # Untouched entries are written back as is.
+    repo.users.add("my-user-c")
+    assert {"pubkey-file": 3} == repo.users.load_raw().ssh_users \
+        .get_unparsed("my-user-b")  # type: ignore
@@ -268,7 +268,9 @@ rec {
 
 
   loadAuthAlwaysRawAttrs = dCfg: dir:
-    loadAttrs dCfg.dir-layout.file-format dir dCfg.dir-layout.auth-always defAuthRawAttrs;
+    loadAttrsWEntityDir
+      dCfg.dir-layout.file-format (dCfg.dir-layout.entity-dirs or null) "device-users"
+      dir dCfg.dir-layout.auth-always defAuthRawAttrs;
 
 
   loadAuthAlways' = dCfg: dir: users: groups:
@@ -296,8 +298,9 @@ rec {
 
 
   loadAuthOnRawAttrs = dCfg: dir: onState:
-    loadAttrs
-      dCfg.dir-layout.file-format (getAuthOnDir dCfg dir)
+    loadAttrsWEntityDir
+      dCfg.dir-layout.file-format (dCfg.dir-layout.entity-dirs or null) "device-users"
+      (getAuthOnDir dCfg dir)
       {stem = onState; mandatory-file = dCfg.dir-layout.auth-on.fail-on-missing-file; } defAuthRawAttrs;
 
 
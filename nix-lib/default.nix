@@ -14,6 +14,7 @@ let
   authModule = callPackage ./auth.nix {};
   deviceUserModule = callPackage ./device-user.nix {};
   dirModule = callPackage ./dir.nix {};
+  resolvedModule = callPackage ./resolved.nix {};
 in
 
 rec {
@@ -24,7 +25,8 @@ rec {
     groupsModule
     authModule
     deviceUserModule
-    dirModule;
+    dirModule
+    resolvedModule;
 
   inherit (usersModule)
     listPubKeysForSshUsers
@@ -58,4 +60,9 @@ rec {
     mkAuthDirDeviceUser
     defaultAuthDirCfg
     overrideAuthDirCfg;
+
+  inherit (resolvedModule)
+    loadAuthDirResolved
+    loadAuthDirDeviceUserResolved
+    isResolvedSnapshotUpToDate;
 }
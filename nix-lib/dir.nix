@@ -60,6 +60,13 @@ rec {
         # fail if the file is absent.
         fail-on-missing-file = false;
       };
+
+      # When not null, each user, group and device user authorization
+      # may also live in its own file under a `<stem><suffix>` dir
+      # (e.g.: `users.d/my-user.json`). Missing dirs are simply ignored
+      # so that, as the python side's layout detection, both layouts
+      # load by default.
+      entity-dirs = { suffix = ".d"; };
     };
 
     merge-policy = rec {
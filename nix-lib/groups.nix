@@ -22,7 +22,9 @@ rec {
 
 
   loadGroupsRawAttrs = dCfg: dir:
-    loadAttrs dCfg.dir-layout.file-format dir dCfg.dir-layout.groups defGroupsRawAttrs;
+    loadAttrsWEntityDir
+      dCfg.dir-layout.file-format (dCfg.dir-layout.entity-dirs or null) "ssh-groups"
+      dir dCfg.dir-layout.groups defGroupsRawAttrs;
 
 
   isSshGroups = groups:
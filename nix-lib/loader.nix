@@ -161,6 +161,73 @@ rec {
     );
 
 
+  # The `""` device user (i.e.: any device user) cannot be a filename.
+  # Should match `src/nsf_ssh_auth_dir/file_entity_dir.py` on the python side.
+  decodeEntityFileStem = stem:
+    if "[ALL]" == stem then "" else stem;
+
+
+  listEntityDirFlns = formats: entityDir:
+    let
+      entries = builtins.readDir entityDir;
+      isEntityFln = n:
+        "directory" != entries."${n}"
+        && lib.lists.any (format: lib.strings.hasSuffix ".${format.ext}" n) formats;
+    in
+    builtins.map (n: entityDir + "/${n}")
+      (lib.lists.filter isEntityFln (lib.attrNames entries));
+
+
+  getEntityNameForFln = fln:
+    let
+      baseName = builtins.baseNameOf (builtins.toString fln);
+    in
+    decodeEntityFileStem (
+      lib.strings.concatStringsSep "." (
+        lib.lists.init (lib.strings.splitString "." baseName)));
+
+
+  loadEntityDirAttrs = formats: entityDir:
+    lib.listToAttrs (builtins.map
+      (fln: {
+        name = getEntityNameForFln fln;
+        value = loadAttrsFromFile formats fln;
+      })
+      (listEntityDirFlns formats entityDir));
+
+
+  /*
+    Same as `loadAttrs` but with the `entityKey` attrs (e.g.: `ssh-users`)
+    extended with one entity per file found under the `<stem><suffix>` dir
+    when `entityDirsCfg` is not null.
+  */
+  loadAttrsWEntityDir = formats: entityDirsCfg: entityKey: dir: fCfg: default:
+    if null == entityDirsCfg
+    then loadAttrs formats dir fCfg default
+    else
+      let
+        entityDir = dir + "/${fCfg.stem}${entityDirsCfg.suffix}";
+        hasEntityDir = builtins.pathExists entityDir;
+        # The file becomes optional when entities live in their own files.
+        baseAttrs = loadAttrs formats dir
+          (fCfg // lib.attrsets.optionalAttrs hasEntityDir { mandatory-file = false; })
+          default;
+        baseEntities = baseAttrs."${entityKey}" or { };
+        entityFlns = if hasEntityDir then listEntityDirFlns formats entityDir else [ ];
+        entities = if hasEntityDir then loadEntityDirAttrs formats entityDir else { };
+        dupNames = lib.lists.intersectLists
+          (lib.attrNames baseEntities) (lib.attrNames entities);
+        baseFlns = listSrcFilesForSrcs baseAttrs.srcs;
+      in
+      assert lib.asserts.assertMsg ([ ] == dupNames)
+        ("Entities '${lib.strings.concatStringsSep "', '" dupNames}' found both "
+          + "in '${fCfg.stem}' file and '${builtins.toString entityDir}' dir.");
+      extendAttrsWSrcsInfo dir fCfg.stem (baseFlns ++ entityFlns) (
+        (builtins.removeAttrs baseAttrs [ "srcs" ]) // {
+          "${entityKey}" = baseEntities // entities;
+        });
+
+
   mkPathFor = formatExt: dir: stem:
     dir + "/${stem}.${formatExt}";
 
@@ -0,0 +1,170 @@
+{ lib
+, stdenv
+, yq
+} @ args:
+
+/*
+  Module loading the pre-resolved snapshot of an ssh dir.
+  Should match `src/nsf_ssh_auth_dir/repo_export.py` on the python side
+  (see the `nsf-ssh-auth-dir export-resolved` command).
+
+  Loading the snapshot skips the users, groups and auth merge logic
+  entirely. It is only trusted while the files it was exported from
+  still hash to its recorded content hash and its entity dirs (e.g.:
+  `users.d`) still list the recorded file names, falling back to
+  `loadAuthDir` otherwise.
+*/
+
+let
+  callPackage = lib.callPackageWith args;
+  coreModule = callPackage ./core.nix {};
+  loaderModule = callPackage ./loader.nix {};
+  dirModule = callPackage ./dir.nix {};
+in
+
+with coreModule;
+with loaderModule;
+with dirModule;
+
+rec {
+  resolvedSnapshotFormat = "nsf-ssh-auth-dir-resolved";
+  resolvedSnapshotVersion = 2;
+
+
+  # Snapshot paths are relative to the ssh dir unless absolute.
+  resolveSnapshotPath = dir: p:
+    if lib.strings.hasPrefix "/" p
+    then /. + p
+    else dir + "/${p}";
+
+
+  # Same as `src/nsf_ssh_auth_dir/repo_hash.py`'s dir digest, computed
+  # over the files listed by the snapshot.
+  computeResolvedSnapshotContentHash = dir: snapshot:
+    builtins.hashString "sha256" (lib.strings.concatMapStrings
+      (e:
+        let
+          fln = resolveSnapshotPath dir e.path;
+          digest = if builtins.pathExists fln
+            then builtins.hashFile "sha256" fln
+            else "missing";
+        in
+        "${e.kind} ${e.path} ${digest}\n")
+      snapshot.content-hash.files);
+
+
+  # All names, `null` when missing. Files added to an entity dir since
+  # the export are not among the hashed ones, thus the listings.
+  listResolvedSnapshotEntityDirNames = dir: p:
+    let fln = resolveSnapshotPath dir p; in
+    if builtins.pathExists fln
+    then builtins.attrNames (builtins.readDir fln)
+    else null;
+
+
+  isResolvedSnapshotUpToDate = dir: snapshot:
+       resolvedSnapshotFormat == (snapshot.format or null)
+    && resolvedSnapshotVersion == (snapshot.version or null)
+    && snapshot.content-hash.digest == computeResolvedSnapshotContentHash dir snapshot
+    && lib.lists.all
+         (e: e.names == listResolvedSnapshotEntityDirNames dir e.path)
+         snapshot.content-hash.entity-dirs;
+
+
+  mkSrcForResolvedSnapshotSrc = dir: src: {
+    dir = resolveSnapshotPath dir src.dir;
+    inherit (src) stem;
+    files = builtins.map (resolveSnapshotPath dir) src.files;
+  };
+
+
+  /*
+    Same as `loadAuthDir` but from an up to date snapshot. States
+    missing from the snapshot are empty ones, as with `loadAuthDir`.
+  */
+  loadAuthDirFromResolvedSnapshot = dir: snapshot:
+    { cfgBase ? defaultAuthDirCfg
+    , cfgOverrides ? {}
+    , onStates ? []
+    }:
+      let
+        cfg = overrideAuthDirCfg cfgBase cfgOverrides;
+        extra = {};
+        srcs = snapshot.srcs;
+        usersSrcs = [ (mkSrcForResolvedSnapshotSrc dir srcs.users) ];
+        groupsSrcs = [ (mkSrcForResolvedSnapshotSrc dir srcs.groups) ];
+        authSrcs =
+            [ (mkSrcForResolvedSnapshotSrc dir srcs.authorized-always) ]
+         ++ builtins.map (s: mkSrcForResolvedSnapshotSrc dir srcs.authorized-on."${s}")
+              (lib.lists.filter (s: srcs.authorized-on ? "${s}") onStates);
+
+        usersSrcStr = printSrcStrForSrcs usersSrcs;
+        groupsSrcStr = printSrcStrForSrcs groupsSrcs;
+        authSrcStr = printSrcStrForSrcs authSrcs;
+
+        sshUsers = lib.attrsets.mapAttrs (uk: uv: {
+            pubkey.file = resolveSnapshotPath dir uv.pubkey.file;
+            # Spares `listPubKeysContentForSshUsers` a read of the file.
+            pubkey.content = uv.pubkey.content;
+            srcStr = usersSrcStr;
+          })
+          snapshot.ssh-users;
+
+        pickSshUsers = names: lib.attrsets.genAttrs names (n: sshUsers."${n}");
+
+        sshGroups = lib.attrsets.mapAttrs (gk: gv: {
+            members = pickSshUsers gv.members;
+            srcStr = groupsSrcStr;
+          })
+          snapshot.ssh-groups;
+
+        # Merging auth sets only ever amounts to a union of their users
+        # (see `internalAuthMergePolicy`), groups being already expanded.
+        authSets =
+            [ snapshot.device-users.authorized-always ]
+         ++ builtins.map (s: snapshot.device-users.authorized-on."${s}" or {}) onStates;
+
+        deviceUsers = lib.attrsets.zipAttrsWith (duk: duvs: {
+            sshUsers = pickSshUsers (lib.lists.concatMap (duv: duv.ssh-users) duvs);
+            srcStr = authSrcStr;
+          })
+          authSets;
+      in
+    mkAuthDir' cfg onStates extra
+      { inherit sshUsers; srcs = usersSrcs; }
+      { inherit sshGroups; srcs = groupsSrcs; }
+      { inherit deviceUsers; srcs = authSrcs; };
+
+
+  /*
+    Same as `loadAuthDir` but using the snapshot at `snapshotFln` when
+    present, up to date and loaded with the default cfg. Requesting a
+    state unknown to the snapshot also falls back to `loadAuthDir`.
+    Files added to the users, groups or auth entity dirs since the
+    export are noticed through the recorded listings. Note however that
+    other files added since the export which do not change any of the
+    hashed ones (e.g.: a pubkey file found earlier in the search path)
+    go unnoticed: the snapshot should be exported again on such changes.
+  */
+  loadAuthDirResolved = snapshotFln: dir:
+    { cfgBase ? defaultAuthDirCfg
+    , cfgOverrides ? {}
+    , onStates ? []
+    } @ opts:
+      let
+        snapshot = loadAttrsFromJsonFile snapshotFln;
+        useSnapshot =
+             builtins.pathExists snapshotFln
+          && defaultAuthDirCfg == cfgBase
+          && {} == cfgOverrides
+          && isResolvedSnapshotUpToDate dir snapshot
+          && lib.lists.all (s: snapshot.device-users.authorized-on ? "${s}") onStates;
+      in
+    if useSnapshot
+    then loadAuthDirFromResolvedSnapshot dir snapshot opts
+    else loadAuthDir dir opts;
+
+
+  loadAuthDirDeviceUserResolved = snapshotFln: dir: deviceUsername: opts:
+    mkAuthDirDeviceUser (loadAuthDirResolved snapshotFln dir opts) deviceUsername;
+}
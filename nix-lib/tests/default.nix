@@ -23,6 +23,7 @@ let
   test-auth = pkgs.callPackage ./test-auth.nix commonLocalDeps;
   test-auth-dir-w-extra = pkgs.callPackage ./test-auth-dir-w-extra.nix commonLocalDeps;
   test-auth-dir-device-user-w-extra = pkgs.callPackage ./test-auth-dir-device-user-w-extra.nix commonLocalDeps;
+  test-auth-dir-resolved = pkgs.callPackage ./test-auth-dir-resolved.nix commonLocalDeps;
 in
 
 with testTools;
@@ -32,7 +33,8 @@ rec {
   # TODO: Detect duplicate test names / make sure to make names unique by
   # including context attrs keys.
   tests = test-core // test-auth-dir-device-user // test-auth-dir // test-users // test-groups
-    // test-auth // test-auth-dir-w-extra // test-auth-dir-device-user-w-extra;
+    // test-auth // test-auth-dir-w-extra // test-auth-dir-device-user-w-extra
+    // test-auth-dir-resolved;
 
   runTestsAll =
     assert testTools.assertAllNixTestsOk tests;
@@ -0,0 +1,60 @@
+{ testTools
+, sshAuthLib
+}:
+
+with testTools;
+with sshAuthLib;
+
+let
+  snapshotFln = ./case1/device-ssh.resolved.json;
+  snapshot = builtins.fromJSON (builtins.readFile snapshotFln);
+  staleSnapshot = snapshot // {
+    content-hash = snapshot.content-hash // { digest = "stale"; };
+  };
+  # As if a `users.d` dir existed when exported.
+  staleEntityDirsSnapshot = snapshot // {
+    content-hash = snapshot.content-hash // {
+      entity-dirs = [ { path = "users.d"; names = [ "my-ssh-user-z.json" ]; } ];
+    };
+  };
+in
+
+{
+  testC1ResolvedSnapshotUpToDate =
+    {
+      expr = isResolvedSnapshotUpToDate ./case1/device-ssh snapshot;
+      expected = true;
+    };
+
+  testC1StaleResolvedSnapshotNotUpToDate =
+    {
+      expr = isResolvedSnapshotUpToDate ./case1/device-ssh staleSnapshot;
+      expected = false;
+    };
+
+  testC1ResolvedSnapshotWStaleEntityDirsNotUpToDate =
+    {
+      expr = isResolvedSnapshotUpToDate ./case1/device-ssh staleEntityDirsSnapshot;
+      expected = false;
+    };
+
+  testC1ResolvedAllUsersKeys =
+    {
+      expr = listPubKeysContentForSshUsers (loadAuthDirResolved snapshotFln ./case1/device-ssh {});
+      expected = listPubKeysContentForSshUsers (loadAuthDir ./case1/device-ssh {});
+    };
+
+  testC1ResolvedAuthorizedToDeviceUser =
+    {
+      expr = listPubKeysContentOfSshUsersAuthorizedToDeviceUser (
+        loadAuthDirDeviceUserResolved snapshotFln ./case1/device-ssh "my-device-user-b" {});
+      expected = [ "my-ssh-user-b.pub" ];
+    };
+
+  testC1ResolvedMissingSnapshotFallsBack =
+    {
+      expr = listNamesOfSshUsersAuthorizedToDeviceUser (
+        loadAuthDirDeviceUserResolved ./case1/missing.resolved.json ./case1/device-ssh "my-device-user-a" {});
+      expected = [ "my-ssh-user-a" ];
+    };
+}
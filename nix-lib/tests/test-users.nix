@@ -16,6 +16,18 @@ let
   ubC2 = userSetC2.sshUsers.my-ssh-user-b;
 
   userSetC3C = loadUsersPlain defaultAuthDirCfg ./case3/device-ssh-c;
+
+  entityDirsCfg = defaultAuthDirCfg // {
+    dir-layout = defaultAuthDirCfg.dir-layout // {
+      entity-dirs = { suffix = ".d"; };
+    };
+  };
+
+  noEntityDirsCfg = defaultAuthDirCfg // {
+    dir-layout = defaultAuthDirCfg.dir-layout // {
+      entity-dirs = null;
+    };
+  };
 in
 
 {
@@ -50,4 +62,25 @@ in
         ];
       };
     };
+
+  testLoadUsersRawAttrsMergesEntityDir =
+    {
+      expr = builtins.attrNames
+        (loadUsersRawAttrs entityDirsCfg ./case5/device-ssh).ssh-users;
+      expected = [ "my-ssh-user-a" "my-ssh-user-b" "my.ssh.user-c" ];
+    };
+
+  testLoadUsersRawAttrsMergesEntityDirByDefault =
+    {
+      expr = builtins.attrNames
+        (loadUsersRawAttrs defaultAuthDirCfg ./case5/device-ssh).ssh-users;
+      expected = [ "my-ssh-user-a" "my-ssh-user-b" "my.ssh.user-c" ];
+    };
+
+  testLoadUsersRawAttrsIgnoresEntityDirWhenDisabled =
+    {
+      expr = builtins.attrNames
+        (loadUsersRawAttrs noEntityDirsCfg ./case5/device-ssh).ssh-users;
+      expected = [ "my-ssh-user-a" ];
+    };
 }
@@ -29,7 +29,9 @@ rec {
 
 
   loadUsersRawAttrs = dCfg: dir:
-    loadAttrs dCfg.dir-layout.file-format dir dCfg.dir-layout.users defUsersRawAttrs;
+    loadAttrsWEntityDir
+      dCfg.dir-layout.file-format (dCfg.dir-layout.entity-dirs or null) "ssh-users"
+      dir dCfg.dir-layout.users defUsersRawAttrs;
 
 
   resolveStrWUserVarExpansion = user: str:
@@ -85,7 +87,12 @@ rec {
 
 
   listPubKeysContentForSshUsers = users:
-    map builtins.readFile (listPubKeysForSshUsers users);
+    assert isSshUsers users;
+    lib.attrsets.mapAttrsToList (k: v:
+        # Inlined by snapshots (see `loadAuthDirResolved`).
+        v.pubkey.content or (builtins.readFile v.pubkey.file)
+      )
+      users.sshUsers;
 
 
   mkSshPubKeysForSshUsers = users: {